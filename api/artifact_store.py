@@ -0,0 +1,214 @@
+"""
+Хранилище артефактов по содержимому (SHA-256)
+
+Diff, golden truth и MR пакеты хранятся один раз, сессии ссылаются на них по hash.
+Счётчики ссылок - таблица artifact_refs в той же БД, что и sessions.
+
+Порядок операций (чтобы GC не удалил блоб, на который уже есть ссылка):
+- запись: сначала incref (в транзакции), затем put_bytes / перенос файла
+- GC: удаление строк и файлов под BEGIN IMMEDIATE, поэтому incref ждёт окончания GC
+"""
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+from typing import Dict, Optional
+
+import packages
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+BLOBS_DIR = "/artifacts/blobs"
+# Неиспользуемый блоб удаляется не сразу - сессию могут создавать с тем же содержимым прямо сейчас
+GC_GRACE_SECONDS = int(os.getenv("ARTIFACT_GC_GRACE_SECONDS", "3600"))
+
+KIND_DIFF = "diff"
+KIND_GOLDEN = "golden"
+KIND_PACKAGE = "package"
+
+# Предсжатые варианты блобов (diff): content-encoding -> суффикс файла
+# Маленькие блобы не сжимаем - выигрыш меньше накладных расходов
+PRECOMPRESS_MIN_SIZE = int(os.getenv("ARTIFACT_PRECOMPRESS_MIN_SIZE", "1024"))
+COMPRESSED_VARIANTS = {"br": ".br", "gzip": ".gz"}
+# Индекс diff (см. diff_index)
+INDEX_SUFFIX = ".index.json"
+# Производные файлы блоба - удаляются вместе с ним
+DERIVED_SUFFIXES = tuple(COMPRESSED_VARIANTS.values()) + (INDEX_SUFFIX,)
+_CHUNK_SIZE = 1024 * 1024
+
+
+def digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def blob_path(sha: str) -> str:
+    # Двухсимвольный префикс - чтобы не держать все блобы в одном каталоге
+    return os.path.join(BLOBS_DIR, sha[:2], sha)
+
+
+def put_bytes(data: bytes, sha: Optional[str] = None) -> str:
+    """Сохранить блоб (если такого ещё нет); возвращает sha256"""
+    sha = sha or digest(data)
+    path = blob_path(sha)
+    if os.path.exists(path):
+        return sha
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return sha
+
+
+def variant_path(sha: str, encoding: str) -> str:
+    return blob_path(sha) + COMPRESSED_VARIANTS[encoding]
+
+
+def _available_encodings():
+    return [enc for enc in COMPRESSED_VARIANTS if enc != "br" or brotli is not None]
+
+
+def precompress(sha: str):
+    """Создать gzip/brotli варианты блоба (потоково, без чтения целиком в память)"""
+    path = blob_path(sha)
+    if not os.path.exists(path) or os.path.getsize(path) < PRECOMPRESS_MIN_SIZE:
+        return
+    for encoding in _available_encodings():
+        target = variant_path(sha, encoding)
+        if os.path.exists(target):
+            continue
+        tmp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+        with open(path, "rb") as src, open(tmp_path, "wb") as raw:
+            if encoding == "gzip":
+                with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=9, mtime=0) as out:
+                    shutil.copyfileobj(src, out, _CHUNK_SIZE)
+            else:
+                compressor = brotli.Compressor(quality=11)
+                for chunk in iter(lambda: src.read(_CHUNK_SIZE), b""):
+                    raw.write(compressor.process(chunk))
+                raw.write(compressor.finish())
+        os.replace(tmp_path, target)
+
+
+def read_text(sha: str) -> Optional[str]:
+    path = blob_path(sha)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def read_file_bytes(path: str) -> Optional[bytes]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+
+# === Счётчики ссылок ===
+
+def init_schema(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS artifact_refs (
+            sha TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            size INTEGER DEFAULT 0,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            created_at REAL,
+            released_at REAL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_artifact_refs_refcount ON artifact_refs(refcount)")
+
+
+def incref(conn: sqlite3.Connection, sha: str, kind: str, size: int = 0, count: int = 1):
+    """count - число новых ссылок (пакетное создание сессий с общим артефактом)"""
+    conn.execute('''
+        INSERT INTO artifact_refs (sha, kind, size, refcount, created_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(sha) DO UPDATE SET refcount = refcount + excluded.refcount, released_at = NULL
+    ''', (sha, kind, size, count, time.time()))
+
+
+def decref(conn: sqlite3.Connection, sha: str):
+    conn.execute('''
+        UPDATE artifact_refs
+        SET refcount = MAX(refcount - 1, 0),
+            released_at = CASE WHEN refcount <= 1 THEN ? ELSE released_at END
+        WHERE sha = ?
+    ''', (time.time(), sha))
+
+
+def _remove_artifact(sha: str, kind: str) -> int:
+    """Удалить файлы артефакта; возвращает число освобождённых байт"""
+    freed = 0
+    if kind == KIND_PACKAGE:
+        zip_path = packages.package_zip_path(sha)
+        if os.path.exists(zip_path):
+            freed += os.path.getsize(zip_path)
+            os.remove(zip_path)
+        shutil.rmtree(packages.package_dir(sha), ignore_errors=True)
+    else:
+        base = blob_path(sha)
+        for path in [base] + [base + suffix for suffix in DERIVED_SUFFIXES]:
+            if os.path.exists(path):
+                freed += os.path.getsize(path)
+                os.remove(path)
+    return freed
+
+
+def collect_garbage(conn: sqlite3.Connection, grace_seconds: int = GC_GRACE_SECONDS) -> Dict[str, int]:
+    """Удалить артефакты без ссылок, освобождённые раньше grace_seconds назад"""
+    conn.execute("BEGIN IMMEDIATE")
+    rows = conn.execute(
+        "SELECT sha, kind FROM artifact_refs WHERE refcount = 0 AND released_at IS NOT NULL AND released_at < ?",
+        (time.time() - grace_seconds,)
+    ).fetchall()
+    removed = 0
+    freed = 0
+    for sha, kind in rows:
+        try:
+            freed += _remove_artifact(sha, kind)
+        except OSError as e:
+            logger.warning(f"[Artifacts] Failed to remove {kind} {sha}: {e}")
+            continue
+        conn.execute("DELETE FROM artifact_refs WHERE sha = ? AND refcount = 0", (sha,))
+        removed += 1
+    if removed:
+        logger.info(f"[Artifacts] GC removed {removed} artifacts, freed {freed} bytes")
+    return {"removed": removed, "freed_bytes": freed}
+
+
+def stats(conn: sqlite3.Connection) -> Dict[str, Dict[str, int]]:
+    """Число артефактов, ссылок и размер по типам"""
+    result = {}
+    for kind, count, refs, size, unreferenced in conn.execute('''
+        SELECT kind, COUNT(*), SUM(refcount), SUM(size), SUM(CASE WHEN refcount = 0 THEN 1 ELSE 0 END)
+        FROM artifact_refs GROUP BY kind
+    '''):
+        result[kind] = {"artifacts": count, "references": refs or 0, "bytes": size or 0, "unreferenced": unreferenced or 0}
+    return result
+
+
+if __name__ == "__main__":
+    # Ручной запуск GC: python artifact_store.py [grace_seconds]
+    import sys
+    import db
+
+    logging.basicConfig(level=logging.INFO)
+    grace = int(sys.argv[1]) if len(sys.argv) > 1 else GC_GRACE_SECONDS
+    conn = db.connect()
+    try:
+        print(collect_garbage(conn, grace))
+        conn.commit()
+    finally:
+        conn.close()
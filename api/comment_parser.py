@@ -0,0 +1,124 @@
+"""
+Разбор комментариев Gitea PR
+
+- сигнал готовности кандидата ("ready", "готово", ...): одно регулярное выражение на все
+  ключевые слова, по границам слов - "already" или "приготовить" сигналом не считаются,
+  отрицание ("not ready", "не готов") тоже
+- заголовок "[TYPE] SEVERITY" (так комментарии уходят в Gitea, см. main._gitea_comment_body):
+  тип, серьёзность и текст за один проход
+
+Используется синхронизацией из Gitea (ручной, фоновой), страницей PR и webhook.
+"""
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+READY_KEYWORDS = (
+    "ready", "готов", "готова", "готово", "готов к проверке", "готов к ревью",
+    "завершено", "done", "completed",
+)
+
+COMMENT_TYPES = ("bug", "security", "style", "performance")
+SEVERITIES = ("critical", "high", "medium", "low")
+DEFAULT_TYPE = "bug"
+DEFAULT_SEVERITY = "medium"
+
+# По телу в нижнем регистре (IGNORECASE в re заметно медленнее); длинные варианты раньше коротких.
+# Граница слова слева и отрицание проверяются только для найденных совпадений - lookbehind
+# на каждой позиции обходится дороже, чем сам поиск
+_READY_RE = re.compile(
+    "(?:"
+    + "|".join(re.escape(keyword).replace(r"\ ", r"\s+") for keyword in sorted(READY_KEYWORDS, key=len, reverse=True))
+    + r")(?!\w)"
+)
+_NEGATIONS = ("not ", "не ")
+
+# "[TYPE] SEVERITY\n\nтекст": первая строка - заголовок, пустые строки после него пропускаются
+_HEADER_RE = re.compile(r"\[([^\]\n]*)\][ \t]*(\S*)[^\n]*\n(?:[ \t]*\n)*")
+
+
+class ParsedComment(NamedTuple):
+    type: str
+    severity: str
+    text: str
+
+
+def _has_ready_keyword(body: str) -> bool:
+    lowered = body.lower()
+    for match in _READY_RE.finditer(lowered):
+        start = match.start()
+        # \w в Python учитывает кириллицу: "already", "приготовить" - не сигнал
+        if start and (lowered[start - 1].isalnum() or lowered[start - 1] == "_"):
+            continue
+        if lowered.endswith(_NEGATIONS, 0, start):
+            continue
+        return True
+    return False
+
+
+def is_ready_signal(body: Optional[str]) -> bool:
+    """
+    Комментарий - сигнал готовности: есть ключевое слово и нет заголовка [TYPE]
+    (комментарий с заголовком - замечание ревью, "done" в его тексте ничего не значит)
+    """
+    return bool(body) and not _HEADER_RE.match(body) and _has_ready_keyword(body)
+
+
+def first_ready_comment(comments: List[Dict]) -> Optional[Dict]:
+    """Первый комментарий с сигналом готовности"""
+    for comment in comments:
+        if is_ready_signal(comment.get("body")):
+            return comment
+    return None
+
+
+def _parsed(body: str, match: Optional[re.Match]) -> ParsedComment:
+    if not match:
+        return ParsedComment(DEFAULT_TYPE, DEFAULT_SEVERITY, body)
+    comment_type = match.group(1).strip().lower()
+    severity = match.group(2).lower()
+    return ParsedComment(
+        comment_type if comment_type in COMMENT_TYPES else DEFAULT_TYPE,
+        severity if severity in SEVERITIES else DEFAULT_SEVERITY,
+        body[match.end():],
+    )
+
+
+def parse_header(body: str) -> ParsedComment:
+    """Тип, серьёзность и текст; без заголовка - тип и серьёзность по умолчанию, текст целиком"""
+    return _parsed(body, _HEADER_RE.match(body))
+
+
+def convert_gitea_comments(gitea_comments: List[Dict]) -> Tuple[List[Dict], Optional[Dict]]:
+    """
+    Комментарии Gitea -> формат сессии
+
+    Returns:
+        (комментарии, первый комментарий-сигнал готовности или None);
+        сигналы готовности в комментарии сессии не попадают
+    """
+    converted = []
+    ready_comment = None
+    for gitea_comment in gitea_comments:
+        body = gitea_comment.get("body") or ""
+        # Заголовок разбирается один раз: он же отличает замечание ревью от сигнала готовности
+        match = _HEADER_RE.match(body)
+        if not match and _has_ready_keyword(body):
+            if ready_comment is None:
+                ready_comment = gitea_comment
+            continue
+        parsed = _parsed(body, match)
+        # В Gitea комментарии могут иметь разные поля: path, original_path, line, original_line
+        path = gitea_comment.get("path") or gitea_comment.get("original_path") or "main.py"
+        line = gitea_comment.get("line") or gitea_comment.get("original_line") or gitea_comment.get("new_line") or 1
+        converted.append({
+            "file": path,
+            "line_range": f"{line}-{line}",
+            "type": parsed.type,
+            "severity": parsed.severity,
+            "text": parsed.text,
+            "gitea_id": gitea_comment.get("id"),  # ID для дедупликации
+            # review, в котором пришёл комментарий: review, отправленные из сессии, не импортируются
+            "gitea_review_id": gitea_comment.get("pull_request_review_id"),
+            "source": "gitea",
+        })
+    return converted, ready_comment
@@ -0,0 +1,92 @@
+"""
+Доступ к SQLite для async handlers
+
+sqlite3 - блокирующий драйвер, поэтому все запросы выполняются в выделенном
+пуле потоков (не в общем threadpool Starlette и не в event loop).
+У каждого потока пула - своё постоянное подключение.
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = "/app/reviews.db"
+# Размер пула: SQLite сериализует запись, но чтения в WAL идут параллельно
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+# WAL позволяет читать, пока worker/другой запрос пишет. На сетевых ФС (некоторые bind mount) - DELETE
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="db")
+_local = threading.local()
+
+
+def _reset_after_fork():
+    """Дочерний процесс (gunicorn --preload): потоки и подключения родителя использовать нельзя"""
+    global _executor, _local
+    _executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="db")
+    _local = threading.local()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def connect() -> sqlite3.Connection:
+    """Новое подключение с настройками для конкурентного доступа"""
+    conn = sqlite3.connect(DB_PATH, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+    conn.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    return conn
+
+
+def get_connection() -> sqlite3.Connection:
+    """Подключение текущего потока пула (создаётся при первом использовании)"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = connect()
+        _local.conn = conn
+    return conn
+
+
+def _call(fn: Callable, *args) -> Any:
+    conn = get_connection()
+    try:
+        result = fn(conn, *args)
+        conn.commit()
+        return result
+    except Exception:
+        conn.rollback()
+        raise
+
+
+async def run(fn: Callable, *args) -> Any:
+    """
+    Выполнить fn(conn, *args) в пуле БД
+
+    После успешного выполнения транзакция фиксируется, при исключении - откатывается.
+    Для read-modify-write внутри fn используйте conn.execute("BEGIN IMMEDIATE").
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, functools.partial(ctx.run, _call, fn, *args))
+
+
+async def fetchone(sql: str, params: Sequence = ()) -> Optional[tuple]:
+    return await run(lambda conn: conn.execute(sql, params).fetchone())
+
+
+async def fetchall(sql: str, params: Sequence = ()) -> List[tuple]:
+    return await run(lambda conn: conn.execute(sql, params).fetchall())
+
+
+async def execute(sql: str, params: Sequence = ()) -> int:
+    """Выполнить запрос на запись; возвращает lastrowid"""
+    return await run(lambda conn: conn.execute(sql, params).lastrowid)
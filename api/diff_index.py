@@ -0,0 +1,281 @@
+"""
+Индекс unified diff: файлы, hunks, диапазоны строк и байтовые смещения
+
+Индекс строится один раз на diff (по sha256 блоба в artifact_store) и хранится
+рядом с блобом ({sha}.index.json), в процессе - LRU кэш разобранных индексов.
+По смещениям можно читать отдельный файл или диапазон hunks без чтения всего diff.
+
+Формат hunk в индексе (компактный список): [offset, length, old_start, old_lines, new_start, new_lines]
+"""
+import json
+import logging
+import os
+import re
+import threading
+import uuid
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+import artifact_store
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = artifact_store.INDEX_SUFFIX
+DIFF_INDEX_CACHE_SIZE = int(os.getenv("DIFF_INDEX_CACHE_SIZE", "64"))
+
+HUNK_FIELDS = ("offset", "length", "old_start", "old_lines", "new_start", "new_lines")
+_HUNK_RE = re.compile(rb"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+def _decode_path(raw: bytes) -> Optional[str]:
+    path = raw.decode("utf-8", errors="replace").split("\t")[0].strip()
+    if path == "/dev/null":
+        return None
+    if path.startswith(("a/", "b/")):
+        path = path[2:]
+    return path
+
+
+class _IndexBuilder:
+    """Потоковый разбор diff построчно (в памяти - только индекс)"""
+
+    def __init__(self):
+        self.files: List[Dict[str, Any]] = []
+        self.file: Optional[Dict[str, Any]] = None
+        self.hunk: Optional[list] = None
+        self.old_left = 0
+        self.new_left = 0
+        self.offset = 0
+
+    def _close_hunk(self):
+        if self.hunk is not None:
+            self.hunk[1] = self.offset - self.hunk[0]
+            self.hunk = None
+            self.old_left = self.new_left = 0
+
+    def _close_file(self):
+        self._close_hunk()
+        if self.file is not None:
+            self.file["length"] = self.offset - self.file["offset"]
+            self.file = None
+
+    def _open_file(self):
+        self._close_file()
+        self.file = {
+            "path": None, "old_path": None, "status": "modified",
+            "offset": self.offset, "length": 0,
+            "additions": 0, "deletions": 0, "hunks": [],
+        }
+        self.files.append(self.file)
+
+    def _hunk_line(self, line: bytes) -> bool:
+        """Строка тела hunk; False - строка не относится к hunk"""
+        tag = line[:1]
+        if tag in (b" ", b""):
+            # Пустая строка - контекст, у которого редактор обрезал пробел
+            self.old_left -= 1
+            self.new_left -= 1
+        elif tag == b"-":
+            self.old_left -= 1
+            self.file["deletions"] += 1
+        elif tag == b"+":
+            self.new_left -= 1
+            self.file["additions"] += 1
+        elif tag == b"\\":
+            pass
+        else:
+            return False
+        return True
+
+    def feed(self, raw: bytes):
+        line = raw.rstrip(b"\r\n")
+        if self.hunk is not None:
+            if (self.old_left > 0 or self.new_left > 0) and self._hunk_line(line):
+                self.offset += len(raw)
+                return
+            if line.startswith(b"\\"):
+                # "\ No newline at end of file" после последней строки hunk
+                self.offset += len(raw)
+                return
+            self._close_hunk()
+
+        if line.startswith(b"diff --git "):
+            self._open_file()
+            parts = line[len(b"diff --git "):].split(b" b/", 1)
+            if len(parts) == 2:
+                self.file["old_path"] = _decode_path(parts[0])
+                self.file["path"] = parts[1].decode("utf-8", errors="replace")
+        elif line.startswith(b"--- ") and (self.file is None or self.file["hunks"]):
+            # diff без заголовков git: файл начинается с "---"
+            self._open_file()
+            self.file["old_path"] = _decode_path(line[4:])
+        elif self.file is not None:
+            match = _HUNK_RE.match(line)
+            if match:
+                old_start, old_lines, new_start, new_lines = match.groups()
+                old_lines = int(old_lines) if old_lines is not None else 1
+                new_lines = int(new_lines) if new_lines is not None else 1
+                self.hunk = [self.offset, 0, int(old_start), old_lines, int(new_start), new_lines]
+                self.file["hunks"].append(self.hunk)
+                self.old_left, self.new_left = old_lines, new_lines
+            elif line.startswith(b"--- "):
+                self.file["old_path"] = _decode_path(line[4:])
+                if self.file["old_path"] is None:
+                    self.file["status"] = "added"
+            elif line.startswith(b"+++ "):
+                path = _decode_path(line[4:])
+                if path is None:
+                    self.file["status"] = "deleted"
+                else:
+                    self.file["path"] = path
+            elif line.startswith(b"new file mode"):
+                self.file["status"] = "added"
+            elif line.startswith(b"deleted file mode"):
+                self.file["status"] = "deleted"
+            elif line.startswith(b"rename from") or line.startswith(b"rename to"):
+                self.file["status"] = "renamed"
+            elif line.startswith(b"Binary files"):
+                self.file["status"] = "binary"
+        self.offset += len(raw)
+
+    def finish(self) -> Dict[str, Any]:
+        self._close_file()
+        for f in self.files:
+            if f["path"] is None:
+                f["path"] = f["old_path"]
+        return {"version": INDEX_VERSION, "size": self.offset, "files": self.files}
+
+
+def build_index(fp: BinaryIO) -> Dict[str, Any]:
+    builder = _IndexBuilder()
+    for raw in fp:
+        builder.feed(raw)
+    return builder.finish()
+
+
+class DiffIndex:
+    """Разобранный индекс с поиском по файлу и строке"""
+
+    def __init__(self, sha: str, data: Dict[str, Any]):
+        self.sha = sha
+        self.size = data["size"]
+        self.files = data["files"]
+        self._by_path = {f["path"]: i for i, f in enumerate(self.files) if f["path"]}
+        # Начала hunks в новом файле - для bisect (hunks в diff идут по возрастанию строк)
+        self._new_starts = [[h[4] for h in f["hunks"]] for f in self.files]
+
+    def file_index(self, path: str) -> Optional[int]:
+        return self._by_path.get(path)
+
+    def locate(self, path: str, new_line: int) -> Optional[Tuple[int, int]]:
+        """(file_index, hunk_index) для строки нового файла - O(log n) по числу hunks"""
+        file_idx = self._by_path.get(path)
+        if file_idx is None:
+            return None
+        hunk_idx = bisect_right(self._new_starts[file_idx], new_line) - 1
+        if hunk_idx < 0:
+            return None
+        hunk = self.files[file_idx]["hunks"][hunk_idx]
+        if new_line >= hunk[4] + hunk[5]:
+            return None
+        return file_idx, hunk_idx
+
+    def section(self, file_idx: int, hunk_from: int = 0, hunk_to: Optional[int] = None) -> List[Tuple[int, int]]:
+        """
+        Байтовые диапазоны [(offset, length)] для файла или диапазона его hunks
+
+        Заголовок файла (diff --git, ---/+++) включается всегда - фрагмент остаётся валидным патчем.
+        """
+        f = self.files[file_idx]
+        hunks = f["hunks"]
+        if not hunks or (hunk_from == 0 and (hunk_to is None or hunk_to >= len(hunks))):
+            return [(f["offset"], f["length"])]
+        selected = hunks[hunk_from:hunk_to]
+        if not selected:
+            return []
+        header = (f["offset"], hunks[0][0] - f["offset"])
+        start = selected[0][0]
+        end = selected[-1][0] + selected[-1][1]
+        return [header, (start, end - start)]
+
+    def file_summary(self, file_idx: int) -> Dict[str, Any]:
+        f = self.files[file_idx]
+        return {
+            "index": file_idx,
+            "path": f["path"],
+            "old_path": f["old_path"],
+            "status": f["status"],
+            "additions": f["additions"],
+            "deletions": f["deletions"],
+            "hunks": len(f["hunks"]),
+            "offset": f["offset"],
+            "length": f["length"],
+        }
+
+    @staticmethod
+    def hunk_dict(hunk: list) -> Dict[str, int]:
+        return dict(zip(HUNK_FIELDS, hunk))
+
+
+# === Загрузка с кэшем ===
+
+_cache: "OrderedDict[str, DiffIndex]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def index_path(sha: str) -> str:
+    return artifact_store.blob_path(sha) + INDEX_SUFFIX
+
+
+def _load_or_build(sha: str) -> Optional[Dict[str, Any]]:
+    path = index_path(sha)
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION:
+                return data
+        except (OSError, ValueError) as e:
+            logger.warning(f"[DiffIndex] Broken index for {sha}, rebuilding: {e}")
+
+    blob = artifact_store.blob_path(sha)
+    if not os.path.exists(blob):
+        return None
+    with open(blob, "rb") as f:
+        data = build_index(f)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    logger.info(f"[DiffIndex] Built index for {sha}: {len(data['files'])} files")
+    return data
+
+
+def get_index(sha: str) -> Optional[DiffIndex]:
+    """Индекс diff (блокирующая функция - вызывать в пуле io)"""
+    with _cache_lock:
+        index = _cache.get(sha)
+        if index is not None:
+            _cache.move_to_end(sha)
+            return index
+    data = _load_or_build(sha)
+    if data is None:
+        return None
+    index = DiffIndex(sha, data)
+    with _cache_lock:
+        _cache[sha] = index
+        while len(_cache) > DIFF_INDEX_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return index
+
+
+def read_ranges(sha: str, ranges: List[Tuple[int, int]]) -> bytes:
+    """Прочитать байтовые диапазоны блоба"""
+    chunks = []
+    with open(artifact_store.blob_path(sha), "rb") as f:
+        for offset, length in ranges:
+            f.seek(offset)
+            chunks.append(f.read(length))
+    return b"".join(chunks)
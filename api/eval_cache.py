@@ -0,0 +1,90 @@
+"""
+Общий для всех worker кэш данных оценки в Redis
+
+Golden truth адресуется по sha256 (artifact_store), содержимое по sha не меняется,
+поэтому кэш не инвалидируется - только TTL ограничивает память Redis.
+
+Ключи:
+- eval:golden:{sha}          JSON {"defects": [...], "index": {(file, type): [номера]}}
+- eval:emb:{model}:{sha}     float32 blob эмбеддингов дефектов (строки подряд, порядок defects)
+
+Первый worker, не нашедший ключ, строит и публикует его; остальные (на любом узле) читают готовое.
+"""
+import json
+import logging
+import os
+from array import array
+from typing import Callable, Dict, List, Optional
+
+from redis import Redis
+
+import evaluator
+
+logger = logging.getLogger(__name__)
+
+EVAL_CACHE_TTL = int(os.getenv("EVAL_CACHE_TTL", str(7 * 24 * 3600)))
+
+_redis: Optional[Redis] = None
+
+
+def _get_redis() -> Redis:
+    """Отдельное подключение без decode_responses - эмбеддинги хранятся бинарно"""
+    global _redis
+    if _redis is None:
+        _redis = Redis(host='redis', port=6379, socket_connect_timeout=2, socket_timeout=5)
+    return _redis
+
+
+def golden_key(sha: str) -> str:
+    return f"eval:golden:{sha}"
+
+
+def embeddings_key(sha: str, model: str = evaluator.EMBEDDING_MODEL) -> str:
+    return f"eval:emb:{model}:{sha}"
+
+
+def get_golden(sha: str, load: Callable[[], List[Dict]], redis_conn: Optional[Redis] = None) -> Dict:
+    """Golden truth и индекс по sha; при промахе load() загружает дефекты (internal API)"""
+    redis_conn = redis_conn or _get_redis()
+    try:
+        cached = redis_conn.get(golden_key(sha))
+    except Exception as e:
+        logger.warning(f"[EvalCache] Redis unavailable, building golden index locally: {e}")
+        cached = None
+        redis_conn = None
+    if cached is not None:
+        return json.loads(cached)
+
+    defects = load()
+    entry = {"defects": defects, "index": evaluator.build_index(defects)}
+    if redis_conn is not None:
+        try:
+            redis_conn.set(golden_key(sha), json.dumps(entry), ex=EVAL_CACHE_TTL)
+            logger.info(f"[EvalCache] Published golden index {sha[:12]} ({len(defects)} defects)")
+        except Exception as e:
+            logger.warning(f"[EvalCache] Failed to publish golden index {sha[:12]}: {e}")
+    return entry
+
+
+def get_embeddings(sha: str, defects: List[Dict], redis_conn: Optional[Redis] = None) -> List[array]:
+    """Эмбеддинги дефектов golden truth {sha} (вычисляются один раз на кластер)"""
+    redis_conn = redis_conn or _get_redis()
+    key = embeddings_key(sha)
+    try:
+        blob = redis_conn.get(key)
+    except Exception as e:
+        logger.warning(f"[EvalCache] Redis unavailable, computing embeddings locally: {e}")
+        blob = None
+        redis_conn = None
+    if blob is not None:
+        return evaluator.unpack_embeddings(blob, len(defects))
+
+    vectors = evaluator.embed_many([defect.get("text", "") for defect in defects])
+    if redis_conn is not None:
+        try:
+            redis_conn.set(key, evaluator.pack_embeddings(vectors), ex=EVAL_CACHE_TTL)
+            logger.info(f"[EvalCache] Published embeddings {sha[:12]} ({len(vectors)} x {evaluator.EMBEDDING_MODEL})")
+        except Exception as e:
+            logger.warning(f"[EvalCache] Failed to publish embeddings {sha[:12]}: {e}")
+    return vectors
+
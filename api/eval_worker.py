@@ -1,13 +1,74 @@
 # worker/eval_worker.py
-import json
+# Worker не зависит от файлов API: сессия, golden truth и запись результата - через internal API,
+# индексы и эмбеддинги golden truth - в Redis (eval_cache). Масштабирование - новые контейнеры worker.
 import os
 import logging
-import sqlite3
+from typing import Dict, List, Optional
+import requests
 from redis import Redis
+from rq import get_current_job
+from events import publish_event, session_channel, job_channel
+import eval_cache
+import evaluator
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+INTERNAL_API_URL = os.getenv("INTERNAL_API_URL", "http://api:8000").rstrip("/")
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN", "")
+INTERNAL_API_TIMEOUT = float(os.getenv("INTERNAL_API_TIMEOUT", "10"))
+# Семантическое сопоставление (эмбеддинги) в дополнение к точному
+EVAL_SEMANTIC_MATCH = os.getenv("EVAL_SEMANTIC_MATCH", "0") == "1"
+
+_http: Optional[requests.Session] = None
+
+
+def _internal_api() -> requests.Session:
+    global _http
+    if _http is None:
+        _http = requests.Session()
+        if INTERNAL_API_TOKEN:
+            _http.headers["X-Internal-Token"] = INTERNAL_API_TOKEN
+    return _http
+
+
+def _fetch_evaluation_input(session_id: int) -> Optional[Dict]:
+    """{"comments": [...], "golden_sha": ...} или None, если сессии нет"""
+    response = _internal_api().get(f"{INTERNAL_API_URL}/api/internal/sessions/{session_id}/evaluation-input", timeout=INTERNAL_API_TIMEOUT)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.json()
+
+
+def _fetch_golden_truth(session_id: int) -> List[Dict]:
+    response = _internal_api().get(f"{INTERNAL_API_URL}/api/internal/sessions/{session_id}/golden-truth", timeout=INTERNAL_API_TIMEOUT)
+    if response.status_code == 404:
+        logger.warning(f"[Worker] Golden truth not found for session {session_id}, using empty list")
+        return []
+    response.raise_for_status()
+    return response.json()
+
+
+def _post_evaluation(session_id: int, score: float, grade: str, report: str):
+    response = _internal_api().post(
+        f"{INTERNAL_API_URL}/api/internal/sessions/{session_id}/evaluation",
+        json={"score": score, "grade": grade, "report": report},
+        timeout=INTERNAL_API_TIMEOUT,
+    )
+    response.raise_for_status()
+
+
+def _publish_progress(redis_conn, session_id: int, status: str, stage: str, progress: float, **extra):
+    """Публикуем прогресс оценки в канал задачи (SSE /api/jobs/{job_id}/events)"""
+    job = get_current_job()
+    if job is None:
+        return
+    data = {"job_id": job.id, "session_id": session_id, "status": status, "stage": stage, "progress": progress}
+    data.update(extra)
+    publish_event(job_channel(job.id), "status", data, redis_conn=redis_conn)
+
+
 def evaluate(session_id: int):
     logger.info(f"[Worker] Starting evaluation for session {session_id}")
 
@@ -20,82 +81,73 @@ def evaluate(session_id: int):
         logger.error(f"[Worker] Cannot connect to Redis: {e}")
         return
 
-    # 1. Читаем сессию
-    # Используем тот же путь к БД, что и в main.py
-    DB_PATH = "/app/reviews.db"
+    _publish_progress(redis_conn, session_id, "started", "loading", 0.0)
+
+    # 1. Данные сессии - через internal API (worker не открывает SQLite и /mr_packages)
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("SELECT comments, mr_package FROM sessions WHERE id = ?", (session_id,))
-        result = c.fetchone()
-        conn.close()
-        if not result:
-            logger.error(f"[Worker] Session {session_id} not found in DB")
-            return
-        comments_json, mr_package = result
-        comments = json.loads(comments_json) if comments_json else []
-        logger.info(f"[Worker] Loaded session {session_id}, {len(comments)} comments, mr_package={mr_package}")
-    except Exception as e:
-        logger.error(f"[Worker] DB error: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
+        data = _fetch_evaluation_input(session_id)
+    except requests.RequestException as e:
+        # API недоступен (деплой) - задача упадёт и будет повторена RQ
+        logger.error(f"[Worker] Internal API error: {e}")
+        _publish_progress(redis_conn, session_id, "finished", "error", 1.0, error="Internal API unavailable")
+        raise
+    if data is None:
+        logger.error(f"[Worker] Session {session_id} not found")
+        _publish_progress(redis_conn, session_id, "finished", "error", 1.0, error="Session not found")
         return
+    comments = data["comments"]
+    golden_sha = data["golden_sha"]
+    logger.info(f"[Worker] Loaded session {session_id}, {len(comments)} comments, golden_sha={golden_sha}")
 
-    # 2. golden_truth.json
-    gt_path = f"/mr_packages/{mr_package}/golden_truth.json"
-    logger.info(f"[Worker] Looking for golden_truth at: {gt_path}")
-    if not os.path.exists(gt_path):
-        logger.warning(f"[Worker] Golden truth not found: {gt_path}, using empty list")
-        gt = []
-    else:
-        try:
-            with open(gt_path, "r") as f:
-                gt = json.load(f)
-                logger.info(f"[Worker] Loaded {len(gt)} golden truth items")
-        except Exception as e:
-            logger.error(f"[Worker] Failed to read golden_truth: {e}")
-            gt = []
+    # 2. Golden truth и индекс - из общего кэша в Redis (промах - загрузка через API и публикация)
+    try:
+        if golden_sha:
+            golden = eval_cache.get_golden(golden_sha, lambda: _fetch_golden_truth(session_id))
+        else:
+            # Старые сессии без блоба в хранилище - без кэша
+            defects = _fetch_golden_truth(session_id)
+            golden = {"defects": defects, "index": evaluator.build_index(defects)}
+    except requests.RequestException as e:
+        logger.error(f"[Worker] Failed to load golden truth: {e}")
+        _publish_progress(redis_conn, session_id, "finished", "error", 1.0, error="Internal API unavailable")
+        raise
+    gt = golden["defects"]
+    logger.info(f"[Worker] Loaded {len(gt)} golden truth items")
 
-    # 3. Оценка
-    tp = []
-    fp = []
-    fn = gt.copy()
-
-    for comment in comments:
-        matched = False
-        for defect in gt:
-            if (comment["file"] == defect["file"] and
-                comment["line_range"] == defect["line_range"] and
-                comment["type"] == defect["type"]):
-                tp.append(defect)
-                if defect in fn:
-                    fn.remove(defect)
-                matched = True
-                break
-        if not matched:
-            fp.append(comment)
+    embeddings = None
+    if EVAL_SEMANTIC_MATCH:
+        embeddings = eval_cache.get_embeddings(golden_sha, gt) if golden_sha else evaluator.embed_many([d.get("text", "") for d in gt])
+
+    _publish_progress(redis_conn, session_id, "started", "matching", 0.3)
 
+    # 3. Оценка
+    result = evaluator.evaluate_comments(comments, gt, golden["index"], embeddings)
+    tp, fp, fn = result["tp"], result["fp"], result["fn"]
     total = len(tp) + len(fp) + len(fn)
-    score = len(tp) / total if total > 0 else 0
-    grade = "Junior" if score < 0.45 else "Middle" if score < 0.70 else "Senior"
-    
-    # 4. Отчёт
-    report_path = f"/artifacts/{session_id}_report.txt"
+    score, grade = result["score"], result["grade"]
+
+    _publish_progress(redis_conn, session_id, "started", "report", 0.8)
+
+    # 4. Отчёт и оценка сохраняются на стороне API (файл отчёта, session_summaries)
+    report = (
+        f"Evaluation Report for Session #{session_id}\n"
+        f"{'='*50}\n\n"
+        f"True Positives (TP): {len(tp)}\n"
+        f"False Positives (FP): {len(fp)}\n"
+        f"False Negatives (FN): {len(fn)}\n"
+        f"Total: {total}\n\n"
+        f"Score: {score:.3f}\n"
+        f"Grade: {grade}\n"
+    )
     try:
-        with open(report_path, "w", encoding="utf-8") as f:
-            f.write(f"Evaluation Report for Session #{session_id}\n")
-            f.write(f"{'='*50}\n\n")
-            f.write(f"True Positives (TP): {len(tp)}\n")
-            f.write(f"False Positives (FP): {len(fp)}\n")
-            f.write(f"False Negatives (FN): {len(fn)}\n")
-            f.write(f"Total: {total}\n\n")
-            f.write(f"Score: {score:.3f}\n")
-            f.write(f"Grade: {grade}\n")
-        logger.info(f"[Worker] Report saved successfully: {report_path}")
-    except Exception as e:
+        _post_evaluation(session_id, round(score, 3), grade, report)
+        logger.info(f"[Worker] Report saved successfully for session {session_id}")
+    except requests.RequestException as e:
         logger.error(f"[Worker] Failed to save report: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
-        return
+        _publish_progress(redis_conn, session_id, "finished", "error", 1.0, error="Failed to save report")
+        raise
+
+    logger.info(f"[Worker] Evaluation complete: score={score:.3f}, grade={grade}, TP={len(tp)}, FP={len(fp)}, FN={len(fn)}")
 
-    logger.info(f"[Worker] Evaluation complete: score={score:.3f}, grade={grade}, TP={len(tp)}, FP={len(fp)}, FN={len(fn)}")
\ No newline at end of file
+    _publish_progress(redis_conn, session_id, "finished", "done", 1.0, score=round(score, 3), grade=grade)
+    publish_event(session_channel(session_id), "evaluation_finished", {"session_id": session_id, "score": round(score, 3), "grade": grade}, redis_conn=redis_conn)
@@ -1,38 +1,165 @@
-from sentence_transformers import SentenceTransformer, util
-import json
-from difflib import SequenceMatcher
+"""
+Сопоставление комментариев кандидата с golden truth (чистые функции, без I/O)
+
+- exact: файл, line_range и тип совпадают (правило оценки по умолчанию)
+- semantic: если точного совпадения нет - тот же файл и тип, пересекающиеся
+  диапазоны строк и близкий текст (косинус эмбеддингов >= SEMANTIC_THRESHOLD)
+
+Индекс golden truth ((file, type) -> номера дефектов) и эмбеддинги дефектов
+строятся один раз на golden_sha и хранятся в Redis (см. eval_cache).
+
+Эмбеддинги: по умолчанию хэшированные символьные триграммы (без зависимостей),
+EVAL_EMBEDDING_MODEL=<имя модели sentence-transformers> - нейросетевая модель
+(пакет ставится отдельно, в requirements.txt его нет).
+"""
+import math
 import os
+import zlib
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+HASH_MODEL = "hash-trigram-256"
+EMBEDDING_MODEL = os.getenv("EVAL_EMBEDDING_MODEL", HASH_MODEL)
+HASH_DIM = 256
+SEMANTIC_THRESHOLD = float(os.getenv("EVAL_SEMANTIC_THRESHOLD", "0.7"))
+
+_model = None
+
+
+# === Индекс golden truth ===
+
+def index_key(file: str, type_: str) -> str:
+    return f"{file}\n{type_}"
+
+
+def build_index(golden_truth: List[Dict]) -> Dict[str, List[int]]:
+    """(file, type) -> номера дефектов в порядке golden truth"""
+    index: Dict[str, List[int]] = {}
+    for i, defect in enumerate(golden_truth):
+        index.setdefault(index_key(defect.get("file"), defect.get("type")), []).append(i)
+    return index
+
+
+def parse_range(line_range) -> Optional[Tuple[int, int]]:
+    """'10-15' / '10' / [10, 15] -> (10, 15)"""
+    try:
+        if isinstance(line_range, (list, tuple)):
+            start, end = int(line_range[0]), int(line_range[-1])
+        else:
+            start, _, end = str(line_range).partition("-")
+            start, end = int(start), int(end or start)
+    except (ValueError, IndexError):
+        return None
+    return (start, end) if start <= end else (end, start)
+
+
+def ranges_overlap(a, b) -> bool:
+    a, b = parse_range(a), parse_range(b)
+    return a is not None and b is not None and a[0] <= b[1] and b[0] <= a[1]
+
+
+# === Эмбеддинги ===
+
+def _hash_embed(text: str) -> array:
+    vector = array("f", bytes(4 * HASH_DIM))
+    padded = f"  {(text or '').lower()} "
+    for i in range(len(padded) - 2):
+        h = zlib.crc32(padded[i:i + 3].encode("utf-8"))
+        # Старший бит - знак: коллизии триграмм частично гасят друг друга
+        vector[h % HASH_DIM] += -1.0 if h & 0x80000000 else 1.0
+    norm = math.sqrt(sum(x * x for x in vector))
+    if norm:
+        for i in range(HASH_DIM):
+            vector[i] /= norm
+    return vector
+
 
-model = SentenceTransformer('all-MiniLM-L6-v2')  # Легкая модель
-
-def evaluate_comments(session_id, comments, mr_package_path):
-    gt_path = os.path.join(mr_package_path, 'golden_truth.json')
-    with open(gt_path, 'r') as f:
-        golden_truth = json.load(f)  # list of defects: {'file':, 'line_range':, 'type':, 'text':, ...}
-
-    tp, fp, fn = [], [], golden_truth.copy()
-    for comment in comments:
-        matched = False
-        for defect in golden_truth:
-            # (a) Anchor match: check file == and line_range overlap (custom func)
-            if not anchor_match(comment['file'], comment['line_range'], defect['file'], defect['line_range']):
-                continue
-            # (b) Key labels: if comment['type'] in defect['labels']
-            if comment['type'] not in defect.get('labels', []):
-                continue
-            # (c) Semantic: fuzzy + embedding
-            fuzzy_ratio = SequenceMatcher(None, comment['text'], defect['text']).ratio()
-            emb1 = model.encode(comment['text'])
-            emb2 = model.encode(defect['text'])
-            cos_sim = util.cos_sim(emb1, emb2)[0][0]
-            if fuzzy_ratio > 0.6 or cos_sim > 0.7:
-                tp.append(defect)
-                fn.remove(defect)
-                matched = True
-                break
-        if not matched:
+def _get_model():
+    global _model
+    if _model is None:
+        from sentence_transformers import SentenceTransformer  # опциональная зависимость
+        _model = SentenceTransformer(EMBEDDING_MODEL)
+    return _model
+
+
+def embed_many(texts: Sequence[str]) -> List[array]:
+    """Нормированные float32 векторы (косинус = скалярное произведение)"""
+    if EMBEDDING_MODEL == HASH_MODEL:
+        return [_hash_embed(text) for text in texts]
+    if not texts:
+        return []
+    encoded = _get_model().encode(list(texts), normalize_embeddings=True)
+    return [array("f", row.tolist()) for row in encoded]
+
+
+def pack_embeddings(vectors: Sequence[array]) -> bytes:
+    """Векторы одной размерности -> один float32 blob (строки подряд)"""
+    packed = array("f")
+    for vector in vectors:
+        packed.extend(vector)
+    return packed.tobytes()
+
+
+def unpack_embeddings(blob: bytes, count: int) -> List[array]:
+    packed = array("f")
+    packed.frombytes(blob)
+    if count == 0:
+        return []
+    dim = len(packed) // count
+    return [packed[i * dim:(i + 1) * dim] for i in range(count)]
+
+
+def cosine(a: array, b: array) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+
+# === Сопоставление ===
+
+def match_comments(comments: List[Dict], golden_truth: List[Dict],
+                   index: Optional[Dict[str, List[int]]] = None,
+                   embeddings: Optional[List[array]] = None) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+    """
+    TP (дефекты), FP (комментарии), FN (ненайденные дефекты)
+
+    embeddings - эмбеддинги дефектов (в порядке golden truth); без них только точное сравнение
+    """
+    if index is None:
+        index = build_index(golden_truth)
+    tp, fp = [], []
+    found = set()
+    comment_vectors = None
+    if embeddings is not None:
+        comment_vectors = embed_many([comment.get("text", "") for comment in comments])
+
+    for n, comment in enumerate(comments):
+        candidates = index.get(index_key(comment.get("file"), comment.get("type")), [])
+        matched = next((i for i in candidates if golden_truth[i].get("line_range") == comment.get("line_range")), None)
+        if matched is None and comment_vectors is not None:
+            best = SEMANTIC_THRESHOLD
+            for i in candidates:
+                if not ranges_overlap(comment.get("line_range"), golden_truth[i].get("line_range")):
+                    continue
+                similarity = cosine(comment_vectors[n], embeddings[i])
+                if similarity >= best:
+                    matched, best = i, similarity
+        if matched is None:
             fp.append(comment)
+            continue
+        tp.append(golden_truth[matched])
+        found.add(matched)
+
+    fn = [defect for i, defect in enumerate(golden_truth) if i not in found]
+    return tp, fp, fn
+
+
+def grade_for(score: float) -> str:
+    return "Junior" if score < 0.45 else "Middle" if score < 0.70 else "Senior"
+
 
-    # Compute score по рубрике (весам)
-    score = calculate_score(tp, fp, fn, rubric)  # ваша логика
-    return {'tp': tp, 'fp': fp, 'fn': fn, 'score': score}
\ No newline at end of file
+def evaluate_comments(comments: List[Dict], golden_truth: List[Dict],
+                      index: Optional[Dict[str, List[int]]] = None,
+                      embeddings: Optional[List[array]] = None) -> Dict:
+    tp, fp, fn = match_comments(comments, golden_truth, index, embeddings)
+    total = len(tp) + len(fp) + len(fn)
+    score = len(tp) / total if total > 0 else 0
+    return {"tp": tp, "fp": fp, "fn": fn, "score": score, "grade": grade_for(score)}
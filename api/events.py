@@ -0,0 +1,227 @@
+"""
+Шина событий на Redis pub/sub и Server-Sent Events
+
+Публикация: publish_event_async() - из обработчиков API (не блокирует event loop),
+publish_event() - синхронно, из RQ worker
+Подписка: EventBroker - одна Redis подписка на процесс API, которая
+раздаёт события всем открытым SSE соединениям (fan-out в памяти)
+"""
+import asyncio
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional, Set
+
+from redis import Redis
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "events:"
+# Интервал heartbeat для SSE (прокси закрывают "молчащие" соединения)
+SSE_HEARTBEAT_SECONDS = 15
+# Максимум событий в очереди одного подписчика (медленные клиенты не должны копить память)
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def session_channel(session_id: int) -> str:
+    """Канал событий сессии"""
+    return f"{CHANNEL_PREFIX}session:{session_id}"
+
+
+def job_channel(job_id: str) -> str:
+    """Канал событий RQ задачи"""
+    return f"{CHANNEL_PREFIX}job:{job_id}"
+
+
+def bulk_channel(batch_id: str) -> str:
+    """Канал событий пакетного создания сессий"""
+    return f"{CHANNEL_PREFIX}bulk:{batch_id}"
+
+
+# === Публикация ===
+_publisher: Optional[Redis] = None
+_async_publisher: Optional[aioredis.Redis] = None
+
+
+def _get_publisher() -> Redis:
+    """Отдельное подключение для публикации: короткие таймауты, без retry (события не должны тормозить запросы)"""
+    global _publisher
+    if _publisher is None:
+        _publisher = Redis(host='redis', port=6379, socket_connect_timeout=1, socket_timeout=1)
+    return _publisher
+
+
+def event_message(event: str, data: Dict[str, Any]) -> str:
+    """Сообщение события в канале: {"event", "data", "ts"}"""
+    return json.dumps({"event": event, "data": data, "ts": time.time()}, default=str)
+
+
+def publish_event(channel: str, event: str, data: Dict[str, Any], redis_conn: Optional[Redis] = None) -> bool:
+    """
+    Опубликовать событие в канал
+
+    Args:
+        channel: Канал (session_channel / job_channel)
+        event: Тип события (comment_added, candidate_ready, status, ...)
+        data: Данные события (JSON-сериализуемые)
+        redis_conn: Подключение к Redis (по умолчанию - общее подключение процесса)
+
+    Returns:
+        True если событие опубликовано
+    """
+    try:
+        (redis_conn or _get_publisher()).publish(channel, event_message(event, data))
+        return True
+    except Exception as e:
+        # Ошибка публикации не должна ломать основной запрос - клиенты получат данные при следующей загрузке
+        logger.warning(f"Failed to publish event {event} to {channel}: {e}")
+        return False
+
+
+def _get_async_publisher() -> aioredis.Redis:
+    global _async_publisher
+    if _async_publisher is None:
+        _async_publisher = aioredis.Redis(host='redis', port=6379, socket_connect_timeout=1, socket_timeout=1)
+    return _async_publisher
+
+
+async def publish_event_async(channel: str, event: str, data: Dict[str, Any]) -> bool:
+    """То же для обработчиков API: медленный или недоступный Redis не останавливает event loop"""
+    try:
+        await _get_async_publisher().publish(channel, event_message(event, data))
+        return True
+    except Exception as e:
+        logger.warning(f"Failed to publish event {event} to {channel}: {e}")
+        return False
+
+
+async def close_publisher():
+    """Закрыть async подключение публикации (при остановке приложения)"""
+    global _async_publisher
+    if _async_publisher is not None:
+        await _async_publisher.aclose()
+        _async_publisher = None
+
+
+def format_sse(event: str, data: Any, event_id: Optional[str] = None) -> str:
+    """Сформировать SSE сообщение"""
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    payload = data if isinstance(data, str) else json.dumps(data, default=str)
+    for line in payload.splitlines() or [""]:
+        lines.append(f"data: {line}")
+    return "\n".join(lines) + "\n\n"
+
+
+SSE_HEARTBEAT = ": ping\n\n"
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",  # Отключаем буферизацию в nginx
+}
+
+
+# === Подписка ===
+class EventBroker:
+    """
+    Fan-out событий внутри процесса API
+
+    Одна подписка psubscribe("events:*") на процесс, сколько бы SSE клиентов ни было открыто.
+    Каждый клиент получает собственную asyncio.Queue.
+    """
+
+    def __init__(self, host: str = 'redis', port: int = 6379):
+        self.host = host
+        self.port = port
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._redis: Optional[aioredis.Redis] = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def _ensure_listener(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._listen())
+
+    async def _listen(self):
+        """Читаем Redis pub/sub и раздаём сообщения подписчикам (с переподключением)"""
+        retry_delay = 1
+        while True:
+            pubsub = None
+            try:
+                if self._redis is None:
+                    self._redis = aioredis.Redis(host=self.host, port=self.port, socket_connect_timeout=2)
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                await pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+                logger.info("Event broker subscribed to Redis pub/sub")
+                retry_delay = 1
+                async for message in pubsub.listen():
+                    if message.get("type") != "pmessage":
+                        continue
+                    channel = message["channel"]
+                    if isinstance(channel, bytes):
+                        channel = channel.decode("utf-8")
+                    queues = self._subscribers.get(channel)
+                    if not queues:
+                        continue
+                    try:
+                        payload = json.loads(message["data"])
+                    except (TypeError, ValueError):
+                        logger.warning(f"Invalid event payload in {channel}")
+                        continue
+                    for queue in list(queues):
+                        try:
+                            queue.put_nowait(payload)
+                        except asyncio.QueueFull:
+                            # Медленный клиент - пропускаем событие, клиент догрузит состояние сам
+                            logger.warning(f"Dropping event for slow subscriber on {channel}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Event broker connection lost: {e}, reconnecting in {retry_delay}s")
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 30)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+
+    @asynccontextmanager
+    async def subscribe(self, channel: str):
+        """Подписаться на канал; возвращает asyncio.Queue с событиями"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.setdefault(channel, set()).add(queue)
+        self._ensure_listener()
+        try:
+            yield queue
+        finally:
+            queues = self._subscribers.get(channel)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[channel]
+
+    async def close(self):
+        """Остановить слушателя (при остановке приложения)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+
+event_broker = EventBroker()
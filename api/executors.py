@@ -0,0 +1,65 @@
+"""
+Выделенные пулы для блокирующей работы из async handlers
+
+- io: запись файлов, распаковка zip
+- render: генерация PDF (WeasyPrint грузит CPU - отдельные процессы, чтобы не держать GIL API)
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+IO_WORKERS = int(os.getenv("IO_WORKERS", "8"))
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+
+io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
+_render_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _reset_after_fork():
+    """Дочерний процесс: пулы родителя (потоки, процессы рендера) не наследуются"""
+    global io_executor, _render_executor
+    io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
+    _render_executor = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _get_render_executor() -> ProcessPoolExecutor:
+    global _render_executor
+    if _render_executor is None:
+        # spawn: дочерние процессы не наследуют потоки и event loop API
+        _render_executor = ProcessPoolExecutor(
+            max_workers=RENDER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _render_executor
+
+
+async def run_io(fn: Callable, *args, **kwargs) -> Any:
+    """Выполнить блокирующую I/O функцию в пуле io"""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(io_executor, functools.partial(ctx.run, fn, *args, **kwargs))
+
+
+async def run_render(fn: Callable, *args) -> Any:
+    """Выполнить CPU-тяжёлую функцию в пуле процессов (fn и аргументы должны сериализоваться pickle)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_render_executor(), fn, *args)
+
+
+def shutdown():
+    """Остановить пулы (при остановке приложения)"""
+    global _render_executor
+    if _render_executor is not None:
+        _render_executor.shutdown(wait=False, cancel_futures=True)
+        _render_executor = None
+    io_executor.shutdown(wait=False, cancel_futures=True)
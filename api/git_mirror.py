@@ -0,0 +1,258 @@
+"""
+Локальные bare-зеркала репозиториев Gitea
+
+Зеркало ({GIT_MIRRORS_DIR}/{owner}/{repo}.git) создаётся и обновляется RQ задачей sync_mirror
+в очереди MIRROR_QUEUE (worker рядом с /artifacts): первый раз - git clone --mirror,
+дальше - инкрементальный git fetch. Diff PR, его индекс (файлы, hunks, строки - см. diff_index)
+и содержимое файлов вычисляются из зеркала:
+
+- diff адресуется парой коммитов (base, head) и хранится в {owner}/{repo}.cache/ -
+  повторный просмотр PR без новых коммитов читает файл с диска
+- файлы читаются из объектов git по SHA коммита (неизменяемы)
+
+Нет нужных коммитов (зеркало ещё не создано или отстаёт) - функции возвращают None,
+вызывающий берёт diff из Gitea по HTTP и ставит обновление зеркала в очередь.
+"""
+import fcntl
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Tuple
+
+import diff_index
+
+logger = logging.getLogger(__name__)
+
+GIT_MIRROR_ENABLED = os.getenv("GIT_MIRROR_ENABLED", "1") == "1"
+GIT_MIRRORS_DIR = os.getenv("GIT_MIRRORS_DIR", "/artifacts/mirrors")
+MIRROR_QUEUE = os.getenv("GIT_MIRROR_QUEUE", "mirrors")
+# clone/fetch (с), diff и чтение файла (с)
+GIT_FETCH_TIMEOUT = int(os.getenv("GIT_MIRROR_FETCH_TIMEOUT", "300"))
+GIT_LOCAL_TIMEOUT = int(os.getenv("GIT_MIRROR_LOCAL_TIMEOUT", "30"))
+# Разобранные индексы diff в памяти процесса
+DIFF_CACHE_SIZE = int(os.getenv("GIT_MIRROR_DIFF_CACHE_SIZE", "64"))
+
+_SHA_RE = re.compile(r"^[0-9a-f]{40}(?:[0-9a-f]{24})?$")
+_NAME_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+# Счётчики процесса: diff из кэша / вычислен из зеркала / нет коммитов в зеркале
+_counters = {"diff_cached": 0, "diff_computed": 0, "diff_unavailable": 0, "fetches": 0, "clones": 0}
+_counters_lock = threading.Lock()
+
+_indexes: "OrderedDict[str, diff_index.DiffIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+class MirrorError(Exception):
+    pass
+
+
+def _count(name: str):
+    with _counters_lock:
+        _counters[name] += 1
+
+
+def _check_name(value: str) -> str:
+    # owner/repo - имена Gitea, но попадают в пути на диске
+    if not value or not _NAME_RE.match(value) or value in (".", ".."):
+        raise MirrorError(f"Invalid repository name: {value!r}")
+    return value
+
+
+def _check_sha(sha: str) -> str:
+    if not sha or not _SHA_RE.match(sha):
+        raise MirrorError(f"Invalid commit SHA: {sha!r}")
+    return sha
+
+
+def mirror_path(owner: str, repo: str) -> str:
+    return os.path.join(GIT_MIRRORS_DIR, _check_name(owner), f"{_check_name(repo)}.git")
+
+
+def _cache_dir(owner: str, repo: str) -> str:
+    return os.path.join(GIT_MIRRORS_DIR, _check_name(owner), f"{_check_name(repo)}.cache")
+
+
+def _git(args: list, cwd: Optional[str] = None, timeout: int = GIT_LOCAL_TIMEOUT, remote: bool = False) -> bytes:
+    """Запустить git; stdout как bytes. remote - с токеном Gitea (в заголовке, не в config зеркала)"""
+    # Пути с не-ASCII символами в diff - как есть (UTF-8), иначе индекс получит экранированные имена
+    command = ["git", "-c", "core.quotePath=false"]
+    token = os.getenv("GITEA_ADMIN_TOKEN", "")
+    if remote and token:
+        command += ["-c", f"http.extraHeader=Authorization: token {token}"]
+    env = dict(os.environ, GIT_TERMINAL_PROMPT="0")
+    result = subprocess.run(command + args, cwd=cwd, capture_output=True, timeout=timeout, env=env)
+    if result.returncode != 0:
+        stderr = result.stderr.decode("utf-8", errors="replace").strip()
+        if token:
+            stderr = stderr.replace(token, "***")
+        raise MirrorError(f"git {args[0]} failed ({result.returncode}): {stderr}")
+    return result.stdout
+
+
+@contextmanager
+def _mirror_lock(owner: str, repo: str):
+    """Один clone/fetch зеркала одновременно (между процессами worker)"""
+    lock_path = mirror_path(owner, repo) + ".lock"
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# === Обновление зеркала (RQ задача) ===
+
+def sync_mirror(owner: str, repo: str, clone_url: str, diffs: Iterable[Tuple[str, str]] = ()) -> Dict:
+    """
+    Создать или обновить зеркало репозитория и заранее вычислить diff для пар (base, head)
+
+    Returns:
+        {"status": "cloned" | "fetched", "duration_ms": ..., "diffs": число вычисленных diff}
+    """
+    started = time.perf_counter()
+    path = mirror_path(owner, repo)
+    with _mirror_lock(owner, repo):
+        if os.path.isdir(path):
+            _git(["fetch", "--prune", "--quiet", "origin"], cwd=path, timeout=GIT_FETCH_TIMEOUT, remote=True)
+            status = "fetched"
+            _count("fetches")
+        else:
+            # Клон во временный каталог - читатели не видят наполовину созданное зеркало
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            try:
+                _git(["clone", "--mirror", "--quiet", clone_url, tmp_path], timeout=GIT_FETCH_TIMEOUT, remote=True)
+                os.replace(tmp_path, path)
+            finally:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+            status = "cloned"
+            _count("clones")
+    computed = 0
+    for base_sha, head_sha in diffs:
+        try:
+            if pr_diff_path(owner, repo, base_sha, head_sha):
+                computed += 1
+        except MirrorError as e:
+            logger.warning(f"[GitMirror] Diff {base_sha[:8]}...{head_sha[:8]} for {owner}/{repo} failed: {e}")
+    duration_ms = round((time.perf_counter() - started) * 1000)
+    logger.info(f"[GitMirror] {status} {owner}/{repo} in {duration_ms} ms ({computed} diffs)")
+    return {"status": status, "duration_ms": duration_ms, "diffs": computed}
+
+
+# === Чтение из зеркала ===
+
+def has_commits(owner: str, repo: str, *shas: str) -> bool:
+    path = mirror_path(owner, repo)
+    if not os.path.isdir(path):
+        return False
+    for sha in shas:
+        try:
+            _git(["cat-file", "-e", f"{_check_sha(sha)}^{{commit}}"], cwd=path)
+        except MirrorError:
+            return False
+    return True
+
+
+def _diff_key(base_sha: str, head_sha: str) -> str:
+    return f"{_check_sha(base_sha)}...{_check_sha(head_sha)}"
+
+
+def _diff_path(owner: str, repo: str, base_sha: str, head_sha: str) -> str:
+    return os.path.join(_cache_dir(owner, repo), f"{_diff_key(base_sha, head_sha)}.diff")
+
+
+def has_diff(owner: str, repo: str, base_sha: str, head_sha: str) -> bool:
+    """Diff пары коммитов уже вычислен"""
+    return os.path.exists(_diff_path(owner, repo, base_sha, head_sha))
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def pr_diff_path(owner: str, repo: str, base_sha: str, head_sha: str) -> Optional[str]:
+    """
+    Путь к diff PR (base...head - от merge-base, как diff PR в Gitea) с индексом рядом
+
+    Вычисляется один раз на пару коммитов. None - коммитов нет в зеркале.
+    """
+    key = _diff_key(base_sha, head_sha)
+    path = _diff_path(owner, repo, base_sha, head_sha)
+    if os.path.exists(path):
+        _count("diff_cached")
+        return path
+    if not has_commits(owner, repo, base_sha, head_sha):
+        _count("diff_unavailable")
+        return None
+
+    diff = _git(["diff", "--no-color", "--no-ext-diff", "-M", key], cwd=mirror_path(owner, repo))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Индекс пишется раньше diff: есть diff - есть и индекс
+    _write_atomic(path + diff_index.INDEX_SUFFIX, json.dumps(diff_index.build_index(io.BytesIO(diff)), separators=(",", ":")).encode())
+    _write_atomic(path, diff)
+    _count("diff_computed")
+    return path
+
+
+def pr_diff_index(owner: str, repo: str, base_sha: str, head_sha: str) -> Optional[diff_index.DiffIndex]:
+    """Индекс diff PR (файлы, hunks, строки); None - коммитов нет в зеркале"""
+    key = f"{owner}/{repo}:{_diff_key(base_sha, head_sha)}"
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+    path = pr_diff_path(owner, repo, base_sha, head_sha)
+    if path is None:
+        return None
+    with open(path + diff_index.INDEX_SUFFIX, "r", encoding="utf-8") as f:
+        index = diff_index.DiffIndex(_diff_key(base_sha, head_sha), json.load(f))
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > DIFF_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+
+def read_diff_ranges(owner: str, repo: str, base_sha: str, head_sha: str, ranges) -> bytes:
+    """Байтовые диапазоны diff (см. DiffIndex.section)"""
+    chunks = []
+    with open(_diff_path(owner, repo, base_sha, head_sha), "rb") as f:
+        for offset, length in ranges:
+            f.seek(offset)
+            chunks.append(f.read(length))
+    return b"".join(chunks)
+
+
+def read_file(owner: str, repo: str, sha: str, file_path: str) -> Optional[bytes]:
+    """Содержимое файла в коммите sha; None - нет коммита или файла"""
+    path = mirror_path(owner, repo)
+    if not os.path.isdir(path) or not file_path or "\n" in file_path:
+        return None
+    try:
+        return _git(["cat-file", "blob", f"{_check_sha(sha)}:{file_path.lstrip('/')}"], cwd=path)
+    except MirrorError:
+        return None
+
+
+def stats() -> Dict:
+    with _counters_lock:
+        return dict(_counters)
@@ -3,23 +3,297 @@
 Gitea Client для работы с Gitea REST API
 """
 import requests
+from requests.adapters import HTTPAdapter
+import asyncio
+import contextvars
+import functools
 import logging
+import os
 import secrets
-from typing import Optional, Dict, List
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Optional, Dict, List, Tuple
 import json
 
+from singleflight import ThreadSingleFlight
+
 logger = logging.getLogger(__name__)
 
+# Размер пула HTTP соединений к Gitea (keep-alive вместо нового TCP на каждый запрос)
+GITEA_POOL_SIZE = int(os.getenv("GITEA_POOL_SIZE", "16"))
+
+# === Планировщик запросов к Gitea ===
+# Лимиты на экземпляр Gitea в процессе API (при нескольких процессах gunicorn - делить на их число)
+GITEA_MAX_IN_FLIGHT = int(os.getenv("GITEA_MAX_IN_FLIGHT", "8"))
+# Слоты, которые фоновые запросы не занимают никогда - интерактивным не приходится ждать пачку
+GITEA_INTERACTIVE_RESERVED = int(os.getenv("GITEA_INTERACTIVE_RESERVED", "2"))
+# Token bucket: запросов в секунду (0 - без ограничения) и размер всплеска
+GITEA_RATE_LIMIT = float(os.getenv("GITEA_RATE_LIMIT", "0"))
+GITEA_RATE_BURST = int(os.getenv("GITEA_RATE_BURST", "20"))
+# Дольше ждать в очереди нет смысла - запрос считается неудачным
+GITEA_QUEUE_TIMEOUT = float(os.getenv("GITEA_QUEUE_TIMEOUT", "30"))
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+LANES = (INTERACTIVE, BACKGROUND)
+
+# Приоритет текущего запроса; AsyncGiteaClient переносит контекст в поток пула
+gitea_lane: contextvars.ContextVar = contextvars.ContextVar("gitea_lane", default=INTERACTIVE)
+
+
+@contextmanager
+def background_lane():
+    """Запросы к Gitea внутри блока - фоновые (синхронизации, пакетные операции)"""
+    token = gitea_lane.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        gitea_lane.reset(token)
+
+
+class GiteaOverloaded(requests.exceptions.RequestException):
+    """Запрос не дождался слота планировщика"""
+
+
+class GiteaScheduler:
+    """
+    Ограничение нагрузки на один экземпляр Gitea
+
+    - не больше max_in_flight одновременных запросов, из них фоновых - не больше
+      max_in_flight - interactive_reserved
+    - token bucket (rate запросов/с, burst)
+    - фоновый запрос не стартует, пока в очереди есть интерактивные
+    Потоки ждут на Condition; время ожидания в очереди пишется в метрики по полосам.
+    """
+
+    def __init__(self, max_in_flight: int = GITEA_MAX_IN_FLIGHT, interactive_reserved: int = GITEA_INTERACTIVE_RESERVED,
+                 rate: float = GITEA_RATE_LIMIT, burst: int = GITEA_RATE_BURST, queue_timeout: float = GITEA_QUEUE_TIMEOUT):
+        self.max_in_flight = max(max_in_flight, 1)
+        self.background_limit = max(self.max_in_flight - interactive_reserved, 1)
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self.in_flight = 0
+        self._waiting: Dict[str, int] = {lane: 0 for lane in LANES}
+        self.requests: Dict[str, int] = {lane: 0 for lane in LANES}
+        self.rejected: Dict[str, int] = {lane: 0 for lane in LANES}
+        self._waits: Dict[str, deque] = {lane: deque(maxlen=1000) for lane in LANES}
+
+    def _refill(self, now: float):
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _can_start(self, lane: str) -> bool:
+        if lane == BACKGROUND:
+            if self._waiting[INTERACTIVE] or self.in_flight >= self.background_limit:
+                return False
+        elif self.in_flight >= self.max_in_flight:
+            return False
+        return self.rate <= 0 or self._tokens >= 1
+
+    @contextmanager
+    def slot(self, lane: Optional[str] = None):
+        """Занять слот на время одного HTTP запроса"""
+        lane = lane or gitea_lane.get()
+        started = time.monotonic()
+        deadline = started + self.queue_timeout
+        with self._cond:
+            self._waiting[lane] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._can_start(lane):
+                        break
+                    if now >= deadline:
+                        self.rejected[lane] += 1
+                        raise GiteaOverloaded(f"Gitea scheduler queue timeout ({lane}, {self.queue_timeout}s)")
+                    timeout = deadline - now
+                    if self.rate > 0 and self._tokens < 1:
+                        timeout = min(timeout, (1 - self._tokens) / self.rate)
+                    self._cond.wait(timeout)
+            finally:
+                self._waiting[lane] -= 1
+                if lane == INTERACTIVE:
+                    # Фоновые ждут, пока очередь интерактивных не опустеет
+                    self._cond.notify_all()
+            if self.rate > 0:
+                self._tokens -= 1
+            self.in_flight += 1
+            self.requests[lane] += 1
+            self._waits[lane].append(time.monotonic() - started)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            lanes = {}
+            for lane in LANES:
+                waits = sorted(self._waits[lane])
+                pick = lambda p: round(waits[min(int(len(waits) * p), len(waits) - 1)] * 1000, 2) if waits else 0.0
+                lanes[lane] = {
+                    "requests": self.requests[lane],
+                    "queued": self._waiting[lane],
+                    "rejected": self.rejected[lane],
+                    "wait_p50_ms": pick(0.50),
+                    "wait_p99_ms": pick(0.99),
+                    "wait_max_ms": round(waits[-1] * 1000, 2) if waits else 0.0,
+                }
+            self._refill(time.monotonic())
+            return {
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "background_limit": self.background_limit,
+                "rate": self.rate,
+                "tokens": round(self._tokens, 2) if self.rate > 0 else None,
+                "lanes": lanes,
+            }
+
+
+# Один планировщик на экземпляр Gitea (base_url), общий для всех клиентов процесса
+_schedulers: Dict[str, GiteaScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(base_url: str) -> GiteaScheduler:
+    with _schedulers_lock:
+        if base_url not in _schedulers:
+            _schedulers[base_url] = GiteaScheduler()
+        return _schedulers[base_url]
+
+
+# === Кэш метаданных Gitea ===
+GITEA_CACHE_ENABLED = os.getenv("GITEA_CACHE_ENABLED", "1") == "1"
+GITEA_CACHE_MAX_ENTRIES = int(os.getenv("GITEA_CACHE_MAX_ENTRIES", "4096"))
+# TTL по видам записей (с). С настроенным webhook изменения сбрасываются сразу, TTL - страховка
+GITEA_CACHE_TTLS = {
+    "user": int(os.getenv("GITEA_CACHE_USER_TTL", "3600")),
+    "repo": int(os.getenv("GITEA_CACHE_REPO_TTL", "3600")),
+    "branch": int(os.getenv("GITEA_CACHE_BRANCH_TTL", "60")),
+    "pull": int(os.getenv("GITEA_CACHE_PR_TTL", "60")),
+    # Diff и комментарии адресуются версией PR (head sha / updated_at), TTL только ограничивает память
+    "diff": int(os.getenv("GITEA_CACHE_DIFF_TTL", "3600")),
+    "comments": int(os.getenv("GITEA_CACHE_COMMENTS_TTL", "3600")),
+    "issue_comments": int(os.getenv("GITEA_CACHE_COMMENTS_TTL", "3600")),
+}
+# Записи, которые описывают PR (сбрасываются вместе с ним)
+_PR_KINDS = ("pull", "diff", "comments", "issue_comments")
+
+
+class GiteaCache:
+    """
+    Read-through кэш метаданных Gitea в памяти процесса
+
+    Ключ - (вид, owner, repo, ...); имена в Gitea регистронезависимы, поэтому приводятся к нижнему
+    регистру. Вызовы GiteaClient идут из пула потоков, поэтому доступ под блокировкой.
+    """
+
+    def __init__(self, ttls: Dict[str, int] = GITEA_CACHE_TTLS, max_entries: int = GITEA_CACHE_MAX_ENTRIES):
+        self.ttls = dict(ttls)
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits: Dict[str, int] = {kind: 0 for kind in self.ttls}
+        self.misses: Dict[str, int] = {kind: 0 for kind in self.ttls}
+        self.invalidations = 0
+
+    @staticmethod
+    def key(kind: str, *parts) -> Tuple:
+        return (kind,) + tuple(part.lower() if isinstance(part, str) else part for part in parts)
+
+    def get(self, key: Tuple) -> Tuple[bool, Any]:
+        """(найдено, значение); просроченная запись удаляется"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits[key[0]] += 1
+                return True, entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses[key[0]] += 1
+            return False, None
+
+    def set(self, key: Tuple, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttls[key[0]], value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Tuple):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _drop(self, kinds: Tuple[str, ...], prefix: Tuple) -> int:
+        with self._lock:
+            stale = [key for key in self._entries if key[0] in kinds and key[1:1 + len(prefix)] == prefix]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def invalidate_user(self, username: str) -> int:
+        return self._drop(("user",), self.key("", username)[1:])
+
+    def invalidate_repo(self, owner: str, repo: str) -> int:
+        """Ветки и PR репозитория (после push или изменения файлов); существование репозитория не меняется"""
+        return self._drop(("branch",) + _PR_KINDS, self.key("", owner, repo)[1:])
+
+    def invalidate_pr(self, owner: str, repo: str, pr_index: int) -> int:
+        return self._drop(_PR_KINDS, self.key("", owner, repo, int(pr_index))[1:])
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        kinds = {}
+        for kind in self.ttls:
+            total = self.hits[kind] + self.misses[kind]
+            kinds[kind] = {
+                "hits": self.hits[kind],
+                "misses": self.misses[kind],
+                "hit_rate": self.hits[kind] / total if total else 0.0,
+                "ttl": self.ttls[kind],
+            }
+        hits, misses = sum(self.hits.values()), sum(self.misses.values())
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "invalidations": self.invalidations,
+            "kinds": kinds,
+        }
+
+
 class GiteaClient:
     """Клиент для работы с Gitea REST API"""
     
-    def __init__(self, base_url: str, admin_token: str):
+    def __init__(self, base_url: str, admin_token: str, cache: Optional[GiteaCache] = None,
+                 scheduler: Optional[GiteaScheduler] = None):
         """
         Инициализация клиента
         
         Args:
             base_url: Базовый URL Gitea (например, http://gitea:3000)
             admin_token: API токен администратора Gitea
+            cache: Кэш метаданных (по умолчанию - новый, если GITEA_CACHE_ENABLED)
+            scheduler: Планировщик запросов (по умолчанию - общий для base_url)
         """
         self.base_url = base_url.rstrip('/')
         self.token = admin_token
@@ -28,14 +302,58 @@ class GiteaClient:
             "Content-Type": "application/json",
             "Accept": "application/json"
         }
+        # Session переиспользует соединения; адаптер потокобезопасен для параллельных запросов
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=GITEA_POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.scheduler = scheduler or get_scheduler(self.base_url)
+        self.cache = cache if cache is not None else (GiteaCache() if GITEA_CACHE_ENABLED else None)
+        # Одновременные промахи по одному ключу (параллельные запросы страницы PR) - один запрос в Gitea
+        self._flight = ThreadSingleFlight()
+    
+    def _cached(self, key: Tuple, fetch):
+        """Read-through: значение из кэша или fetch() (None - ошибка или 404 - не кэшируется)"""
+        if self.cache is None:
+            return fetch()
+        found, value = self.cache.get(key)
+        if found:
+            return value
+        return self._flight.do(key, lambda: self._fetch_and_store(key, fetch))
     
-    def _request(self, method: str, endpoint: str, **kwargs) -> Optional[Dict]:
+    def _fetch_and_store(self, key: Tuple, fetch):
+        value = fetch()
+        if value is not None:
+            self.cache.set(key, value)
+        return value
+    
+    def _remember(self, key: Tuple, value):
+        if self.cache is not None and value:
+            self.cache.set(key, value)
+    
+    def invalidate_pr(self, owner: str, repo: str, pr_index: int):
+        """Сбросить кэш PR (после изменения через API или по webhook)"""
+        if self.cache is not None:
+            self.cache.invalidate_pr(owner, repo, pr_index)
+    
+    def invalidate_repo(self, owner: str, repo: str):
+        """Сбросить кэш веток и PR репозитория"""
+        if self.cache is not None:
+            self.cache.invalidate_repo(owner, repo)
+    
+    def _http(self, method: str, url: str, **kwargs) -> requests.Response:
+        """HTTP запрос через планировщик (лимит одновременных запросов, rate, приоритет)"""
+        with self.scheduler.slot():
+            return self.session.request(method, url, headers=self.headers, **kwargs)
+    
+    def _request(self, method: str, endpoint: str, missing_ok: bool = False, **kwargs) -> Optional[Dict]:
         """
         Выполнить HTTP запрос к Gitea API
         
         Args:
             method: HTTP метод (GET, POST, PATCH, DELETE)
             endpoint: Endpoint API (например, /api/v1/users)
+            missing_ok: 404 - ожидаемый ответ (None без записи ошибки в лог)
             **kwargs: Дополнительные параметры для requests
             
         Returns:
@@ -43,7 +361,9 @@ class GiteaClient:
         """
         url = f"{self.base_url}/api/v1{endpoint}"
         try:
-            response = requests.request(method, url, headers=self.headers, **kwargs)
+            response = self._http(method, url, **kwargs)
+            if missing_ok and response.status_code == 404:
+                return None
             response.raise_for_status()
             
             if response.status_code == 204:  # No Content
@@ -72,8 +392,8 @@ class GiteaClient:
         Returns:
             Данные пользователя или None если не найден
         """
-        result = self._request("GET", f"/users/{username}")
-        return result
+        return self._cached(GiteaCache.key("user", username),
+                            lambda: self._request("GET", f"/users/{username}", missing_ok=True))
     
     def create_user(self, username: str, email: str, password: Optional[str] = None) -> Optional[Dict]:
         """
@@ -108,6 +428,7 @@ class GiteaClient:
         result = self._request("POST", "/admin/users", json=payload)
         if result:
             logger.info(f"Created Gitea user: {username}")
+            self._remember(GiteaCache.key("user", username), result)
         return result
     
     def create_user_token(self, username: str, token_name: str = "code_review_token") -> Optional[str]:
@@ -152,12 +473,33 @@ class GiteaClient:
             "default_branch": "main"
         }
         
+        # Репозиторий уже создан этим процессом (повтор) - POST вернул бы 409
+        if self.cache is not None:
+            found, existing = self.cache.get(GiteaCache.key("repo", owner, repo_name))
+            if found:
+                return existing
+        
         # Используем admin API для создания репозитория от имени пользователя
         result = self._request("POST", f"/admin/users/{owner}/repos", json=payload)
         if result:
             logger.info(f"Created repository: {owner}/{repo_name}")
+            self._remember(GiteaCache.key("repo", owner, repo_name), result)
         return result
     
+    def get_repository(self, owner: str, repo: str) -> Optional[Dict]:
+        """
+        Получить данные репозитория (None - репозиторий не существует)
+        """
+        return self._cached(GiteaCache.key("repo", owner, repo),
+                            lambda: self._request("GET", f"/repos/{owner}/{repo}", missing_ok=True))
+    
+    def get_branch(self, owner: str, repo: str, branch: str) -> Optional[Dict]:
+        """
+        Получить данные ветки (с head commit)
+        """
+        return self._cached(GiteaCache.key("branch", owner, repo, branch),
+                            lambda: self._request("GET", f"/repos/{owner}/{repo}/branches/{branch}", missing_ok=True))
+    
     def create_file(self, owner: str, repo: str, file_path: str, content: str, message: str = "Initial commit", branch: str = "main", new_branch: bool = True) -> Optional[Dict]:
         """
         Создать файл в репозитории
@@ -199,6 +541,8 @@ class GiteaClient:
         result = self._request("POST", f"/repos/{owner}/{repo}/contents/{file_path}", json=payload)
         if result:
             logger.info(f"Created file: {owner}/{repo}/{file_path}")
+            # Новый коммит сдвигает head ветки (и PR из неё)
+            self.invalidate_repo(owner, repo)
         return result
     
     def create_branch(self, owner: str, repo: str, branch_name: str, from_branch: str = "main") -> Optional[Dict]:
@@ -227,7 +571,7 @@ class GiteaClient:
         # Если не получилось, пробуем получить SHA и использовать его
         if not result:
             logger.info(f"Failed to create branch with name only, trying with SHA...")
-            branch_info = self._request("GET", f"/repos/{owner}/{repo}/branches/{from_branch}")
+            branch_info = self.get_branch(owner, repo, from_branch)
             if branch_info:
                 logger.info(f"Branch info structure: {branch_info}")
                 
@@ -262,6 +606,7 @@ class GiteaClient:
         
         if result:
             logger.info(f"Created branch: {owner}/{repo}/{branch_name}")
+            self._remember(GiteaCache.key("branch", owner, repo, branch_name), result)
         else:
             logger.error(f"Failed to create branch {branch_name} from {from_branch}")
         return result
@@ -312,6 +657,7 @@ class GiteaClient:
         result = self._request("PUT", f"/repos/{owner}/{repo}/contents/{file_path}", json=payload)
         if result:
             logger.info(f"Updated file: {owner}/{repo}/{file_path} in branch {branch}")
+            self.invalidate_repo(owner, repo)
         return result
     
     def create_pull_request(self, owner: str, repo: str, title: str, body: str, head: str, base: str = "main") -> Optional[Dict]:
@@ -343,9 +689,11 @@ class GiteaClient:
         result = self._request("POST", f"/repos/{owner}/{repo}/pulls", json=payload)
         if result:
             logger.info(f"Created PR: {owner}/{repo} #{result.get('number')}")
+            if result.get("number"):
+                self._remember(GiteaCache.key("pull", owner, repo, int(result["number"])), result)
         return result
     
-    def get_pull_request(self, owner: str, repo: str, pr_index: int) -> Optional[Dict]:
+    def get_pull_request(self, owner: str, repo: str, pr_index: int, fresh: bool = False) -> Optional[Dict]:
         """
         Получить данные Pull Request
         
@@ -353,16 +701,30 @@ class GiteaClient:
             owner: Владелец репозитория
             repo: Имя репозитория
             pr_index: Номер PR
+            fresh: Перечитать PR из Gitea (diff и комментарии в кэше остаются - они адресуются версией PR)
             
         Returns:
-            Данные PR или None
+            Данные PR или None (в том числе если PR или репозиторий удалён)
         """
-        result = self._request("GET", f"/repos/{owner}/{repo}/pulls/{pr_index}")
-        return result
+        key = GiteaCache.key("pull", owner, repo, int(pr_index))
+        if fresh and self.cache is not None:
+            self.cache.delete(key)
+        return self._cached(key, lambda: self._request("GET", f"/repos/{owner}/{repo}/pulls/{pr_index}", missing_ok=True))
+    
+    def _pr_version(self, owner: str, repo: str, pr_index: int, field: str) -> Optional[str]:
+        """Версия PR из (кэшированного) объекта: head sha для diff, updated_at для комментариев"""
+        if self.cache is None:
+            return None
+        pr = self.get_pull_request(owner, repo, pr_index)
+        if not pr:
+            return None
+        if field == "head":
+            return (pr.get("head") or {}).get("sha")
+        return pr.get(field)
     
     def get_pull_request_diff(self, owner: str, repo: str, pr_index: int) -> Optional[str]:
         """
-        Получить diff Pull Request
+        Получить diff Pull Request (кэшируется по head SHA)
         
         Args:
             owner: Владелец репозитория
@@ -372,9 +734,16 @@ class GiteaClient:
         Returns:
             Diff в текстовом формате или None
         """
+        head_sha = self._pr_version(owner, repo, pr_index, "head")
+        if not head_sha:
+            return self._fetch_pull_request_diff(owner, repo, pr_index)
+        return self._cached(GiteaCache.key("diff", owner, repo, int(pr_index), head_sha),
+                            lambda: self._fetch_pull_request_diff(owner, repo, pr_index))
+    
+    def _fetch_pull_request_diff(self, owner: str, repo: str, pr_index: int) -> Optional[str]:
         url = f"{self.base_url}/api/v1/repos/{owner}/{repo}/pulls/{pr_index}.diff"
         try:
-            response = requests.get(url, headers=self.headers)
+            response = self._http("GET", url)
             response.raise_for_status()
             return response.text
         except requests.exceptions.RequestException as e:
@@ -384,6 +753,16 @@ class GiteaClient:
     def get_pull_request_comments(self, owner: str, repo: str, pr_index: int) -> List[Dict]:
         """
         Получить review comments (комментарии к строкам кода) к Pull Request
+        Кэшируются по updated_at PR: новый комментарий или review обновляет PR
+        """
+        updated_at = self._pr_version(owner, repo, pr_index, "updated_at")
+        if not updated_at:
+            return self._fetch_pull_request_comments(owner, repo, pr_index)
+        return self._cached(GiteaCache.key("comments", owner, repo, int(pr_index), updated_at),
+                            lambda: self._fetch_pull_request_comments(owner, repo, pr_index)) or []
+    
+    def _fetch_pull_request_comments(self, owner: str, repo: str, pr_index: int) -> List[Dict]:
+        """
         Использует несколько стратегий для получения всех комментариев
         """
         all_comments = []
@@ -391,7 +770,7 @@ class GiteaClient:
         # Способ 1: Получаем все reviews и их комментарии
         reviews_url = f"{self.base_url}/api/v1/repos/{owner}/{repo}/pulls/{pr_index}/reviews"
         try:
-            reviews_response = requests.get(reviews_url, headers=self.headers)
+            reviews_response = self._http("GET", reviews_url)
             if reviews_response.status_code == 200:
                 reviews = reviews_response.json() if reviews_response.content else []
                 logger.info(f"Found {len(reviews)} reviews for PR {owner}/{repo}#{pr_index}")
@@ -409,7 +788,7 @@ class GiteaClient:
                     if review_id:
                         comments_url = f"{self.base_url}/api/v1/repos/{owner}/{repo}/pulls/{pr_index}/reviews/{review_id}/comments"
                         try:
-                            comments_response = requests.get(comments_url, headers=self.headers)
+                            comments_response = self._http("GET", comments_url)
                             if comments_response.status_code == 200:
                                 review_comments = comments_response.json() if comments_response.content else []
                                 logger.info(f"Found {len(review_comments)} comments via review comments endpoint for review {review_id}")
@@ -427,7 +806,7 @@ class GiteaClient:
         # В Gitea review comments могут быть привязаны к файлам
         files_url = f"{self.base_url}/api/v1/repos/{owner}/{repo}/pulls/{pr_index}/files"
         try:
-            files_response = requests.get(files_url, headers=self.headers)
+            files_response = self._http("GET", files_url)
             if files_response.status_code == 200:
                 files = files_response.json() if files_response.content else []
                 logger.info(f"Found {len(files)} files in PR {owner}/{repo}#{pr_index}")
@@ -448,7 +827,7 @@ class GiteaClient:
         # Способ 3: Пробуем получить комментарии напрямую (может работать в некоторых версиях Gitea)
         direct_url = f"{self.base_url}/api/v1/repos/{owner}/{repo}/pulls/{pr_index}/comments"
         try:
-            direct_response = requests.get(direct_url, headers=self.headers)
+            direct_response = self._http("GET", direct_url)
             if direct_response.status_code == 200:
                 direct_comments = direct_response.json() if direct_response.content else []
                 logger.info(f"Found {len(direct_comments)} comments via direct endpoint")
@@ -479,10 +858,17 @@ class GiteaClient:
         Returns:
             Список комментариев
         """
+        updated_at = self._pr_version(owner, repo, pr_index, "updated_at")
+        if not updated_at:
+            return self._fetch_pull_request_issue_comments(owner, repo, pr_index)
+        return self._cached(GiteaCache.key("issue_comments", owner, repo, int(pr_index), updated_at),
+                            lambda: self._fetch_pull_request_issue_comments(owner, repo, pr_index)) or []
+    
+    def _fetch_pull_request_issue_comments(self, owner: str, repo: str, pr_index: int) -> List[Dict]:
         # В Gitea PR - это issue, поэтому используем issue comments endpoint
         url = f"{self.base_url}/api/v1/repos/{owner}/{repo}/issues/{pr_index}/comments"
         try:
-            response = requests.get(url, headers=self.headers)
+            response = self._http("GET", url)
             if response.status_code == 404:
                 return []
             response.raise_for_status()
@@ -519,8 +905,47 @@ class GiteaClient:
         result = self._request("POST", f"/repos/{owner}/{repo}/pulls/{pr_index}/comments", json=payload)
         if result:
             logger.info(f"Created PR comment: {owner}/{repo} PR#{pr_index}")
+            self.invalidate_pr(owner, repo, pr_index)
         return result
-    
+
+    def create_pull_request_review(self, owner: str, repo: str, pr_index: int, body: str,
+                                   comments: List[Dict], event: str = "COMMENT") -> Optional[Dict]:
+        """
+        Создать review с несколькими inline комментариями одним запросом
+
+        Args:
+            owner: Владелец репозитория
+            repo: Имя репозитория
+            pr_index: Номер PR
+            body: Общий текст review
+            comments: Комментарии [{"path": ..., "body": ..., "new_position": строка}]
+            event: COMMENT, APPROVED или REQUEST_CHANGES
+
+        Returns:
+            Данные созданного review (id) или None
+        """
+        payload = {
+            "body": body,
+            "event": event,
+            "comments": comments
+        }
+
+        result = self._request("POST", f"/repos/{owner}/{repo}/pulls/{pr_index}/reviews", json=payload)
+        if result:
+            logger.info(f"Created PR review: {owner}/{repo} PR#{pr_index} ({len(comments)} comments)")
+            self.invalidate_pr(owner, repo, pr_index)
+        return result
+
+    def get_pull_request_review_comments(self, owner: str, repo: str, pr_index: int, review_id: int) -> List[Dict]:
+        """
+        Получить комментарии review
+
+        Returns:
+            Список комментариев (пустой при ошибке)
+        """
+        result = self._request("GET", f"/repos/{owner}/{repo}/pulls/{pr_index}/reviews/{review_id}/comments")
+        return result if isinstance(result, list) else []
+
     def merge_pull_request(self, owner: str, repo: str, pr_index: int, merge_type: str = "merge") -> Optional[Dict]:
         """
         Слить Pull Request
@@ -541,6 +966,7 @@ class GiteaClient:
         result = self._request("POST", f"/repos/{owner}/{repo}/pulls/{pr_index}/merge", json=payload)
         if result:
             logger.info(f"Merged PR: {owner}/{repo} PR#{pr_index}")
+            self.invalidate_pr(owner, repo, pr_index)
         return result
     
     def close_pull_request(self, owner: str, repo: str, pr_index: int) -> Optional[Dict]:
@@ -562,6 +988,7 @@ class GiteaClient:
         result = self._request("PATCH", f"/repos/{owner}/{repo}/pulls/{pr_index}", json=payload)
         if result:
             logger.info(f"Closed PR: {owner}/{repo} PR#{pr_index}")
+            self.invalidate_pr(owner, repo, pr_index)
         return result
     
     def get_repository_clone_url(self, owner: str, repo: str, protocol: str = "http") -> str:
@@ -582,3 +1009,38 @@ class GiteaClient:
             # HTTP с токеном для доступа
             return f"{self.base_url}/{owner}/{repo}.git"
 
+
+class AsyncGiteaClient:
+    """
+    Async обёртка над GiteaClient для async handlers
+
+    Методы GiteaClient вызываются как корутины: HTTP запросы выполняются в выделенном
+    пуле потоков с общим пулом соединений, event loop не блокируется.
+    """
+
+    def __init__(self, client: GiteaClient, max_workers: int = GITEA_POOL_SIZE):
+        self.client = client
+        # Пул потоков на полосу: фоновые вызовы, ждущие слота планировщика, не занимают потоки интерактивных
+        self._executors = {
+            lane: ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"gitea-{lane}")
+            for lane in LANES
+        }
+
+    @staticmethod
+    def background():
+        """with async_gitea.background(): ... - вызовы внутри блока идут фоновой полосой"""
+        return background_lane()
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.client, name)
+        if not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            ctx = contextvars.copy_context()
+            executor = self._executors[ctx.get(gitea_lane, INTERACTIVE)]
+            return await loop.run_in_executor(executor, functools.partial(ctx.run, attr, *args, **kwargs))
+
+        call.__name__ = name
+        return call
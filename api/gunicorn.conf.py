@@ -0,0 +1,64 @@
+"""
+Production запуск API: gunicorn + uvicorn workers
+
+    gunicorn -c gunicorn.conf.py main:app
+
+Число процессов - по числу доступных ядер (с учётом affinity и квоты cgroup в контейнере),
+переопределяется WEB_CONCURRENCY. Для разработки по-прежнему uvicorn --reload (один процесс).
+
+Общее состояние между процессами:
+- кэш токенов: L1 в процессе + L2 в Redis, инвалидации рассылаются через Redis
+- события (SSE): Redis pub/sub, одна подписка на процесс
+- sweeper истёкших сессий и фоновая синхронизация PR из Gitea: работают в процессе, держащем lease в Redis
+- single-flight (PR из Gitea, рендер PDF): lock и результат в Redis
+- Gitea клиент, пулы БД/io: свои в каждом процессе (создаются после fork)
+"""
+import math
+import os
+
+
+def _available_cores() -> int:
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    # Лимит CPU контейнера (cgroup v2): "<quota> <period>" или "max <period>"
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cores = min(cores, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(cores, 1)
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+# Async workers: один процесс на ядро (2n+1 - для синхронных workers)
+workers = int(os.getenv("WEB_CONCURRENCY", str(_available_cores())))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Приложение импортируется в каждом worker после fork: подключения к SQLite/Redis,
+# пулы потоков и requests.Session не наследуются от master
+preload_app = os.getenv("GUNICORN_PRELOAD", "0") == "1"
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+# Перезапуск worker после N запросов (с разбросом) - ограничивает рост памяти
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+
+accesslog = "-"
+errorlog = "-"
+
+# Несколько процессов: кэш токенов обязательно общий - без Redis инвалидация (удаление, завершение)
+# видна только в одном процессе, остальные отдают сессию до истечения TTL. Не переопределяется.
+# Одинаковые запросы в разные процессы объединяются через Redis
+if workers > 1:
+    os.environ["TOKEN_CACHE_REDIS"] = "1"
+    os.environ.setdefault("SINGLEFLIGHT_REDIS", "1")
+
+
+def post_fork(server, worker):
+    server.log.info(f"Worker spawned (pid: {worker.pid})")
@@ -1,24 +1,46 @@
 # api/main.py
 from fastapi import FastAPI, Request, HTTPException, File, UploadFile
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, StreamingResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from pydantic import BaseModel
-import sqlite3
+from pydantic import BaseModel, Field
+from typing import Literal
 import json
 import os
 import shutil
-import zipfile
 import logging
-from rq import Queue
 from redis import Redis
 import time
 import secrets
-from eval_worker import evaluate
+import hashlib
+import hmac
+import asyncio
+import socket
+import redis.asyncio as aioredis
+from contextlib import asynccontextmanager, contextmanager, nullcontext
 from datetime import datetime, timedelta
+from email.utils import formatdate, parsedate_to_datetime
+from events import (
+    event_broker, publish_event_async, close_publisher, session_channel, job_channel, bulk_channel, CHANNEL_PREFIX,
+    format_sse, SSE_HEARTBEAT, SSE_HEADERS, SSE_HEARTBEAT_SECONDS,
+)
+import db
+import executors
+from executors import run_io, run_render
 
 # === PDF ===
-from weasyprint import HTML
+# Рендер выполняется в пуле процессов (executors.run_render), WeasyPrint импортируется там
+from reports import render_session_report
+import packages
+import artifact_store
+import summaries
+import session_timer
+import migrations
+import diff_index
+import comment_parser
+import git_mirror
+from token_cache import token_cache, TokenEntry
+from singleflight import SingleFlight
+import singleflight
 
 
 # === ЛОГИРОВАНИЕ ===
@@ -26,11 +48,9 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # === БД ===
-DB_PATH = "/app/reviews.db"
+DB_PATH = db.DB_PATH
 
 # === GITEA ===
-from gitea_client import GiteaClient
-
 # Конфигурация Gitea (можно сделать через переменные окружения)
 # GITEA_URL по умолчанию для доступа к Gitea в Docker контейнере
 # Внутри Docker сети используем имя сервиса: http://gitea:4000
@@ -40,113 +60,25 @@ GITEA_URL = os.getenv("GITEA_URL", "http://gitea:4000")
 GITEA_WEB_URL = os.getenv("GITEA_WEB_URL", "http://localhost:4001")
 GITEA_ADMIN_TOKEN = os.getenv("GITEA_ADMIN_TOKEN", "")  # Будет установлен при первой настройке
 
-# Инициализация Gitea клиента (опционально, только если токен установлен)
+# Gitea клиент (опционально, только если токен установлен) создаётся при старте приложения (lifespan)
 gitea_client = None
-if GITEA_ADMIN_TOKEN:
+async_gitea = None  # Async обёртка для async handlers
+
+def _init_gitea():
+    global gitea_client, async_gitea
+    if not GITEA_ADMIN_TOKEN:
+        logger.info("Gitea client not initialized (no admin token)")
+        return
     try:
+        # requests импортируется только если Gitea настроен
+        from gitea_client import GiteaClient, AsyncGiteaClient
         gitea_client = GiteaClient(GITEA_URL, GITEA_ADMIN_TOKEN)
+        async_gitea = AsyncGiteaClient(gitea_client)
         logger.info(f"Gitea client initialized: {GITEA_URL}")
     except Exception as e:
         logger.warning(f"Failed to initialize Gitea client: {e}")
         gitea_client = None
-else:
-    logger.info("Gitea client not initialized (no admin token)")
-
-
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    # Создаём таблицу с новыми полями
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS sessions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            candidate_id TEXT,
-            mr_package TEXT,
-            comments TEXT,
-            created_at TEXT,
-            expires_at TEXT
-        )
-    ''')
-
-    # === КРИТИЧНО: Добавляем колонки, если их нет (для старых БД) ===
-    c.execute("PRAGMA table_info(sessions)")
-    columns = [col[1] for col in c.fetchall()]
-
-    if 'created_at' not in columns:
-        c.execute("ALTER TABLE sessions ADD COLUMN created_at TEXT")
-        print("Added column: created_at")
-
-    if 'expires_at' not in columns:
-        c.execute("ALTER TABLE sessions ADD COLUMN expires_at TEXT")
-        print("Added column: expires_at")
-
-    # === Поля для разделения ролей ===
-    if 'access_token' not in columns:
-        # SQLite не поддерживает добавление UNIQUE колонки напрямую
-        # Добавляем без UNIQUE, затем заполняем NULL значения и создаём индекс
-        c.execute("ALTER TABLE sessions ADD COLUMN access_token TEXT")
-        # Заполняем NULL значения для существующих записей уникальными токенами
-        c.execute("SELECT id FROM sessions WHERE access_token IS NULL")
-        null_rows = c.fetchall()
-        for row in null_rows:
-            session_id = row[0]
-            token = secrets.token_urlsafe(32)
-            c.execute("UPDATE sessions SET access_token = ? WHERE id = ?", (token, session_id))
-        # Создаём уникальный индекс
-        try:
-            c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_access_token ON sessions(access_token)")
-        except sqlite3.OperationalError as e:
-            # Индекс может уже существовать или быть невозможным из-за дубликатов
-            logger.warning(f"Could not create unique index on access_token: {e}")
-        print("Added column: access_token")
-    
-    if 'reviewer_token' not in columns:
-        c.execute("ALTER TABLE sessions ADD COLUMN reviewer_token TEXT")
-        print("Added column: reviewer_token")
-    
-    if 'reviewer_name' not in columns:
-        c.execute("ALTER TABLE sessions ADD COLUMN reviewer_name TEXT")
-        print("Added column: reviewer_name")
-    
-    if 'candidate_name' not in columns:
-        c.execute("ALTER TABLE sessions ADD COLUMN candidate_name TEXT")
-        print("Added column: candidate_name")
-    
-    if 'status' not in columns:
-        c.execute("ALTER TABLE sessions ADD COLUMN status TEXT DEFAULT 'active'")
-        print("Added column: status")
-    
-    # === Поля для Gitea интеграции ===
-    if 'gitea_user' not in columns:
-        c.execute("ALTER TABLE sessions ADD COLUMN gitea_user TEXT")
-        print("Added column: gitea_user")
-    
-    if 'gitea_repo' not in columns:
-        c.execute("ALTER TABLE sessions ADD COLUMN gitea_repo TEXT")
-        print("Added column: gitea_repo")
-    
-    if 'gitea_pr_id' not in columns:
-        c.execute("ALTER TABLE sessions ADD COLUMN gitea_pr_id INTEGER")
-        print("Added column: gitea_pr_id")
-    
-    if 'gitea_enabled' not in columns:
-        c.execute("ALTER TABLE sessions ADD COLUMN gitea_enabled INTEGER DEFAULT 0")
-        print("Added column: gitea_enabled")
-    
-    # === Поле для soft delete ===
-    if 'deleted_at' not in columns:
-        c.execute("ALTER TABLE sessions ADD COLUMN deleted_at TEXT")
-        print("Added column: deleted_at")
-    
-    # === Поле для готовности кандидата ===
-    if 'candidate_ready_at' not in columns:
-        c.execute("ALTER TABLE sessions ADD COLUMN candidate_ready_at TEXT")
-        print("Added column: candidate_ready_at")
-
-    conn.commit()
-    conn.close()
-init_db()
+        async_gitea = None
 
 # === Redis + RQ ===
 # Ленивое подключение к Redis (при первом использовании)
@@ -178,6 +110,7 @@ def get_queue():
     if _queue is None:
         if _redis_conn is None:
             _redis_conn = get_redis_connection()
+        from rq import Queue  # rq нужен только для постановки задач - не грузим при старте
         _queue = Queue(connection=_redis_conn)
     return _queue
 
@@ -208,8 +141,85 @@ class LazyQueue:
 redis_conn = LazyRedis()
 queue = LazyQueue()
 
+def _reset_redis_after_fork():
+    """Дочерний процесс (gunicorn --preload): подключение родителя не используем"""
+    global _redis_conn, _queue
+    _redis_conn = None
+    _queue = None
+    redis_conn._conn = None
+    queue._queue = None
+
+os.register_at_fork(after_in_child=_reset_redis_after_fork)
+
 # === FastAPI ===
-app = FastAPI()
+# === Схема БД ===
+# MIGRATE_ON_STARTUP=0 - миграции запускаются отдельно перед деплоем, API только проверяет версию
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "1") == "1"
+
+def _prepare_schema(conn):
+    if MIGRATE_ON_STARTUP:
+        applied = migrations.migrate(conn)
+        if applied:
+            logger.info(f"Applied schema migrations: {applied}")
+        return
+    version = migrations.current_version(conn)
+    if version < migrations.LATEST_VERSION:
+        raise RuntimeError(f"Database schema version {version} < {migrations.LATEST_VERSION}, run: python migrations.py")
+
+@contextmanager
+def _startup_phase(name: str):
+    started = time.perf_counter()
+    yield
+    logger.info(f"Startup phase '{name}': {(time.perf_counter() - started) * 1000:.1f} ms")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    # Схема БД: миграции - явный шаг старта (или отдельно: python migrations.py), не побочный эффект импорта
+    with _startup_phase("schema"):
+        await db.run(_prepare_schema)
+    with _startup_phase("gitea"):
+        await run_io(_init_gitea)
+    if not INTERNAL_API_TOKEN:
+        logger.warning("INTERNAL_API_TOKEN is not set: internal API (/api/internal/*) rejects all requests, workers cannot save results")
+    with _startup_phase("background tasks"):
+        # Несколько процессов API с общим Redis-кэшем токенов: слушаем инвалидации от соседей
+        invalidation_task = None
+        if token_cache.use_redis:
+            invalidation_task = asyncio.create_task(token_cache.listen_invalidations(event_broker))
+        sweeper_task = asyncio.create_task(_session_sweeper()) if SESSION_SWEEPER_ENABLED else None
+        gitea_invalidation_task = None
+        if gitea_client and gitea_client.cache is not None:
+            gitea_invalidation_task = asyncio.create_task(_listen_gitea_invalidations())
+        gitea_sync_task = asyncio.create_task(_gitea_pr_sync_loop()) if async_gitea and GITEA_PR_SYNC_ENABLED else None
+        bulk_resume_task = asyncio.create_task(_bulk_resume_loop()) if async_gitea else None
+    logger.info(f"Startup complete in {(time.perf_counter() - started) * 1000:.1f} ms")
+    yield
+    for task in (invalidation_task, sweeper_task, gitea_invalidation_task, gitea_sync_task, bulk_resume_task):
+        if task is not None:
+            task.cancel()
+    # Закрываем подписку на события (SSE) и пулы блокирующей работы
+    await token_cache.close()
+    await singleflight.close_all()
+    await event_broker.close()
+    await close_publisher()
+    executors.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+
+# === Лимит размера загрузки ===
+# Заявленный Content-Length проверяем до разбора multipart, чтобы не принимать тело целиком.
+# Точный лимит (для chunked запросов) - при копировании в packages.spool_upload
+UPLOAD_PATHS = {"/api/upload-mr"}
+MULTIPART_OVERHEAD = 64 * 1024
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    if request.method == "POST" and request.url.path in UPLOAD_PATHS:
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > packages.MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD:
+            return JSONResponse(status_code=413, content={"detail": f"File too large (max {packages.MAX_UPLOAD_SIZE} bytes)"})
+    return await call_next(request)
 
 # === Healthcheck endpoint (для Railway и других платформ) ===
 @app.get("/health")
@@ -221,30 +231,11 @@ def healthcheck():
 # === RQ Monitoring (должен быть ПЕРЕД статикой и catch-all) ===
 _rq_router_enabled = False
 try:
-    logger.info("Attempting to import rq_dashboard...")
+    # rq_monitor (и rq) импортируются при первом запросе к /api/rq/*
     from rq_dashboard import router as rq_router
-    logger.info(f"Router imported: prefix={rq_router.prefix}, routes count={len(rq_router.routes)}")
-    
     app.include_router(rq_router)
     _rq_router_enabled = True
-    
-    # Проверяем, что роутер действительно подключён
-    all_routes = []
-    for r in app.routes:
-        if hasattr(r, 'path'):
-            all_routes.append(r.path)
-        elif hasattr(r, 'routes'):  # Для роутеров
-            for sub_r in r.routes:
-                if hasattr(sub_r, 'path'):
-                    all_routes.append(sub_r.path)
-    
-    rq_routes = [r for r in all_routes if '/api/rq' in r]
-    logger.info(f"RQ monitoring dashboard enabled at /api/rq/*")
-    logger.info(f"RQ routes registered: {rq_routes}")
-    
-    if not rq_routes:
-        logger.error("WARNING: No RQ routes found after registration!")
-        
+    logger.info(f"RQ monitoring dashboard enabled at {rq_router.prefix}/* ({len(rq_router.routes)} routes)")
 except ImportError as e:
     logger.error(f"Failed to import RQ dashboard (module not found): {e}")
     import traceback
@@ -259,18 +250,30 @@ app.mount("/assets", StaticFiles(directory="static/assets"), name="assets")
 app.mount("/artifacts", StaticFiles(directory="/artifacts"), name="artifacts")
 
 @app.get("/api/artifacts/{filename}")
-def get_artifact(filename: str):
+async def get_artifact(filename: str, request: Request):
     file_path = f"/artifacts/{filename}"
-    if not os.path.exists(file_path):
+    # {id}_diff.patch больше не пишется на каждую сессию - отдаём блоб из хранилища
+    if filename.endswith("_diff.patch") and filename[:-len("_diff.patch")].isdigit():
+        session_id = int(filename[:-len("_diff.patch")])
+        row = await db.fetchone("SELECT diff_sha FROM sessions WHERE id = ?", (session_id,))
+        return await _diff_response(request, session_id, row[0] if row else None)
+    if not await run_io(os.path.exists, file_path):
         # Для report.txt возвращаем пустой ответ вместо 404 (файл может быть еще не создан)
         if filename.endswith('_report.txt'):
-            from fastapi.responses import Response
             return Response(content="Отчёт ещё не готов...", media_type="text/plain; charset=utf-8")
         raise HTTPException(status_code=404, detail="File not found")
     return FileResponse(file_path)
 
 # === HTML шаблоны ===
-templates = Jinja2Templates(directory="static")
+# Jinja2 нужен только для index.html - создаём при первом запросе
+_templates = None
+
+def _get_templates():
+    global _templates
+    if _templates is None:
+        from fastapi.templating import Jinja2Templates
+        _templates = Jinja2Templates(directory="static")
+    return _templates
 
 # === Утилиты ===
 def generate_access_token() -> str:
@@ -281,6 +284,190 @@ def generate_reviewer_token() -> str:
     """Генерирует токен для проверяющего"""
     return secrets.token_urlsafe(24)
 
+def _write_text(path: str, content: str):
+    with open(path, "w") as f:
+        f.write(content)
+
+DEMO_DIFF = """diff --git a/main.py b/main.py
+index abc123..def456 100644
+--- a/main.py
++++ b/main.py
+@@ -1,5 +1,6 @@
+ def greet():
+-    print("Hi")
++    print("Hello, secure world!")
++    # TODO: add input validation
+     return True
+"""
+
+UPLOAD_DIFF = """diff --git a/uploaded_file b/uploaded_file
+index 0000000..1111111 100644
+--- /dev/null
++++ b/uploaded_file
+@@ -0,0 +1,1 @@
++Uploaded via /api/upload-mr
+"""
+
+# === Запись сессии вместе с проекцией session_summaries ===
+def _insert_session(conn, sql: str, params: tuple) -> int:
+    session_id = conn.execute(sql, params).lastrowid
+    summaries.refresh(conn, session_id)
+    return session_id
+
+def _write_session(conn, session_id: int, sql: str, params: tuple) -> int:
+    """Изменить сессию и обновить её строку в session_summaries в одной транзакции"""
+    updated = conn.execute(sql, params).rowcount
+    if updated:
+        summaries.refresh(conn, session_id)
+    return updated
+
+async def _create_session_row(sql: str, params: tuple) -> int:
+    return await db.run(_insert_session, sql, params)
+
+async def _update_session(session_id: int, sql: str, params: tuple) -> int:
+    return await db.run(_write_session, session_id, sql, params)
+
+# === Артефакты сессии (хранилище по содержимому, см. artifact_store) ===
+def _attach_artifacts(conn, session_id: int, refs: dict):
+    """Сохранить ссылки сессии на артефакты и увеличить счётчики (refs: колонка -> (sha, kind, size))"""
+    conn.execute("BEGIN IMMEDIATE")
+    for column, (sha, kind, size) in refs.items():
+        conn.execute(f"UPDATE sessions SET {column} = ? WHERE id = ?", (sha, session_id))
+        artifact_store.incref(conn, sha, kind, size)
+
+def _release_session_artifacts(conn, session_id: int, deleted_at: str) -> bool:
+    """Пометить сессию удалённой и освободить её артефакты (False - уже удалена)"""
+    conn.execute("BEGIN IMMEDIATE")
+    updated = conn.execute(
+        "UPDATE sessions SET deleted_at = ? WHERE id = ? AND deleted_at IS NULL", (deleted_at, session_id)
+    ).rowcount
+    if not updated:
+        return False
+    summaries.refresh(conn, session_id)
+    row = conn.execute("SELECT diff_sha, golden_sha, package_sha FROM sessions WHERE id = ?", (session_id,)).fetchone()
+    for sha in row:
+        if sha:
+            artifact_store.decref(conn, sha)
+    return True
+
+def _put_blobs(blobs: dict, diffs: tuple = ()):
+    for sha, data in blobs.items():
+        artifact_store.put_bytes(data, sha)
+    # gzip/brotli варианты и индекс diff - один раз при сохранении, а не на каждый запрос
+    for sha in diffs:
+        artifact_store.precompress(sha)
+        diff_index.get_index(sha)
+
+async def _session_artifact_refs(diff: str, mr_package: str = None, package: tuple = None):
+    """(refs: колонка -> (sha, kind, size), блобы для записи, sha diff)"""
+    diff_bytes = diff.encode("utf-8")
+    diff_sha = artifact_store.digest(diff_bytes)
+    refs = {"diff_sha": (diff_sha, artifact_store.KIND_DIFF, len(diff_bytes))}
+    blobs = {diff_sha: diff_bytes}
+
+    if mr_package:
+        golden = await run_io(artifact_store.read_file_bytes, f"/mr_packages/{mr_package}/golden_truth.json")
+        if golden is not None:
+            golden_sha = artifact_store.digest(golden)
+            refs["golden_sha"] = (golden_sha, artifact_store.KIND_GOLDEN, len(golden))
+            blobs[golden_sha] = golden
+
+    if package:
+        refs["package_sha"] = (package[0], artifact_store.KIND_PACKAGE, package[1])
+    return refs, blobs, diff_sha
+
+async def _store_session_artifacts(session_id: int, diff: str, mr_package: str = None, package: tuple = None):
+    """
+    Привязать к сессии diff, golden truth пакета и загруженный zip (package: (sha, size))
+
+    Одинаковое содержимое хранится один раз. Блобы пишутся после incref, чтобы GC их не удалил.
+    """
+    refs, blobs, diff_sha = await _session_artifact_refs(diff, mr_package, package)
+    await db.run(_attach_artifacts, session_id, refs)
+    await run_io(_put_blobs, blobs, (diff_sha,))
+
+# === Отдача diff: sendfile, ETag/Last-Modified, Range, предсжатые варианты ===
+DIFF_MEDIA_TYPE = "text/plain; charset=utf-8"
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name and q > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+def _select_diff_variant(diff_sha: str, accept_encoding: str):
+    """(путь, content-encoding или None, stat) лучшего доступного варианта блоба"""
+    accepted = _accepted_encodings(accept_encoding)
+    for encoding in artifact_store.COMPRESSED_VARIANTS:
+        if encoding in accepted or "*" in accepted:
+            path = artifact_store.variant_path(diff_sha, encoding)
+            if os.path.exists(path):
+                return path, encoding, os.stat(path)
+    path = artifact_store.blob_path(diff_sha)
+    if os.path.exists(path):
+        return path, None, os.stat(path)
+    return None, None, None
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match - слабое сравнение (RFC 9110)
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match приоритетнее If-Modified-Since
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+async def _diff_response(request: Request, session_id: int, diff_sha: str = None):
+    """
+    Ответ с diff сессии без чтения файла в память (FileResponse - sendfile, Range)
+
+    ETag - sha256 содержимого (сильный, у сжатых вариантов свой суффикс),
+    повторный запрос с If-None-Match получает 304 без тела.
+    """
+    if diff_sha:
+        path, encoding, st = await run_io(_select_diff_variant, diff_sha, request.headers.get("accept-encoding", ""))
+        etag = f'"{diff_sha}-{encoding}"' if encoding else f'"{diff_sha}"'
+    else:
+        # Сессии до хранилища артефактов: файл на сессию
+        path, encoding = f"/artifacts/{session_id}_diff.patch", None
+        st = await run_io(lambda: os.stat(path) if os.path.exists(path) else None)
+        etag = f'"{int(st.st_mtime)}-{st.st_size}"' if st else None
+    if st is None:
+        raise HTTPException(status_code=404, detail="Diff not found")
+
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    if _not_modified(request, etag, st.st_mtime):
+        headers["Last-Modified"] = formatdate(st.st_mtime, usegmt=True)
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=DIFF_MEDIA_TYPE, headers=headers, stat_result=st)
+
+async def _session_diff_path(session_id: int) -> str:
+    """Путь к diff сессии (блоб в хранилище или файл старого формата)"""
+    row = await db.fetchone("SELECT diff_sha FROM sessions WHERE id = ?", (session_id,))
+    if row and row[0]:
+        return artifact_store.blob_path(row[0])
+    return f"/artifacts/{session_id}_diff.patch"
+
 # === Модели ===
 class SessionCreate(BaseModel):
     candidate_id: str
@@ -291,78 +478,52 @@ class ReviewerSessionCreate(BaseModel):
     mr_package: str
     reviewer_name: str = "Reviewer"
 
+class ReviewerBulkSessionCreate(BaseModel):
+    candidates: list[str]  # имена кандидатов раунда
+    mr_package: str
+    reviewer_name: str = "Reviewer"
+
 # === API: Создать сессию (старый endpoint для обратной совместимости) ===
 @app.post("/api/sessions")
-def create_session(payload: SessionCreate):
+async def create_session(payload: SessionCreate):
     logger.info(f"Creating session for candidate_id={payload.candidate_id}, mr_package={payload.mr_package}")
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    now = datetime.utcnow()
-    expires_at = now + timedelta(hours=2)
+    created_at, expires_at, created_at_epoch, expires_at_epoch = session_timer.session_times()
     access_token = generate_access_token()
     reviewer_token = generate_reviewer_token()
 
-    c.execute(
-        "INSERT INTO sessions (candidate_id, mr_package, comments, created_at, expires_at, access_token, reviewer_token, candidate_name, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-        (payload.candidate_id, payload.mr_package, json.dumps([]), now.isoformat() + 'Z', expires_at.isoformat() + 'Z', access_token, reviewer_token, payload.candidate_id, 'active')
+    session_id = await _create_session_row(
+        "INSERT INTO sessions (candidate_id, mr_package, comments, created_at, expires_at, access_token, reviewer_token, candidate_name, status, created_at_epoch, expires_at_epoch) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (payload.candidate_id, payload.mr_package, json.dumps([]), created_at, expires_at, access_token, reviewer_token, payload.candidate_id, 'active', created_at_epoch, expires_at_epoch)
     )
-    session_id = c.lastrowid
-    conn.commit()
-    conn.close()
 
-    diff_path = f"/artifacts/{session_id}_diff.patch"
-    demo_diff = """diff --git a/main.py b/main.py
-index abc123..def456 100644
---- a/main.py
-+++ b/main.py
-@@ -1,5 +1,6 @@
- def greet():
--    print("Hi")
-+    print("Hello, secure world!")
-+    # TODO: add input validation
-     return True
-"""
-    with open(diff_path, "w") as f:
-        f.write(demo_diff)
+    await _store_session_artifacts(session_id, DEMO_DIFF, payload.mr_package)
 
     return {"session_id": session_id, "access_token": access_token, "reviewer_token": reviewer_token}
 
-# === REVIEWER API ===
-# === API: Reviewer - Создать сессию ===
-@app.post("/api/reviewer/sessions")
-def reviewer_create_session(payload: ReviewerSessionCreate):
-    logger.info(f"Reviewer creating session for candidate={payload.candidate_name}, reviewer={payload.reviewer_name}")
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    now = datetime.utcnow()
-    expires_at = now + timedelta(hours=2)
-    access_token = generate_access_token()  # Для кандидата
-    reviewer_token = generate_reviewer_token()  # Для проверяющего
+# === Имена кандидата в Gitea ===
+def _transliterate(text):
+    """Простая транслитерация кириллицы в латиницу"""
+    trans_dict = {
+        'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo',
+        'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
+        'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+        'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch',
+        'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+        'А': 'A', 'Б': 'B', 'В': 'V', 'Г': 'G', 'Д': 'D', 'Е': 'E', 'Ё': 'Yo',
+        'Ж': 'Zh', 'З': 'Z', 'И': 'I', 'Й': 'Y', 'К': 'K', 'Л': 'L', 'М': 'M',
+        'Н': 'N', 'О': 'O', 'П': 'P', 'Р': 'R', 'С': 'S', 'Т': 'T', 'У': 'U',
+        'Ф': 'F', 'Х': 'H', 'Ц': 'Ts', 'Ч': 'Ch', 'Ш': 'Sh', 'Щ': 'Sch',
+        'Ъ': '', 'Ы': 'Y', 'Ь': '', 'Э': 'E', 'Ю': 'Yu', 'Я': 'Ya'
+    }
+    result = ''
+    for char in text:
+        result += trans_dict.get(char, char if char.isalnum() or char in ['_', '-'] else '_')
+    return result
 
-    # Генерируем имена для Gitea (транслитерация кириллицы)
-    def transliterate(text):
-        """Простая транслитерация кириллицы в латиницу"""
-        trans_dict = {
-            'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo',
-            'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
-            'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
-            'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch',
-            'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
-            'А': 'A', 'Б': 'B', 'В': 'V', 'Г': 'G', 'Д': 'D', 'Е': 'E', 'Ё': 'Yo',
-            'Ж': 'Zh', 'З': 'Z', 'И': 'I', 'Й': 'Y', 'К': 'K', 'Л': 'L', 'М': 'M',
-            'Н': 'N', 'О': 'O', 'П': 'P', 'Р': 'R', 'С': 'S', 'Т': 'T', 'У': 'U',
-            'Ф': 'F', 'Х': 'H', 'Ц': 'Ts', 'Ч': 'Ch', 'Ш': 'Sh', 'Щ': 'Sch',
-            'Ъ': '', 'Ы': 'Y', 'Ь': '', 'Э': 'E', 'Ю': 'Yu', 'Я': 'Ya'
-        }
-        result = ''
-        for char in text:
-            result += trans_dict.get(char, char if char.isalnum() or char in ['_', '-'] else '_')
-        return result
-    
+def _candidate_gitea_names(candidate_name: str) -> tuple:
+    """(candidate_id_safe, gitea_user) - имя пользователя Gitea из имени кандидата (транслитерация кириллицы)"""
     # Нормализация имени кандидата для Gitea username
-    candidate_id_safe = transliterate(payload.candidate_name).lower()
+    candidate_id_safe = _transliterate(candidate_name).lower()
     # Заменяем все недопустимые символы на подчёркивания
     candidate_id_safe = ''.join(c if c.isalnum() or c in ['_', '-'] else '_' for c in candidate_id_safe)
     # Убираем множественные подчёркивания
@@ -372,177 +533,196 @@ def reviewer_create_session(payload: ReviewerSessionCreate):
     candidate_id_safe = candidate_id_safe.strip('_')
     # Если пусто или слишком короткое, используем hash
     if not candidate_id_safe or len(candidate_id_safe) < 2:
-        candidate_id_safe = f"candidate_{abs(hash(payload.candidate_name)) % 10000}"
-    
-    gitea_user = f"candidate_{candidate_id_safe}"
+        candidate_id_safe = f"candidate_{abs(hash(candidate_name)) % 10000}"
+    return candidate_id_safe, f"candidate_{candidate_id_safe}"
+
+# === Gitea: пользователь, репозиторий, ветка со стартовым кодом и PR для сессии ===
+async def _provision_gitea(session_id: int, candidate_name: str, gitea_user: str):
+    """
+    Подготовить Gitea для уже созданной сессии (имя репозитория - по session_id)
+
+    Returns:
+        {"user", "repo", "clone_url", "pr_id"} или None - сессия остаётся без Gitea (gitea_enabled=0)
+    """
     gitea_repo = None
-    gitea_pr_id = None
     gitea_enabled = 0
-
-    # Сначала всегда создаём сессию, чтобы получить session_id
-    c.execute(
-        "INSERT INTO sessions (candidate_name, mr_package, comments, created_at, expires_at, access_token, reviewer_token, reviewer_name, status, candidate_id, gitea_user, gitea_enabled) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-        (payload.candidate_name, payload.mr_package, json.dumps([]), now.isoformat() + 'Z', expires_at.isoformat() + 'Z', access_token, reviewer_token, payload.reviewer_name, 'active', candidate_id_safe, gitea_user if gitea_client else None, 0)
-    )
-    session_id = c.lastrowid
-    conn.commit()
-    
-    # Интеграция с Gitea (если клиент инициализирован)
     gitea_clone_url = None
-    if gitea_client:
-        try:
-            # 1. Создаём пользователя для кандидата (или используем существующего)
-            candidate_email = f"{gitea_user}@code-review.local"
-            user_result = gitea_client.create_user(
-                username=gitea_user,
-                email=candidate_email
-            )
-            
-            # Пользователь создан или уже существует - продолжаем в любом случае
-            if user_result:
-                logger.info(f"Created Gitea user: {gitea_user}")
-            else:
-                # Проверяем, может пользователь уже существует (это нормально)
-                # Это не ошибка - просто продолжаем использовать существующего пользователя
-                logger.info(f"Gitea user may already exist: {gitea_user}, continuing...")
+    pr_id = None
+    try:
+        # 1. Создаём пользователя для кандидата (или используем существующего)
+        candidate_email = f"{gitea_user}@code-review.local"
+        user_result = await async_gitea.create_user(
+            username=gitea_user,
+            email=candidate_email
+        )
+        
+        # Пользователь создан или уже существует - продолжаем в любом случае
+        if user_result:
+            logger.info(f"Created Gitea user: {gitea_user}")
+        else:
+            # Проверяем, может пользователь уже существует (это нормально)
+            # Это не ошибка - просто продолжаем использовать существующего пользователя
+            logger.info(f"Gitea user may already exist: {gitea_user}, continuing...")
+        
+        # Продолжаем создание репозитория даже если пользователь уже существует
+        
+        # Теперь создаём репозиторий с session_id
+        gitea_repo = f"session_{session_id}"
+        repo_result = await async_gitea.create_repository(
+            owner=gitea_user,
+            repo_name=gitea_repo,
+            description=f"Code review session for {candidate_name}",
+            private=True
+        )
+        
+        if repo_result:
+            logger.info(f"Created Gitea repository: {gitea_user}/{gitea_repo}")
             
-            # Продолжаем создание репозитория даже если пользователь уже существует
+            # Минимальная задержка для инициализации репозитория (не блокирует event loop)
+            await asyncio.sleep(0.3)
             
-            # Теперь создаём репозиторий с session_id
-            gitea_repo = f"session_{session_id}"
-            repo_result = gitea_client.create_repository(
+            # 3. Создаём ветку для кандидата сразу
+            candidate_branch = f"candidate-work-{session_id}"
+            branch_result = await async_gitea.create_branch(
                 owner=gitea_user,
-                repo_name=gitea_repo,
-                description=f"Code review session for {payload.candidate_name}",
-                private=True
+                repo=gitea_repo,
+                branch_name=candidate_branch,
+                from_branch="main"
             )
             
-            if repo_result:
-                logger.info(f"Created Gitea repository: {gitea_user}/{gitea_repo}")
-                
-                # Минимальная задержка для инициализации репозитория
-                import time
-                time.sleep(0.3)  # Уменьшили до 0.3 секунды
-                
-                # 3. Создаём ветку для кандидата сразу
-                candidate_branch = f"candidate-work-{session_id}"
-                branch_result = gitea_client.create_branch(
-                    owner=gitea_user,
-                    repo=gitea_repo,
-                    branch_name=candidate_branch,
-                    from_branch="main"
-                )
-                
-                if not branch_result:
-                    # Если не получилось создать ветку, пробуем создать файл в main
-                    logger.warning(f"Failed to create branch {candidate_branch}, trying main branch")
-                    candidate_branch = "main"
-                
-                # Создаём файл сразу в нужной ветке (candidate-work-{id} или main)
-                starting_code = f"""# Code Review Session #{session_id}
-# Candidate: {payload.candidate_name}
+            if not branch_result:
+                # Если не получилось создать ветку, пробуем создать файл в main
+                logger.warning(f"Failed to create branch {candidate_branch}, trying main branch")
+                candidate_branch = "main"
+            
+            # Создаём файл сразу в нужной ветке (candidate-work-{id} или main)
+            starting_code = f"""# Code Review Session #{session_id}
+# Candidate: {candidate_name}
 
 def greet():
     print("Hi")
     return True
 """
-                # Пытаемся создать файл с быстрыми повторными попытками
-                file_result = None
-                for attempt in range(2):  # Уменьшили до 2 попыток
-                    file_result = gitea_client.create_file(
-                        owner=gitea_user,
-                        repo=gitea_repo,
-                        file_path="main.py",
-                        content=starting_code,
-                        message=f"Code review session #{session_id} - candidate work",
-                        branch=candidate_branch,
-                        new_branch=True
-                    )
-                    if file_result:
-                        break
-                    if attempt < 1:
-                        time.sleep(0.5)  # Быстрая задержка: 0.5 сек вместо 2, 4
-                        logger.info(f"Retrying file creation (attempt {attempt + 2}/2)...")
-                
+            # Пытаемся создать файл с быстрыми повторными попытками
+            file_result = None
+            for attempt in range(2):  # Уменьшили до 2 попыток
+                file_result = await async_gitea.create_file(
+                    owner=gitea_user,
+                    repo=gitea_repo,
+                    file_path="main.py",
+                    content=starting_code,
+                    message=f"Code review session #{session_id} - candidate work",
+                    branch=candidate_branch,
+                    new_branch=True
+                )
                 if file_result:
-                    gitea_enabled = 1
-                    gitea_clone_url = gitea_client.get_repository_clone_url(gitea_user, gitea_repo)
-                    logger.info(f"Initialized starting code in repository (branch: {candidate_branch})")
-                    
-                    # Обновляем сессию с данными Gitea
-                    c.execute(
-                        "UPDATE sessions SET gitea_repo = ?, gitea_enabled = ? WHERE id = ?",
-                        (gitea_repo, gitea_enabled, session_id)
-                    )
-                    conn.commit()
+                    break
+                if attempt < 1:
+                    await asyncio.sleep(0.5)  # Быстрая задержка: 0.5 сек вместо 2, 4
+                    logger.info(f"Retrying file creation (attempt {attempt + 2}/2)...")
+            
+            if file_result:
+                gitea_enabled = 1
+                gitea_clone_url = gitea_client.get_repository_clone_url(gitea_user, gitea_repo)
+                logger.info(f"Initialized starting code in repository (branch: {candidate_branch})")
+                
+                # Обновляем сессию с данными Gitea
+                await _update_session(
+                    session_id,
+                    "UPDATE sessions SET gitea_repo = ?, gitea_enabled = ? WHERE id = ?",
+                    (gitea_repo, gitea_enabled, session_id)
+                )
+                
+                # Автоматически создаём PR (файл уже в нужной ветке)
+                try:
+                    logger.info(f"Creating PR for session {session_id}")
+                    # Минимальная задержка для синхронизации Gitea
+                    await asyncio.sleep(0.3)
                     
-                    # Автоматически создаём PR (файл уже в нужной ветке)
-                    try:
-                        logger.info(f"Creating PR for session {session_id}")
-                        # Минимальная задержка для синхронизации Gitea
-                        time.sleep(0.3)
-                        
-                        # Создаём PR из ветки кандидата в main
-                        pr_title = f"Code Review Session #{session_id} - {payload.candidate_name}"
-                        pr_body = f"Code review session for candidate: {payload.candidate_name}\n\nSession ID: {session_id}\n\nThis PR contains the candidate's work for review."
-                        
-                        pr_result = gitea_client.create_pull_request(
-                            owner=gitea_user,
-                            repo=gitea_repo,
-                            title=pr_title,
-                            body=pr_body,
-                            head=candidate_branch,
-                            base="main"
-                        )
-                        
-                        if pr_result:
-                            pr_id = pr_result.get("number")
-                            c.execute("UPDATE sessions SET gitea_pr_id = ? WHERE id = ?", (pr_id, session_id))
-                            conn.commit()
-                            logger.info(f"Created PR #{pr_id} for session {session_id}")
-                        else:
-                            logger.warning(f"Failed to create PR for session {session_id}")
-                    except Exception as e:
-                        logger.error(f"Error creating PR for session {session_id}: {e}", exc_info=True)
-                        # Не прерываем создание сессии, если PR не создался
-                else:
-                    logger.warning(f"Failed to create initial file in repository, but repository exists")
-                    # Репозиторий создан, но файл не создан - всё равно включаем интеграцию
-                    gitea_enabled = 1
-                    gitea_clone_url = gitea_client.get_repository_clone_url(gitea_user, gitea_repo)
+                    # Создаём PR из ветки кандидата в main
+                    pr_title = f"Code Review Session #{session_id} - {candidate_name}"
+                    pr_body = f"Code review session for candidate: {candidate_name}\n\nSession ID: {session_id}\n\nThis PR contains the candidate's work for review."
                     
-                    # Обновляем сессию с данными Gitea
-                    c.execute(
-                        "UPDATE sessions SET gitea_repo = ?, gitea_enabled = ? WHERE id = ?",
-                        (gitea_repo, gitea_enabled, session_id)
+                    pr_result = await async_gitea.create_pull_request(
+                        owner=gitea_user,
+                        repo=gitea_repo,
+                        title=pr_title,
+                        body=pr_body,
+                        head=candidate_branch,
+                        base="main"
                     )
-                    conn.commit()
+                    
+                    if pr_result:
+                        pr_id = pr_result.get("number")
+                        await _update_session(session_id, "UPDATE sessions SET gitea_pr_id = ? WHERE id = ?", (pr_id, session_id))
+                        logger.info(f"Created PR #{pr_id} for session {session_id}")
+                        # Зеркало клонируется заранее - к первому просмотру PR diff уже локальный
+                        await _schedule_mirror_sync(gitea_user, gitea_repo, [_pr_commits(pr_result)] if _pr_commits(pr_result) else [])
+                    else:
+                        logger.warning(f"Failed to create PR for session {session_id}")
+                except Exception as e:
+                    logger.error(f"Error creating PR for session {session_id}: {e}", exc_info=True)
+                    # Не прерываем создание сессии, если PR не создался
             else:
-                logger.warning(f"Failed to create Gitea repository for user: {gitea_user}")
-                # Репозиторий не создан - сессия уже создана без Gitea
-        except Exception as e:
-            logger.error(f"Error during Gitea integration: {e}", exc_info=True)
-            # Если произошла ошибка, сессия уже создана без Gitea (gitea_enabled=0)
-    
-    # Сессия уже создана выше (с gitea_enabled=0 по умолчанию, или обновлена если Gitea успешно настроен)
+                logger.warning(f"Failed to create initial file in repository, but repository exists")
+                # Репозиторий создан, но файл не создан - всё равно включаем интеграцию
+                gitea_enabled = 1
+                gitea_clone_url = gitea_client.get_repository_clone_url(gitea_user, gitea_repo)
+                
+                # Обновляем сессию с данными Gitea
+                await _update_session(
+                    session_id,
+                    "UPDATE sessions SET gitea_repo = ?, gitea_enabled = ? WHERE id = ?",
+                    (gitea_repo, gitea_enabled, session_id)
+                )
+        else:
+            logger.warning(f"Failed to create Gitea repository for user: {gitea_user}")
+            # Репозиторий не создан - сессия уже создана без Gitea
+    except Exception as e:
+        logger.error(f"Error during Gitea integration: {e}", exc_info=True)
+        # Если произошла ошибка, сессия уже создана без Gitea (gitea_enabled=0)
 
-    conn.close()
 
-    # Создаём demo diff (для обратной совместимости)
-    diff_path = f"/artifacts/{session_id}_diff.patch"
-    demo_diff = """diff --git a/main.py b/main.py
-index abc123..def456 100644
---- a/main.py
-+++ b/main.py
-@@ -1,5 +1,6 @@
- def greet():
--    print("Hi")
-+    print("Hello, secure world!")
-+    # TODO: add input validation
-     return True
-"""
-    with open(diff_path, "w") as f:
-        f.write(demo_diff)
+    if gitea_enabled and gitea_clone_url:
+        return {"user": gitea_user, "repo": gitea_repo, "clone_url": gitea_clone_url, "pr_id": pr_id}
+    return None
+
+def _gitea_info(gitea: dict) -> dict:
+    return {
+        "enabled": True,
+        "user": gitea["user"],
+        "repo": gitea["repo"],
+        "clone_url": gitea["clone_url"],
+        "web_url": f"{GITEA_WEB_URL}/{gitea['user']}/{gitea['repo']}"
+    }
+
+# === REVIEWER API ===
+# === API: Reviewer - Создать сессию ===
+_REVIEWER_SESSION_COLUMNS = (
+    "candidate_name, mr_package, comments, created_at, expires_at, access_token, reviewer_token, reviewer_name, "
+    "status, candidate_id, gitea_user, gitea_enabled, created_at_epoch, expires_at_epoch"
+)
+
+@app.post("/api/reviewer/sessions")
+async def reviewer_create_session(payload: ReviewerSessionCreate):
+    logger.info(f"Reviewer creating session for candidate={payload.candidate_name}, reviewer={payload.reviewer_name}")
+
+    created_at, expires_at, created_at_epoch, expires_at_epoch = session_timer.session_times()
+    access_token = generate_access_token()  # Для кандидата
+    reviewer_token = generate_reviewer_token()  # Для проверяющего
+    candidate_id_safe, gitea_user = _candidate_gitea_names(payload.candidate_name)
+
+    # Сначала всегда создаём сессию, чтобы получить session_id
+    session_id = await _create_session_row(
+        f"INSERT INTO sessions ({_REVIEWER_SESSION_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (payload.candidate_name, payload.mr_package, json.dumps([]), created_at, expires_at, access_token, reviewer_token, payload.reviewer_name, 'active', candidate_id_safe, gitea_user if gitea_client else None, 0, created_at_epoch, expires_at_epoch)
+    )
+    
+    # Интеграция с Gitea (если клиент инициализирован); без неё сессия остаётся с gitea_enabled=0
+    gitea = await _provision_gitea(session_id, payload.candidate_name, gitea_user) if async_gitea else None
+
+    # Demo diff и golden truth - общие для всех сессий с тем же содержимым
+    await _store_session_artifacts(session_id, DEMO_DIFF, payload.mr_package)
 
     response = {
         "session_id": session_id,
@@ -553,26 +733,339 @@ index abc123..def456 100644
     }
     
     # Добавляем информацию о Gitea если она доступна
-    if gitea_enabled and gitea_clone_url:
-        response["gitea"] = {
-            "enabled": True,
-            "user": gitea_user,
-            "repo": gitea_repo,
-            "clone_url": gitea_clone_url,
-            "web_url": f"{GITEA_WEB_URL}/{gitea_user}/{gitea_repo}"
-        }
+    if gitea:
+        response["gitea"] = _gitea_info(gitea)
     
     return response
 
+# === API: Reviewer - Пакетное создание сессий (раунд найма) ===
+BULK_SESSIONS_MAX = int(os.getenv("BULK_SESSIONS_MAX", "200"))
+# Сессий, для которых Gitea готовится одновременно (запросы идут фоновой полосой планировщика Gitea)
+BULK_PROVISION_CONCURRENCY = int(os.getenv("BULK_PROVISION_CONCURRENCY", "8"))
+BULK_STATUS_TTL = int(os.getenv("BULK_STATUS_TTL", "86400"))
+# Подготовка идёт в процессе API. Незавершённые сессии пачек - в множестве bulk:pending, каждая
+# захвачена процессом (bulk:claim:{id}, TTL продлевается при старте её подготовки). После рестарта
+# захваты истекают, и фоновый проход (один процесс, lease) доделывает брошенные сессии
+BULK_CLAIM_TTL = int(os.getenv("BULK_CLAIM_TTL", "300"))
+BULK_RESUME_INTERVAL = float(os.getenv("BULK_RESUME_INTERVAL", "60"))
+BULK_RESUME_LEASE_KEY = "bulk_resume:leader"
+BULK_PENDING_KEY = "bulk:pending"
+_BULK_OWNER = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+
+# Задачи подготовки Gitea идут дольше запроса - ссылки держим, пока не завершатся
+_bulk_tasks: set = set()
+
+def _bulk_status_key(batch_id: str) -> str:
+    return f"bulk:{batch_id}"
+
+def _bulk_session_key(session_id: int) -> str:
+    # Сессия -> пачка, пока подготовка сессии не завершена
+    return f"bulk:session:{session_id}"
+
+def _bulk_claim_key(session_id: int) -> str:
+    return f"bulk:claim:{session_id}"
+
+def _insert_sessions_bulk(conn, rows: list, refs: dict) -> list:
+    """
+    Пачка сессий одной транзакцией: строки - executemany, общие артефакты (diff, golden truth) -
+    один incref на артефакт на всю пачку. Returns: id сессий в порядке rows
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    conn.executemany(
+        f"INSERT INTO sessions ({_REVIEWER_SESSION_COLUMNS}, diff_sha, golden_sha) VALUES ({', '.join('?' * 16)})", rows
+    )
+    tokens = [row[5] for row in rows]  # access_token - уникальный индекс
+    ids = dict(conn.execute(
+        f"SELECT access_token, id FROM sessions WHERE access_token IN ({', '.join('?' * len(tokens))})", tokens
+    ).fetchall())
+    session_ids = [ids[token] for token in tokens]
+    for sha, kind, size in refs.values():
+        artifact_store.incref(conn, sha, kind, size, count=len(rows))
+    summaries.refresh_many(conn, session_ids)
+    return session_ids
+
+def _set_bulk_status(batch_id: str, statuses: dict):
+    key = _bulk_status_key(batch_id)
+    pipe = redis_conn.pipeline()
+    pipe.hset(key, mapping={field: json.dumps(status) for field, status in statuses.items()})
+    pipe.expire(key, BULK_STATUS_TTL)
+    pipe.execute()
+
+async def _save_bulk_status(batch_id: str, statuses: dict):
+    # Статус - для клиентов, подключившихся к потоку позже; подготовку сессий не прерывает
+    try:
+        await run_io(_set_bulk_status, batch_id, statuses)
+    except Exception as e:
+        logger.warning(f"Failed to save bulk status {batch_id}: {e}")
+
+def _start_bulk_status(batch_id: str, session_ids: list):
+    """Статус pending по сессиям, связь сессия -> пачка и захват сессий этим процессом"""
+    key = _bulk_status_key(batch_id)
+    pipe = redis_conn.pipeline()
+    statuses = {str(sid): json.dumps({"session_id": sid, "status": "pending"}) for sid in session_ids}
+    pipe.hset(key, mapping={**statuses, "started_at": json.dumps(time.time())})
+    pipe.expire(key, BULK_STATUS_TTL)
+    for sid in session_ids:
+        pipe.set(_bulk_session_key(sid), batch_id, ex=BULK_STATUS_TTL)
+        pipe.set(_bulk_claim_key(sid), _BULK_OWNER, nx=True, ex=BULK_CLAIM_TTL)
+    pipe.sadd(BULK_PENDING_KEY, *session_ids)
+    pipe.execute()
+
+def _take_bulk_claim(session_id: int) -> bool:
+    """Захватить сессию (или продлить свой захват); False - сессию готовит другой процесс"""
+    key = _bulk_claim_key(session_id)
+    if redis_conn.set(key, _BULK_OWNER, nx=True, ex=BULK_CLAIM_TTL):
+        return True
+    if redis_conn.get(key) == _BULK_OWNER.encode():
+        redis_conn.expire(key, BULK_CLAIM_TTL)
+        return True
+    return False
+
+def _finish_bulk_session(batch_id: str, session_id: int, status: dict):
+    """Записать статус сессии и снять захват. Returns: итог пачки, если сессия последняя (ровно один раз), иначе None"""
+    key = _bulk_status_key(batch_id)
+    pipe = redis_conn.pipeline()
+    pipe.hset(key, str(session_id), json.dumps(status))
+    pipe.delete(_bulk_session_key(session_id), _bulk_claim_key(session_id))
+    pipe.srem(BULK_PENDING_KEY, session_id)
+    pipe.hgetall(key)
+    statuses = {field.decode(): json.loads(value) for field, value in pipe.execute()[-1].items()}
+    started_at = statuses.pop("started_at", None)
+    if "completed" in statuses or any(s["status"] == "pending" for s in statuses.values()):
+        return None
+    counts = {"ready": 0, "failed": 0}
+    for session_status in statuses.values():
+        counts[session_status["status"]] += 1
+    completed = dict(counts, total=len(statuses), duration_ms=round((time.time() - started_at) * 1000) if started_at else 0)
+    # Последние сессии пачки могут завершиться в разных процессах - итог пишет и публикует один
+    if not redis_conn.hsetnx(key, "completed", json.dumps(completed)):
+        return None
+    return completed
+
+def _bulk_snapshot(batch_id: str):
+    """{"sessions": [...], "completed": итог или None}; None - пачка неизвестна или статус истёк"""
+    raw = redis_conn.hgetall(_bulk_status_key(batch_id))
+    if not raw:
+        return None
+    statuses = {field.decode(): json.loads(value) for field, value in raw.items()}
+    completed = statuses.pop("completed", None)
+    statuses.pop("started_at", None)
+    sessions = sorted(statuses.values(), key=lambda status: status["session_id"])
+    return {"batch_id": batch_id, "sessions": sessions, "completed": completed}
+
+async def _claim_bulk_session(batch_id: str, session_id: int) -> bool:
+    try:
+        return await run_io(_take_bulk_claim, session_id)
+    except Exception as e:
+        logger.warning(f"Bulk {batch_id}: claim for session {session_id} unavailable, provisioning locally: {e}")
+        return True
+
+async def _provision_bulk_session(batch_id: str, session_id: int, candidate_name: str, gitea_user: str):
+    """Подготовить Gitea для сессии пачки; сессию, захваченную другим процессом, пропускаем"""
+    if not await _claim_bulk_session(batch_id, session_id):
+        return
+    try:
+        with async_gitea.background():
+            gitea = await _provision_gitea(session_id, candidate_name, gitea_user)
+    except Exception as e:
+        logger.error(f"Bulk {batch_id}: Gitea provisioning failed for session {session_id}: {e}")
+        gitea = None
+    await _report_bulk_session(batch_id, session_id, gitea)
+
+async def _report_bulk_session(batch_id: str, session_id: int, gitea: dict | None):
+    """Статус сессии пачки: в Redis, в поток пачки и сессии; последняя сессия - completed"""
+    status = {"session_id": session_id, "status": "ready" if gitea else "failed"}
+    if gitea:
+        status["gitea"] = _gitea_info(gitea)
+    # Статус - для клиентов, подключившихся к потоку позже; подготовку сессий не прерывает
+    try:
+        completed = await run_io(_finish_bulk_session, batch_id, session_id, status)
+    except Exception as e:
+        logger.warning(f"Failed to save bulk status {batch_id}: {e}")
+        completed = None
+    await publish_event_async(bulk_channel(batch_id), "provisioned", status)
+    await publish_event_async(session_channel(session_id), "gitea_provisioned", status)
+    if completed:
+        await publish_event_async(bulk_channel(batch_id), "completed", completed)
+        logger.info(f"Bulk {batch_id}: {completed['ready']}/{completed['total']} sessions provisioned in {completed['duration_ms']} ms")
+
+async def _provision_bulk(sessions: list):
+    """Подготовить Gitea для сессий [(batch_id, session_id, candidate_name, gitea_user)] (не больше BULK_PROVISION_CONCURRENCY одновременно)"""
+    semaphore = asyncio.Semaphore(BULK_PROVISION_CONCURRENCY)
+
+    async def provision(session: tuple):
+        async with semaphore:
+            await _provision_bulk_session(*session)
+
+    await asyncio.gather(*(provision(session) for session in sessions))
+
+def _abandoned_bulk_sessions() -> dict:
+    """session_id -> batch_id незавершённых сессий пачек, которые не готовит ни один процесс"""
+    session_ids = [int(sid) for sid in redis_conn.smembers(BULK_PENDING_KEY)]
+    if not session_ids:
+        return {}
+    pipe = redis_conn.pipeline()
+    for sid in session_ids:
+        pipe.get(_bulk_session_key(sid))
+        pipe.exists(_bulk_claim_key(sid))
+    values = pipe.execute()
+    abandoned, expired = {}, []
+    for sid, batch_id, claimed in zip(session_ids, values[::2], values[1::2]):
+        if not batch_id:
+            expired.append(sid)  # статус пачки истёк
+        elif not claimed:
+            abandoned[sid] = batch_id.decode()
+    if expired:
+        redis_conn.srem(BULK_PENDING_KEY, *expired)
+    return abandoned
+
+def _load_bulk_sessions(conn, session_ids: list) -> list:
+    return conn.execute(
+        f"SELECT id, candidate_name, gitea_user, gitea_repo, gitea_enabled, status, deleted_at FROM sessions "
+        f"WHERE id IN ({', '.join('?' * len(session_ids))})", session_ids
+    ).fetchall()
+
+async def _resume_bulk_provisioning() -> int:
+    """Доделать подготовку сессий пачек, брошенную процессом (рестарт); Returns: сколько сессий взято"""
+    abandoned = await run_io(_abandoned_bulk_sessions)
+    if not abandoned:
+        return 0
+    rows = {row[0]: row for row in await db.run(_load_bulk_sessions, list(abandoned))}
+    to_provision = []
+    for session_id, batch_id in abandoned.items():
+        _, candidate_name, gitea_user, gitea_repo, gitea_enabled, status, deleted_at = rows.get(session_id, (None,) * 7)
+        if gitea_enabled:
+            # Подготовлена до рестарта, статус не успел записаться
+            if await _claim_bulk_session(batch_id, session_id):
+                clone_url = gitea_client.get_repository_clone_url(gitea_user, gitea_repo)
+                await _report_bulk_session(batch_id, session_id, {"user": gitea_user, "repo": gitea_repo, "clone_url": clone_url})
+        elif status == "active" and not deleted_at and gitea_user:
+            to_provision.append((batch_id, session_id, candidate_name, gitea_user))
+        elif await _claim_bulk_session(batch_id, session_id):
+            # Удалена или завершена - готовить нечего
+            await _report_bulk_session(batch_id, session_id, None)
+    if to_provision:
+        await _provision_bulk(to_provision)
+    return len(abandoned)
+
+async def _bulk_resume_loop():
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    client = aioredis.Redis(host='redis', port=6379, socket_connect_timeout=1, socket_timeout=1, decode_responses=True)
+    try:
+        while True:
+            try:
+                if await _hold_lease(client, BULK_RESUME_LEASE_KEY, owner, BULK_RESUME_INTERVAL):
+                    resumed = await _resume_bulk_provisioning()
+                    if resumed:
+                        logger.info(f"Bulk provisioning resumed for {resumed} sessions")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Bulk provisioning resume failed: {e}", exc_info=True)
+            await asyncio.sleep(BULK_RESUME_INTERVAL)
+    finally:
+        await client.aclose()
+
+@app.post("/api/reviewer/sessions/bulk")
+async def reviewer_create_sessions_bulk(payload: ReviewerBulkSessionCreate):
+    """
+    Создать сессии для раунда кандидатов
+
+    Строки сессий и ссылки на общие артефакты - одна транзакция, demo diff и golden truth
+    пишутся один раз на пачку. Токены возвращаются сразу; Gitea (пользователь, репозиторий, PR)
+    готовится в фоне - статус по сессиям в SSE потоке events_url.
+    """
+    if not payload.candidates:
+        raise HTTPException(status_code=400, detail="No candidates")
+    if len(payload.candidates) > BULK_SESSIONS_MAX:
+        raise HTTPException(status_code=400, detail=f"Too many candidates (max {BULK_SESSIONS_MAX})")
+    logger.info(f"Reviewer creating {len(payload.candidates)} sessions, reviewer={payload.reviewer_name}")
+
+    created_at, expires_at, created_at_epoch, expires_at_epoch = session_timer.session_times()
+    refs, blobs, diff_sha = await _session_artifact_refs(DEMO_DIFF, payload.mr_package)
+    golden_sha = refs["golden_sha"][0] if "golden_sha" in refs else None
+
+    rows = []
+    created = []
+    for candidate_name in payload.candidates:
+        access_token = generate_access_token()
+        reviewer_token = generate_reviewer_token()
+        candidate_id_safe, gitea_user = _candidate_gitea_names(candidate_name)
+        rows.append((candidate_name, payload.mr_package, json.dumps([]), created_at, expires_at, access_token, reviewer_token, payload.reviewer_name, 'active', candidate_id_safe, gitea_user if gitea_client else None, 0, created_at_epoch, expires_at_epoch, diff_sha, golden_sha))
+        created.append((candidate_name, gitea_user, access_token, reviewer_token))
+
+    session_ids = await db.run(_insert_sessions_bulk, rows, refs)
+    await run_io(_put_blobs, blobs, (diff_sha,))
+
+    batch_id = secrets.token_urlsafe(12)
+    sessions = []
+    for session_id, (candidate_name, gitea_user, access_token, reviewer_token) in zip(session_ids, created):
+        sessions.append({
+            "session_id": session_id,
+            "candidate_name": candidate_name,
+            "access_token": access_token,
+            "reviewer_token": reviewer_token,
+            "candidate_url": f"/candidate/{access_token}",
+            "reviewer_url": f"/reviewer/sessions/{session_id}"
+        })
+
+    if async_gitea:
+        try:
+            await run_io(_start_bulk_status, batch_id, session_ids)
+        except Exception as e:
+            logger.warning(f"Failed to save bulk status {batch_id}: {e}")
+        task = asyncio.create_task(_provision_bulk([
+            (batch_id, session_id, candidate_name, gitea_user)
+            for session_id, (candidate_name, gitea_user, _, _) in zip(session_ids, created)
+        ]))
+        _bulk_tasks.add(task)
+        task.add_done_callback(_bulk_tasks.discard)
+    else:
+        # Без Gitea подготавливать нечего - пачка сразу завершена
+        statuses = {str(sid): {"session_id": sid, "status": "skipped"} for sid in session_ids}
+        statuses["completed"] = {"ready": 0, "failed": 0, "total": len(session_ids), "duration_ms": 0}
+        await _save_bulk_status(batch_id, statuses)
+
+    return {
+        "batch_id": batch_id,
+        "sessions": sessions,
+        "events_url": f"/api/reviewer/sessions/bulk/{batch_id}/events"
+    }
+
+@app.get("/api/reviewer/sessions/bulk/{batch_id}/events")
+async def reviewer_bulk_events(batch_id: str):
+    """
+    SSE поток подготовки пачки: снимок статусов, затем provisioned на каждую сессию
+    и completed с итогом (поток закрывается)
+    """
+    if await run_io(_bulk_snapshot, batch_id) is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    async def stream():
+        async with event_broker.subscribe(bulk_channel(batch_id)) as events:
+            # Снимок после подписки - чтобы не потерять события между проверкой и подпиской
+            snapshot = await run_io(_bulk_snapshot, batch_id)
+            yield format_sse("status", snapshot)
+            if snapshot is None or snapshot["completed"]:
+                return
+            while True:
+                try:
+                    message = await asyncio.wait_for(events.get(), timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield SSE_HEARTBEAT
+                    continue
+                yield format_sse(message["event"], message["data"])
+                if message["event"] == "completed":
+                    return
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 # === API: Reviewer - Список сессий ===
 @app.get("/api/reviewer/sessions")
-def reviewer_list_sessions():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+async def reviewer_list_sessions():
     # Показываем только не удалённые сессии
-    c.execute("SELECT id, candidate_name, reviewer_name, created_at, expires_at, status, gitea_user, gitea_repo, gitea_pr_id, gitea_enabled, comments, candidate_ready_at FROM sessions WHERE deleted_at IS NULL ORDER BY created_at DESC")
-    rows = c.fetchall()
-    conn.close()
+    # Узкие строки из проекции session_summaries (без JSON комментариев) - один проход по индексу
+    rows = await db.run(summaries.list_active)
     
     sessions = []
     for row in rows:
@@ -583,18 +1076,22 @@ def reviewer_list_sessions():
             "created_at": row[3],
             "expires_at": row[4],
             "status": row[5] or "active",
-            "comments": json.loads(row[10]) if len(row) > 10 and row[10] else [],
-            "candidate_ready_at": row[11] if len(row) > 11 else None
+            "comment_count": row[6],
+            "comment_counts": {"by_type": json.loads(row[7]), "by_severity": json.loads(row[8])},
+            "last_activity_at": row[9],
+            "score": row[10],
+            "grade": row[11],
+            "candidate_ready_at": row[12]
         }
         
         # Добавляем информацию о Gitea если она доступна
-        if len(row) > 9 and row[9]:  # gitea_enabled
+        if row[13]:  # gitea_enabled
             session_data["gitea"] = {
                 "enabled": True,
-                "user": row[6],  # gitea_user
-                "repo": row[7],  # gitea_repo
-                "pr_id": row[8],  # gitea_pr_id
-                "web_url": f"{GITEA_WEB_URL}/{row[6]}/{row[7]}" if row[6] and row[7] else None
+                "user": row[14],  # gitea_user
+                "repo": row[15],  # gitea_repo
+                "pr_id": row[16],  # gitea_pr_id
+                "web_url": f"{GITEA_WEB_URL}/{row[14]}/{row[15]}" if row[14] and row[15] else None
             }
         
         sessions.append(session_data)
@@ -603,84 +1100,68 @@ def reviewer_list_sessions():
 
 # === API: Reviewer - Удалить сессию ===
 @app.delete("/api/reviewer/sessions/{session_id}")
-def reviewer_delete_session(session_id: int):
+async def reviewer_delete_session(session_id: int):
     """
     Удалить сессию (soft delete - помечаем как удалённую)
     """
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
     # Проверяем, что сессия существует и не удалена
-    c.execute("SELECT id, deleted_at FROM sessions WHERE id = ?", (session_id,))
-    row = c.fetchone()
+    row = await db.fetchone("SELECT id, deleted_at FROM sessions WHERE id = ?", (session_id,))
     
     if not row:
-        conn.close()
         raise HTTPException(status_code=404, detail="Session not found")
     
     if row[1]:  # deleted_at уже установлен
-        conn.close()
         raise HTTPException(status_code=400, detail="Session already deleted")
     
-    # Soft delete - помечаем как удалённую
+    # Soft delete - помечаем как удалённую, артефакты сессии освобождаются (удалит GC)
     deleted_at = datetime.utcnow().isoformat() + 'Z'
-    c.execute("UPDATE sessions SET deleted_at = ? WHERE id = ?", (deleted_at, session_id))
-    conn.commit()
-    conn.close()
+    if not await db.run(_release_session_artifacts, session_id, deleted_at):
+        raise HTTPException(status_code=400, detail="Session already deleted")
+    await _invalidate_token_cache(session_id)
     
     logger.info(f"Session {session_id} marked as deleted")
+    await publish_event_async(session_channel(session_id), "session_deleted", {"session_id": session_id, "deleted_at": deleted_at})
     return {"status": "deleted", "session_id": session_id, "deleted_at": deleted_at}
 
 # === API: Reviewer - Завершить сессию досрочно ===
 @app.post("/api/reviewer/sessions/{session_id}/finish")
-def reviewer_finish_session(session_id: int):
+async def reviewer_finish_session(session_id: int):
     """
     Завершить сессию досрочно (установить expires_at на текущее время)
     """
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
     # Проверяем, что сессия существует
-    c.execute("SELECT id, expires_at, deleted_at FROM sessions WHERE id = ?", (session_id,))
-    row = c.fetchone()
+    row = await db.fetchone("SELECT id, expires_at, deleted_at FROM sessions WHERE id = ?", (session_id,))
     
     if not row:
-        conn.close()
         raise HTTPException(status_code=404, detail="Session not found")
     
     if row[2]:  # deleted_at уже установлен
-        conn.close()
         raise HTTPException(status_code=400, detail="Session already deleted")
     
     # Устанавливаем expires_at на текущее время
     finished_at = datetime.utcnow().isoformat() + 'Z'
-    c.execute("UPDATE sessions SET expires_at = ?, status = 'finished' WHERE id = ?", (finished_at, session_id))
-    conn.commit()
-    conn.close()
+    await _update_session(
+        session_id,
+        "UPDATE sessions SET expires_at = ?, expires_at_epoch = ?, status = ? WHERE id = ?",
+        (finished_at, session_timer.to_epoch(finished_at), session_timer.STATUS_FINISHED, session_id)
+    )
+    await _invalidate_token_cache(session_id)
     
     logger.info(f"Session {session_id} finished early by reviewer")
+    await publish_event_async(session_channel(session_id), "session_finished", {"session_id": session_id, "status": "finished", "expires_at": finished_at})
     return {"status": "finished", "session_id": session_id, "finished_at": finished_at}
 
 # === API: Reviewer - Получить сессию ===
 @app.get("/api/reviewer/sessions/{session_id}")
-def reviewer_get_session(session_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+async def reviewer_get_session(session_id: int):
     # Показываем сессию даже если она удалена (для просмотра истории)
-    c.execute("SELECT id, candidate_name, reviewer_name, mr_package, comments, created_at, expires_at, status, access_token, gitea_user, gitea_repo, gitea_pr_id, gitea_enabled, deleted_at, candidate_ready_at FROM sessions WHERE id = ?", (session_id,))
-    row = c.fetchone()
-    conn.close()
+    row = await db.fetchone("SELECT id, candidate_name, reviewer_name, mr_package, comments, created_at, expires_at, status, access_token, gitea_user, gitea_repo, gitea_pr_id, gitea_enabled, deleted_at, candidate_ready_at, package_sha, package_status FROM sessions WHERE id = ?", (session_id,))
     
     if not row:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    created_at = row[5] if row[5] else datetime.utcnow().isoformat() + 'Z'
-    expires_at = row[6] if row[6] else (datetime.utcnow() + timedelta(hours=2)).isoformat() + 'Z'
-    
-    if created_at and not created_at.endswith('Z') and '+' not in created_at:
-        created_at = created_at + 'Z'
-    if expires_at and not expires_at.endswith('Z') and '+' not in expires_at:
-        expires_at = expires_at + 'Z'
+    # Время уже нормализовано при записи (и в session_timer.backfill для старых сессий)
+    created_at, expires_at = row[5], row[6]
     
     response = {
         "id": row[0],
@@ -693,7 +1174,9 @@ def reviewer_get_session(session_id: int):
         "status": row[7] or "active",
         "access_token": row[8],  # Токен для кандидата
         "deleted_at": row[13] if len(row) > 13 else None,  # deleted_at
-        "candidate_ready_at": row[14] if len(row) > 14 else None  # candidate_ready_at
+        "candidate_ready_at": row[14] if len(row) > 14 else None,  # candidate_ready_at
+        "package_sha": row[15],
+        "package_status": row[16]
     }
     
     # Добавляем информацию о Gitea если она доступна
@@ -708,34 +1191,45 @@ def reviewer_get_session(session_id: int):
     
     return response
 
+# === SSE: события сессии для дашборда ревьюера ===
+@app.get("/api/reviewer/sessions/{session_id}/events")
+async def reviewer_session_events(session_id: int):
+    """
+    SSE поток событий сессии: новые комментарии, готовность кандидата,
+    продление/завершение, постановка оценки в очередь
+    """
+    if not await db.fetchone("SELECT 1 FROM sessions WHERE id = ?", (session_id,)):
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    async def stream():
+        async with event_broker.subscribe(session_channel(session_id)) as events:
+            yield format_sse("connected", {"session_id": session_id})
+            while True:
+                try:
+                    message = await asyncio.wait_for(events.get(), timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield SSE_HEARTBEAT
+                    continue
+                yield format_sse(message["event"], message["data"])
+                if message["event"] == "session_deleted":
+                    return
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 # === API: Получить сессию ===
 @app.get("/api/sessions/{session_id}")
-def get_session(session_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT id, candidate_id, mr_package, comments, created_at, expires_at FROM sessions WHERE id = ?", (session_id,))
-    row = c.fetchone()
-    conn.close()
+async def get_session(session_id: int):
+    row = await db.fetchone("SELECT id, candidate_id, mr_package, comments, created_at, expires_at FROM sessions WHERE id = ?", (session_id,))
     if not row:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    # Fallback для старых сессий без created_at/expires_at
-    created_at = row[4] if row[4] else datetime.utcnow().isoformat() + 'Z'
-    expires_at = row[5] if row[5] else (datetime.utcnow() + timedelta(hours=2)).isoformat() + 'Z'
-    
-    # Убеждаемся, что время в UTC формате (добавляем Z если его нет)
-    if created_at and not created_at.endswith('Z') and '+' not in created_at:
-        created_at = created_at + 'Z'
-    if expires_at and not expires_at.endswith('Z') and '+' not in expires_at:
-        expires_at = expires_at + 'Z'
-    
     return {
         "id": row[0],
         "candidate_id": row[1],
         "mr_package": row[2],
         "comments": json.loads(row[3]),
-        "created_at": created_at,
-        "expires_at": expires_at
+        "created_at": row[4],
+        "expires_at": row[5]
     }
 
 @app.post("/api/upload-mr")
@@ -743,75 +1237,156 @@ async def upload_mr(file: UploadFile = File(...)):
     if not file.filename.endswith('.zip'):
         raise HTTPException(status_code=400, detail="Only .zip files allowed")
 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    # Копирование чанками с sha256 - в пуле io, в памяти не держим весь архив
+    try:
+        tmp_path, package_sha, size = await run_io(packages.spool_upload, file.file)
+    except packages.UploadTooLarge:
+        raise HTTPException(status_code=413, detail=f"File too large (max {packages.MAX_UPLOAD_SIZE} bytes)")
+    finally:
+        await file.close()
 
-    now = datetime.utcnow()
-    expires_at = now + timedelta(hours=2)
+    if not await run_io(packages.validate_upload, tmp_path):
+        raise HTTPException(status_code=400, detail="Invalid ZIP file")
+
+    # Тот же пакет уже распакован - повторно не распаковываем
+    already_extracted = await run_io(packages.is_extracted, package_sha)
+    package_status = packages.PACKAGE_READY if already_extracted else packages.PACKAGE_PENDING
+
+    created_at, expires_at, created_at_epoch, expires_at_epoch = session_timer.session_times()
     access_token = generate_access_token()
     reviewer_token = generate_reviewer_token()
 
-    c.execute(
-        "INSERT INTO sessions (candidate_id, mr_package, comments, created_at, expires_at, access_token, reviewer_token, candidate_name, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-        (f"upload_{int(time.time())}", file.filename, json.dumps([]), now.isoformat() + 'Z', expires_at.isoformat() + 'Z', access_token, reviewer_token, f"upload_{int(time.time())}", 'active')
+    session_id = await _create_session_row(
+        "INSERT INTO sessions (candidate_id, mr_package, comments, created_at, expires_at, access_token, reviewer_token, candidate_name, status, package_status, created_at_epoch, expires_at_epoch) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (f"upload_{int(time.time())}", file.filename, json.dumps([]), created_at, expires_at, access_token, reviewer_token, f"upload_{int(time.time())}", 'active', package_status, created_at_epoch, expires_at_epoch)
     )
-    session_id = c.lastrowid
-    conn.commit()
-    conn.close()
-
-    mr_dir = f"/artifacts/mr_{session_id}"
-    os.makedirs(mr_dir, exist_ok=True)
-    zip_path = f"{mr_dir}/{session_id}.zip"
-    with open(zip_path, "wb") as f:
-        content = await file.read()
-        f.write(content)
+    logger.info(f"Uploaded MR package {package_sha} ({size} bytes) for session {session_id}")
 
-    if not zipfile.is_zipfile(zip_path):
-        os.remove(zip_path)
-        raise HTTPException(status_code=400, detail="Invalid ZIP file")
-
-    with zipfile.ZipFile(zip_path) as z:
-        z.extractall(mr_dir)
+    # Ссылка на пакет (incref) - до переноса zip в хранилище
+    await _store_session_artifacts(session_id, UPLOAD_DIFF, package=(package_sha, size))
+    await run_io(packages.store_upload, tmp_path, package_sha)
 
-    diff_path = f"/artifacts/{session_id}_diff.patch"
-    with open(diff_path, "w") as f:
-        f.write(f"""diff --git a/uploaded_file b/uploaded_file
-index 0000000..1111111 100644
---- /dev/null
-+++ b/uploaded_file
-@@ -0,0 +1,1 @@
-+Uploaded via /api/upload-mr
-""")
+    extract_job_id = None
+    if not already_extracted:
+        job = await run_io(_enqueue_package_extraction, package_sha, session_id)
+        extract_job_id = job.id
 
-    return {"session_id": session_id, "access_token": access_token, "reviewer_token": reviewer_token}
+    return {
+        "session_id": session_id,
+        "access_token": access_token,
+        "reviewer_token": reviewer_token,
+        "package_sha": package_sha,
+        "package_status": package_status,
+        "extract_job_id": extract_job_id
+    }
 
-# === API: Оценка (старый endpoint для обратной совместимости) ===
-@app.get("/api/sessions/{session_id}/evaluate")
-def evaluate_session(session_id: int):
+# Распаковка пакетов - в отдельной очереди: её worker работает рядом с хранилищем (/artifacts),
+# а worker оценки (default) файлов API не касается и масштабируется независимо
+PACKAGE_QUEUE = os.getenv("PACKAGE_QUEUE", "packages")
+
+def _enqueue_package_extraction(package_sha: str, session_id: int):
+    from rq import Queue
+    package_queue = Queue(PACKAGE_QUEUE, connection=get_queue().connection)
+    return package_queue.enqueue("packages.extract_package", package_sha, session_id, job_timeout=300)
+
+# Зеркала репозиториев Gitea (git_mirror) - своя очередь, её тоже обслуживает worker рядом с /artifacts.
+# Повторные постановки для одного репозитория в пределах GIT_MIRROR_SYNC_DEBOUNCE отбрасываются:
+# webhook push и pull_request приходят почти одновременно, а fetch без новых коммитов ничего не даёт
+GIT_MIRROR_SYNC_DEBOUNCE = int(os.getenv("GIT_MIRROR_SYNC_DEBOUNCE", "10"))
+
+def _pr_commits(pr: dict):
+    """(base sha, head sha) PR или None"""
+    base_sha = (pr.get("base") or {}).get("sha")
+    head_sha = (pr.get("head") or {}).get("sha")
+    return (base_sha, head_sha) if base_sha and head_sha else None
+
+def _enqueue_mirror_sync(owner: str, repo: str, diffs: list):
+    if not redis_conn.set(f"git_mirror:pending:{owner}/{repo}", 1, nx=True, ex=GIT_MIRROR_SYNC_DEBOUNCE):
+        return None
+    from rq import Queue
+    mirror_queue = Queue(git_mirror.MIRROR_QUEUE, connection=get_queue().connection)
+    return mirror_queue.enqueue(
+        "git_mirror.sync_mirror", owner, repo, gitea_client.get_repository_clone_url(owner, repo), diffs,
+        job_timeout=git_mirror.GIT_FETCH_TIMEOUT + 60)
+
+async def _schedule_mirror_sync(owner: str, repo: str, diffs: list = None):
+    """Обновить зеркало репозитория в фоне (и заранее вычислить diff для пар коммитов diffs)"""
+    if not git_mirror.GIT_MIRROR_ENABLED or not gitea_client or not owner or not repo:
+        return
+    try:
+        await run_io(_enqueue_mirror_sync, owner, repo, diffs or [])
+    except Exception as e:
+        logger.warning(f"Failed to schedule git mirror sync for {owner}/{repo}: {e}")
+
+# CI runner (worker/ci_runner.py): тесты ветки кандидата, свой пул worker в очереди CI_QUEUE.
+# Команда тестов - ci.json пакета: {"command": "...", "timeout": ..., "memory_mb": ..., "max_processes": ...}
+CI_ENABLED = os.getenv("CI_ENABLED", "0") == "1"
+CI_QUEUE = os.getenv("CI_QUEUE", "ci")
+CI_JOB_TIMEOUT = int(os.getenv("CI_JOB_TIMEOUT", "1800"))
+
+def _enqueue_ci(session_id: int):
+    from rq import Queue
+    ci_queue = Queue(CI_QUEUE, connection=get_queue().connection)
+    return ci_queue.enqueue("ci_runner.run_ci", session_id, job_timeout=CI_JOB_TIMEOUT)
+
+def _load_ci_config(mr_package: str, package_sha: str):
+    """ci.json пакета (загруженного или из /mr_packages); None - CI для пакета не настроен"""
+    path = os.path.join(packages.package_dir(package_sha), "ci.json") if package_sha else f"/mr_packages/{mr_package}/ci.json"
+    data = artifact_store.read_file_bytes(path)
+    if data is None:
+        return None
+    try:
+        config = json.loads(data)
+    except ValueError as e:
+        logger.warning(f"Invalid CI config {path}: {e}")
+        return None
+    if not isinstance(config, dict) or not isinstance(config.get("command"), str) or not config["command"].strip():
+        logger.warning(f"CI config {path} has no command")
+        return None
+    return config
+
+def _ci_package_version(package_id: str, config: dict) -> str:
+    """Версия пакета для ключа кэша результатов CI: содержимое пакета и его ci.json"""
+    payload = json.dumps({"package": package_id, "ci": config}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+def _enqueue_evaluation(session_id: int):
+    """Поставить оценку в очередь (RQ - синхронный клиент, вызывать через run_io)"""
     # Используем оптимизированную очередь с мониторингом
     try:
         from rq_monitor import OptimizedQueue
         opt_queue = OptimizedQueue(get_redis_connection(), "default")
-        job = opt_queue.enqueue_evaluation(session_id, timeout=300, retry=2, priority="normal")
+        job = opt_queue.enqueue_evaluation(
+            session_id,
+            timeout=300,  # 5 минут
+            retry=2,  # 2 попытки
+            priority="normal"
+        )
         logger.info(f"Evaluation job enqueued: {job.id} for session {session_id}")
     except Exception as e:
+        import traceback
         logger.warning(f"Failed to use optimized queue, falling back to default: {e}")
+        logger.warning(f"Traceback: {traceback.format_exc()}")
+        # Fallback на обычную очередь
         job = queue.enqueue("eval_worker.evaluate", session_id)
+    return job
+
+# === API: Оценка (старый endpoint для обратной совместимости) ===
+@app.get("/api/sessions/{session_id}/evaluate")
+async def evaluate_session(session_id: int):
+    job = await run_io(_enqueue_evaluation, session_id)
+    await publish_event_async(session_channel(session_id), "evaluation_queued", {"session_id": session_id, "job_id": job.id})
     return {"job_id": job.id}
 
 # === API: Reviewer - Запустить оценку ===
 @app.post("/api/reviewer/sessions/{session_id}/evaluate")
-def reviewer_evaluate_session(session_id: int):
+async def reviewer_evaluate_session(session_id: int):
     """
     Запустить оценку сессии (асинхронно через RQ)
     Перед оценкой автоматически синхронизируем комментарии из Gitea PR, если он существует
     """
     # Проверяем, что сессия существует
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT gitea_user, gitea_repo, gitea_pr_id FROM sessions WHERE id = ?", (session_id,))
-    row = c.fetchone()
-    conn.close()
+    row = await db.fetchone("SELECT gitea_user, gitea_repo, gitea_pr_id FROM sessions WHERE id = ?", (session_id,))
     
     if not row:
         raise HTTPException(status_code=404, detail="Session not found")
@@ -822,83 +1397,468 @@ def reviewer_evaluate_session(session_id: int):
     if gitea_client and gitea_pr_id:
         try:
             logger.info(f"Auto-syncing comments from Gitea PR before evaluation for session {session_id}")
-            reviewer_sync_comments_from_gitea(session_id)
+            await reviewer_sync_comments_from_gitea(session_id)
         except Exception as e:
             logger.warning(f"Failed to sync comments from Gitea before evaluation: {e}")
             # Не прерываем оценку, если синхронизация не удалась
     
-    # Используем оптимизированную очередь с мониторингом
-    try:
-        from rq_monitor import OptimizedQueue
-        opt_queue = OptimizedQueue(get_redis_connection(), "default")
-        job = opt_queue.enqueue_evaluation(
-            session_id,
-            timeout=300,  # 5 минут
-            retry=2,  # 2 попытки
-            priority="normal"
-        )
-        logger.info(f"Evaluation job enqueued: {job.id} for session {session_id}")
-    except Exception as e:
-        import traceback
-        logger.warning(f"Failed to use optimized queue, falling back to default: {e}")
-        logger.warning(f"Traceback: {traceback.format_exc()}")
-        # Fallback на обычную очередь
-        job = queue.enqueue("eval_worker.evaluate", session_id)
+    job = await run_io(_enqueue_evaluation, session_id)
     
+    await publish_event_async(session_channel(session_id), "evaluation_queued", {"session_id": session_id, "job_id": job.id})
+    response = {"job_id": job.id}
+    # Тесты ветки кандидата - вместе с оценкой (неизменённый код не перезапускается, см. ci_runner)
+    if CI_ENABLED and gitea_pr_id:
+        ci_job = await run_io(_enqueue_ci, session_id)
+        await publish_event_async(session_channel(session_id), "ci_queued", {"session_id": session_id, "job_id": ci_job.id})
+        response["ci_job_id"] = ci_job.id
+    return response
+
+# === API: Reviewer - CI (тесты ветки кандидата) ===
+@app.post("/api/reviewer/sessions/{session_id}/ci")
+async def reviewer_run_ci(session_id: int):
+    """Запустить тесты head коммита PR (результат для того же коммита и пакета берётся из кэша)"""
+    if not CI_ENABLED:
+        raise HTTPException(status_code=503, detail="CI runner not enabled")
+    row = await db.fetchone("SELECT gitea_pr_id FROM sessions WHERE id = ?", (session_id,))
+    if not row:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if not row[0]:
+        raise HTTPException(status_code=409, detail="PR not created for this session")
+    job = await run_io(_enqueue_ci, session_id)
+    await publish_event_async(session_channel(session_id), "ci_queued", {"session_id": session_id, "job_id": job.id})
     return {"job_id": job.id}
 
+@app.get("/api/reviewer/sessions/{session_id}/ci")
+async def reviewer_get_ci_result(session_id: int):
+    """Последний результат CI сессии"""
+    content = await run_io(_read_text, f"/artifacts/{session_id}_ci.json")
+    if content is None:
+        raise HTTPException(status_code=404, detail="CI result not available")
+    return json.loads(content)
+
+def _job_status(job_id: str):
+    job = queue.fetch_job(job_id)
+    if not job:
+        return None
+    return {"status": job.get_status(), "result": job.result}
+
 @app.get("/api/jobs/{job_id}")
-def get_job_status(job_id: str):
+async def get_job_status(job_id: str):
+    status = await run_io(_job_status, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
+
+# === Internal API для RQ worker ===
+# Worker не открывает reviews.db и /mr_packages: данные сессии и запись результата - здесь,
+# поэтому worker можно запускать на любом узле, где доступны Redis и API.
+# Запросы без заголовка X-Internal-Token = INTERNAL_API_TOKEN отклоняются; токен не задан - отклоняются все
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN", "")
+
+class EvaluationResult(BaseModel):
+    score: float
+    grade: str
+    report: str
+
+def _check_internal_token(request: Request):
+    # Без токена internal API закрыт: иначе golden truth и запись оценки доступны любому клиенту API
+    if not INTERNAL_API_TOKEN or not secrets.compare_digest(request.headers.get("x-internal-token", ""), INTERNAL_API_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+def _save_evaluation(conn, session_id: int, score: float, grade: str) -> bool:
+    if not conn.execute("SELECT 1 FROM sessions WHERE id = ?", (session_id,)).fetchone():
+        return False
+    summaries.set_evaluation(conn, session_id, score, grade)
+    return True
+
+@app.get("/api/internal/sessions/{session_id}/evaluation-input")
+async def internal_evaluation_input(session_id: int, request: Request):
+    _check_internal_token(request)
+    row = await db.fetchone("SELECT comments, golden_sha FROM sessions WHERE id = ?", (session_id,))
+    if not row:
+        raise HTTPException(status_code=404, detail="Session not found")
+    comments_json, golden_sha = row
+    return {"session_id": session_id, "comments": json.loads(comments_json) if comments_json else [], "golden_sha": golden_sha}
+
+@app.get("/api/internal/sessions/{session_id}/golden-truth")
+async def internal_golden_truth(session_id: int, request: Request):
+    """golden_truth.json сессии: блоб из хранилища, для старых сессий - из пакета"""
+    _check_internal_token(request)
+    row = await db.fetchone("SELECT golden_sha, mr_package FROM sessions WHERE id = ?", (session_id,))
+    if not row:
+        raise HTTPException(status_code=404, detail="Session not found")
+    golden_sha, mr_package = row
+    path = artifact_store.blob_path(golden_sha) if golden_sha else f"/mr_packages/{mr_package}/golden_truth.json"
+    data = await run_io(artifact_store.read_file_bytes, path)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Golden truth not found")
+    return Response(content=data, media_type="application/json")
+
+@app.post("/api/internal/sessions/{session_id}/evaluation")
+async def internal_save_evaluation(session_id: int, result: EvaluationResult, request: Request):
+    """Результат оценки от worker: текстовый отчёт и оценка в session_summaries"""
+    _check_internal_token(request)
+    if not await db.run(_save_evaluation, session_id, result.score, result.grade):
+        raise HTTPException(status_code=404, detail="Session not found")
+    await run_io(_write_text, f"/artifacts/{session_id}_report.txt", result.report)
+    return {"status": "ok"}
+
+@app.get("/api/internal/sessions/{session_id}/ci-input")
+async def internal_ci_input(session_id: int, request: Request):
+    """Вход CI runner: откуда брать код, head SHA PR, команда тестов пакета и версия пакета"""
+    _check_internal_token(request)
+    row = await db.fetchone("SELECT gitea_user, gitea_repo, gitea_pr_id, mr_package, package_sha, golden_sha FROM sessions WHERE id = ?", (session_id,))
+    if not row:
+        raise HTTPException(status_code=404, detail="Session not found")
+    gitea_user, gitea_repo, gitea_pr_id, mr_package, package_sha, golden_sha = row
+    config = await run_io(_load_ci_config, mr_package, package_sha)
+    if config is None:
+        raise HTTPException(status_code=409, detail="CI not configured for package")
+    if not async_gitea or not gitea_pr_id:
+        raise HTTPException(status_code=409, detail="PR not available")
+    # Тестируется текущий head PR, а не закэшированный объект
+    pr = await async_gitea.get_pull_request(gitea_user, gitea_repo, gitea_pr_id, fresh=True)
+    head_sha = ((pr or {}).get("head") or {}).get("sha")
+    if not head_sha:
+        raise HTTPException(status_code=409, detail="PR head commit not available")
+    return {
+        "session_id": session_id,
+        "clone_url": gitea_client.get_repository_clone_url(gitea_user, gitea_repo),
+        "head_sha": head_sha,
+        "pr_ref": f"refs/pull/{gitea_pr_id}/head",
+        "ci": config,
+        "package_version": _ci_package_version(package_sha or golden_sha or mr_package, config),
+    }
+
+# Вывод тестов runner обрезает до CI_OUTPUT_TAIL байт (64 KiB); с запасом на декодирование
+CI_RESULT_OUTPUT_MAX = 256 * 1024
+
+class CIResult(BaseModel):
+    status: Literal["passed", "failed", "timeout", "error", "skipped"]
+    exit_code: int | None = None
+    duration_ms: int = 0
+    output: str = Field("", max_length=CI_RESULT_OUTPUT_MAX)
+    head_sha: str | None = Field(None, max_length=64)
+    package_version: str | None = Field(None, max_length=128)
+    cached: bool = False
+    limits: dict[str, int] | None = None
+
+@app.post("/api/internal/sessions/{session_id}/ci-result")
+async def internal_save_ci_result(session_id: int, result: CIResult, request: Request):
+    """Результат CI от runner: файл результата сессии и событие ci_finished"""
+    _check_internal_token(request)
+    if not await db.fetchone("SELECT 1 FROM sessions WHERE id = ?", (session_id,)):
+        raise HTTPException(status_code=404, detail="Session not found")
+    saved = {**result.model_dump(), "finished_at": datetime.utcnow().isoformat() + 'Z'}
+    await run_io(_write_text, f"/artifacts/{session_id}_ci.json", json.dumps(saved))
+    await publish_event_async(session_channel(session_id), "ci_finished", {
+        "session_id": session_id, "status": result.status, "head_sha": result.head_sha, "cached": result.cached,
+    })
+    return {"status": "ok"}
+
+# === Фоновый sweeper истёкших сессий ===
+# Переводит active -> expired по индексу (status, expires_at_epoch), запускает оценку и закрывает PR.
+# Спит до ближайшего expires_at, но не дольше SESSION_SWEEP_INTERVAL (новые сессии и продления)
+SESSION_SWEEPER_ENABLED = os.getenv("SESSION_SWEEPER_ENABLED", "1") == "1"
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "30"))
+SESSION_AUTO_EVALUATE = os.getenv("SESSION_AUTO_EVALUATE", "1") == "1"
+
+async def _on_session_expired(session: dict):
+    session_id = session["session_id"]
+    await _invalidate_token_cache(session_id)
+    logger.info(f"Session {session_id} expired")
+    await publish_event_async(session_channel(session_id), "session_expired", {"session_id": session_id, "status": session_timer.STATUS_EXPIRED, "expires_at": session["expires_at"]})
+
+    if SESSION_AUTO_EVALUATE:
+        try:
+            # Тот же путь, что и ручной запуск: синхронизация комментариев из Gitea, затем очередь
+            with async_gitea.background() if async_gitea else nullcontext():
+                await reviewer_evaluate_session(session_id)
+        except Exception as e:
+            logger.error(f"Failed to auto-evaluate expired session {session_id}: {e}")
+
+    if async_gitea and session["gitea_pr_id"] and session["gitea_user"] and session["gitea_repo"]:
+        with async_gitea.background():
+            result = await async_gitea.close_pull_request(session["gitea_user"], session["gitea_repo"], session["gitea_pr_id"])
+        if result:
+            await publish_event_async(session_channel(session_id), "gitea_pr_closed", {"session_id": session_id, "pr_id": session["gitea_pr_id"]})
+        else:
+            logger.warning(f"Failed to close PR #{session['gitea_pr_id']} for expired session {session_id}")
+
+async def _expire_sessions() -> int:
+    """Один проход: перевести все истёкшие сессии (пачками) и обработать их"""
+    total = 0
+    while True:
+        expired = await db.run(session_timer.claim_expired, int(time.time()))
+        for session in expired:
+            await _on_session_expired(session)
+        total += len(expired)
+        if len(expired) < session_timer.SWEEP_BATCH_SIZE:
+            return total
+
+# Несколько процессов API (gunicorn): проходы делает один - владелец lease в Redis.
+# Без Redis каждый процесс работает сам: claim_expired атомарен, двойных переходов нет
+SWEEPER_LEASE_KEY = "session_sweeper:leader"
+
+async def _hold_lease(client: aioredis.Redis, key: str, owner: str, interval: float) -> bool:
+    """Взять или продлить lease фоновой задачи; без Redis - работаем локально"""
+    ttl = max(int(interval * 2), 2)
+    try:
+        if await client.set(key, owner, nx=True, ex=ttl):
+            return True
+        if await client.get(key) == owner:
+            await client.expire(key, ttl)
+            return True
+        return False
+    except Exception as e:
+        logger.warning(f"Lease {key} unavailable, running locally: {e}")
+        return True
+
+async def _session_sweeper():
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    client = aioredis.Redis(host='redis', port=6379, socket_connect_timeout=1, socket_timeout=1, decode_responses=True)
+    try:
+        while True:
+            next_at = None
+            try:
+                if await _hold_lease(client, SWEEPER_LEASE_KEY, owner, SESSION_SWEEP_INTERVAL):
+                    await _expire_sessions()
+                    next_at = await db.run(session_timer.next_expiry)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Session sweeper failed: {e}", exc_info=True)
+            delay = SESSION_SWEEP_INTERVAL if next_at is None else min(max(next_at - time.time(), 1.0), SESSION_SWEEP_INTERVAL)
+            await asyncio.sleep(delay)
+    finally:
+        await client.aclose()
+
+# === Фоновая синхронизация PR активных сессий из Gitea ===
+# Комментарии и готовность кандидата попадают в БД без ручного sync: раз в GITEA_PR_SYNC_INTERVAL
+# проходим активные сессии с PR. PR с прежним updated_at пропускается (один запрос в Gitea),
+# изменённые - комментарии читаются параллельно (не больше GITEA_PR_SYNC_PARALLELISM) в фоновой
+# полосе планировщика, запись - пачками по GITEA_PR_SYNC_WRITE_BATCH сессий в одной транзакции.
+GITEA_PR_SYNC_ENABLED = os.getenv("GITEA_PR_SYNC_ENABLED", "1") == "1"
+GITEA_PR_SYNC_INTERVAL = float(os.getenv("GITEA_PR_SYNC_INTERVAL", "60"))
+GITEA_PR_SYNC_PARALLELISM = int(os.getenv("GITEA_PR_SYNC_PARALLELISM", "16"))
+GITEA_PR_SYNC_WRITE_BATCH = int(os.getenv("GITEA_PR_SYNC_WRITE_BATCH", "100"))
+GITEA_PR_SYNC_LEASE_KEY = "gitea_pr_sync:leader"
+
+def _list_syncable_sessions(conn, now: int) -> list:
+    return conn.execute('''
+        SELECT id, gitea_user, gitea_repo, gitea_pr_id, gitea_pr_updated_at FROM sessions
+        WHERE status = ? AND deleted_at IS NULL AND gitea_pr_id IS NOT NULL
+          AND (expires_at_epoch IS NULL OR expires_at_epoch > ?)
+    ''', (session_timer.STATUS_ACTIVE, now)).fetchall()
+
+async def _prefetch_mirror_diff(gitea_user: str, gitea_repo: str, pr: dict):
+    """Новые коммиты в PR - обновить зеркало и вычислить diff, пока ревьюер не открыл PR"""
+    commits = _pr_commits(pr)
+    if not commits or not git_mirror.GIT_MIRROR_ENABLED:
+        return
+    try:
+        if await run_io(git_mirror.has_diff, gitea_user, gitea_repo, *commits):
+            return
+    except git_mirror.MirrorError as e:
+        logger.warning(f"Git mirror unavailable for {gitea_user}/{gitea_repo}: {e}")
+        return
+    await _schedule_mirror_sync(gitea_user, gitea_repo, [commits])
+
+async def _fetch_pr_changes(row: tuple, semaphore: asyncio.Semaphore, stats: dict):
+    """Изменения PR сессии с прошлой синхронизации (None - не изменился или ошибка)"""
+    session_id, gitea_user, gitea_repo, gitea_pr_id, seen_updated_at = row
+    try:
+        async with semaphore:
+            pr = await async_gitea.get_pull_request(gitea_user, gitea_repo, gitea_pr_id, fresh=True)
+            if not pr:
+                stats["errors"] += 1
+                return None
+            updated_at = pr.get("updated_at")
+            if updated_at and updated_at == seen_updated_at:
+                stats["unchanged"] += 1
+                return None
+            pr_comments, issue_comments = await asyncio.gather(
+                async_gitea.get_pull_request_comments(gitea_user, gitea_repo, gitea_pr_id),
+                async_gitea.get_pull_request_issue_comments(gitea_user, gitea_repo, gitea_pr_id),
+            )
+    except Exception as e:
+        logger.warning(f"Gitea PR sync failed for session {session_id}: {e}")
+        stats["errors"] += 1
+        return None
+    await _prefetch_mirror_diff(gitea_user, gitea_repo, pr)
+    comments, ready_comment = comment_parser.convert_gitea_comments(pr_comments + issue_comments)
+    stats["changed"] += 1
+    return {"session_id": session_id, "comments": comments, "ready_at": _ready_comment_time(ready_comment), "updated_at": updated_at}
+
+def _apply_gitea_pr_sync(conn, changes: list) -> list:
+    """
+    Записать изменения пачки сессий одной транзакцией
+
+    Returns:
+        [(session_id, добавлено комментариев, всего, ready_at если готовность установлена сейчас)]
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    applied = []
+    for change in changes:
+        session_id = change["session_id"]
+        added, total = _merge_gitea_comments_locked(conn, session_id, change["comments"])
+        ready_at = None
+        if change["ready_at"] and conn.execute(
+            "UPDATE sessions SET candidate_ready_at = ? WHERE id = ? AND candidate_ready_at IS NULL",
+            (change["ready_at"], session_id)
+        ).rowcount:
+            summaries.refresh(conn, session_id)
+            ready_at = change["ready_at"]
+        conn.execute("UPDATE sessions SET gitea_pr_updated_at = ? WHERE id = ?", (change["updated_at"], session_id))
+        applied.append((session_id, added, total, ready_at))
+    return applied
+
+async def _sync_gitea_prs() -> dict:
+    """Один проход по всем активным сессиям с PR"""
+    started = time.perf_counter()
+    rows = await db.run(_list_syncable_sessions, int(time.time()))
+    stats = {"sessions": len(rows), "unchanged": 0, "changed": 0, "errors": 0, "comments_added": 0, "ready_detected": 0}
+    semaphore = asyncio.Semaphore(GITEA_PR_SYNC_PARALLELISM)
+    with async_gitea.background():
+        changes = await asyncio.gather(*(_fetch_pr_changes(row, semaphore, stats) for row in rows))
+    changes = [change for change in changes if change]
+
+    for start in range(0, len(changes), GITEA_PR_SYNC_WRITE_BATCH):
+        applied = await db.run(_apply_gitea_pr_sync, changes[start:start + GITEA_PR_SYNC_WRITE_BATCH])
+        for session_id, added, total, ready_at in applied:
+            if added:
+                stats["comments_added"] += added
+                await publish_event_async(session_channel(session_id), "comments_synced", {"session_id": session_id, "synced_count": added, "total": total})
+            if ready_at:
+                stats["ready_detected"] += 1
+                await publish_event_async(session_channel(session_id), "candidate_ready", {"session_id": session_id, "ready_at": ready_at, "source": "gitea"})
+    stats["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return stats
+
+async def _gitea_pr_sync_loop():
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    client = aioredis.Redis(host='redis', port=6379, socket_connect_timeout=1, socket_timeout=1, decode_responses=True)
+    try:
+        while True:
+            try:
+                if await _hold_lease(client, GITEA_PR_SYNC_LEASE_KEY, owner, GITEA_PR_SYNC_INTERVAL):
+                    stats = await _sync_gitea_prs()
+                    if stats["changed"] or stats["errors"]:
+                        logger.info(f"Gitea PR sync: {stats}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Gitea PR sync failed: {e}", exc_info=True)
+            await asyncio.sleep(GITEA_PR_SYNC_INTERVAL)
+    finally:
+        await client.aclose()
+
+# === SSE: статус задачи (вместо polling GET /api/jobs/{job_id}) ===
+JOB_TERMINAL_STATUSES = {"finished", "failed", "stopped", "canceled"}
+
+def _job_snapshot(job_id: str):
+    """Текущее состояние задачи в формате события status (None если задачи нет)"""
     job = queue.fetch_job(job_id)
     if not job:
+        return None
+    status = job.get_status()
+    status = getattr(status, "value", status)  # JobStatus enum -> str
+    return {"job_id": job_id, "status": status, "result": job.result if status == "finished" else None}
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    SSE поток статуса задачи: прогресс worker и финальный статус
+    Поток закрывается, когда задача завершена
+    """
+    if await run_io(_job_snapshot, job_id) is None:
         raise HTTPException(status_code=404, detail="Job not found")
-    return {"status": job.get_status(), "result": job.result}
 
-# === API: Добавить комментарий (старый endpoint для обратной совместимости) ===
-@app.post("/api/sessions/{session_id}/comments")
-def add_comment(session_id: int, comment: dict):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT comments FROM sessions WHERE id = ?", (session_id,))
-    row = c.fetchone()
+    async def stream():
+        async with event_broker.subscribe(job_channel(job_id)) as events:
+            # Снимок после подписки - чтобы не потерять завершение между проверкой и подпиской
+            snapshot = await run_io(_job_snapshot, job_id)
+            yield format_sse("status", snapshot)
+            if snapshot is None or snapshot["status"] in JOB_TERMINAL_STATUSES:
+                return
+            while True:
+                try:
+                    message = await asyncio.wait_for(events.get(), timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Страховка: задача могла упасть без события (таймаут, исключение в worker)
+                    snapshot = await run_io(_job_snapshot, job_id)
+                    if snapshot is None or snapshot["status"] in JOB_TERMINAL_STATUSES:
+                        yield format_sse("status", snapshot)
+                        return
+                    yield SSE_HEARTBEAT
+                    continue
+                yield format_sse(message["event"], message["data"])
+                if message["data"].get("status") in JOB_TERMINAL_STATUSES:
+                    return
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+def _append_comment(conn, where: str, key, comment: dict):
+    """Добавить комментарий к сессии в одной транзакции (read-modify-write без потерянных обновлений)"""
+    conn.execute("BEGIN IMMEDIATE")
+    row = conn.execute(f"SELECT comments, id FROM sessions WHERE {where}", (key,)).fetchone()
     if not row:
-        raise HTTPException(status_code=404)
+        return None
     comments = json.loads(row[0]) if row[0] else []
     comments.append(comment)
-    c.execute("UPDATE sessions SET comments = ? WHERE id = ?", (json.dumps(comments), session_id))
-    conn.commit()
-    conn.close()
+    conn.execute("UPDATE sessions SET comments = ? WHERE id = ?", (json.dumps(comments), row[1]))
+    summaries.add_comments(conn, row[1], [comment])
+    return row[1], len(comments)
+
+# === API: Добавить комментарий (старый endpoint для обратной совместимости) ===
+@app.post("/api/sessions/{session_id}/comments")
+async def add_comment(session_id: int, comment: dict):
+    result = await db.run(_append_comment, "id = ?", session_id, comment)
+    if not result:
+        raise HTTPException(status_code=404)
+    _, total = result
+    await publish_event_async(session_channel(session_id), "comment_added", {"session_id": session_id, "comment": comment, "total": total})
     return {"status": "ok"}
 
 # === CANDIDATE API ===
+# === Кэш токенов кандидата (см. token_cache) ===
+# Через кэш идут только endpoints, которым хватает полей TokenEntry (diff и его индекс):
+# им не нужен запрос к БД. Endpoints, читающие строку сессии, ищут её сразу по токену -
+# один запрос, и удалённая сессия не отдаётся из кэша.
+async def _load_token_entry(token: str):
+    row = await db.fetchone("SELECT id, status, expires_at, deleted_at, diff_sha FROM sessions WHERE access_token = ?", (token,))
+    if not row:
+        return None
+    return TokenEntry(row[0], row[1] or "active", row[2], bool(row[3]), row[4])
+
+async def _resolve_candidate_token(token: str, detail: str = "Session not found") -> TokenEntry:
+    """Сессия кандидата по токену (удалённые сессии недоступны)"""
+    entry = await token_cache.resolve(token, _load_token_entry)
+    if entry is None or entry.deleted:
+        raise HTTPException(status_code=404, detail=detail)
+    return entry
+
+async def _invalidate_token_cache(session_id: int):
+    row = await db.fetchone("SELECT access_token FROM sessions WHERE id = ?", (session_id,))
+    await token_cache.invalidate(session_id, row[0] if row else None)
+
 # === API: Candidate - Получить сессию по токену ===
 @app.get("/api/candidate/sessions/{token}")
-def candidate_get_session(token: str):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+async def candidate_get_session(token: str):
     # Кандидат не может получить доступ к удалённым сессиям
-    c.execute("SELECT id, candidate_name, mr_package, comments, created_at, expires_at, status, gitea_user, gitea_repo, gitea_enabled, gitea_pr_id, candidate_ready_at FROM sessions WHERE access_token = ? AND deleted_at IS NULL", (token,))
-    row = c.fetchone()
-    conn.close()
+    # Строка нужна целиком - один запрос по токену (уникальный индекс), кэш токенов не нужен
+    row = await db.fetchone("SELECT id, candidate_name, mr_package, comments, created_at, expires_at, status, gitea_user, gitea_repo, gitea_enabled, gitea_pr_id, candidate_ready_at FROM sessions WHERE access_token = ? AND deleted_at IS NULL", (token,))
     
     if not row:
         raise HTTPException(status_code=404, detail="Session not found or invalid token")
     
-    created_at = row[4] if row[4] else datetime.utcnow().isoformat() + 'Z'
-    expires_at = row[5] if row[5] else (datetime.utcnow() + timedelta(hours=2)).isoformat() + 'Z'
-    
-    if created_at and not created_at.endswith('Z') and '+' not in created_at:
-        created_at = created_at + 'Z'
-    if expires_at and not expires_at.endswith('Z') and '+' not in expires_at:
-        expires_at = expires_at + 'Z'
-    
     response = {
         "session_id": row[0],
         "candidate_name": row[1] or "Candidate",
         "mr_package": row[2],
         "comments": json.loads(row[3]) if row[3] else [],
-        "created_at": created_at,
-        "expires_at": expires_at,
+        "created_at": row[4],
+        "expires_at": row[5],
         "status": row[6] or "active",
         "candidate_ready_at": row[11] if len(row) > 11 else None
     }
@@ -928,40 +1888,91 @@ def candidate_get_session(token: str):
     
     return response
 
+def _read_text(path: str):
+    """Прочитать текстовый файл (None если файла нет)"""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
 # === API: Candidate - Получить diff ===
 @app.get("/api/candidate/sessions/{token}/diff")
-def candidate_get_diff(token: str):
-    # Находим session_id по токену (только не удалённые сессии)
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT id FROM sessions WHERE access_token = ? AND deleted_at IS NULL", (token,))
-    row = c.fetchone()
-    conn.close()
-    
-    if not row:
-        raise HTTPException(status_code=404, detail="Session not found")
-    
-    session_id = row[0]
-    diff_path = f"/artifacts/{session_id}_diff.patch"
-    
-    if not os.path.exists(diff_path):
+async def candidate_get_diff(token: str, request: Request):
+    # Находим сессию по токену (только не удалённые сессии)
+    entry = await _resolve_candidate_token(token)
+    return await _diff_response(request, entry.session_id, entry.diff_sha)
+
+# === API: Candidate - Diff по файлам (индекс diff, см. diff_index) ===
+async def _candidate_diff_index(token: str) -> "diff_index.DiffIndex":
+    entry = await _resolve_candidate_token(token)
+    if not entry.diff_sha:
+        # Сессии до хранилища артефактов - только целиком через /diff
+        raise HTTPException(status_code=404, detail="Diff index not available for this session")
+    index = await run_io(diff_index.get_index, entry.diff_sha)
+    if index is None:
         raise HTTPException(status_code=404, detail="Diff not found")
-    
-    with open(diff_path, "r", encoding="utf-8") as f:
-        diff_content = f.read()
-    
-    from fastapi.responses import Response
-    return Response(content=diff_content, media_type="text/plain; charset=utf-8")
+    return index
+
+def _immutable_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+@app.get("/api/candidate/sessions/{token}/diff/files")
+async def candidate_get_diff_files(token: str, request: Request):
+    """Список файлов diff (без содержимого)"""
+    index = await _candidate_diff_index(token)
+    etag = f'"{index.sha}-files"'
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=_immutable_headers(etag))
+    return JSONResponse(
+        content={
+            "diff_sha": index.sha,
+            "size": index.size,
+            "files": [index.file_summary(i) for i in range(len(index.files))]
+        },
+        headers=_immutable_headers(etag)
+    )
+
+@app.get("/api/candidate/sessions/{token}/diff/files/{file_index}")
+async def candidate_get_diff_file(token: str, file_index: int, request: Request, hunk_from: int = 0, hunk_to: int = None):
+    """
+    Diff одного файла (или диапазона его hunks [hunk_from, hunk_to)) как текст патча
+
+    Читаются только нужные байты блоба по смещениям из индекса.
+    """
+    index = await _candidate_diff_index(token)
+    if not 0 <= file_index < len(index.files):
+        raise HTTPException(status_code=404, detail="File not found in diff")
+    if hunk_from < 0 or (hunk_to is not None and hunk_to <= hunk_from):
+        raise HTTPException(status_code=400, detail="Invalid hunk range")
+    ranges = index.section(file_index, hunk_from, hunk_to)
+    if not ranges:
+        raise HTTPException(status_code=404, detail="Hunk range not found")
+
+    etag = f'"{index.sha}-f{file_index}-{hunk_from}-{hunk_to if hunk_to is not None else ""}"'
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=_immutable_headers(etag))
+    content = await run_io(diff_index.read_ranges, index.sha, ranges)
+    return Response(content=content, media_type=DIFF_MEDIA_TYPE, headers=_immutable_headers(etag))
+
+@app.get("/api/candidate/sessions/{token}/diff/locate")
+async def candidate_locate_diff_line(token: str, file: str, line: int):
+    """Найти hunk, содержащий строку line нового файла file"""
+    index = await _candidate_diff_index(token)
+    found = index.locate(file, line)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Line not found in diff")
+    file_idx, hunk_idx = found
+    return {
+        "file_index": file_idx,
+        "hunk_index": hunk_idx,
+        "hunk": index.hunk_dict(index.files[file_idx]["hunks"][hunk_idx])
+    }
 
 # === API: Candidate - Получить комментарии ===
 @app.get("/api/candidate/sessions/{token}/comments")
-def candidate_get_comments(token: str):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+async def candidate_get_comments(token: str):
     # Кандидат не может получить доступ к удалённым сессиям
-    c.execute("SELECT comments FROM sessions WHERE access_token = ? AND deleted_at IS NULL", (token,))
-    row = c.fetchone()
-    conn.close()
+    row = await db.fetchone("SELECT comments FROM sessions WHERE access_token = ? AND deleted_at IS NULL", (token,))
     
     if not row:
         raise HTTPException(status_code=404, detail="Session not found")
@@ -971,102 +1982,73 @@ def candidate_get_comments(token: str):
 
 # === API: Candidate - Добавить комментарий ===
 @app.post("/api/candidate/sessions/{token}/comments")
-def candidate_add_comment(token: str, comment: dict):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+async def candidate_add_comment(token: str, comment: dict):
     # Кандидат не может добавлять комментарии к удалённым сессиям
-    c.execute("SELECT comments, id FROM sessions WHERE access_token = ? AND deleted_at IS NULL", (token,))
-    row = c.fetchone()
+    result = await db.run(_append_comment, "access_token = ? AND deleted_at IS NULL", token, comment)
     
-    if not row:
-        conn.close()
+    if not result:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    comments = json.loads(row[0]) if row[0] else []
-    comments.append(comment)
-    session_id = row[1]
-    
-    c.execute("UPDATE sessions SET comments = ? WHERE id = ?", (json.dumps(comments), session_id))
-    conn.commit()
-    conn.close()
-    
+    session_id, total = result
+    await publish_event_async(session_channel(session_id), "comment_added", {"session_id": session_id, "comment": comment, "total": total})
     return {"status": "ok"}
 
 # === API: Candidate - Отметить готовность ===
 @app.post("/api/candidate/sessions/{token}/ready")
-def candidate_mark_ready(token: str):
+async def candidate_mark_ready(token: str):
     """
     Кандидат сигнализирует о готовности (завершил code review)
     """
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT id, candidate_ready_at FROM sessions WHERE access_token = ? AND deleted_at IS NULL", (token,))
-    row = c.fetchone()
+    row = await db.fetchone("SELECT id, candidate_ready_at FROM sessions WHERE access_token = ? AND deleted_at IS NULL", (token,))
     
     if not row:
-        conn.close()
         raise HTTPException(status_code=404, detail="Session not found")
     
     session_id = row[0]
     already_ready = row[1]
     
     if already_ready:
-        conn.close()
         return {"status": "already_ready", "ready_at": already_ready}
     
     # Отмечаем готовность
     ready_at = datetime.utcnow().isoformat() + 'Z'
-    c.execute("UPDATE sessions SET candidate_ready_at = ? WHERE id = ?", (ready_at, session_id))
-    conn.commit()
-    conn.close()
+    await _update_session(session_id, "UPDATE sessions SET candidate_ready_at = ? WHERE id = ?", (ready_at, session_id))
     
     logger.info(f"Candidate marked session {session_id} as ready")
+    await publish_event_async(session_channel(session_id), "candidate_ready", {"session_id": session_id, "ready_at": ready_at})
     return {"status": "ready", "ready_at": ready_at}
 
-# === API: Продлить сессию на 30 минут (старый endpoint для обратной совместимости) ===
-@app.post("/api/sessions/{session_id}/extend")
-def extend_session(session_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT expires_at FROM sessions WHERE id = ?", (session_id,))
-    row = c.fetchone()
+def _extend_expires_at(conn, session_id: int):
+    """Продлить expires_at на 30 минут (None если сессии нет); истёкшая сессия снова становится активной"""
+    conn.execute("BEGIN IMMEDIATE")
+    row = conn.execute("SELECT expires_at_epoch FROM sessions WHERE id = ?", (session_id,)).fetchone()
     if not row:
-        raise HTTPException(status_code=404, detail="Session not found")
+        return None
     
-    # Получаем текущий expires_at или создаём новый
-    if row[0]:
-        expires_str = row[0]
-        # Обрабатываем формат с Z или без него
-        # Убираем Z и парсим как UTC
-        if expires_str.endswith('Z'):
-            expires_str = expires_str[:-1]
-        try:
-            current_expires = datetime.fromisoformat(expires_str)
-        except ValueError:
-            # Если не удалось распарсить, используем текущее время + 2 часа
-            current_expires = datetime.utcnow() + timedelta(hours=2)
-        
-        # Если нет timezone info, считаем UTC
-        if current_expires.tzinfo is not None:
-            # Конвертируем в UTC naive для вычислений
-            current_expires = current_expires.replace(tzinfo=None)
-        
-        # Проверяем, что expires_at не в прошлом (если в прошлом, используем текущее время + 2 часа)
-        if current_expires < datetime.utcnow():
-            current_expires = datetime.utcnow() + timedelta(hours=2)
-    else:
-        # Если expires_at не установлен, создаём новое время (текущее + 2 часа)
-        current_expires = datetime.utcnow() + timedelta(hours=2)
+    now = datetime.utcnow()
+    current_expires = session_timer.from_epoch(row[0]) if row[0] is not None else None
+    # Если expires_at не установлен или уже в прошлом, считаем от текущего времени + 2 часа
+    if current_expires is None or current_expires < now:
+        current_expires = now + session_timer.SESSION_DURATION
     
     # Продлеваем на 30 минут от текущего expires_at
-    new_expires_at = current_expires + timedelta(minutes=30)
-    
-    # Сохраняем новое время с Z для явного указания UTC
-    expires_at_str = new_expires_at.isoformat() + 'Z'
-    c.execute("UPDATE sessions SET expires_at = ? WHERE id = ?", (expires_at_str, session_id))
-    conn.commit()
-    conn.close()
+    expires_at_str = session_timer.to_iso(current_expires + timedelta(minutes=30))
+    conn.execute(
+        "UPDATE sessions SET expires_at = ?, expires_at_epoch = ?, status = CASE WHEN status = ? THEN ? ELSE status END WHERE id = ?",
+        (expires_at_str, session_timer.to_epoch(expires_at_str), session_timer.STATUS_EXPIRED, session_timer.STATUS_ACTIVE, session_id)
+    )
+    summaries.refresh(conn, session_id)
+    return expires_at_str
+
+# === API: Продлить сессию на 30 минут (старый endpoint для обратной совместимости) ===
+@app.post("/api/sessions/{session_id}/extend")
+async def extend_session(session_id: int):
+    expires_at_str = await db.run(_extend_expires_at, session_id)
+    if not expires_at_str:
+        raise HTTPException(status_code=404, detail="Session not found")
+    await _invalidate_token_cache(session_id)
     
+    await publish_event_async(session_channel(session_id), "session_extended", {"session_id": session_id, "expires_at": expires_at_str})
     return {
         "status": "ok",
         "expires_at": expires_at_str  # Возвращаем с Z
@@ -1074,38 +2056,13 @@ def extend_session(session_id: int):
 
 # === API: Reviewer - Продлить сессию на 30 минут ===
 @app.post("/api/reviewer/sessions/{session_id}/extend")
-def reviewer_extend_session(session_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT expires_at FROM sessions WHERE id = ?", (session_id,))
-    row = c.fetchone()
-    if not row:
-        conn.close()
+async def reviewer_extend_session(session_id: int):
+    expires_at_str = await db.run(_extend_expires_at, session_id)
+    if not expires_at_str:
         raise HTTPException(status_code=404, detail="Session not found")
+    await _invalidate_token_cache(session_id)
     
-    if row[0]:
-        expires_str = row[0]
-        if expires_str.endswith('Z'):
-            expires_str = expires_str[:-1]
-        try:
-            current_expires = datetime.fromisoformat(expires_str)
-        except ValueError:
-            current_expires = datetime.utcnow() + timedelta(hours=2)
-        
-        if current_expires.tzinfo is not None:
-            current_expires = current_expires.replace(tzinfo=None)
-        
-        if current_expires < datetime.utcnow():
-            current_expires = datetime.utcnow() + timedelta(hours=2)
-    else:
-        current_expires = datetime.utcnow() + timedelta(hours=2)
-    
-    new_expires_at = current_expires + timedelta(minutes=30)
-    expires_at_str = new_expires_at.isoformat() + 'Z'
-    c.execute("UPDATE sessions SET expires_at = ? WHERE id = ?", (expires_at_str, session_id))
-    conn.commit()
-    conn.close()
-    
+    await publish_event_async(session_channel(session_id), "session_extended", {"session_id": session_id, "expires_at": expires_at_str})
     return {
         "status": "ok",
         "expires_at": expires_at_str
@@ -1113,18 +2070,14 @@ def reviewer_extend_session(session_id: int):
 
 # === API: Reviewer - Создать Pull Request в Gitea ===
 @app.post("/api/reviewer/sessions/{session_id}/gitea/create-pr")
-def reviewer_create_gitea_pr(session_id: int, payload: dict = None):
+async def reviewer_create_gitea_pr(session_id: int, payload: dict = None):
     """
     Создать Pull Request в Gitea для сессии
     """
-    if not gitea_client:
+    if not async_gitea:
         raise HTTPException(status_code=503, detail="Gitea integration not available")
     
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT gitea_user, gitea_repo, gitea_enabled, candidate_name FROM sessions WHERE id = ?", (session_id,))
-    row = c.fetchone()
-    conn.close()
+    row = await db.fetchone("SELECT gitea_user, gitea_repo, gitea_enabled, candidate_name FROM sessions WHERE id = ?", (session_id,))
     
     if not row:
         raise HTTPException(status_code=404, detail="Session not found")
@@ -1137,7 +2090,7 @@ def reviewer_create_gitea_pr(session_id: int, payload: dict = None):
     # Создаём PR - для этого нужна ветка с изменениями
     # 1. Создаём новую ветку для изменений кандидата
     candidate_branch = f"candidate-work-{session_id}"
-    branch_result = gitea_client.create_branch(
+    branch_result = await async_gitea.create_branch(
         owner=gitea_user,
         repo=gitea_repo,
         branch_name=candidate_branch,
@@ -1148,12 +2101,11 @@ def reviewer_create_gitea_pr(session_id: int, payload: dict = None):
         raise HTTPException(status_code=500, detail="Failed to create candidate branch in Gitea")
     
     # 2. Обновляем файл в новой ветке, добавляя комментарий о code review
-    import time
-    time.sleep(0.3)  # Минимальная задержка для синхронизации Gitea
+    await asyncio.sleep(0.3)  # Минимальная задержка для синхронизации Gitea
     
     # Обновляем файл в новой ветке, добавляя комментарий о code review
     # update_file сам получит SHA файла из новой ветки
-    update_result = gitea_client.update_file(
+    update_result = await async_gitea.update_file(
         owner=gitea_user,
         repo=gitea_repo,
         file_path="main.py",
@@ -1176,7 +2128,7 @@ def greet():
     pr_title = f"Code Review Session #{session_id} - {candidate_name}"
     pr_body = f"Code review session for candidate: {candidate_name}\n\nSession ID: {session_id}\n\nThis PR contains the candidate's work for review."
     
-    pr_result = gitea_client.create_pull_request(
+    pr_result = await async_gitea.create_pull_request(
         owner=gitea_user,
         repo=gitea_repo,
         title=pr_title,
@@ -1191,11 +2143,7 @@ def greet():
     pr_id = pr_result.get("number")
     
     # Сохраняем PR ID в БД
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("UPDATE sessions SET gitea_pr_id = ? WHERE id = ?", (pr_id, session_id))
-    conn.commit()
-    conn.close()
+    await _update_session(session_id, "UPDATE sessions SET gitea_pr_id = ? WHERE id = ?", (pr_id, session_id))
     
     return {
         "status": "ok",
@@ -1205,63 +2153,65 @@ def greet():
     }
 
 # === API: Reviewer - Получить Pull Request из Gitea ===
+gitea_pr_flight = SingleFlight("gitea_pr")
+
+async def _gitea_pr_diff(gitea_user: str, gitea_repo: str, gitea_pr_id: int, pr: dict):
+    """Diff PR: из локального зеркала по SHA коммитов; пока зеркало не догнало - из Gitea"""
+    commits = _pr_commits(pr) if pr and git_mirror.GIT_MIRROR_ENABLED else None
+    if commits:
+        try:
+            path = await run_io(git_mirror.pr_diff_path, gitea_user, gitea_repo, *commits)
+        except git_mirror.MirrorError as e:
+            logger.warning(f"Git mirror diff failed for {gitea_user}/{gitea_repo}#{gitea_pr_id}: {e}")
+            path = None
+        if path:
+            return await run_io(_read_text, path)
+        await _schedule_mirror_sync(gitea_user, gitea_repo, [commits])
+    return await async_gitea.get_pull_request_diff(gitea_user, gitea_repo, gitea_pr_id)
+
+async def _fetch_gitea_pr(gitea_user: str, gitea_repo: str, gitea_pr_id: int):
+    """PR, затем комментарии и diff (параллельно)"""
+    pr = await async_gitea.get_pull_request(gitea_user, gitea_repo, gitea_pr_id)
+    comments, issue_comments, diff = await asyncio.gather(
+        async_gitea.get_pull_request_comments(gitea_user, gitea_repo, gitea_pr_id),
+        async_gitea.get_pull_request_issue_comments(gitea_user, gitea_repo, gitea_pr_id),
+        _gitea_pr_diff(gitea_user, gitea_repo, gitea_pr_id, pr),
+    )
+    return [pr, comments, issue_comments, diff]
+
 @app.get("/api/reviewer/sessions/{session_id}/gitea/pr")
-def reviewer_get_gitea_pr(session_id: int):
+async def reviewer_get_gitea_pr(session_id: int):
     """
     Получить информацию о Pull Request из Gitea
     """
-    if not gitea_client:
+    if not async_gitea:
         raise HTTPException(status_code=503, detail="Gitea integration not available")
     
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT gitea_user, gitea_repo, gitea_pr_id FROM sessions WHERE id = ?", (session_id,))
-    row = c.fetchone()
+    row = await db.fetchone("SELECT gitea_user, gitea_repo, gitea_pr_id, candidate_ready_at FROM sessions WHERE id = ?", (session_id,))
     
     if not row:
-        conn.close()
         raise HTTPException(status_code=404, detail="Session not found")
     
-    gitea_user, gitea_repo, gitea_pr_id = row
+    gitea_user, gitea_repo, gitea_pr_id, current_ready_at = row
     
     if not gitea_pr_id:
-        conn.close()
         raise HTTPException(status_code=404, detail="PR not created for this session")
     
-    pr_data = gitea_client.get_pull_request(gitea_user, gitea_repo, gitea_pr_id)
+    # Одновременные просмотры одного PR (несколько ревьюеров) - один набор запросов в Gitea
+    pr_data, pr_comments, issue_comments, pr_diff = await gitea_pr_flight.do(
+        f"{gitea_user}/{gitea_repo}#{gitea_pr_id}",
+        lambda: _fetch_gitea_pr(gitea_user, gitea_repo, gitea_pr_id),
+    )
     
     if not pr_data:
-        conn.close()
         raise HTTPException(status_code=404, detail="PR not found in Gitea")
     
-    # Получаем комментарии к PR
-    pr_comments = gitea_client.get_pull_request_comments(gitea_user, gitea_repo, gitea_pr_id)
-    issue_comments = gitea_client.get_pull_request_issue_comments(gitea_user, gitea_repo, gitea_pr_id)
     all_comments = pr_comments + issue_comments
     
     # Проверяем, есть ли сигнал готовности в комментариях (автоматически обновляем статус)
-    ready_keywords = ["✅ ready", "ready", "готов", "готов к проверке", "готов к ревью", 
-                      "готово", "завершено", "done", "completed", "✓ ready", "🎯 ready"]
-    
-    for comment in all_comments:
-        body = comment.get("body", "").lower().strip()
-        if any(keyword in body for keyword in ready_keywords):
-            # Проверяем, не установлен ли уже candidate_ready_at
-            c.execute("SELECT candidate_ready_at FROM sessions WHERE id = ?", (session_id,))
-            current_ready_at = c.fetchone()[0]
-            if not current_ready_at:
-                # Устанавливаем candidate_ready_at
-                created_at = comment.get("created_at")
-                ready_at = created_at if created_at else datetime.utcnow().isoformat() + 'Z'
-                c.execute("UPDATE sessions SET candidate_ready_at = ? WHERE id = ?", (ready_at, session_id))
-                conn.commit()
-                logger.info(f"Auto-detected candidate readiness from Gitea PR comment for session {session_id}")
-            break
-    
-    # Получаем diff
-    pr_diff = gitea_client.get_pull_request_diff(gitea_user, gitea_repo, gitea_pr_id)
-    
-    conn.close()
+    ready_comment = comment_parser.first_ready_comment(all_comments)
+    if ready_comment and not current_ready_at:
+        await _mark_candidate_ready(session_id, _ready_comment_time(ready_comment))
     
     return {
         "pr": pr_data,
@@ -1271,35 +2221,179 @@ def reviewer_get_gitea_pr(session_id: int):
         "pr_url": f"{GITEA_WEB_URL}/{gitea_user}/{gitea_repo}/pulls/{gitea_pr_id}"
     }
 
+# === API: Reviewer - Diff и файлы PR из локального зеркала (git_mirror) ===
+# Адресуются SHA коммитов - ответы неизменяемы, повторный запрос с If-None-Match получает 304
+MIRROR_RETRY_AFTER = "5"
+
+async def _session_pr_commits(session_id: int):
+    """(gitea_user, gitea_repo, base sha, head sha) PR сессии"""
+    if not async_gitea or not git_mirror.GIT_MIRROR_ENABLED:
+        raise HTTPException(status_code=503, detail="Git mirror not available")
+    row = await db.fetchone("SELECT gitea_user, gitea_repo, gitea_pr_id FROM sessions WHERE id = ?", (session_id,))
+    if not row:
+        raise HTTPException(status_code=404, detail="Session not found")
+    gitea_user, gitea_repo, gitea_pr_id = row
+    if not gitea_pr_id:
+        raise HTTPException(status_code=404, detail="PR not created for this session")
+    pr = await async_gitea.get_pull_request(gitea_user, gitea_repo, gitea_pr_id)
+    if not pr:
+        raise HTTPException(status_code=404, detail="PR not found in Gitea")
+    commits = _pr_commits(pr)
+    if not commits:
+        raise HTTPException(status_code=404, detail="PR commits not available")
+    return gitea_user, gitea_repo, commits[0], commits[1]
+
+async def _raise_mirror_not_ready(gitea_user: str, gitea_repo: str, commits: list):
+    """Коммитов ещё нет в зеркале: поставить обновление, клиент повторит запрос"""
+    await _schedule_mirror_sync(gitea_user, gitea_repo, commits)
+    raise HTTPException(status_code=503, detail="Git mirror is not up to date yet", headers={"Retry-After": MIRROR_RETRY_AFTER})
+
+async def _session_pr_diff_index(session_id: int):
+    gitea_user, gitea_repo, base_sha, head_sha = await _session_pr_commits(session_id)
+    try:
+        index = await run_io(git_mirror.pr_diff_index, gitea_user, gitea_repo, base_sha, head_sha)
+    except git_mirror.MirrorError as e:
+        logger.warning(f"Git mirror diff failed for session {session_id}: {e}")
+        index = None
+    if index is None:
+        await _raise_mirror_not_ready(gitea_user, gitea_repo, [(base_sha, head_sha)])
+    return gitea_user, gitea_repo, base_sha, head_sha, index
+
+@app.get("/api/reviewer/sessions/{session_id}/gitea/pr/diff/files")
+async def reviewer_get_pr_diff_files(session_id: int, request: Request):
+    """Список файлов diff PR (без содержимого)"""
+    gitea_user, gitea_repo, base_sha, head_sha, index = await _session_pr_diff_index(session_id)
+    etag = f'"{index.sha}-files"'
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=_immutable_headers(etag))
+    return JSONResponse(
+        content={
+            "base_sha": base_sha,
+            "head_sha": head_sha,
+            "size": index.size,
+            "files": [index.file_summary(i) for i in range(len(index.files))]
+        },
+        headers=_immutable_headers(etag)
+    )
+
+@app.get("/api/reviewer/sessions/{session_id}/gitea/pr/diff/files/{file_index}")
+async def reviewer_get_pr_diff_file(session_id: int, file_index: int, request: Request, hunk_from: int = 0, hunk_to: int = None):
+    """Diff одного файла PR (или диапазона его hunks [hunk_from, hunk_to))"""
+    gitea_user, gitea_repo, base_sha, head_sha, index = await _session_pr_diff_index(session_id)
+    if not 0 <= file_index < len(index.files):
+        raise HTTPException(status_code=404, detail="File not found in diff")
+    if hunk_from < 0 or (hunk_to is not None and hunk_to <= hunk_from):
+        raise HTTPException(status_code=400, detail="Invalid hunk range")
+    ranges = index.section(file_index, hunk_from, hunk_to)
+    if not ranges:
+        raise HTTPException(status_code=404, detail="Hunk range not found")
+    etag = f'"{index.sha}-f{file_index}-{hunk_from}-{hunk_to if hunk_to is not None else ""}"'
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=_immutable_headers(etag))
+    content = await run_io(git_mirror.read_diff_ranges, gitea_user, gitea_repo, base_sha, head_sha, ranges)
+    return Response(content=content, media_type=DIFF_MEDIA_TYPE, headers=_immutable_headers(etag))
+
+@app.get("/api/reviewer/sessions/{session_id}/gitea/pr/file")
+async def reviewer_get_pr_file(session_id: int, path: str, request: Request, side: str = "head"):
+    """Содержимое файла PR: side=head - версия кандидата, side=base - базовая ветка"""
+    if side not in ("head", "base"):
+        raise HTTPException(status_code=400, detail="side must be 'head' or 'base'")
+    gitea_user, gitea_repo, base_sha, head_sha = await _session_pr_commits(session_id)
+    sha = head_sha if side == "head" else base_sha
+    # Путь может содержать кавычки и не-ASCII символы - в ETag только его hash
+    etag = f'"{sha}-{hashlib.sha1(path.encode()).hexdigest()[:16]}"'
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=_immutable_headers(etag))
+    try:
+        has_commit = await run_io(git_mirror.has_commits, gitea_user, gitea_repo, sha)
+    except git_mirror.MirrorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not has_commit:
+        await _raise_mirror_not_ready(gitea_user, gitea_repo, [(base_sha, head_sha)])
+    content = await run_io(git_mirror.read_file, gitea_user, gitea_repo, sha, path)
+    if content is None:
+        raise HTTPException(status_code=404, detail="File not found in commit")
+    return Response(content=content, media_type=DIFF_MEDIA_TYPE, headers=_immutable_headers(etag))
+
+@app.get("/api/reviewer/gitea/mirror/stats")
+async def reviewer_git_mirror_stats():
+    """Зеркала репозиториев: diff из кэша / вычислено из зеркала / зеркало отставало (счётчики процесса)"""
+    return {"enabled": git_mirror.GIT_MIRROR_ENABLED, **git_mirror.stats()}
+
 # === API: Reviewer - Синхронизировать комментарии ИЗ Gitea PR в нашу систему ===
+def _ready_comment_time(ready_comment):
+    """Время сигнала готовности: created_at комментария, без него - текущее"""
+    if ready_comment is None:
+        return None
+    return ready_comment.get("created_at") or datetime.utcnow().isoformat() + 'Z'
+
+async def _mark_candidate_ready(session_id: int, ready_at: str) -> bool:
+    """Установить candidate_ready_at, если ещё не установлен (условие в UPDATE - чтобы не перезаписать параллельный запрос)"""
+    updated = await _update_session(
+        session_id,
+        "UPDATE sessions SET candidate_ready_at = ? WHERE id = ? AND candidate_ready_at IS NULL",
+        (ready_at, session_id))
+    if updated:
+        logger.info(f"Auto-detected candidate readiness from Gitea PR comment for session {session_id}")
+        await publish_event_async(session_channel(session_id), "candidate_ready", {"session_id": session_id, "ready_at": ready_at, "source": "gitea"})
+    return bool(updated)
+
+def _merge_gitea_comments(conn, session_id: int, new_comments: list):
+    """Добавить комментарии из Gitea, пропуская уже синхронизированные (read-modify-write в одной транзакции)"""
+    conn.execute("BEGIN IMMEDIATE")
+    return _merge_gitea_comments_locked(conn, session_id, new_comments)
+
+def _merge_gitea_comments_locked(conn, session_id: int, new_comments: list):
+    """То же внутри уже открытой транзакции"""
+    row = conn.execute("SELECT comments FROM sessions WHERE id = ?", (session_id,)).fetchone()
+    comments = json.loads(row[0]) if row and row[0] else []
+    existing_ids = {c.get("gitea_id") for c in comments if c.get("gitea_id")}
+    # Копии наших комментариев в Gitea: review, отправленный отсюда (маркер может быть без gitea_id,
+    # если id комментариев review не сопоставились), и комментарии, отправка которых ещё идёт
+    pushed_reviews = {c["gitea_review_id"] for c in comments if c.get("gitea_review_id") and c.get("source") != "gitea"}
+    pushing = {(c.get("file", "main.py"), c.get("text", "")) for c in comments if c.get("gitea_push_pending")}
+    added = []
+    for comment in new_comments:
+        gitea_id = comment.get("gitea_id")
+        if gitea_id and gitea_id in existing_ids:
+            continue
+        if comment.get("gitea_review_id") in pushed_reviews or (comment.get("file"), comment.get("text")) in pushing:
+            continue
+        comments.append(comment)
+        existing_ids.add(gitea_id)
+        added.append(comment)
+    if added:
+        conn.execute("UPDATE sessions SET comments = ? WHERE id = ?", (json.dumps(comments), session_id))
+        summaries.add_comments(conn, session_id, added)
+    return len(added), len(comments)
+
 @app.post("/api/reviewer/sessions/{session_id}/gitea/sync-comments-from-gitea")
-def reviewer_sync_comments_from_gitea(session_id: int):
+async def reviewer_sync_comments_from_gitea(session_id: int):
     """
     Синхронизировать комментарии ИЗ Gitea PR в нашу систему (для отчёта)
     """
-    if not gitea_client:
+    if not async_gitea:
         raise HTTPException(status_code=503, detail="Gitea integration not available")
     
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT comments, gitea_user, gitea_repo, gitea_pr_id FROM sessions WHERE id = ?", (session_id,))
-    row = c.fetchone()
+    row = await db.fetchone("SELECT comments, gitea_user, gitea_repo, gitea_pr_id FROM sessions WHERE id = ?", (session_id,))
     
     if not row:
-        conn.close()
         raise HTTPException(status_code=404, detail="Session not found")
     
     comments_json, gitea_user, gitea_repo, gitea_pr_id = row
     existing_comments = json.loads(comments_json) if comments_json else []
     
     if not gitea_pr_id:
-        conn.close()
         raise HTTPException(status_code=400, detail="PR not created for this session")
     
     # Получаем комментарии из Gitea PR (и review comments, и issue comments)
     logger.info(f"Syncing comments from Gitea PR {gitea_user}/{gitea_repo}#{gitea_pr_id} for session {session_id}")
-    pr_comments = gitea_client.get_pull_request_comments(gitea_user, gitea_repo, gitea_pr_id)
-    issue_comments = gitea_client.get_pull_request_issue_comments(gitea_user, gitea_repo, gitea_pr_id)
+    # Явная синхронизация: перечитываем PR (комментарии возьмутся из кэша, если updated_at не изменился)
+    await async_gitea.get_pull_request(gitea_user, gitea_repo, gitea_pr_id, fresh=True)
+    pr_comments, issue_comments = await asyncio.gather(
+        async_gitea.get_pull_request_comments(gitea_user, gitea_repo, gitea_pr_id),
+        async_gitea.get_pull_request_issue_comments(gitea_user, gitea_repo, gitea_pr_id),
+    )
     
     logger.info(f"Retrieved {len(pr_comments)} review comments and {len(issue_comments)} issue comments from Gitea PR")
     
@@ -1310,36 +2404,14 @@ def reviewer_sync_comments_from_gitea(session_id: int):
         # Логируем структуру первого комментария для отладки
         logger.info(f"Sample comment structure: {json.dumps(all_pr_comments[0] if all_pr_comments else {}, indent=2)}")
     
-    # Проверяем, есть ли сигнал готовности в комментариях
-    ready_keywords = ["✅ ready", "ready", "готов", "готов к проверке", "готов к ревью", 
-                      "готово", "завершено", "done", "completed", "✓ ready", "🎯 ready"]
-    candidate_ready_detected = False
-    ready_comment_time = None
-    
-    for comment in all_pr_comments:
-        body = comment.get("body", "").lower().strip()
-        # Проверяем, содержит ли комментарий сигнал готовности
-        if any(keyword in body for keyword in ready_keywords):
-            candidate_ready_detected = True
-            # Получаем время создания комментария
-            created_at = comment.get("created_at")
-            if created_at:
-                ready_comment_time = created_at
-            break
+    converted_comments, ready_comment = comment_parser.convert_gitea_comments(all_pr_comments)
+    candidate_ready_detected = ready_comment is not None
     
     # Если обнаружен сигнал готовности и candidate_ready_at ещё не установлен
     if candidate_ready_detected:
-        c.execute("SELECT candidate_ready_at FROM sessions WHERE id = ?", (session_id,))
-        current_ready_at = c.fetchone()[0]
-        if not current_ready_at:
-            # Устанавливаем candidate_ready_at
-            ready_at = ready_comment_time if ready_comment_time else datetime.utcnow().isoformat() + 'Z'
-            c.execute("UPDATE sessions SET candidate_ready_at = ? WHERE id = ?", (ready_at, session_id))
-            conn.commit()
-            logger.info(f"Auto-detected candidate readiness from Gitea PR comment for session {session_id}")
+        await _mark_candidate_ready(session_id, _ready_comment_time(ready_comment))
     
     if not all_pr_comments:
-        conn.close()
         return {
             "status": "ok",
             "synced_count": 0,
@@ -1348,324 +2420,412 @@ def reviewer_sync_comments_from_gitea(session_id: int):
             "candidate_ready_detected": candidate_ready_detected
         }
     
-    # Конвертируем комментарии из Gitea в наш формат
-    synced_count = 0
-    existing_comment_ids = {c.get("gitea_id") for c in existing_comments if c.get("gitea_id")}
+    # Сохраняем: дедупликация по gitea_id по актуальному состоянию (внутри транзакции)
+    synced_count, total_count = await db.run(_merge_gitea_comments, session_id, converted_comments)
     
-    # Пропускаем комментарии-сигналы готовности (они уже обработаны выше)
-    for pr_comment in all_pr_comments:
-        body = pr_comment.get("body", "").lower().strip()
-        # Пропускаем комментарии-сигналы готовности (не добавляем их как code review комментарии)
-        if any(keyword in body for keyword in ready_keywords):
-            continue
-        # Проверяем, не добавлен ли уже этот комментарий
-        gitea_comment_id = pr_comment.get("id")
-        if gitea_comment_id and gitea_comment_id in existing_comment_ids:
-            continue
-        
-        # Парсим комментарий из Gitea
-        # Формат Gitea: body может содержать [TYPE] SEVERITY\n\nтекст
-        body = pr_comment.get("body", "")
-        comment_type = "bug"
-        severity = "medium"
-        text = body
-        
-        # Пытаемся извлечь тип и серьёзность из формата [TYPE] SEVERITY
-        lines = body.split("\n", 2)
-        if len(lines) >= 2 and lines[0].startswith("[") and "]" in lines[0]:
-            type_part = lines[0].split("]")[0].replace("[", "").strip().lower()
-            severity_part = lines[0].split("]")[1].strip().lower() if "]" in lines[0] else "medium"
-            text = "\n".join(lines[2:]) if len(lines) > 2 else body
-            
-            # Маппинг типов
-            type_map = {"bug": "bug", "security": "security", "style": "style", "performance": "performance"}
-            comment_type = type_map.get(type_part, "bug")
-            
-            # Маппинг серьёзности
-            severity_map = {"critical": "critical", "high": "high", "medium": "medium", "low": "low"}
-            severity = severity_map.get(severity_part, "medium")
-        
-        # Извлекаем информацию о файле и строке
-        # В Gitea комментарии могут иметь разные поля: path, original_path, diff_hunk, line, original_line
-        path = pr_comment.get("path") or pr_comment.get("original_path") or "main.py"
-        line = pr_comment.get("line") or pr_comment.get("original_line") or pr_comment.get("new_line") or 1
-        line_range = f"{line}-{line}"
-        
-        logger.info(f"Parsing comment: path={path}, line={line}, gitea_id={gitea_comment_id}, body_preview={text[:50] if text else 'empty'}...")
-        
-        # Создаём комментарий в нашем формате
-        new_comment = {
-            "file": path,
-            "line_range": line_range,
-            "type": comment_type,
-            "severity": severity,
-            "text": text,
-            "gitea_id": gitea_comment_id,  # Сохраняем ID для избежания дубликатов
-            "source": "gitea"  # Помечаем, что комментарий из Gitea
-        }
-        
-        existing_comments.append(new_comment)
-        synced_count += 1
-        logger.info(f"Added comment {synced_count}: file={path}, line={line}")
-    
-    # Сохраняем обновлённые комментарии
-    c.execute("UPDATE sessions SET comments = ? WHERE id = ?", (json.dumps(existing_comments), session_id))
-    conn.commit()
-    conn.close()
-    
-    logger.info(f"Comment sync completed for session {session_id}: synced {synced_count} new comments, total {len(existing_comments)} comments")
+    logger.info(f"Comment sync completed for session {session_id}: synced {synced_count} new comments, total {total_count} comments")
+    if synced_count:
+        await publish_event_async(session_channel(session_id), "comments_synced", {"session_id": session_id, "synced_count": synced_count, "total": total_count})
     
     return {
         "status": "ok",
         "synced_count": synced_count,
-        "total_count": len(existing_comments),
+        "total_count": total_count,
         "message": f"Synced {synced_count} comments from Gitea",
         "candidate_ready_detected": candidate_ready_detected
     }
 
+@app.post("/api/reviewer/gitea/sync-all")
+async def reviewer_sync_all_gitea_prs():
+    """Синхронизировать PR всех активных сессий сейчас (не дожидаясь фонового прохода)"""
+    if not async_gitea:
+        raise HTTPException(status_code=503, detail="Gitea integration not available")
+    return await _sync_gitea_prs()
+
 # === API: Reviewer - Синхронизировать комментарии в Gitea PR ===
+# Отправленный комментарий получает маркер (gitea_id / gitea_review_id), повторная синхронизация
+# отправляет только новые. Комментарии отправляются пачками одним review; если Gitea не принял
+# review - по одному с ограничением параллельности.
+# Перед отправкой комментарии захватываются (gitea_push_pending) в транзакции: параллельная
+# синхронизация их не отправит повторно, а обратная синхронизация не импортирует их копии.
+# Захват процесса, упавшего во время отправки, истекает через GITEA_PUSH_CLAIM_TTL
+GITEA_SYNC_CONCURRENCY = int(os.getenv("GITEA_SYNC_CONCURRENCY", "4"))
+GITEA_REVIEW_BATCH_SIZE = int(os.getenv("GITEA_REVIEW_BATCH_SIZE", "50"))
+GITEA_PUSH_CLAIM_TTL = int(os.getenv("GITEA_PUSH_CLAIM_TTL", "300"))
+
+def _is_pushed(comment: dict) -> bool:
+    return comment.get("source") == "gitea" or bool(comment.get("gitea_id") or comment.get("gitea_review_id") or comment.get("gitea_pushed_at"))
+
+def _claim_pending_comments(conn, session_id: int):
+    """
+    Захватить неотправленные комментарии сессии для отправки в Gitea
+
+    Returns:
+        ([(индекс, комментарий с маркером захвата)], всего комментариев)
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    row = conn.execute("SELECT comments FROM sessions WHERE id = ?", (session_id,)).fetchone()
+    comments = json.loads(row[0]) if row and row[0] else []
+    now = time.time()
+    claimed = []
+    for index, comment in enumerate(comments):
+        if _is_pushed(comment) or now - comment.get("gitea_push_pending", 0) < GITEA_PUSH_CLAIM_TTL:
+            continue
+        comment["gitea_push_pending"] = now
+        claimed.append((index, comment))
+    if claimed:
+        conn.execute("UPDATE sessions SET comments = ? WHERE id = ?", (json.dumps(comments), session_id))
+    return claimed, len(comments)
+
+def _comment_line(comment: dict) -> int:
+    # Номер строки из line_range (например, "10-15" -> 10)
+    try:
+        return int(str(comment.get("line_range") or "1").split("-")[0])
+    except ValueError:
+        return 1
+
+def _gitea_comment_body(comment: dict) -> str:
+    return f"[{comment.get('type', 'comment').upper()}] {comment.get('severity', 'medium').upper()}\n\n{comment.get('text', '')}"
+
+def _mark_pushed(conn, session_id: int, pushed: list, released: list = ()) -> int:
+    """
+    Записать маркеры отправки (pushed: [(индекс, комментарий при захвате, маркер)])
+    и снять захват с неотправленных (released: [(индекс, комментарий при захвате)])
+
+    Комментарии только добавляются в конец, поэтому индекс стабилен; сравнение с захваченным
+    комментарием защищает от записи маркера не в тот элемент.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    row = conn.execute("SELECT comments FROM sessions WHERE id = ?", (session_id,)).fetchone()
+    comments = json.loads(row[0]) if row and row[0] else []
+    marked = 0
+    for index, snapshot, marker in pushed:
+        if index < len(comments) and comments[index] == snapshot:
+            comments[index].pop("gitea_push_pending", None)
+            comments[index].update(marker)
+            marked += 1
+    changed = marked
+    for index, snapshot in released:
+        if index < len(comments) and comments[index] == snapshot:
+            comments[index].pop("gitea_push_pending", None)
+            changed += 1
+    if changed:
+        conn.execute("UPDATE sessions SET comments = ? WHERE id = ?", (json.dumps(comments), session_id))
+    return marked
+
+async def _push_review(gitea_user: str, gitea_repo: str, gitea_pr_id: int, batch: list):
+    """Отправить пачку [(индекс, комментарий)] одним review; None - review не создан"""
+    review = await async_gitea.create_pull_request_review(
+        owner=gitea_user,
+        repo=gitea_repo,
+        pr_index=gitea_pr_id,
+        body=f"Code review: {len(batch)} comments",
+        comments=[
+            {"path": comment.get("file", "main.py"), "body": _gitea_comment_body(comment), "new_position": _comment_line(comment)}
+            for _, comment in batch
+        ]
+    )
+    if not review or not review.get("id"):
+        return None
+    # id созданных комментариев - для дедупликации при обратной синхронизации (по gitea_id)
+    remote_ids = {}
+    for remote in await async_gitea.get_pull_request_review_comments(gitea_user, gitea_repo, gitea_pr_id, review["id"]):
+        remote_ids.setdefault((remote.get("path"), remote.get("body")), []).append(remote.get("id"))
+    pushed_at = datetime.utcnow().isoformat() + 'Z'
+    pushed = []
+    for index, comment in batch:
+        ids = remote_ids.get((comment.get("file", "main.py"), _gitea_comment_body(comment)))
+        marker = {"gitea_review_id": review["id"], "gitea_pushed_at": pushed_at}
+        if ids:
+            marker["gitea_id"] = ids.pop(0)
+        pushed.append((index, comment, marker))
+    return pushed
+
 @app.post("/api/reviewer/sessions/{session_id}/gitea/sync-comments")
-def reviewer_sync_gitea_comments(session_id: int):
+async def reviewer_sync_gitea_comments(session_id: int):
     """
-    Синхронизировать комментарии из нашей системы в Gitea PR
+    Синхронизировать комментарии из нашей системы в Gitea PR (только ещё не отправленные)
     """
-    if not gitea_client:
+    if not async_gitea:
         raise HTTPException(status_code=503, detail="Gitea integration not available")
     
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT comments, gitea_user, gitea_repo, gitea_pr_id FROM sessions WHERE id = ?", (session_id,))
-    row = c.fetchone()
-    conn.close()
+    row = await db.fetchone("SELECT gitea_user, gitea_repo, gitea_pr_id FROM sessions WHERE id = ?", (session_id,))
     
     if not row:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    comments_json, gitea_user, gitea_repo, gitea_pr_id = row
+    gitea_user, gitea_repo, gitea_pr_id = row
     
     if not gitea_pr_id:
         raise HTTPException(status_code=400, detail="PR not created for this session")
     
-    comments = json.loads(comments_json) if comments_json else []
+    # Пропускаем комментарии из Gitea, уже отправленные и отправляемые параллельной синхронизацией
+    pending, total = await db.run(_claim_pending_comments, session_id)
     
-    synced_count = 0
     errors = []
-    
-    for comment in comments:
-        # Пропускаем комментарии, которые уже из Gitea (чтобы не дублировать)
-        if comment.get("source") == "gitea" or comment.get("gitea_id"):
+    pushed = []
+    reviews = 0
+    fallback = []
+    for start in range(0, len(pending), GITEA_REVIEW_BATCH_SIZE):
+        batch = pending[start:start + GITEA_REVIEW_BATCH_SIZE]
+        try:
+            batch_pushed = await _push_review(gitea_user, gitea_repo, gitea_pr_id, batch)
+        except Exception as e:
+            logger.warning(f"Failed to create Gitea review for session {session_id}: {e}")
+            batch_pushed = None
+        if batch_pushed is None:
+            fallback.extend(batch)
             continue
-            
+        pushed.extend(batch_pushed)
+        reviews += 1
+    
+    semaphore = asyncio.Semaphore(GITEA_SYNC_CONCURRENCY)
+    
+    async def push_comment(index: int, comment: dict):
         try:
-            # Парсим line_range для получения номера строки
-            line = 1
-            if comment.get("line_range"):
-                # Пытаемся извлечь номер строки из line_range (например, "10-15" -> 10)
-                try:
-                    line = int(comment.get("line_range", "1").split("-")[0])
-                except:
-                    line = 1
-            
-            # Создаём комментарий в Gitea PR
-            comment_body = f"[{comment.get('type', 'comment').upper()}] {comment.get('severity', 'medium').upper()}\n\n{comment.get('text', '')}"
-            
-            result = gitea_client.create_pull_request_comment(
-                owner=gitea_user,
-                repo=gitea_repo,
-                pr_index=gitea_pr_id,
-                body=comment_body,
-                path=comment.get("file", "main.py"),
-                line=line,
-                side="RIGHT"
-            )
-            
-            if result:
-                synced_count += 1
+            # Поштучная отправка - пачка запросов: фоновая полоса планировщика Gitea
+            async with semaphore:
+                with async_gitea.background():
+                    result = await async_gitea.create_pull_request_comment(
+                        owner=gitea_user,
+                        repo=gitea_repo,
+                        pr_index=gitea_pr_id,
+                        body=_gitea_comment_body(comment),
+                        path=comment.get("file", "main.py"),
+                        line=_comment_line(comment),
+                        side="RIGHT"
+                    )
         except Exception as e:
             errors.append(f"Failed to sync comment: {str(e)}")
+            return
+        if not result:
+            errors.append(f"Failed to sync comment on {comment.get('file', 'main.py')}:{_comment_line(comment)}")
+            return
+        marker = {"gitea_pushed_at": datetime.utcnow().isoformat() + 'Z'}
+        if result.get("id"):
+            marker["gitea_id"] = result["id"]
+        pushed.append((index, comment, marker))
+    
+    if fallback:
+        await asyncio.gather(*(push_comment(index, comment) for index, comment in fallback))
+    
+    pushed_indexes = {index for index, _, _ in pushed}
+    released = [(index, comment) for index, comment in pending if index not in pushed_indexes]
+    if pending:
+        await db.run(_mark_pushed, session_id, pushed, released)
+    logger.info(f"Pushed {len(pushed)}/{len(pending)} comments to Gitea PR for session {session_id} ({reviews} reviews, {len(fallback)} single)")
     
     return {
         "status": "ok",
-        "synced_count": synced_count,
-        "total_count": len(comments),
+        "synced_count": len(pushed),
+        "skipped_count": total - len(pending),
+        "total_count": total,
+        "reviews_created": reviews,
         "errors": errors
     }
 
-# === НОВОЕ: PDF ОТЧЁТ (старый endpoint для обратной совместимости) ===
-@app.get("/api/sessions/{session_id}/report/pdf")
-def get_pdf_report(session_id: int):
-    session = get_session(session_id)
-    diff_path = f"/artifacts/{session_id}_diff.patch"
-    report_path = f"/artifacts/{session_id}_report.txt"
+# === Gitea: webhook и кэш метаданных ===
+# Секрет webhook в настройках репозитория/организации Gitea (пусто - подпись не проверяется)
+GITEA_WEBHOOK_SECRET = os.getenv("GITEA_WEBHOOK_SECRET", "")
+# Инвалидации рассылаются всем процессам API: webhook приходит только в один из них
+GITEA_INVALIDATION_CHANNEL = f"{CHANNEL_PREFIX}gitea"
+
+def _gitea_invalidation_target(payload: dict):
+    """Репозиторий и номер PR из payload webhook (push - весь репозиторий)"""
+    repository = payload.get("repository") or {}
+    owner = (repository.get("owner") or {}).get("login") or (repository.get("owner") or {}).get("username")
+    repo = repository.get("name")
+    if not owner or not repo:
+        return None
+    pr_index = (payload.get("pull_request") or {}).get("number")
+    issue = payload.get("issue") or {}
+    if pr_index is None and issue.get("pull_request") is not None:
+        pr_index = issue.get("number")
+    return {"owner": owner, "repo": repo, "pr": pr_index}
+
+def _apply_gitea_invalidation(target: dict):
+    if not gitea_client:
+        return
+    if target.get("pr") is not None:
+        gitea_client.invalidate_pr(target["owner"], target["repo"], target["pr"])
+    else:
+        gitea_client.invalidate_repo(target["owner"], target["repo"])
+
+async def _invalidate_gitea_cache(target: dict):
+    """Сбросить кэш здесь и в остальных процессах API"""
+    _apply_gitea_invalidation(target)
+    await publish_event_async(GITEA_INVALIDATION_CHANNEL, "invalidate", target)
+
+async def _listen_gitea_invalidations():
+    """Фоновая задача: применять инвалидации кэша Gitea из других процессов"""
+    async with event_broker.subscribe(GITEA_INVALIDATION_CHANNEL) as queue:
+        while True:
+            payload = await queue.get()
+            target = payload.get("data") or {}
+            if target.get("owner") and target.get("repo"):
+                _apply_gitea_invalidation(target)
+
+def _webhook_comment(payload: dict):
+    """Новый комментарий из payload webhook (issue_comment - comment, отзыв на PR - review)"""
+    if payload.get("action") not in (None, "created", "reviewed"):
+        return None
+    comment = payload.get("comment")
+    if comment and comment.get("body"):
+        return comment
+    review = payload.get("review") or {}
+    if review.get("content"):
+        return {"body": review["content"], "created_at": (payload.get("pull_request") or {}).get("updated_at")}
+    return None
+
+async def _ready_comment_from_gitea(target: dict):
+    """Сигнал готовности из комментариев PR, перечитанных из Gitea (None - нет или Gitea недоступна)"""
+    if not async_gitea:
+        return None
+    try:
+        pr_comments, issue_comments = await asyncio.gather(
+            async_gitea.get_pull_request_comments(target["owner"], target["repo"], target["pr"]),
+            async_gitea.get_pull_request_issue_comments(target["owner"], target["repo"], target["pr"]),
+        )
+    except Exception as e:
+        logger.warning(f"Gitea webhook: failed to re-read comments of {target['owner']}/{target['repo']}#{target['pr']}: {e}")
+        return None
+    return comment_parser.first_ready_comment(pr_comments + issue_comments)
 
-    diff_content = "# No diff"
-    if os.path.exists(diff_path):
-        with open(diff_path) as f:
-            diff_content = f.read()
-
-    report_content = "Отчёт ещё не готов..."
-    if os.path.exists(report_path):
-        with open(report_path) as f:
-            report_content = f.read()
-
-    # 2. HTML
-    html_content = f"""<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="utf-8">
-    <title>Code Review Report #{session_id}</title>
-    <style>
-        @page {{ size: A4; margin: 2cm; }}
-        body {{ font-family: 'DejaVu Sans', sans-serif; line-height: 1.6; color: #333; }}
-        h1, h2 {{ color: #2c3e50; }}
-        .header {{ border-bottom: 3px solid #3498db; padding-bottom: 10px; }}
-        pre {{ background: #f8f9fa; padding: 15px; border-radius: 8px; overflow-x: auto; font-size: 12px; }}
-        table {{ width: 100%; border-collapse: collapse; margin: 20px 0; }}
-        th, td {{ border: 1px solid #ddd; padding: 10px; text-align: left; }}
-        th {{ background: #f2f2f2; }}
-        .critical {{ background: #ffebee; }}
-        .high {{ background: #fff3e0; }}
-        .medium {{ background: #fffde7; }}
-        .low {{ background: #f3f4f7; }}
-        .grade {{ font-size: 2em; font-weight: bold; text-align: center; margin: 20px 0; color: #27ae60; }}
-    </style>
-</head>
-<body>
-    <div class="header">
-        <h1>Code Review Report</h1>
-        <p><strong>Session ID:</strong> #{session['id']}</p>
-        <p><strong>Candidate:</strong> {session['candidate_id']}</p>
-        <p><strong>Date:</strong> {time.strftime("%d.%m.%Y %H:%M")}</p>
-    </div>
-
-    <div class="section">
-        <h2>Evaluation Results</h2>
-        <pre>{report_content}</pre>
-        <div class="grade">
-            {report_content.split('Grade: ')[-1].strip() if 'Grade:' in report_content else '—'}
-        </div>
-    </div>
-
-    <div class="section">
-        <h2>Comments ({len(session['comments'])})</h2>
-        {"" if session['comments'] else "<p>No comments yet.</p>"}
-        <table>
-            <tr><th>File</th><th>Line</th><th>Type</th><th>Severity</th><th>Comment</th></tr>
-            {''.join(
-                f'<tr class="{c["severity"]}"><td>{c["file"]}</td><td>{c["line_range"]}</td><td>{c["type"]}</td><td>{c["severity"]}</td><td>{c["text"]}</td></tr>'
-                for c in session['comments']
-            )}
-        </table>
-    </div>
-
-    <div class="section">
-        <h2>Diff</h2>
-        <pre>{diff_content}</pre>
-    </div>
-</body>
-</html>"""
-
-    # 3. Генерация PDF
-    html = HTML(string=html_content)
-    pdf_path = f"/artifacts/{session_id}_report.pdf"
-    html.write_pdf(pdf_path)
+async def _detect_ready_from_webhook(target: dict, payload: dict, signed: bool) -> list:
+    """
+    Сигнал готовности в новом комментарии PR - отметить сессии сразу, не дожидаясь синхронизации
 
+    Payload без подписи может прислать кто угодно (и с любым created_at): тогда он лишь повод
+    перечитать комментарии PR из Gitea, сигнал и время готовности берутся оттуда
+    """
+    comment = _webhook_comment(payload)
+    if not comment or not comment_parser.is_ready_signal(comment.get("body")):
+        return []
+    rows = await db.fetchall(
+        "SELECT id FROM sessions WHERE gitea_user = ? AND gitea_repo = ? AND gitea_pr_id = ? AND candidate_ready_at IS NULL",
+        (target["owner"], target["repo"], target["pr"]))
+    if not rows:
+        return []
+    if not signed:
+        comment = await _ready_comment_from_gitea(target)
+        if comment is None:
+            return []
+    ready_at = _ready_comment_time(comment)
+    return [session_id for (session_id,) in rows if await _mark_candidate_ready(session_id, ready_at)]
+
+@app.post("/api/gitea/webhook")
+async def gitea_webhook(request: Request):
+    """
+    Webhook Gitea (push, pull_request, issue_comment, pull_request_review_*): сбросить кэш PR/репозитория,
+    на push/pull_request - обновить зеркало репозитория; комментарий-сигнал готовности сразу отмечает кандидата готовым
+    (без секрета - только если сигнал подтверждается комментариями PR в самой Gitea)
+    """
+    body = await request.body()
+    signed = bool(GITEA_WEBHOOK_SECRET)
+    if signed:
+        expected = hmac.new(GITEA_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+        if not secrets.compare_digest(request.headers.get("x-gitea-signature", ""), expected):
+            raise HTTPException(status_code=403, detail="Invalid signature")
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON payload")
+    target = _gitea_invalidation_target(payload) if isinstance(payload, dict) else None
+    if target:
+        await _invalidate_gitea_cache(target)
+        logger.info(f"Gitea webhook {request.headers.get('x-gitea-event', '?')}: invalidated {target['owner']}/{target['repo']}#{target['pr']}")
+    if target and request.headers.get("x-gitea-event") in ("push", "pull_request"):
+        # Новые коммиты - обновить локальное зеркало (diff PR дальше считается из него)
+        commits = _pr_commits(payload.get("pull_request") or {})
+        await _schedule_mirror_sync(target["owner"], target["repo"], [commits] if commits else [])
+    ready_sessions = await _detect_ready_from_webhook(target, payload, signed) if target and target["pr"] is not None else []
+    return {"status": "ok", "invalidated": target, "ready_sessions": ready_sessions}
+
+@app.get("/api/reviewer/gitea/cache/stats")
+async def reviewer_gitea_cache_stats():
+    """Статистика кэша метаданных Gitea (hit rate по видам записей)"""
+    if not gitea_client or gitea_client.cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **gitea_client.cache.stats()}
+
+@app.get("/api/reviewer/gitea/scheduler/stats")
+async def reviewer_gitea_scheduler_stats():
+    """Планировщик запросов к Gitea: занятые слоты, очереди и время ожидания по полосам"""
+    if not gitea_client:
+        return {"enabled": False}
+    return {"enabled": True, **gitea_client.scheduler.stats()}
+
+@app.get("/api/reviewer/singleflight/stats")
+async def reviewer_singleflight_stats():
+    """Объединение одновременных запросов: сколько вызовов выполнено, сколько получили общий результат"""
+    return singleflight.stats()
+
+@app.post("/api/reviewer/sessions/{session_id}/gitea/cache/invalidate")
+async def reviewer_invalidate_gitea_cache(session_id: int):
+    """Явно сбросить кэш PR сессии (если webhook не настроен)"""
+    if not async_gitea:
+        raise HTTPException(status_code=503, detail="Gitea integration not available")
+    row = await db.fetchone("SELECT gitea_user, gitea_repo, gitea_pr_id FROM sessions WHERE id = ?", (session_id,))
+    if not row:
+        raise HTTPException(status_code=404, detail="Session not found")
+    gitea_user, gitea_repo, gitea_pr_id = row
+    if not gitea_repo:
+        raise HTTPException(status_code=404, detail="Gitea repository not created for this session")
+    target = {"owner": gitea_user, "repo": gitea_repo, "pr": gitea_pr_id}
+    await _invalidate_gitea_cache(target)
+    return {"status": "ok", "invalidated": target}
+
+# === НОВОЕ: PDF ОТЧЁТ (старый endpoint для обратной совместимости) ===
+# Одновременные скачивания отчёта одной сессии ждут один рендер
+pdf_render_flight = SingleFlight("pdf_render")
+
+@app.get("/api/sessions/{session_id}/report/pdf")
+async def get_pdf_report(session_id: int):
+    session = await get_session(session_id)
+    # WeasyPrint грузит CPU - рендер в пуле процессов, event loop свободен
+    diff_path = await _session_diff_path(session_id)
+    pdf_path = await pdf_render_flight.do(
+        f"{session_id}:candidate",
+        lambda: run_render(render_session_report, session_id, session['candidate_id'], session['comments'], None, diff_path, "candidate"),
+    )
     return FileResponse(pdf_path, media_type="application/pdf", filename=f"review_report_{session_id}.pdf")
 
 # === API: Reviewer - Получить PDF отчёт ===
 @app.get("/api/reviewer/sessions/{session_id}/report/pdf")
-def reviewer_get_pdf_report(session_id: int):
-    session = reviewer_get_session(session_id)
-    diff_path = f"/artifacts/{session_id}_diff.patch"
-    report_path = f"/artifacts/{session_id}_report.txt"
-
-    diff_content = "# No diff"
-    if os.path.exists(diff_path):
-        with open(diff_path, encoding="utf-8") as f:
-            diff_content = f.read()
-
-    report_content = "Отчёт ещё не готов..."
-    if os.path.exists(report_path):
-        with open(report_path, encoding="utf-8") as f:
-            report_content = f.read()
-
-    html_content = f"""<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="utf-8">
-    <title>Code Review Report #{session_id}</title>
-    <style>
-        @page {{ size: A4; margin: 2cm; }}
-        body {{ font-family: 'DejaVu Sans', sans-serif; line-height: 1.6; color: #333; }}
-        h1, h2 {{ color: #2c3e50; }}
-        .header {{ border-bottom: 3px solid #3498db; padding-bottom: 10px; }}
-        pre {{ background: #f8f9fa; padding: 15px; border-radius: 8px; overflow-x: auto; font-size: 12px; }}
-        table {{ width: 100%; border-collapse: collapse; margin: 20px 0; }}
-        th, td {{ border: 1px solid #ddd; padding: 10px; text-align: left; }}
-        th {{ background: #f2f2f2; }}
-        .critical {{ background: #ffebee; }}
-        .high {{ background: #fff3e0; }}
-        .medium {{ background: #fffde7; }}
-        .low {{ background: #f3f4f7; }}
-        .grade {{ font-size: 2em; font-weight: bold; text-align: center; margin: 20px 0; color: #27ae60; }}
-    </style>
-</head>
-<body>
-    <div class="header">
-        <h1>Code Review Report</h1>
-        <p><strong>Session ID:</strong> #{session['id']}</p>
-        <p><strong>Candidate:</strong> {session['candidate_name']}</p>
-        <p><strong>Reviewer:</strong> {session.get('reviewer_name', 'Unknown')}</p>
-        <p><strong>Date:</strong> {time.strftime("%d.%m.%Y %H:%M")}</p>
-    </div>
-
-    <div class="section">
-        <h2>Evaluation Results</h2>
-        <pre>{report_content}</pre>
-        <div class="grade">
-            {report_content.split('Grade: ')[-1].strip() if 'Grade:' in report_content else '—'}
-        </div>
-    </div>
-
-    <div class="section">
-        <h2>Comments ({len(session['comments'])})</h2>
-        {"" if session['comments'] else "<p>No comments yet.</p>"}
-        <table>
-            <tr><th>File</th><th>Line</th><th>Type</th><th>Severity</th><th>Comment</th></tr>
-            {''.join(
-                f'<tr class="{c.get("severity", "medium")}"><td>{c.get("file", "unknown")}</td><td>{c.get("line_range", "-")}</td><td>{c.get("type", "comment")}</td><td>{c.get("severity", "medium")}</td><td>{c.get("text", "")}</td></tr>'
-                for c in session['comments']
-            )}
-        </table>
-    </div>
-
-    <div class="section">
-        <h2>Diff</h2>
-        <pre>{diff_content}</pre>
-    </div>
-</body>
-</html>"""
-
-    html = HTML(string=html_content)
-    pdf_path = f"/artifacts/{session_id}_report.pdf"
-    html.write_pdf(pdf_path)
-
+async def reviewer_get_pdf_report(session_id: int):
+    session = await reviewer_get_session(session_id)
+    diff_path = await _session_diff_path(session_id)
+    pdf_path = await pdf_render_flight.do(
+        f"{session_id}:reviewer",
+        lambda: run_render(
+            render_session_report, session_id, session['candidate_name'], session['comments'],
+            session.get('reviewer_name', 'Unknown'), diff_path, "reviewer"
+        ),
+    )
     return FileResponse(pdf_path, media_type="application/pdf", filename=f"review_report_{session_id}.pdf")
 
 # === API: Reviewer - Получить текстовый отчёт ===
 @app.get("/api/reviewer/sessions/{session_id}/report")
-def reviewer_get_report(session_id: int):
+async def reviewer_get_report(session_id: int):
+    from fastapi.responses import Response
     report_path = f"/artifacts/{session_id}_report.txt"
-    if not os.path.exists(report_path):
-        from fastapi.responses import Response
+    report_content = await run_io(_read_text, report_path)
+    if report_content is None:
         return Response(content="Отчёт ещё не готов...", media_type="text/plain; charset=utf-8")
     
-    with open(report_path, "r", encoding="utf-8") as f:
-        report_content = f.read()
-    
-    from fastapi.responses import Response
     return Response(content=report_content, media_type="text/plain; charset=utf-8")
 
+# === API: Reviewer - Хранилище артефактов ===
+@app.get("/api/reviewer/artifacts/stats")
+async def reviewer_artifact_stats():
+    """Статистика хранилища артефактов (число, ссылки, размер по типам)"""
+    return await db.run(artifact_store.stats)
+
+@app.post("/api/reviewer/artifacts/gc")
+async def reviewer_artifact_gc(grace_seconds: int = artifact_store.GC_GRACE_SECONDS):
+    """Удалить артефакты, на которые не ссылается ни одна сессия"""
+    return await db.run(artifact_store.collect_garbage, max(grace_seconds, 0))
+
 # === SPA ===
 # Catch-all роут должен быть последним, чтобы не перехватывать API запросы
 # ВАЖНО: Этот роут регистрируется последним, но FastAPI всё равно может его вызвать
@@ -1686,4 +2846,4 @@ async def serve_spa(request: Request, full_path: str):
     if full_path and os.path.isfile(file_path):
         return FileResponse(file_path)
 
-    return templates.TemplateResponse("index.html", {"request": request})                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                    
\ No newline at end of file
+    return _get_templates().TemplateResponse("index.html", {"request": request})
@@ -0,0 +1,219 @@
+"""
+Версионированные миграции схемы SQLite
+
+Версия схемы хранится в таблице schema_version. Каждая миграция:
+- schema(conn) - DDL, идемпотентный (колонки добавляются только если их нет -
+  старые БД, созданные прежним init_db, уже содержат часть колонок)
+- backfill(conn, limit) - заполнение данных пачками; каждая пачка в своей транзакции,
+  возвращает число обработанных строк (меньше limit - готово)
+
+Версия записывается после backfill, поэтому прерванная миграция при следующем
+запуске продолжится с того же места.
+
+Запуск:
+    python migrations.py            # применить все миграции
+    python migrations.py --status   # текущая и последняя версии
+"""
+import logging
+import os
+import secrets
+import sqlite3
+import time
+from typing import Callable, List, NamedTuple, Optional
+
+import artifact_store
+import session_timer
+import summaries
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "500"))
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    schema: Callable[[sqlite3.Connection], None]
+    backfill: Optional[Callable[[sqlite3.Connection, int], int]] = None
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> set:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _add_columns(conn: sqlite3.Connection, table: str, columns: List[tuple]):
+    existing = _columns(conn, table)
+    for name, definition in columns:
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+            logger.info(f"[Migrations] Added column: {table}.{name}")
+
+
+# === Миграции ===
+
+def _001_sessions(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            candidate_id TEXT,
+            mr_package TEXT,
+            comments TEXT,
+            created_at TEXT,
+            expires_at TEXT
+        )
+    ''')
+    _add_columns(conn, "sessions", [
+        ("created_at", "TEXT"),
+        ("expires_at", "TEXT"),
+        # Роли: токен кандидата (UNIQUE - индексом в 002), токен и имя ревьюера
+        ("access_token", "TEXT"),
+        ("reviewer_token", "TEXT"),
+        ("reviewer_name", "TEXT"),
+        ("candidate_name", "TEXT"),
+        ("status", "TEXT DEFAULT 'active'"),
+        # Gitea интеграция
+        ("gitea_user", "TEXT"),
+        ("gitea_repo", "TEXT"),
+        ("gitea_pr_id", "INTEGER"),
+        ("gitea_enabled", "INTEGER DEFAULT 0"),
+        # Soft delete и готовность кандидата
+        ("deleted_at", "TEXT"),
+        ("candidate_ready_at", "TEXT"),
+    ])
+
+
+def _002_access_token_index(conn):
+    # Индекс создаётся после заполнения токенов (см. backfill), здесь - только для новых БД
+    if not conn.execute("SELECT 1 FROM sessions WHERE access_token IS NULL LIMIT 1").fetchone():
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_access_token ON sessions(access_token)")
+
+
+def _002_access_token_backfill(conn, limit):
+    rows = conn.execute("SELECT id FROM sessions WHERE access_token IS NULL LIMIT ?", (limit,)).fetchall()
+    conn.executemany(
+        "UPDATE sessions SET access_token = ? WHERE id = ?",
+        [(secrets.token_urlsafe(32), session_id) for (session_id,) in rows]
+    )
+    if len(rows) < limit:
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_access_token ON sessions(access_token)")
+    return len(rows)
+
+
+def _003_packages(conn):
+    _add_columns(conn, "sessions", [("package_sha", "TEXT"), ("package_status", "TEXT")])
+
+
+def _004_artifacts(conn):
+    _add_columns(conn, "sessions", [("diff_sha", "TEXT"), ("golden_sha", "TEXT")])
+    artifact_store.init_schema(conn)
+
+
+def _005_summaries(conn):
+    summaries.init_schema(conn)
+
+
+def _006_epoch_times(conn):
+    _add_columns(conn, "sessions", [("created_at_epoch", "INTEGER"), ("expires_at_epoch", "INTEGER")])
+    session_timer.init_schema(conn)
+
+
+def _007_gitea_pr_sync(conn):
+    # updated_at PR на момент последней фоновой синхронизации (неизменённые PR пропускаются)
+    _add_columns(conn, "sessions", [("gitea_pr_updated_at", "TEXT")])
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "sessions", _001_sessions),
+    Migration(2, "access_token_index", _002_access_token_index, _002_access_token_backfill),
+    Migration(3, "packages", _003_packages),
+    Migration(4, "artifacts", _004_artifacts),
+    Migration(5, "session_summaries", _005_summaries, summaries.backfill),
+    Migration(6, "epoch_times", _006_epoch_times, session_timer.backfill),
+    Migration(7, "gitea_pr_sync", _007_gitea_pr_sync),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+# === Запуск ===
+
+def _ensure_version_table(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT,
+            applied_at REAL
+        )
+    ''')
+    conn.commit()
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    try:
+        row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] or 0
+
+
+def _apply(conn: sqlite3.Connection, migration: Migration, batch_size: int):
+    started = time.monotonic()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        migration.schema(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    rows = 0
+    if migration.backfill is not None:
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                done = migration.backfill(conn, batch_size)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            rows += done
+            if done < batch_size:
+                break
+
+    # OR IGNORE - миграцию параллельно мог завершить другой процесс
+    conn.execute(
+        "INSERT OR IGNORE INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+        (migration.version, migration.name, time.time())
+    )
+    conn.commit()
+    logger.info(f"[Migrations] Applied {migration.version:03d}_{migration.name}: {rows} rows backfilled in {time.monotonic() - started:.2f}s")
+
+
+def migrate(conn: sqlite3.Connection, batch_size: int = BACKFILL_BATCH_SIZE) -> List[int]:
+    """Применить недостающие миграции; возвращает применённые версии"""
+    if current_version(conn) >= LATEST_VERSION:
+        return []
+    _ensure_version_table(conn)
+    applied = []
+    for migration in MIGRATIONS:
+        if migration.version <= current_version(conn):
+            continue
+        _apply(conn, migration, batch_size)
+        applied.append(migration.version)
+    return applied
+
+
+if __name__ == "__main__":
+    import sys
+    import db
+
+    logging.basicConfig(level=logging.INFO)
+    conn = db.connect()
+    try:
+        if "--status" in sys.argv:
+            print(f"schema version: {current_version(conn)} (latest: {LATEST_VERSION})")
+        else:
+            applied = migrate(conn)
+            print(f"applied: {applied or 'nothing'}; schema version: {current_version(conn)}")
+    finally:
+        conn.close()
@@ -0,0 +1,231 @@
+"""
+Загрузка и распаковка MR пакетов (zip)
+
+- Загрузка копируется на диск чанками с инкрементальным sha256 и лимитом размера
+- Пакеты хранятся по содержимому: /artifacts/packages/{sha256}.zip и {sha256}/,
+  одинаковые загрузки распаковываются один раз
+- Распаковка выполняется RQ задачей (extract_package) с лимитами на число
+  и размер файлов и проверкой path traversal
+"""
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import stat
+import uuid
+import zipfile
+from typing import BinaryIO, Optional, Tuple
+
+from events import publish_event, session_channel
+
+logger = logging.getLogger(__name__)
+
+PACKAGES_DIR = "/artifacts/packages"
+UPLOADS_DIR = "/artifacts/uploads"
+DB_PATH = "/app/reviews.db"
+
+# Лимиты (байты / штуки), настраиваются через переменные окружения
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(50 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_ZIP_ENTRIES = int(os.getenv("MAX_ZIP_ENTRIES", "2000"))
+MAX_ZIP_ENTRY_SIZE = int(os.getenv("MAX_ZIP_ENTRY_SIZE", str(20 * 1024 * 1024)))
+MAX_ZIP_TOTAL_SIZE = int(os.getenv("MAX_ZIP_TOTAL_SIZE", str(200 * 1024 * 1024)))
+
+PACKAGE_PENDING = "pending"
+PACKAGE_READY = "ready"
+PACKAGE_FAILED = "failed"
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UnsafePackage(Exception):
+    pass
+
+
+def package_zip_path(sha: str) -> str:
+    return os.path.join(PACKAGES_DIR, f"{sha}.zip")
+
+
+def package_dir(sha: str) -> str:
+    return os.path.join(PACKAGES_DIR, sha)
+
+
+def is_extracted(sha: str) -> bool:
+    return os.path.isdir(package_dir(sha))
+
+
+# === Загрузка ===
+
+def spool_upload(src: BinaryIO, max_size: int = MAX_UPLOAD_SIZE) -> Tuple[str, str, int]:
+    """
+    Скопировать загрузку на диск чанками, считая sha256 по ходу
+
+    Returns:
+        (путь к временному файлу, sha256, размер)
+
+    Raises:
+        UploadTooLarge: размер превышает max_size (временный файл удаляется)
+    """
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
+    tmp_path = os.path.join(UPLOADS_DIR, f"{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as out:
+            while True:
+                chunk = src.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge(f"Upload exceeds {max_size} bytes")
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        _remove_quietly(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest(), size
+
+
+def validate_upload(tmp_path: str) -> bool:
+    """Проверить, что загрузка - zip (иначе временный файл удаляется)"""
+    if zipfile.is_zipfile(tmp_path):
+        return True
+    _remove_quietly(tmp_path)
+    return False
+
+
+def store_upload(tmp_path: str, sha: str):
+    """Переместить загрузку в хранилище пакетов (дубликат не храним)"""
+    os.makedirs(PACKAGES_DIR, exist_ok=True)
+    target = package_zip_path(sha)
+    if os.path.exists(target):
+        _remove_quietly(tmp_path)
+    else:
+        os.replace(tmp_path, target)
+
+
+# === Распаковка ===
+
+def _safe_member_path(root: str, name: str) -> str:
+    """Путь назначения для записи архива; исключение, если он выходит за root"""
+    if not name or name.startswith(("/", "\\")) or ":" in name.split("/")[0]:
+        raise UnsafePackage(f"Absolute path in archive: {name!r}")
+    target = os.path.realpath(os.path.join(root, name))
+    if os.path.commonpath([root, target]) != root:
+        raise UnsafePackage(f"Path traversal in archive: {name!r}")
+    return target
+
+
+def _check_archive(zf: zipfile.ZipFile):
+    """Проверка заголовков архива до распаковки"""
+    infos = zf.infolist()
+    if len(infos) > MAX_ZIP_ENTRIES:
+        raise UnsafePackage(f"Too many entries: {len(infos)} > {MAX_ZIP_ENTRIES}")
+    total = 0
+    for info in infos:
+        if stat.S_ISLNK(info.external_attr >> 16):
+            raise UnsafePackage(f"Symlink in archive: {info.filename!r}")
+        if info.file_size > MAX_ZIP_ENTRY_SIZE:
+            raise UnsafePackage(f"Entry too large: {info.filename!r} ({info.file_size} bytes)")
+        total += info.file_size
+    if total > MAX_ZIP_TOTAL_SIZE:
+        raise UnsafePackage(f"Uncompressed size too large: {total} bytes")
+
+
+def extract_archive(zip_path: str, dest: str):
+    """
+    Распаковать архив с лимитами
+
+    Размеры из заголовков проверяются заранее, но им не доверяем:
+    при записи считаются реально распакованные байты.
+    """
+    root = os.path.realpath(dest)
+    os.makedirs(root, exist_ok=True)
+    written_total = 0
+    with zipfile.ZipFile(zip_path) as zf:
+        _check_archive(zf)
+        for info in zf.infolist():
+            target = _safe_member_path(root, info.filename)
+            if info.is_dir():
+                os.makedirs(target, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            written = 0
+            with zf.open(info) as src, open(target, "wb") as out:
+                while True:
+                    chunk = src.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    written += len(chunk)
+                    written_total += len(chunk)
+                    if written > MAX_ZIP_ENTRY_SIZE or written_total > MAX_ZIP_TOTAL_SIZE:
+                        raise UnsafePackage(f"Entry exceeds size limit while extracting: {info.filename!r}")
+                    out.write(chunk)
+
+
+def _set_package_status(sha: str, status: str):
+    try:
+        conn = sqlite3.connect(DB_PATH, timeout=5)
+        try:
+            conn.execute("UPDATE sessions SET package_status = ? WHERE package_sha = ?", (status, sha))
+            conn.commit()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.error(f"[Packages] Failed to update status for {sha}: {e}")
+
+
+def extract_package(sha: str, session_id: Optional[int] = None) -> str:
+    """
+    RQ задача: распаковать пакет {sha}.zip в /artifacts/packages/{sha}/
+
+    Распаковка идёт во временный каталог и переименовывается атомарно,
+    поэтому параллельные задачи для одного пакета безопасны.
+    """
+    dest = package_dir(sha)
+    if os.path.isdir(dest):
+        logger.info(f"[Packages] Package {sha} already extracted")
+        _set_package_status(sha, PACKAGE_READY)
+        _publish_status(session_id, sha, PACKAGE_READY)
+        return PACKAGE_READY
+
+    tmp_dest = f"{dest}.{uuid.uuid4().hex}.tmp"
+    try:
+        extract_archive(package_zip_path(sha), tmp_dest)
+        try:
+            os.rename(tmp_dest, dest)
+        except OSError:
+            # Другая задача успела распаковать тот же пакет
+            if not os.path.isdir(dest):
+                raise
+            shutil.rmtree(tmp_dest, ignore_errors=True)
+    except (UnsafePackage, zipfile.BadZipFile, OSError) as e:
+        logger.error(f"[Packages] Failed to extract {sha}: {e}")
+        shutil.rmtree(tmp_dest, ignore_errors=True)
+        _set_package_status(sha, PACKAGE_FAILED)
+        _publish_status(session_id, sha, PACKAGE_FAILED, error=str(e))
+        return PACKAGE_FAILED
+
+    logger.info(f"[Packages] Extracted package {sha}")
+    _set_package_status(sha, PACKAGE_READY)
+    _publish_status(session_id, sha, PACKAGE_READY)
+    return PACKAGE_READY
+
+
+def _publish_status(session_id: Optional[int], sha: str, status: str, **extra):
+    if session_id is None:
+        return
+    data = {"session_id": session_id, "package_sha": sha, "package_status": status}
+    data.update(extra)
+    publish_event(session_channel(session_id), "package_status", data)
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
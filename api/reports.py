@@ -0,0 +1,112 @@
+"""
+Генерация PDF отчётов по сессиям
+
+Функции этого модуля выполняются в пуле процессов (executors.run_render),
+поэтому модуль не импортирует main и держит WeasyPrint импорт внутри функции.
+"""
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+
+def _read_text(path: str, default: str) -> str:
+    if not os.path.exists(path):
+        return default
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def build_report_html(session_id: int, candidate: str, comments: List[Dict[str, Any]],
+                      report_content: str, diff_content: str, reviewer: Optional[str] = None) -> str:
+    """HTML отчёта (шаблон для WeasyPrint)"""
+    reviewer_line = f"<p><strong>Reviewer:</strong> {reviewer}</p>" if reviewer is not None else ""
+    return f"""<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>Code Review Report #{session_id}</title>
+    <style>
+        @page {{ size: A4; margin: 2cm; }}
+        body {{ font-family: 'DejaVu Sans', sans-serif; line-height: 1.6; color: #333; }}
+        h1, h2 {{ color: #2c3e50; }}
+        .header {{ border-bottom: 3px solid #3498db; padding-bottom: 10px; }}
+        pre {{ background: #f8f9fa; padding: 15px; border-radius: 8px; overflow-x: auto; font-size: 12px; }}
+        table {{ width: 100%; border-collapse: collapse; margin: 20px 0; }}
+        th, td {{ border: 1px solid #ddd; padding: 10px; text-align: left; }}
+        th {{ background: #f2f2f2; }}
+        .critical {{ background: #ffebee; }}
+        .high {{ background: #fff3e0; }}
+        .medium {{ background: #fffde7; }}
+        .low {{ background: #f3f4f7; }}
+        .grade {{ font-size: 2em; font-weight: bold; text-align: center; margin: 20px 0; color: #27ae60; }}
+    </style>
+</head>
+<body>
+    <div class="header">
+        <h1>Code Review Report</h1>
+        <p><strong>Session ID:</strong> #{session_id}</p>
+        <p><strong>Candidate:</strong> {candidate}</p>
+        {reviewer_line}
+        <p><strong>Date:</strong> {time.strftime("%d.%m.%Y %H:%M")}</p>
+    </div>
+
+    <div class="section">
+        <h2>Evaluation Results</h2>
+        <pre>{report_content}</pre>
+        <div class="grade">
+            {report_content.split('Grade: ')[-1].strip() if 'Grade:' in report_content else '—'}
+        </div>
+    </div>
+
+    <div class="section">
+        <h2>Comments ({len(comments)})</h2>
+        {"" if comments else "<p>No comments yet.</p>"}
+        <table>
+            <tr><th>File</th><th>Line</th><th>Type</th><th>Severity</th><th>Comment</th></tr>
+            {''.join(
+                f'<tr class="{c.get("severity", "medium")}"><td>{c.get("file", "unknown")}</td><td>{c.get("line_range", "-")}</td><td>{c.get("type", "comment")}</td><td>{c.get("severity", "medium")}</td><td>{c.get("text", "")}</td></tr>'
+                for c in comments
+            )}
+        </table>
+    </div>
+
+    <div class="section">
+        <h2>Diff</h2>
+        <pre>{diff_content}</pre>
+    </div>
+</body>
+</html>"""
+
+
+def render_session_report(session_id: int, candidate: str, comments: List[Dict[str, Any]],
+                          reviewer: Optional[str] = None, diff_path: Optional[str] = None,
+                          variant: str = "candidate") -> str:
+    """
+    Собрать и отрендерить PDF отчёт сессии
+
+    Args:
+        diff_path: путь к diff (блоб в artifact_store); по умолчанию - файл старого формата
+        variant: вариант отчёта (candidate/reviewer) - у каждого свой файл
+
+    Returns:
+        Путь к PDF файлу
+    """
+    from weasyprint import HTML
+
+    diff_content = _read_text(diff_path or f"/artifacts/{session_id}_diff.patch", "# No diff")
+    report_content = _read_text(f"/artifacts/{session_id}_report.txt", "Отчёт ещё не готов...")
+    html_content = build_report_html(session_id, candidate, comments, report_content, diff_content, reviewer)
+
+    # Рендер во временный файл и атомарная подмена: параллельный FileResponse
+    # никогда не отдаёт недописанный PDF или отчёт другого варианта
+    pdf_path = f"/artifacts/{session_id}_report_{variant}.pdf"
+    tmp_path = f"{pdf_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        HTML(string=html_content).write_pdf(tmp_path)
+        os.replace(tmp_path, pdf_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return pdf_path
@@ -3,7 +3,6 @@
 Можно добавить как endpoint в FastAPI
 """
 from fastapi import APIRouter, HTTPException
-from rq_monitor import RQMonitor
 from redis import Redis
 import logging
 
@@ -36,12 +35,18 @@ def get_redis_connection():
                 raise
 
 
+def _get_monitor(redis_conn):
+    """RQMonitor (rq импортируется при первом запросе, а не при старте API)"""
+    from rq_monitor import RQMonitor
+    return RQMonitor(redis_conn, "default")
+
+
 @router.get("/stats")
 def get_rq_stats():
     """Получить статистику RQ очереди"""
     try:
         redis_conn = get_redis_connection()
-        monitor = RQMonitor(redis_conn, "default")
+        monitor = _get_monitor(redis_conn)
         stats = monitor.get_queue_stats()
         return {
             "status": "ok",
@@ -57,7 +62,7 @@ def get_recent_jobs(limit: int = 10):
     """Получить список недавних задач"""
     try:
         redis_conn = get_redis_connection()
-        monitor = RQMonitor(redis_conn, "default")
+        monitor = _get_monitor(redis_conn)
         jobs = monitor.get_recent_jobs(limit)
         return {
             "status": "ok",
@@ -74,7 +79,7 @@ def get_job_details(job_id: str):
     """Получить детальную информацию о задаче"""
     try:
         redis_conn = get_redis_connection()
-        monitor = RQMonitor(redis_conn, "default")
+        monitor = _get_monitor(redis_conn)
         job_info = monitor.get_job_info(job_id)
         
         if not job_info:
@@ -101,7 +106,7 @@ def get_performance_metrics(hours: int = 24):
     """
     try:
         redis_conn = get_redis_connection()
-        monitor = RQMonitor(redis_conn, "default")
+        monitor = _get_monitor(redis_conn)
         metrics = monitor.get_performance_metrics(hours=hours)
         return {
             "status": "ok",
@@ -123,7 +128,7 @@ def get_performance_trends(periods: int = 6, hours_per_period: int = 4):
     """
     try:
         redis_conn = get_redis_connection()
-        monitor = RQMonitor(redis_conn, "default")
+        monitor = _get_monitor(redis_conn)
         trends = monitor.get_performance_trends(periods=periods, hours_per_period=hours_per_period)
         return {
             "status": "ok",
@@ -145,7 +150,7 @@ def get_efficiency_comparison(current_hours: int = 1, previous_hours: int = 1):
     """
     try:
         redis_conn = get_redis_connection()
-        monitor = RQMonitor(redis_conn, "default")
+        monitor = _get_monitor(redis_conn)
         comparison = monitor.get_efficiency_comparison(
             current_hours=current_hours,
             previous_hours=previous_hours
@@ -0,0 +1,142 @@
+"""
+Таймер сессий: время истечения в epoch и переходы статусов
+
+Статусы:
+- active -> finished (ревьюер завершил досрочно)
+- active -> expired (истекло время, переводит фоновый sweeper)
+- expired -> active (ревьюер продлил истёкшую сессию)
+
+Строки created_at/expires_at (ISO с 'Z') остаются для API, рядом хранятся
+created_at_epoch/expires_at_epoch (INTEGER) - по ним индекс и выборка истёкших.
+"""
+import os
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import summaries
+
+STATUS_ACTIVE = "active"
+STATUS_FINISHED = "finished"
+STATUS_EXPIRED = "expired"
+
+SESSION_DURATION = timedelta(hours=2)
+# Сколько истёкших сессий переводить за один проход
+SWEEP_BATCH_SIZE = int(os.getenv("SESSION_SWEEP_BATCH_SIZE", "100"))
+
+
+def to_epoch(value: Optional[str]) -> Optional[int]:
+    """ISO строка (с 'Z' или без, считаем UTC) -> epoch секунды"""
+    if not value:
+        return None
+    text = value[:-1] if value.endswith('Z') else value
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        return int(parsed.timestamp())
+    return int((parsed - datetime(1970, 1, 1)).total_seconds())
+
+
+def from_epoch(epoch: int) -> datetime:
+    """epoch секунды -> naive datetime в UTC"""
+    return datetime(1970, 1, 1) + timedelta(seconds=epoch)
+
+
+def to_iso(moment: datetime) -> str:
+    return moment.isoformat() + 'Z'
+
+
+def normalize_iso(value: str) -> str:
+    """Дописать 'Z' к времени без часового пояса (старые записи)"""
+    if value.endswith('Z') or '+' in value:
+        return value
+    return value + 'Z'
+
+
+def session_times(now: Optional[datetime] = None) -> Tuple[str, str, int, int]:
+    """created_at, expires_at (ISO) и их epoch для новой сессии"""
+    now = now or datetime.utcnow()
+    created_at, expires_at = to_iso(now), to_iso(now + SESSION_DURATION)
+    return created_at, expires_at, to_epoch(created_at), to_epoch(expires_at)
+
+
+def init_schema(conn: sqlite3.Connection):
+    # Выборка sweeper: WHERE status = 'active' AND expires_at_epoch <= ? ORDER BY expires_at_epoch
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expiry ON sessions(status, expires_at_epoch)")
+
+
+def backfill(conn: sqlite3.Connection, limit: int = -1) -> int:
+    """
+    Заполнить epoch колонки и дописать 'Z' в старых записях (не больше limit за вызов, -1 - все)
+
+    Вызывать после summaries.backfill - строки проекции обновляются, а не создаются заново.
+    """
+    rows = conn.execute('''
+        SELECT id, created_at, expires_at FROM sessions
+        WHERE created_at_epoch IS NULL OR expires_at_epoch IS NULL
+        LIMIT ?
+    ''', (limit,)).fetchall()
+    now = datetime.utcnow()
+    for session_id, created_at, expires_at in rows:
+        if not created_at:
+            created_at = to_iso(now)
+        if not expires_at:
+            expires_at = to_iso(from_epoch(to_epoch(created_at) or 0) + SESSION_DURATION)
+        created_at, expires_at = normalize_iso(created_at), normalize_iso(expires_at)
+        # Нераспознанное время - 0, иначе строка выбиралась бы пакетным backfill снова и снова
+        created_at_epoch = to_epoch(created_at) or 0
+        expires_at_epoch = to_epoch(expires_at) or 0
+        # Истёкшие до появления sweeper сессии просто помечаем: без массовой оценки и закрытия PR
+        expired = from_epoch(expires_at_epoch) <= now
+        conn.execute(
+            "UPDATE sessions SET created_at = ?, expires_at = ?, created_at_epoch = ?, expires_at_epoch = ?, "
+            "status = CASE WHEN status IS NULL OR status = ? THEN ? ELSE status END WHERE id = ?",
+            (created_at, expires_at, created_at_epoch, expires_at_epoch,
+             STATUS_ACTIVE, STATUS_EXPIRED if expired else STATUS_ACTIVE, session_id)
+        )
+        summaries.refresh(conn, session_id)
+    return len(rows)
+
+
+def claim_expired(conn: sqlite3.Connection, now: int, limit: int = SWEEP_BATCH_SIZE) -> List[Dict]:
+    """
+    Перевести истёкшие активные сессии в expired
+
+    Условие на статус в UPDATE - параллельный продлевающий запрос или другой процесс
+    не приведут к двойному переходу. Возвращает переведённые сессии (для оценки и закрытия PR).
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    rows = conn.execute('''
+        SELECT id, expires_at, gitea_user, gitea_repo, gitea_pr_id FROM sessions
+        WHERE status = ? AND expires_at_epoch <= ? AND deleted_at IS NULL
+        ORDER BY expires_at_epoch
+        LIMIT ?
+    ''', (STATUS_ACTIVE, now, limit)).fetchall()
+    expired = []
+    for session_id, expires_at, gitea_user, gitea_repo, gitea_pr_id in rows:
+        updated = conn.execute(
+            "UPDATE sessions SET status = ? WHERE id = ? AND status = ?",
+            (STATUS_EXPIRED, session_id, STATUS_ACTIVE)
+        ).rowcount
+        if not updated:
+            continue
+        summaries.refresh(conn, session_id)
+        expired.append({
+            "session_id": session_id,
+            "expires_at": expires_at,
+            "gitea_user": gitea_user,
+            "gitea_repo": gitea_repo,
+            "gitea_pr_id": gitea_pr_id,
+        })
+    return expired
+
+
+def next_expiry(conn: sqlite3.Connection) -> Optional[int]:
+    """Ближайший expires_at_epoch среди активных сессий (по индексу)"""
+    row = conn.execute(
+        "SELECT MIN(expires_at_epoch) FROM sessions WHERE status = ? AND deleted_at IS NULL",
+        (STATUS_ACTIVE,)
+    ).fetchone()
+    return row[0] if row else None
@@ -0,0 +1,208 @@
+"""
+Объединение одинаковых одновременных вычислений (single-flight)
+
+Первый вызов с ключом запускает вычисление, остальные - пока оно идёт - ждут его результат.
+Несколько ревьюеров открыли одну сессию одновременно: один поход в Gitea / один рендер PDF.
+
+- SingleFlight (async handlers): asyncio.Task на ключ. Отмена одного ожидающего (клиент
+  закрыл соединение) не отменяет общее вычисление.
+- Между процессами API (SINGLEFLIGHT_REDIS=1): лидер держит lock в Redis и публикует результат
+  (JSON) с коротким TTL; другие процессы ждут снятия lock и берут опубликованный результат.
+  Без Redis работает как обычный in-process single-flight.
+- ThreadSingleFlight: то же для блокирующего кода в пуле потоков (GiteaClient).
+
+Результат не кэшируется: после завершения вычисления следующий вызов запускает новое.
+"""
+import asyncio
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+SINGLEFLIGHT_REDIS = os.getenv("SINGLEFLIGHT_REDIS", "0") == "1"
+# Максимальное время удержания lock (лидер упал - lock истечёт сам)
+SINGLEFLIGHT_LOCK_TTL = float(os.getenv("SINGLEFLIGHT_LOCK_TTL", "60"))
+# Сколько опубликованный результат ждёт остальные процессы
+SINGLEFLIGHT_RESULT_TTL = float(os.getenv("SINGLEFLIGHT_RESULT_TTL", "5"))
+SINGLEFLIGHT_POLL_INTERVAL = 0.05
+
+_KEY_PREFIX = "singleflight:"
+
+# Снятие lock только владельцем (lock мог истечь и достаться другому процессу)
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_flights: Dict[str, "SingleFlight"] = {}
+
+
+class SingleFlight:
+    def __init__(self, name: str, use_redis: bool = SINGLEFLIGHT_REDIS,
+                 lock_ttl: float = SINGLEFLIGHT_LOCK_TTL, result_ttl: float = SINGLEFLIGHT_RESULT_TTL):
+        self.name = name
+        self.use_redis = use_redis
+        self.lock_ttl = lock_ttl
+        self.result_ttl = result_ttl
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._redis: Optional[aioredis.Redis] = None
+        self.calls = 0
+        self.executed = 0
+        self.shared = 0
+        self.remote = 0
+        _flights[name] = self
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Результат fn() - общий для всех одновременных вызовов с этим ключом"""
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._run(key, fn))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done, key=key: self._finish(key, done))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Все ожидающие могли уйти - исключение не должно попасть в лог как "never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+    async def _execute(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.executed += 1
+        return await fn()
+
+    async def _run(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.use_redis:
+            return await self._execute(fn)
+
+        client = self._get_redis()
+        lock_key = f"{_KEY_PREFIX}{self.name}:{key}:lock"
+        result_key = f"{_KEY_PREFIX}{self.name}:{key}:result"
+        owner = secrets.token_hex(8)
+        try:
+            acquired = await client.set(lock_key, owner, nx=True, px=int(self.lock_ttl * 1000))
+        except Exception as e:
+            logger.warning(f"[SingleFlight] Redis unavailable for {self.name}, running locally: {e}")
+            return await self._execute(fn)
+
+        if acquired:
+            try:
+                result = await self._execute(fn)
+                await self._publish(client, result_key, result)
+                return result
+            finally:
+                try:
+                    await client.eval(_RELEASE_SCRIPT, 1, lock_key, owner)
+                except Exception as e:
+                    logger.warning(f"[SingleFlight] Failed to release {lock_key}: {e}")
+
+        # Вычисление идёт в другом процессе - ждём его результат
+        deadline = time.monotonic() + self.lock_ttl
+        try:
+            while time.monotonic() < deadline and await client.exists(lock_key):
+                await asyncio.sleep(SINGLEFLIGHT_POLL_INTERVAL)
+            cached = await client.get(result_key)
+        except Exception as e:
+            logger.warning(f"[SingleFlight] Redis unavailable for {self.name}, running locally: {e}")
+            cached = None
+        if cached is not None:
+            self.remote += 1
+            return json.loads(cached)
+        return await self._execute(fn)
+
+    async def _publish(self, client: aioredis.Redis, result_key: str, result: Any):
+        try:
+            payload = json.dumps(result)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"[SingleFlight] {self.name} result is not JSON serializable: {e}")
+            return
+        try:
+            await client.set(result_key, payload, px=int(self.result_ttl * 1000))
+        except Exception as e:
+            logger.warning(f"[SingleFlight] Failed to publish {result_key}: {e}")
+
+    def _get_redis(self) -> aioredis.Redis:
+        if self._redis is None:
+            self._redis = aioredis.Redis(host='redis', port=6379, socket_connect_timeout=1, socket_timeout=2)
+        return self._redis
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "executed": self.executed,
+            "shared": self.shared,
+            "remote": self.remote,
+            "in_flight": len(self._inflight),
+            "redis": self.use_redis,
+        }
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class ThreadSingleFlight:
+    """Single-flight для блокирующих функций, вызываемых из нескольких потоков"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    return {name: flight.stats() for name, flight in _flights.items()}
+
+
+async def close_all():
+    for flight in _flights.values():
+        await flight.close()
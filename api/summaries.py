@@ -0,0 +1,163 @@
+"""
+Проекция session_summaries для дашборда ревьюера
+
+Узкие строки с тем, что нужно списку сессий: счётчики комментариев по типу и
+серьёзности, последняя активность, оценка, готовность кандидата, Gitea.
+Обновляется инкрементально в тех же транзакциях, что и изменения sessions
+(функции принимают conn и не делают commit - его делает вызывающий код).
+"""
+import json
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# Колонки sessions, копируемые в проекцию при изменении состояния
+_STATE_COLUMNS = (
+    "candidate_name", "reviewer_name", "created_at", "expires_at", "status",
+    "candidate_ready_at", "gitea_enabled", "gitea_user", "gitea_repo", "gitea_pr_id",
+)
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat() + 'Z'
+
+
+def init_schema(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS session_summaries (
+            session_id INTEGER PRIMARY KEY,
+            candidate_name TEXT,
+            reviewer_name TEXT,
+            created_at TEXT,
+            expires_at TEXT,
+            status TEXT,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            comment_count INTEGER NOT NULL DEFAULT 0,
+            counts_by_type TEXT NOT NULL DEFAULT '{}',
+            counts_by_severity TEXT NOT NULL DEFAULT '{}',
+            last_activity_at TEXT,
+            score REAL,
+            grade TEXT,
+            evaluated_at TEXT,
+            candidate_ready_at TEXT,
+            gitea_enabled INTEGER DEFAULT 0,
+            gitea_user TEXT,
+            gitea_repo TEXT,
+            gitea_pr_id INTEGER
+        )
+    ''')
+    # Список дашборда: WHERE deleted = 0 ORDER BY created_at DESC - один проход по индексу
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_session_summaries_list ON session_summaries(deleted, created_at DESC)")
+
+
+_COLUMNS = ", ".join(_STATE_COLUMNS)
+_REFRESH_SQL = f'''
+    INSERT INTO session_summaries (session_id, {_COLUMNS}, deleted, last_activity_at)
+    SELECT id, {_COLUMNS}, deleted_at IS NOT NULL, ?
+    FROM sessions WHERE id = ?
+    ON CONFLICT(session_id) DO UPDATE SET {", ".join(f"{c} = excluded.{c}" for c in _STATE_COLUMNS)},
+        deleted = excluded.deleted,
+        last_activity_at = COALESCE(excluded.last_activity_at, session_summaries.last_activity_at)
+'''
+
+
+def refresh(conn: sqlite3.Connection, session_id: int, activity_at: Optional[str] = None):
+    """Скопировать состояние сессии в проекцию (создаёт строку, если её нет; счётчики не трогает)"""
+    conn.execute(_REFRESH_SQL, (activity_at or _now(), session_id))
+
+
+def refresh_many(conn: sqlite3.Connection, session_ids: List[int], activity_at: Optional[str] = None):
+    """refresh для пачки сессий (executemany)"""
+    activity_at = activity_at or _now()
+    conn.executemany(_REFRESH_SQL, [(activity_at, session_id) for session_id in session_ids])
+
+
+def _count(comments: List[Dict[str, Any]], counts_by_type: Dict[str, int], counts_by_severity: Dict[str, int]):
+    for comment in comments:
+        comment_type = comment.get("type") or "comment"
+        severity = comment.get("severity") or "medium"
+        counts_by_type[comment_type] = counts_by_type.get(comment_type, 0) + 1
+        counts_by_severity[severity] = counts_by_severity.get(severity, 0) + 1
+
+
+def add_comments(conn: sqlite3.Connection, session_id: int, comments: List[Dict[str, Any]]):
+    """Учесть новые комментарии (инкрементально, без пересчёта всего списка)"""
+    if not comments:
+        return
+    row = conn.execute(
+        "SELECT counts_by_type, counts_by_severity FROM session_summaries WHERE session_id = ?", (session_id,)
+    ).fetchone()
+    if row is None:
+        rebuild(conn, session_id)
+        return
+    counts_by_type, counts_by_severity = json.loads(row[0]), json.loads(row[1])
+    _count(comments, counts_by_type, counts_by_severity)
+    conn.execute('''
+        UPDATE session_summaries
+        SET comment_count = comment_count + ?, counts_by_type = ?, counts_by_severity = ?, last_activity_at = ?
+        WHERE session_id = ?
+    ''', (len(comments), json.dumps(counts_by_type), json.dumps(counts_by_severity), _now(), session_id))
+
+
+def set_evaluation(conn: sqlite3.Connection, session_id: int, score: float, grade: str):
+    now = _now()
+    conn.execute(
+        "UPDATE session_summaries SET score = ?, grade = ?, evaluated_at = ?, last_activity_at = ? WHERE session_id = ?",
+        (score, grade, now, now, session_id)
+    )
+
+
+def rebuild(conn: sqlite3.Connection, session_id: int):
+    """Полный пересчёт строки по sessions (создание проекции для старых сессий)"""
+    row = conn.execute("SELECT comments, created_at FROM sessions WHERE id = ?", (session_id,)).fetchone()
+    if row is None:
+        return
+    comments = json.loads(row[0]) if row[0] else []
+    counts_by_type: Dict[str, int] = {}
+    counts_by_severity: Dict[str, int] = {}
+    _count(comments, counts_by_type, counts_by_severity)
+    refresh(conn, session_id, activity_at=row[1])
+    conn.execute('''
+        UPDATE session_summaries SET comment_count = ?, counts_by_type = ?, counts_by_severity = ?
+        WHERE session_id = ?
+    ''', (len(comments), json.dumps(counts_by_type), json.dumps(counts_by_severity), session_id))
+
+
+def backfill(conn: sqlite3.Connection, limit: int = -1) -> int:
+    """Построить проекцию для сессий, у которых её ещё нет (не больше limit за вызов, -1 - все)"""
+    missing = conn.execute('''
+        SELECT id FROM sessions
+        WHERE id NOT IN (SELECT session_id FROM session_summaries)
+        LIMIT ?
+    ''', (limit,)).fetchall()
+    for (session_id,) in missing:
+        rebuild(conn, session_id)
+    return len(missing)
+
+
+def get(conn: sqlite3.Connection, session_id: int) -> Optional[Dict[str, Any]]:
+    row = conn.execute('''
+        SELECT comment_count, counts_by_type, counts_by_severity, last_activity_at, score, grade, evaluated_at
+        FROM session_summaries WHERE session_id = ?
+    ''', (session_id,)).fetchone()
+    if row is None:
+        return None
+    return {
+        "comment_count": row[0],
+        "comment_counts": {"by_type": json.loads(row[1]), "by_severity": json.loads(row[2])},
+        "last_activity_at": row[3],
+        "score": row[4],
+        "grade": row[5],
+        "evaluated_at": row[6],
+    }
+
+
+def list_active(conn: sqlite3.Connection) -> List[tuple]:
+    return conn.execute('''
+        SELECT session_id, candidate_name, reviewer_name, created_at, expires_at, status,
+               comment_count, counts_by_type, counts_by_severity, last_activity_at, score, grade,
+               candidate_ready_at, gitea_enabled, gitea_user, gitea_repo, gitea_pr_id
+        FROM session_summaries
+        WHERE deleted = 0
+        ORDER BY created_at DESC
+    ''').fetchall()
@@ -0,0 +1,176 @@
+"""
+Кэш access_token кандидата -> сессия
+
+Используется endpoints кандидата, которым хватает полей TokenEntry (diff и его индекс);
+endpoints, читающие строку сессии, ищут её по токену напрямую.
+Уровни:
+- L1: OrderedDict в процессе (TTL + LRU), попадание - один dict lookup
+- L2 (TOKEN_CACHE_REDIS=1, обязательно при нескольких процессах API - WEB_CONCURRENCY > 1
+  или gunicorn.conf.py): Redis, общий для всех процессов
+
+Инвалидация явная (удаление, завершение, продление сессии). При включённом L2
+она рассылается другим процессам через шину событий, чтобы они сбросили свой L1.
+"""
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+
+import redis.asyncio as aioredis
+
+from events import CHANNEL_PREFIX, event_message
+
+logger = logging.getLogger(__name__)
+
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "30"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+# Без общего L2 инвалидация видна только в своём процессе - остальные отдают удалённую сессию до TTL
+TOKEN_CACHE_REDIS = os.getenv("TOKEN_CACHE_REDIS", "0") == "1" or int(os.getenv("WEB_CONCURRENCY", "1")) > 1
+
+INVALIDATION_CHANNEL = f"{CHANNEL_PREFIX}tokens"
+_REDIS_KEY_PREFIX = "token_cache:"
+
+
+class TokenEntry(NamedTuple):
+    session_id: int
+    status: str
+    expires_at: Optional[str]
+    deleted: bool
+    diff_sha: Optional[str]
+
+
+class TokenCache:
+    def __init__(self, ttl: float = TOKEN_CACHE_TTL, max_size: int = TOKEN_CACHE_SIZE, use_redis: bool = TOKEN_CACHE_REDIS):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.use_redis = use_redis
+        self._entries: "OrderedDict[str, Tuple[TokenEntry, float]]" = OrderedDict()
+        self._by_session: Dict[int, str] = {}
+        self._redis: Optional[aioredis.Redis] = None
+        self.hits = 0
+        self.misses = 0
+
+    # === L1 ===
+    def get(self, token: str) -> Optional[TokenEntry]:
+        item = self._entries.get(token)
+        if item is None:
+            return None
+        entry, deadline = item
+        if deadline < time.monotonic():
+            self._drop(token)
+            return None
+        self._entries.move_to_end(token)
+        return entry
+
+    def put(self, token: str, entry: TokenEntry):
+        self._entries[token] = (entry, time.monotonic() + self.ttl)
+        self._entries.move_to_end(token)
+        self._by_session[entry.session_id] = token
+        while len(self._entries) > self.max_size:
+            old_token, (old_entry, _) = self._entries.popitem(last=False)
+            self._by_session.pop(old_entry.session_id, None)
+
+    def _drop(self, token: str):
+        item = self._entries.pop(token, None)
+        if item is not None:
+            self._by_session.pop(item[0].session_id, None)
+
+    def invalidate_local(self, session_id: int):
+        token = self._by_session.get(session_id)
+        if token is not None:
+            self._drop(token)
+
+    def clear(self):
+        self._entries.clear()
+        self._by_session.clear()
+
+    # === L2 (Redis) ===
+    def _get_redis(self) -> aioredis.Redis:
+        if self._redis is None:
+            self._redis = aioredis.Redis(host='redis', port=6379, socket_connect_timeout=1, socket_timeout=1)
+        return self._redis
+
+    async def _redis_get(self, token: str) -> Optional[TokenEntry]:
+        try:
+            raw = await self._get_redis().get(_REDIS_KEY_PREFIX + token)
+        except Exception as e:
+            logger.warning(f"Token cache Redis unavailable: {e}")
+            return None
+        if raw is None:
+            return None
+        try:
+            return TokenEntry(*json.loads(raw))
+        except (TypeError, ValueError):
+            return None
+
+    async def _redis_set(self, token: str, entry: TokenEntry):
+        try:
+            await self._get_redis().set(_REDIS_KEY_PREFIX + token, json.dumps(list(entry)), ex=max(int(self.ttl), 1))
+        except Exception as e:
+            logger.warning(f"Token cache Redis unavailable: {e}")
+
+    # === API ===
+    async def resolve(self, token: str, loader: Callable[[str], Awaitable[Optional[TokenEntry]]]) -> Optional[TokenEntry]:
+        """Сессия по токену: L1 -> L2 -> loader (БД)"""
+        entry = self.get(token)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        if self.use_redis:
+            entry = await self._redis_get(token)
+            if entry is not None:
+                self.put(token, entry)
+                return entry
+        entry = await loader(token)
+        if entry is not None:
+            self.put(token, entry)
+            if self.use_redis:
+                await self._redis_set(token, entry)
+        return entry
+
+    async def invalidate(self, session_id: int, token: Optional[str] = None):
+        """Сбросить запись сессии (во всех процессах, если включён Redis)"""
+        token = token or self._by_session.get(session_id)
+        self.invalidate_local(session_id)
+        if not self.use_redis:
+            return
+        if token:
+            try:
+                await self._get_redis().delete(_REDIS_KEY_PREFIX + token)
+            except Exception as e:
+                logger.warning(f"Token cache Redis unavailable: {e}")
+        # Тем же async клиентом: синхронная публикация остановила бы event loop при недоступном Redis
+        try:
+            await self._get_redis().publish(INVALIDATION_CHANNEL, event_message("invalidate", {"session_id": session_id}))
+        except Exception as e:
+            logger.warning(f"Token cache Redis unavailable: {e}")
+
+    async def listen_invalidations(self, broker):
+        """Фоновая задача: сбрасывать L1 по инвалидациям из других процессов"""
+        async with broker.subscribe(INVALIDATION_CHANNEL) as queue:
+            while True:
+                payload = await queue.get()
+                session_id = (payload.get("data") or {}).get("session_id")
+                if session_id is not None:
+                    self.invalidate_local(session_id)
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "redis": self.use_redis,
+        }
+
+
+token_cache = TokenCache()
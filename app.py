@@ -1,10 +1,44 @@
+"""
+Webhook Huntflow для запуска code review
+
+Webhook только проверяет запрос, фиксирует ключ идемпотентности и ставит задачу в RQ (202).
+Получение кандидата, оценка, PDF и отправка фидбека - huntflow_pipeline.process_webhook в worker.
+
+Повтор доставки с тем же ключом - no-op, пока задача в очереди, выполняется или выполнена.
+Задача упала (все RQ Retry исчерпаны) или пропала - повтор принимается заново и продолжает
+с незавершённого шага. Ключ без Idempotency-Key (по содержимому события): выполненная задача
+старше HUNTFLOW_REDELIVERY_WINDOW - это новое событие с тем же содержимым, обрабатывается с нуля.
+
+    rq worker --worker-class rq.worker.SimpleWorker huntflow
+"""
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-import requests
-from reportlab.pdfgen import canvas
+from redis import Redis
+import redis.asyncio as aioredis
+import asyncio
+import hashlib
+import json
+import logging
 import os
+import time
+from typing import Optional
 
 app = FastAPI()
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("RQ_REDIS_URL", "redis://redis:6379")
+HUNTFLOW_QUEUE = os.getenv("HUNTFLOW_QUEUE", "huntflow")
+# Повторная доставка того же события в пределах TTL - no-op
+HUNTFLOW_IDEMPOTENCY_TTL = int(os.getenv("HUNTFLOW_IDEMPOTENCY_TTL", str(7 * 24 * 3600)))
+HUNTFLOW_JOB_TIMEOUT = int(os.getenv("HUNTFLOW_JOB_TIMEOUT", "300"))
+# Повтор события без Idempotency-Key позже этого окна после обработки - новое событие
+HUNTFLOW_REDELIVERY_WINDOW = int(os.getenv("HUNTFLOW_REDELIVERY_WINDOW", "3600"))
+# Ключ уже записан, задачи ещё нет: первая доставка между SET и enqueue - не считаем задачу потерянной
+HUNTFLOW_ENQUEUE_GRACE = 60
+REQUEUE_STATUSES = {"failed", "stopped", "canceled"}
+# Всплеск доставок ждёт свободное соединение с Redis, а не открывает по соединению на запрос
+REDIS_POOL_SIZE = int(os.getenv("HUNTFLOW_REDIS_POOL_SIZE", "20"))
 
 
 # Pydantic модель для валидации webhook от Huntflow
@@ -14,74 +48,128 @@ class HuntflowWebhook(BaseModel):
     github_url: str | None = None
 
 
-# Mock Huntflow API (json-server на localhost:3000)
-HUNTFLOW_MOCK_API = "http://localhost:3000"
-
-
-@app.post("/webhook/huntflow")
-async def handle_webhook(webhook: HuntflowWebhook):
-    """Обработчик webhook от Huntflow для запуска code review"""
+_redis = None
+_queue = None
+
+
+def _get_redis():
+    global _redis
+    if _redis is None:
+        pool = aioredis.BlockingConnectionPool.from_url(
+            REDIS_URL, max_connections=REDIS_POOL_SIZE, timeout=5, socket_connect_timeout=1, socket_timeout=1
+        )
+        _redis = aioredis.Redis(connection_pool=pool)
+    return _redis
+
+
+def _get_queue():
+    global _queue
+    if _queue is None:
+        from rq import Queue  # rq нужен только для постановки задач
+        _queue = Queue(HUNTFLOW_QUEUE, connection=Redis.from_url(REDIS_URL))
+    return _queue
+
+
+def idempotency_key(webhook: HuntflowWebhook, request: Request) -> str:
+    """Ключ доставки: заголовок Idempotency-Key, иначе - содержимое события"""
+    source = request.headers.get("idempotency-key") or json.dumps(webhook.model_dump(), sort_keys=True)
+    return hashlib.sha256(source.encode()).hexdigest()[:32]
+
+
+def _enqueue(key: str, webhook: HuntflowWebhook):
+    from rq import Retry
+    return _get_queue().enqueue(
+        "huntflow_pipeline.process_webhook", webhook.candidate_id, webhook.github_url, key,
+        job_id=f"huntflow-{key}", job_timeout=HUNTFLOW_JOB_TIMEOUT,
+        # Шаги, завершённые до сбоя, повтор не выполняет заново (см. huntflow_pipeline)
+        retry=Retry(max=3, interval=[10, 60, 300]),
+        # Статус задачи хранится, пока действует ключ доставки: по нему решается судьба повторов
+        result_ttl=HUNTFLOW_IDEMPOTENCY_TTL, failure_ttl=HUNTFLOW_IDEMPOTENCY_TTL,
+    )
+
+
+def _redelivery(key: str, content_key: bool, key_age: int) -> Optional[str]:
+    """
+    Повтор доставки: None - дубликат, "retry" - прошлая обработка не удалась (продолжить),
+    "new" - новое событие с тем же содержимым (обработать с нуля)
+    """
+    job = _get_queue().fetch_job(f"huntflow-{key}")
+    if job is None:
+        return "retry" if key_age > HUNTFLOW_ENQUEUE_GRACE else None
+    status = job.get_status(refresh=False)
+    if status in REQUEUE_STATUSES:
+        return "retry"
+    if content_key and status == "finished" and job.ended_at and time.time() - job.ended_at.timestamp() > HUNTFLOW_REDELIVERY_WINDOW:
+        return "new"
+    return None
+
+
+def _requeue(key: str, webhook: HuntflowWebhook, new_event: bool):
+    queue = _get_queue()
+    job = queue.fetch_job(f"huntflow-{key}")
+    if job is not None:
+        job.delete()
+    if new_event:
+        # Результаты шагов прошлого события (huntflow_pipeline) - иначе фидбек не отправится
+        queue.connection.delete(f"huntflow:state:{key}")
+    return _enqueue(key, webhook)
+
+
+@app.post("/webhook/huntflow", status_code=202)
+async def handle_webhook(webhook: HuntflowWebhook, request: Request):
+    """Обработчик webhook от Huntflow: принять доставку и поставить code review в очередь"""
     if webhook.event != "tech_interview":
         raise HTTPException(status_code=400, detail="Invalid event")
 
-    # Получи данные кандидата (mock)
-    candidate_data = await get_candidate(webhook.candidate_id)
-
-    # AI-анализ кода (Grok mock)
-    score = await ai_grade(candidate_data.get("github_url", ""))
-
-    # Генерация PDF
-    pdf_path = await generate_pdf(webhook.candidate_id, score)
-
-    # Push фидбека в Huntflow (mock)
-    feedback_response = await push_feedback(webhook.candidate_id, score, pdf_path)
-
-    return {"success": True, "feedback_id": feedback_response.get("id")}
-
-
-async def get_candidate(candidate_id: int):
-    """Получить данные кандидата из mock Huntflow"""
+    key = idempotency_key(webhook, request)
+    job_id = f"huntflow-{key}"
+    delivery_key = f"huntflow:delivery:{key}"
+    redis = _get_redis()
     try:
-        response = requests.get(f"{HUNTFLOW_MOCK_API}/candidates/{candidate_id}")
-        response.raise_for_status()
-        return response.json()
-    except requests.RequestException as e:
-        raise HTTPException(status_code=500, detail=f"Failed to get candidate: {str(e)}")
-
-
-async def ai_grade(github_url: str) -> str:
-    """Mock AI для анализа GitHub (замени на Grok/ChatGPT free)"""
-    # Здесь интегрируй Grok API или локальный анализ
-    return "8/10 по SOLID"
+        accepted = await redis.set(delivery_key, job_id, nx=True, ex=HUNTFLOW_IDEMPOTENCY_TTL)
+        if not accepted:
+            return await _handle_redelivery(webhook, request, key)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to check Huntflow delivery key {key}: {e}")
+        raise HTTPException(status_code=503, detail="Queue unavailable")
 
-
-async def generate_pdf(candidate_id: int, score: str) -> str:
-    """Генерация PDF с фидбеком (как 'интервьюилка' тим-лида)"""
-    pdf_path = f"feedback_{candidate_id}.pdf"
-    p = canvas.Canvas(pdf_path)
-    p.drawString(100, 750, f"Candidate ID: {candidate_id}")
-    p.drawString(100, 700, f"Code Review Score: {score}")
-    p.drawString(100, 650, "Comment: Strong in React, improve SOLID principles")
-    p.save()
-    return pdf_path
-
-
-async def push_feedback(candidate_id: int, score: str, pdf_path: str):
-    """Push фидбека в Huntflow (mock)"""
     try:
-        feedback_data = {
-            "candidate_id": candidate_id,
-            "text": f"Code review: {score}",
-            "attached_pdf": pdf_path
-        }
-        response = requests.post(f"{HUNTFLOW_MOCK_API}/feedback", json=feedback_data)
-        response.raise_for_status()
-        return response.json()
-    except requests.RequestException as e:
-        raise HTTPException(status_code=500, detail=f"Failed to push feedback: {str(e)}")
+        await asyncio.to_thread(_enqueue, key, webhook)
+    except Exception as e:
+        # Доставка не принята - Huntflow повторит её, ключ не должен её отсечь
+        await redis.delete(delivery_key)
+        logger.error(f"Failed to enqueue Huntflow delivery {key}: {e}")
+        raise HTTPException(status_code=503, detail="Queue unavailable")
+
+    return {"status": "accepted", "job_id": job_id}
+
+
+async def _handle_redelivery(webhook: HuntflowWebhook, request: Request, key: str):
+    """Ключ доставки уже есть: дубликат, либо прошлая задача упала/пропала, либо это новое событие"""
+    job_id = f"huntflow-{key}"
+    delivery_key = f"huntflow:delivery:{key}"
+    redis = _get_redis()
+    key_age = HUNTFLOW_IDEMPOTENCY_TTL - await redis.ttl(delivery_key)
+    content_key = not request.headers.get("idempotency-key")
+    reason = await asyncio.to_thread(_redelivery, key, content_key, key_age)
+    # Одновременные повторы: задачу заново ставит один
+    if reason is None or not await redis.set(f"huntflow:requeue:{key}", job_id, nx=True, ex=HUNTFLOW_ENQUEUE_GRACE):
+        return JSONResponse({"status": "duplicate", "job_id": job_id}, status_code=200)
+    try:
+        await asyncio.to_thread(_requeue, key, webhook, reason == "new")
+        await redis.set(delivery_key, job_id, ex=HUNTFLOW_IDEMPOTENCY_TTL)
+    except Exception as e:
+        logger.error(f"Failed to requeue Huntflow delivery {key}: {e}")
+        raise HTTPException(status_code=503, detail="Queue unavailable")
+    finally:
+        await redis.delete(f"huntflow:requeue:{key}")
+    logger.info(f"Huntflow delivery {key} accepted again ({reason})")
+    return {"status": "accepted", "job_id": job_id}
 
 
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
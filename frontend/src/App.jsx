@@ -177,16 +177,45 @@ export default function App() {
     }
   }, [sessionId])
 
+  const onJobFinished = async () => {
+    setIsEvaluating(false)
+    const rep = await axios.get(`${API_URL}/artifacts/${sessionId}_report.txt`, { responseType: 'text' })
+    setReport(rep.data)
+    setStatus('Оценка завершена')
+  }
+
+  // SSE поток статуса задачи; при ошибке соединения - старый polling
   const pollJob = (jobId) => {
+    if (!window.EventSource) return pollJobFallback(jobId)
+    const es = new EventSource(`${API_URL}/jobs/${jobId}/events`)
+    es.addEventListener('status', async (e) => {
+      const data = JSON.parse(e.data)
+      if (!data) return
+      if (data.status === 'started' && data.stage) {
+        setStatus(`Оценка: ${data.stage} (${Math.round((data.progress || 0) * 100)}%)`)
+      }
+      if (data.status === 'finished') {
+        es.close()
+        try { await onJobFinished() } catch {}
+      } else if (data.status === 'failed' || data.status === 'stopped' || data.status === 'canceled') {
+        es.close()
+        setIsEvaluating(false)
+        setStatus('Ошибка оценки')
+      }
+    })
+    es.onerror = () => {
+      es.close()
+      pollJobFallback(jobId)
+    }
+  }
+
+  const pollJobFallback = (jobId) => {
     const iv = setInterval(async () => {
       try {
         const r = await axios.get(`${API_URL}/jobs/${jobId}`)
         if (r.data.status === 'finished') {
           clearInterval(iv)
-          setIsEvaluating(false)
-          const rep = await axios.get(`${API_URL}/artifacts/${sessionId}_report.txt`, { responseType: 'text' })
-          setReport(rep.data)
-          setStatus('Оценка завершена')
+          await onJobFinished()
         }
       } catch {}
     }, 2000)
@@ -7,11 +7,15 @@ import axios from 'axios'
 import * as monaco from 'monaco-editor'
 
 const API_URL = '/api'
+// Большие diff загружаются по файлам (индекс на сервере), маленькие - целиком
+const LARGE_DIFF_BYTES = 512 * 1024
 
 export default function CandidateView() {
   const { token } = useParams()
   const [session, setSession] = useState(null)
   const [diffContent, setDiffContent] = useState('')
+  const [diffFiles, setDiffFiles] = useState([])
+  const [activeFile, setActiveFile] = useState(null)
   const [comments, setComments] = useState([])
   const [isLoading, setIsLoading] = useState(true)
   const [selectedLine, setSelectedLine] = useState(null)
@@ -40,6 +44,14 @@ export default function CandidateView() {
     }
   }, [token])
 
+  const loadDiffFile = async (file) => {
+    const res = await axios.get(`${API_URL}/candidate/sessions/${token}/diff/files/${file.index}`, { responseType: 'text' })
+      .catch(() => ({ data: '# No diff available' }))
+    setDiffContent(res.data)
+    setActiveFile(file.index)
+    setNewComment(prev => ({ ...prev, file: file.path }))
+  }
+
   const loadSession = async () => {
     setIsLoading(true)
     try {
@@ -51,9 +63,16 @@ export default function CandidateView() {
       // Если Gitea включена, но PR не создан - загружаем только сессию (без diff)
       // Для случая без Gitea загружаем diff
       if (!sessionData.gitea?.enabled) {
-        const diffRes = await axios.get(`${API_URL}/candidate/sessions/${token}/diff`, { responseType: 'text' })
-          .catch(() => ({ data: '# No diff available' }))
-        setDiffContent(diffRes.data)
+        const indexRes = await axios.get(`${API_URL}/candidate/sessions/${token}/diff/files`).catch(() => null)
+        const index = indexRes?.data
+        if (index && index.files.length > 1 && index.size > LARGE_DIFF_BYTES) {
+          setDiffFiles(index.files)
+          await loadDiffFile(index.files[0])
+        } else {
+          const diffRes = await axios.get(`${API_URL}/candidate/sessions/${token}/diff`, { responseType: 'text' })
+            .catch(() => ({ data: '# No diff available' }))
+          setDiffContent(diffRes.data)
+        }
       }
       
       setComments(sessionData.comments || [])
@@ -748,8 +767,21 @@ export default function CandidateView() {
 
       <div className="main">
         <div className="editor-container">
+          {diffFiles.length > 0 && (
+            <select
+              value={activeFile ?? ''}
+              onChange={(e) => loadDiffFile(diffFiles[Number(e.target.value)])}
+              style={{ width: '100%', height: '32px', fontFamily: 'monospace' }}
+            >
+              {diffFiles.map(f => (
+                <option key={f.index} value={f.index}>
+                  {f.path} (+{f.additions} -{f.deletions})
+                </option>
+              ))}
+            </select>
+          )}
           <Editor
-            height="100%"
+            height={diffFiles.length > 0 ? 'calc(100% - 32px)' : '100%'}
             defaultLanguage="diff"
             value={diffContent}
             theme="light"
@@ -33,6 +33,41 @@ export default function ReviewerDashboard() {
     }
   }, [sessionId])
 
+  // SSE: обновления открытой сессии (комментарии, готовность, продление) без перезагрузки всей сессии
+  useEffect(() => {
+    if (!sessionId || !window.EventSource) return
+    const id = parseInt(sessionId)
+    const es = new EventSource(`${API_URL}/reviewer/sessions/${id}/events`)
+    const patchSession = (patch) => setSelectedSession(s => (s && s.id === id ? { ...s, ...patch(s) } : s))
+
+    es.addEventListener('comment_added', (e) => {
+      const data = JSON.parse(e.data)
+      patchSession(s => ({ comments: [...(s.comments || []), data.comment] }))
+    })
+    es.addEventListener('candidate_ready', (e) => {
+      const data = JSON.parse(e.data)
+      patchSession(() => ({ candidate_ready_at: data.ready_at }))
+    })
+    es.addEventListener('session_extended', (e) => {
+      const data = JSON.parse(e.data)
+      // Продление истёкшей сессии снова делает её активной
+      patchSession(s => ({ expires_at: data.expires_at, status: s.status === 'expired' ? 'active' : s.status }))
+    })
+    es.addEventListener('session_finished', (e) => {
+      const data = JSON.parse(e.data)
+      patchSession(() => ({ expires_at: data.expires_at, status: data.status }))
+    })
+    es.addEventListener('session_expired', (e) => {
+      const data = JSON.parse(e.data)
+      patchSession(() => ({ status: data.status }))
+    })
+    // Пакетная синхронизация из Gitea - проще перечитать сессию целиком
+    es.addEventListener('comments_synced', () => loadSession(id))
+    es.addEventListener('session_deleted', () => es.close())
+
+    return () => es.close()
+  }, [sessionId])
+
   // Таймер сессии с прогресс-баром (для детального вида)
   useEffect(() => {
     if (!sessionId || !selectedSession) {
@@ -1491,7 +1526,7 @@ export default function ReviewerDashboard() {
                             gap: '6px'
                           }}>
                             <MessageSquare size={14} />
-                            {session.comments?.length || 0}
+                            {session.comment_count || 0}
                           </div>
                         </div>
                       </div>
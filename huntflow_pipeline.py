@@ -0,0 +1,166 @@
+"""
+Pipeline обработки webhook Huntflow (RQ задача process_webhook, очередь HUNTFLOW_QUEUE)
+
+Кандидат из Huntflow -> оценка -> PDF с фидбеком -> фидбек в Huntflow.
+Результат каждого шага сохраняется в Redis (huntflow:state:{key}): повтор задачи после сбоя
+(RQ Retry) продолжает с незавершённого шага - кандидат не запрашивается заново, фидбек
+не отправляется дважды.
+
+HTTP - один httpx.AsyncClient на процесс worker (пул keep-alive соединений) с повторами
+на сетевые ошибки, 429 и 5xx. Пул живёт между задачами с SimpleWorker:
+
+    rq worker --worker-class rq.worker.SimpleWorker huntflow
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+from redis import Redis
+from reportlab.pdfgen import canvas
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("RQ_REDIS_URL", "redis://redis:6379")
+# Mock Huntflow API (json-server на localhost:3000)
+HUNTFLOW_API_URL = os.getenv("HUNTFLOW_API_URL", "http://localhost:3000").rstrip("/")
+HUNTFLOW_TIMEOUT = float(os.getenv("HUNTFLOW_TIMEOUT", "10"))
+HUNTFLOW_POOL_SIZE = int(os.getenv("HUNTFLOW_POOL_SIZE", "10"))
+# Повторы запроса внутри задачи (с): 0.5, 1, 2, ...; дальше - повтор всей задачи через RQ Retry
+HUNTFLOW_RETRIES = int(os.getenv("HUNTFLOW_RETRIES", "3"))
+HUNTFLOW_RETRY_BACKOFF = float(os.getenv("HUNTFLOW_RETRY_BACKOFF", "0.5"))
+HUNTFLOW_PDF_DIR = os.getenv("HUNTFLOW_PDF_DIR", ".")
+HUNTFLOW_STATE_TTL = int(os.getenv("HUNTFLOW_STATE_TTL", str(7 * 24 * 3600)))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HuntflowError(Exception):
+    pass
+
+
+# === HTTP клиент (пул соединений на процесс) ===
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_client: Optional[httpx.AsyncClient] = None
+_redis: Optional[Redis] = None
+
+
+def _run(coro):
+    """Задачи RQ синхронные: один event loop на процесс - клиент и его соединения переживают задачу"""
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+    return _loop.run_until_complete(coro)
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=HUNTFLOW_API_URL,
+            timeout=HUNTFLOW_TIMEOUT,
+            limits=httpx.Limits(max_connections=HUNTFLOW_POOL_SIZE, max_keepalive_connections=HUNTFLOW_POOL_SIZE),
+        )
+    return _client
+
+
+def _get_redis() -> Redis:
+    global _redis
+    if _redis is None:
+        _redis = Redis.from_url(REDIS_URL)
+    return _redis
+
+
+async def _request(method: str, path: str, **kwargs) -> Dict[str, Any]:
+    """Запрос к Huntflow с повторами на сетевые ошибки, 429 и 5xx; прочие 4xx - сразу HuntflowError"""
+    error = None
+    for attempt in range(HUNTFLOW_RETRIES + 1):
+        try:
+            response = await _get_client().request(method, path, **kwargs)
+            if response.status_code not in RETRY_STATUSES:
+                response.raise_for_status()
+                return response.json()
+            error = f"HTTP {response.status_code}"
+        except httpx.HTTPStatusError as e:
+            raise HuntflowError(f"{method} {path}: HTTP {e.response.status_code}") from e
+        except httpx.TransportError as e:
+            error = str(e) or type(e).__name__
+        if attempt < HUNTFLOW_RETRIES:
+            delay = HUNTFLOW_RETRY_BACKOFF * 2 ** attempt
+            logger.warning(f"[Huntflow] {method} {path} failed ({error}), retry in {delay:.1f}s")
+            await asyncio.sleep(delay)
+    raise HuntflowError(f"{method} {path} failed after {HUNTFLOW_RETRIES + 1} attempts: {error}")
+
+
+# === Шаги pipeline ===
+
+async def get_candidate(candidate_id: int) -> Dict[str, Any]:
+    """Получить данные кандидата из Huntflow"""
+    return await _request("GET", f"/candidates/{candidate_id}")
+
+
+async def ai_grade(github_url: str) -> str:
+    """Mock AI для анализа GitHub (замени на Grok/ChatGPT free)"""
+    # Здесь интегрируй Grok API или локальный анализ
+    return "8/10 по SOLID"
+
+
+def generate_pdf(candidate_id: int, score: str) -> str:
+    """Генерация PDF с фидбеком (как 'интервьюилка' тим-лида)"""
+    pdf_path = os.path.join(HUNTFLOW_PDF_DIR, f"feedback_{candidate_id}.pdf")
+    p = canvas.Canvas(pdf_path)
+    p.drawString(100, 750, f"Candidate ID: {candidate_id}")
+    p.drawString(100, 700, f"Code Review Score: {score}")
+    p.drawString(100, 650, "Comment: Strong in React, improve SOLID principles")
+    p.save()
+    return pdf_path
+
+
+async def push_feedback(candidate_id: int, score: str, pdf_path: str) -> Dict[str, Any]:
+    """Push фидбека в Huntflow"""
+    feedback_data = {
+        "candidate_id": candidate_id,
+        "text": f"Code review: {score}",
+        "attached_pdf": pdf_path
+    }
+    return await _request("POST", "/feedback", json=feedback_data)
+
+
+async def _pipeline(candidate_id: int, github_url: Optional[str], state: Dict[str, Any], save: Callable) -> Dict[str, Any]:
+    if "candidate" not in state:
+        save("candidate", await get_candidate(candidate_id))
+    if "score" not in state:
+        save("score", await ai_grade(state["candidate"].get("github_url") or github_url or ""))
+    if "pdf_path" not in state or not os.path.exists(state["pdf_path"]):
+        # reportlab - синхронный рендер, в потоке: запросы других шагов в том же loop не ждут
+        save("pdf_path", await asyncio.to_thread(generate_pdf, candidate_id, state["score"]))
+    if "feedback" not in state:
+        save("feedback", await push_feedback(candidate_id, state["score"], state["pdf_path"]))
+    return {"candidate_id": candidate_id, "score": state["score"], "feedback_id": state["feedback"].get("id")}
+
+
+def process_webhook(candidate_id: int, github_url: Optional[str], key: str) -> Dict[str, Any]:
+    """
+    RQ задача: обработать доставку webhook (key - ключ идемпотентности, см. app.handle_webhook)
+
+    Returns:
+        {"candidate_id", "score", "feedback_id"}
+    """
+    redis = _get_redis()
+    state_key = f"huntflow:state:{key}"
+    state = {field.decode(): json.loads(value) for field, value in redis.hgetall(state_key).items()}
+    if state:
+        logger.info(f"[Huntflow] Resuming delivery {key} after: {', '.join(state)}")
+
+    def save(field: str, value: Any):
+        state[field] = value
+        pipe = redis.pipeline()
+        pipe.hset(state_key, field, json.dumps(value))
+        pipe.expire(state_key, HUNTFLOW_STATE_TTL)
+        pipe.execute()
+
+    result = _run(_pipeline(candidate_id, github_url, state, save))
+    logger.info(f"[Huntflow] Candidate {candidate_id}: {result['score']}, feedback {result['feedback_id']}")
+    return result
@@ -0,0 +1,89 @@
+"""
+Фикстуры micro-benchmarks движка оценки (api/evaluator.py, api/eval_cache.py)
+
+Модули API импортируются напрямую - сервер не нужен.
+"""
+import os
+import random
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import pytest
+
+API_DIR = Path(__file__).resolve().parent.parent.parent / "api"
+sys.path.insert(0, str(API_DIR))
+
+# Размеры наборов (golden truth и комментарии); 10000 - только при BENCH_MAX_ITEMS=10000
+BENCH_SIZES = [10, 100, 1000, 10000]
+BENCH_MAX_ITEMS = int(os.getenv("BENCH_MAX_ITEMS", "1000"))
+
+TYPES = ["bug", "security", "style", "performance"]
+WORDS = ("input validation missing null check sql injection race condition leak buffer "
+         "overflow unused variable naming loop complexity cache timeout retry error handling").split()
+
+
+def bench_sizes() -> List[int]:
+    return [size for size in BENCH_SIZES if size <= BENCH_MAX_ITEMS]
+
+
+def _text(rng: random.Random, words: int = 8) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def generate_dataset(size: int, files: int, overlap: float, seed: int = 1) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Синтетический golden truth (size дефектов в files файлах) и size комментариев
+
+    overlap - доля комментариев, относящихся к дефектам: половина из них точные
+    (тот же line_range), половина - сдвинутый диапазон и перефразированный текст
+    """
+    rng = random.Random(seed)
+    golden = []
+    for i in range(size):
+        start = rng.randint(1, 2000)
+        golden.append({
+            "file": f"src/module_{i % files}.py",
+            "line_range": f"{start}-{start + rng.randint(0, 10)}",
+            "type": rng.choice(TYPES),
+            "severity": "high",
+            "text": _text(rng),
+        })
+    comments = []
+    for i in range(size):
+        if rng.random() < overlap:
+            defect = golden[rng.randrange(size)]
+            comment = dict(defect)
+            if rng.random() < 0.5:
+                start = int(defect["line_range"].split("-")[0]) + 1
+                comment["line_range"] = f"{start}-{start + 2}"
+                comment["text"] = defect["text"] + " " + rng.choice(WORDS)
+        else:
+            start = rng.randint(1, 2000)
+            comment = {
+                "file": f"src/module_{rng.randrange(files)}.py",
+                "line_range": f"{start}-{start}",
+                "type": rng.choice(TYPES),
+                "severity": "low",
+                "text": _text(rng),
+            }
+        comments.append(comment)
+    return golden, comments
+
+
+class MemoryRedis:
+    """Redis get/set в памяти - кэш eval_cache без сервера"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value.encode() if isinstance(value, str) else value
+
+
+@pytest.fixture
+def memory_redis() -> MemoryRedis:
+    return MemoryRedis()
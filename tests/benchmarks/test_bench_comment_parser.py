@@ -0,0 +1,112 @@
+"""
+Micro-benchmarks разбора комментариев Gitea PR (api/comment_parser.py)
+
+    pytest benchmarks/test_bench_comment_parser.py --benchmark-only
+
+Сравнение с прежним разбором: подстроки из списка ключевых слов на каждый комментарий
+и заголовок [TYPE] SEVERITY через split.
+"""
+import random
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import comment_parser
+from conftest import TYPES, WORDS, bench_sizes
+
+SEVERITIES = ["critical", "high", "medium", "low"]
+READY_BODIES = ["Ready for review", "✅ ready", "Готово, можно смотреть", "готов к проверке", "Done."]
+
+LEGACY_READY_KEYWORDS = ["✅ ready", "ready", "готов", "готов к проверке", "готов к ревью",
+                         "готово", "завершено", "done", "completed", "✓ ready", "🎯 ready"]
+
+
+def legacy_convert(all_pr_comments):
+    """Прежний разбор (main._convert_gitea_comments до выноса в comment_parser)"""
+    ready_comment = None
+    converted = []
+    for pr_comment in all_pr_comments:
+        body = pr_comment.get("body", "")
+        if any(keyword in body.lower().strip() for keyword in LEGACY_READY_KEYWORDS):
+            if ready_comment is None:
+                ready_comment = pr_comment
+            continue
+        comment_type, severity, text = "bug", "medium", body
+        lines = body.split("\n", 2)
+        if len(lines) >= 2 and lines[0].startswith("[") and "]" in lines[0]:
+            type_part = lines[0].split("]")[0].replace("[", "").strip().lower()
+            severity_part = lines[0].split("]")[1].strip().lower()
+            text = "\n".join(lines[2:]) if len(lines) > 2 else body
+            comment_type = type_part if type_part in TYPES else "bug"
+            severity = severity_part if severity_part in SEVERITIES else "medium"
+        path = pr_comment.get("path") or pr_comment.get("original_path") or "main.py"
+        line = pr_comment.get("line") or pr_comment.get("original_line") or pr_comment.get("new_line") or 1
+        converted.append({"file": path, "line_range": f"{line}-{line}", "type": comment_type, "severity": severity,
+                          "text": text, "gitea_id": pr_comment.get("id"), "source": "gitea"})
+    return converted, ready_comment
+
+
+def generate_comments(size: int, ready_share: float = 0.01, seed: int = 1):
+    """Комментарии в формате, в котором они уходят в Gitea, с небольшой долей сигналов готовности"""
+    rng = random.Random(seed)
+    comments = []
+    for i in range(size):
+        if rng.random() < ready_share:
+            body = rng.choice(READY_BODIES)
+        else:
+            words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 40)))
+            body = f"[{rng.choice(TYPES).upper()}] {rng.choice(SEVERITIES).upper()}\n\n{words}"
+        comments.append({"id": i, "body": body, "path": f"src/module_{i % 20}.py", "line": rng.randint(1, 500),
+                         "created_at": "2026-01-01T00:00:00Z"})
+    return comments
+
+
+def _rounds(size: int) -> int:
+    return 3 if size >= 1000 else 10
+
+
+class TestCommentParser:
+    """Сигнал готовности и заголовок [TYPE] SEVERITY"""
+
+    @pytest.mark.parametrize("size", bench_sizes())
+    def test_convert(self, benchmark, size):
+        """Тест: время разбора пачки комментариев"""
+        comments = generate_comments(size)
+        converted, _ = benchmark.pedantic(comment_parser.convert_gitea_comments, args=(comments,),
+                                          rounds=_rounds(size), iterations=1)
+        assert len(converted) <= size
+        print(f"✓ convert size={size}")
+
+    @pytest.mark.parametrize("size", bench_sizes())
+    def test_convert_legacy(self, benchmark, size):
+        """Тест: время прежнего разбора - точка сравнения"""
+        comments = generate_comments(size)
+        converted, _ = benchmark.pedantic(legacy_convert, args=(comments,), rounds=_rounds(size), iterations=1)
+        assert len(converted) <= size
+        print(f"✓ legacy convert size={size}")
+
+    def test_convert_matches_legacy(self):
+        """Тест: на комментариях без ложных срабатываний результат совпадает с прежним разбором"""
+        comments = generate_comments(2000, ready_share=0.05)
+        converted, ready_comment = comment_parser.convert_gitea_comments(comments)
+        legacy, legacy_ready = legacy_convert(comments)
+        assert converted == legacy
+        assert ready_comment is legacy_ready
+        print(f"✓ {len(converted)} comments identical to legacy parser")
+
+    def test_ready_signal_false_positives(self):
+        """Тест: слова, содержащие ключевое слово, и отрицания - не сигнал готовности"""
+        not_ready = ["This is already handled", "Приготовить тестовые данные", "I am not ready yet",
+                     "Ещё не готово", "[BUG] HIGH\n\nretry is done twice", "readyState check missing"]
+        ready = ["Ready", "готово!", "Готов к ревью", "✓ ready", "All done", "Completed."]
+        assert [body for body in not_ready if comment_parser.is_ready_signal(body)] == []
+        assert [body for body in ready if not comment_parser.is_ready_signal(body)] == []
+        assert any(keyword in "this is already handled" for keyword in LEGACY_READY_KEYWORDS)
+        print("✓ no false positives on 'already', negations and review comments")
+
+    def test_header_single_newline(self):
+        """Тест: заголовок и текст через один перевод строки - текст без заголовка"""
+        parsed = comment_parser.parse_header("[Security] critical\nSQL injection in query")
+        assert parsed == ("security", "critical", "SQL injection in query")
+        print("✓ header parsed with single newline")
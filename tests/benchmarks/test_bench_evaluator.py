@@ -0,0 +1,138 @@
+"""
+Micro-benchmarks сопоставления комментариев с golden truth
+
+    pytest benchmarks/ --benchmark-only
+    BENCH_MAX_ITEMS=10000 pytest benchmarks/ --benchmark-only --benchmark-autosave
+    pytest benchmarks/ --benchmark-only --benchmark-compare --benchmark-compare-fail=mean:20%
+
+Пик памяти (tracemalloc) - в extra_info каждого benchmark и с проверкой бюджета на элемент.
+"""
+import tracemalloc
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import eval_cache
+import evaluator
+from conftest import bench_sizes, generate_dataset
+
+# Бюджет пиковой памяти на элемент набора (байт)
+EXACT_PEAK_BYTES_PER_ITEM = 4 * 1024
+SEMANTIC_PEAK_BYTES_PER_ITEM = 8 * 1024
+
+
+def peak_memory(fn, *args) -> int:
+    """Пик выделенной памяти (байт) за один вызов fn"""
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def reference_match(comments, golden_truth):
+    """Исходное правило: полный перебор, совпадение file + line_range + type"""
+    tp, fp, fn = [], [], list(golden_truth)
+    for comment in comments:
+        for defect in golden_truth:
+            if (comment["file"] == defect["file"] and comment["line_range"] == defect["line_range"]
+                    and comment["type"] == defect["type"]):
+                tp.append(defect)
+                if defect in fn:
+                    fn.remove(defect)
+                break
+        else:
+            fp.append(comment)
+    return tp, fp, fn
+
+
+def _rounds(size: int) -> int:
+    return 3 if size >= 1000 else 10
+
+
+class TestExactMatcher:
+    """Точное сопоставление по индексу (file, type)"""
+
+    @pytest.mark.parametrize("overlap", [0.1, 0.8])
+    @pytest.mark.parametrize("files", [1, 50])
+    @pytest.mark.parametrize("size", bench_sizes())
+    def test_exact(self, benchmark, size, files, overlap):
+        """Тест: время и память точного сопоставления"""
+        golden, comments = generate_dataset(size, files, overlap)
+        index = evaluator.build_index(golden)
+
+        result = benchmark.pedantic(evaluator.evaluate_comments, args=(comments, golden, index), rounds=_rounds(size), iterations=1)
+
+        peak = peak_memory(evaluator.evaluate_comments, comments, golden, index)
+        benchmark.extra_info["peak_kb"] = round(peak / 1024, 1)
+        assert peak < EXACT_PEAK_BYTES_PER_ITEM * size + 64 * 1024, f"Peak memory {peak} bytes for {size} items"
+        assert len(result["tp"]) + len(result["fp"]) == size
+        print(f"✓ exact size={size} files={files} overlap={overlap}: peak {peak / 1024:.0f} KB")
+
+    def test_exact_matches_reference(self):
+        """Тест: индексный matcher даёт тот же результат, что и полный перебор"""
+        golden, comments = generate_dataset(500, 5, 0.6)
+        tp, fp, fn = evaluator.match_comments(comments, golden)
+        ref_tp, ref_fp, ref_fn = reference_match(comments, golden)
+        assert (tp, fp) == (ref_tp, ref_fp)
+        assert sorted(map(id, fn)) == sorted(map(id, ref_fn))
+        print(f"✓ Indexed matcher == reference: TP={len(tp)} FP={len(fp)} FN={len(fn)}")
+
+
+class TestSemanticMatcher:
+    """Семантическое сопоставление: эмбеддинги дефектов вычисляются или берутся из кэша"""
+
+    @pytest.mark.parametrize("size", bench_sizes())
+    def test_semantic_uncached(self, benchmark, size, memory_redis):
+        """Тест: оценка с вычислением эмбеддингов дефектов (холодный кэш)"""
+        golden, comments = generate_dataset(size, 10, 0.5)
+        index = evaluator.build_index(golden)
+
+        def run():
+            memory_redis.data.clear()
+            embeddings = eval_cache.get_embeddings("bench", golden, redis_conn=memory_redis)
+            return evaluator.evaluate_comments(comments, golden, index, embeddings)
+
+        result = benchmark.pedantic(run, rounds=_rounds(size), iterations=1)
+
+        peak = peak_memory(run)
+        benchmark.extra_info["peak_kb"] = round(peak / 1024, 1)
+        assert peak < SEMANTIC_PEAK_BYTES_PER_ITEM * size + 256 * 1024, f"Peak memory {peak} bytes for {size} items"
+        exact = evaluator.evaluate_comments(comments, golden, index)
+        assert len(result["tp"]) >= len(exact["tp"]), "Semantic matching should only add matches"
+        print(f"✓ semantic (cold) size={size}: TP {len(exact['tp'])} -> {len(result['tp'])}, peak {peak / 1024:.0f} KB")
+
+    @pytest.mark.parametrize("size", bench_sizes())
+    def test_semantic_cached(self, benchmark, size, memory_redis):
+        """Тест: оценка с эмбеддингами из кэша (float32 blob)"""
+        golden, comments = generate_dataset(size, 10, 0.5)
+        index = evaluator.build_index(golden)
+        eval_cache.get_embeddings("bench", golden, redis_conn=memory_redis)
+
+        def run():
+            embeddings = eval_cache.get_embeddings("bench", golden, redis_conn=memory_redis)
+            return evaluator.evaluate_comments(comments, golden, index, embeddings)
+
+        benchmark.pedantic(run, rounds=_rounds(size), iterations=1)
+
+        peak = peak_memory(run)
+        benchmark.extra_info["peak_kb"] = round(peak / 1024, 1)
+        assert peak < SEMANTIC_PEAK_BYTES_PER_ITEM * size + 256 * 1024, f"Peak memory {peak} bytes for {size} items"
+        print(f"✓ semantic (cached) size={size}: peak {peak / 1024:.0f} KB")
+
+
+class TestGoldenCache:
+    """Загрузка golden truth и индекса: из кэша и с построением"""
+
+    @pytest.mark.parametrize("size", bench_sizes())
+    def test_golden_index(self, benchmark, size, memory_redis):
+        """Тест: golden truth + индекс из кэша против построения с нуля"""
+        golden, _ = generate_dataset(size, 10, 0.0)
+        eval_cache.get_golden("bench", lambda: golden, redis_conn=memory_redis)
+
+        entry = benchmark(eval_cache.get_golden, "bench", lambda: pytest.fail("cache miss"), memory_redis)
+
+        assert len(entry["defects"]) == size
+        print(f"✓ golden index size={size}: {len(entry['index'])} buckets")
@@ -9,6 +9,8 @@ from typing import Dict, Any
 # Базовый URL API (можно переопределить через переменную окружения)
 # По умолчанию для локального запуска, но внутри Docker сети используем имя сервиса
 API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
+# Токен internal API (/api/internal/*) - тот же, что у API
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN", "")
 
 
 @pytest.fixture
@@ -17,6 +19,12 @@ def api_client():
     return httpx.AsyncClient(base_url=API_BASE_URL, timeout=30.0)
 
 
+@pytest.fixture
+def internal_headers() -> Dict[str, str]:
+    """Заголовок для запросов к internal API от имени worker"""
+    return {"X-Internal-Token": INTERNAL_API_TOKEN}
+
+
 @pytest.fixture
 def test_reviewer_data() -> Dict[str, str]:
     """Тестовые данные для ревьюера"""
@@ -0,0 +1,242 @@
+"""
+Заглушка Gitea REST API для нагрузочных тестов (данные в памяти)
+
+Реализует только endpoints, которые вызывает api/gitea_client.py. Задержка ответа
+настраивается, чтобы API под нагрузкой ждал "сеть" как с настоящим Gitea.
+
+Запуск:
+    uvicorn fake_gitea:app --port 4000
+    FAKE_GITEA_LATENCY_MS=20 uvicorn fake_gitea:app --port 4000
+
+API запускается с GITEA_URL=http://localhost:4000 и любым GITEA_ADMIN_TOKEN.
+"""
+import asyncio
+import hashlib
+import itertools
+import os
+from datetime import datetime
+from typing import Dict, List
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+LATENCY = float(os.getenv("FAKE_GITEA_LATENCY_MS", "5")) / 1000
+
+FAKE_DIFF = """diff --git a/main.py b/main.py
+index abc123..def456 100644
+--- a/main.py
++++ b/main.py
+@@ -1,5 +1,6 @@
+ def greet():
+-    print("Hi")
++    print("Hello, secure world!")
++    # TODO: add input validation
+     return True
+"""
+
+app = FastAPI()
+
+users: Dict[str, Dict] = {}
+repos: Dict[str, Dict] = {}
+branches: Dict[str, Dict[str, Dict]] = {}
+pulls: Dict[str, Dict[int, Dict]] = {}
+reviews: Dict[str, List[Dict]] = {}
+_ids = itertools.count(1)
+# Счётчик вызовов по endpoint - для проверки, сколько запросов API делает в Gitea
+calls: Dict[str, int] = {}
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def _sha(text: str) -> str:
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+@app.middleware("http")
+async def simulate_latency(request: Request, call_next):
+    if LATENCY:
+        await asyncio.sleep(LATENCY)
+    response = await call_next(request)
+    # Шаблон маршрута известен после роутинга
+    route = request.scope.get("route")
+    key = f"{request.method} {route.path if route else request.url.path}"
+    calls[key] = calls.get(key, 0) + 1
+    return response
+
+
+@app.get("/_stats")
+async def stats():
+    return {"calls": calls, "users": len(users), "repos": len(repos), "pulls": sum(len(p) for p in pulls.values())}
+
+
+# === Пользователи ===
+@app.get("/api/v1/users/{username}")
+async def get_user(username: str):
+    if username not in users:
+        raise HTTPException(status_code=404, detail="user does not exist")
+    return users[username]
+
+
+@app.post("/api/v1/admin/users", status_code=201)
+async def create_user(payload: dict):
+    username = payload["username"]
+    if username in users:
+        raise HTTPException(status_code=422, detail="user already exists")
+    users[username] = {"id": next(_ids), "login": username, "username": username, "email": payload.get("email")}
+    return users[username]
+
+
+@app.post("/api/v1/users/{username}/tokens", status_code=201)
+async def create_token(username: str, payload: dict):
+    return {"id": next(_ids), "name": payload.get("name"), "sha1": _sha(f"{username}{next(_ids)}")}
+
+
+# === Репозитории, ветки, файлы ===
+@app.post("/api/v1/admin/users/{owner}/repos", status_code=201)
+async def create_repo(owner: str, payload: dict):
+    full_name = f"{owner}/{payload['name']}"
+    if full_name in repos:
+        raise HTTPException(status_code=409, detail="repository already exists")
+    repos[full_name] = {
+        "id": next(_ids), "name": payload["name"], "full_name": full_name,
+        "owner": {"login": owner}, "private": payload.get("private", True),
+        "default_branch": "main", "clone_url": f"http://fake-gitea/{full_name}.git",
+    }
+    branches[full_name] = {"main": {"name": "main", "commit": {"id": _sha(full_name)}}}
+    pulls[full_name] = {}
+    return repos[full_name]
+
+
+def _repo(owner: str, repo: str) -> str:
+    full_name = f"{owner}/{repo}"
+    if full_name not in repos:
+        raise HTTPException(status_code=404, detail="repository does not exist")
+    return full_name
+
+
+@app.get("/api/v1/repos/{owner}/{repo}/branches/{branch}")
+async def get_branch(owner: str, repo: str, branch: str):
+    full_name = _repo(owner, repo)
+    if branch not in branches[full_name]:
+        raise HTTPException(status_code=404, detail="branch does not exist")
+    return branches[full_name][branch]
+
+
+@app.post("/api/v1/repos/{owner}/{repo}/branches", status_code=201)
+async def create_branch(owner: str, repo: str, payload: dict):
+    full_name = _repo(owner, repo)
+    name = payload.get("new_branch_name")
+    branches[full_name][name] = {"name": name, "commit": {"id": _sha(f"{full_name}:{name}")}}
+    return branches[full_name][name]
+
+
+@app.get("/api/v1/repos/{owner}/{repo}/contents/{file_path:path}")
+async def get_file(owner: str, repo: str, file_path: str):
+    _repo(owner, repo)
+    return {"path": file_path, "sha": _sha(file_path), "type": "file"}
+
+
+@app.post("/api/v1/repos/{owner}/{repo}/contents/{file_path:path}", status_code=201)
+@app.put("/api/v1/repos/{owner}/{repo}/contents/{file_path:path}")
+async def write_file(owner: str, repo: str, file_path: str, payload: dict):
+    full_name = _repo(owner, repo)
+    branch = payload.get("new_branch") or payload.get("branch") or "main"
+    commit = _sha(f"{full_name}:{branch}:{file_path}:{next(_ids)}")
+    branches[full_name][branch] = {"name": branch, "commit": {"id": commit}}
+    return {"content": {"path": file_path, "sha": _sha(file_path)}, "commit": {"sha": commit}}
+
+
+# === Pull requests ===
+def _pull(owner: str, repo: str, index: int) -> Dict:
+    full_name = _repo(owner, repo)
+    if index not in pulls[full_name]:
+        raise HTTPException(status_code=404, detail="pull request does not exist")
+    return pulls[full_name][index]
+
+
+@app.post("/api/v1/repos/{owner}/{repo}/pulls", status_code=201)
+async def create_pull(owner: str, repo: str, payload: dict):
+    full_name = _repo(owner, repo)
+    number = len(pulls[full_name]) + 1
+    pulls[full_name][number] = {
+        "id": next(_ids), "number": number, "title": payload.get("title"), "body": payload.get("body"),
+        "state": "open", "html_url": f"http://fake-gitea/{full_name}/pulls/{number}",
+        "head": {"ref": payload.get("head"), "sha": _sha(f"{full_name}:{number}")},
+        "base": {"ref": payload.get("base", "main"), "sha": branches[full_name].get(payload.get("base", "main"), {}).get("commit", {}).get("id")},
+        "created_at": _now(), "updated_at": _now(),
+    }
+    reviews[f"{full_name}#{number}"] = []
+    return pulls[full_name][number]
+
+
+@app.get("/api/v1/repos/{owner}/{repo}/pulls/{index}.diff", response_class=PlainTextResponse)
+async def get_pull_diff(owner: str, repo: str, index: int):
+    _pull(owner, repo, index)
+    return FAKE_DIFF
+
+
+@app.get("/api/v1/repos/{owner}/{repo}/pulls/{index}")
+async def get_pull(owner: str, repo: str, index: int):
+    return _pull(owner, repo, index)
+
+
+@app.patch("/api/v1/repos/{owner}/{repo}/pulls/{index}")
+async def edit_pull(owner: str, repo: str, index: int, payload: dict):
+    pull = _pull(owner, repo, index)
+    pull.update({k: v for k, v in payload.items() if k in ("state", "title", "body")})
+    pull["updated_at"] = _now()
+    return pull
+
+
+@app.post("/api/v1/repos/{owner}/{repo}/pulls/{index}/merge")
+async def merge_pull(owner: str, repo: str, index: int):
+    pull = _pull(owner, repo, index)
+    pull.update({"state": "closed", "merged": True, "updated_at": _now()})
+    return {}
+
+
+@app.get("/api/v1/repos/{owner}/{repo}/pulls/{index}/files")
+async def get_pull_files(owner: str, repo: str, index: int):
+    _pull(owner, repo, index)
+    return [{"filename": "main.py", "status": "modified", "additions": 2, "deletions": 1}]
+
+
+@app.get("/api/v1/repos/{owner}/{repo}/pulls/{index}/reviews")
+async def get_reviews(owner: str, repo: str, index: int):
+    _pull(owner, repo, index)
+    return [
+        {"id": review["id"], "state": review["state"], "body": review["body"], "comments_count": len(review["comments"])}
+        for review in reviews[f"{owner}/{repo}#{index}"]
+    ]
+
+
+@app.post("/api/v1/repos/{owner}/{repo}/pulls/{index}/reviews")
+async def create_review(owner: str, repo: str, index: int, payload: dict):
+    pull = _pull(owner, repo, index)
+    review = {"id": next(_ids), "state": payload.get("event", "COMMENT"), "body": payload.get("body", ""), "comments": []}
+    for item in payload.get("comments") or []:
+        review["comments"].append({
+            "id": next(_ids), "body": item.get("body", ""), "path": item.get("path"),
+            "new_position": item.get("new_position"), "pull_request_review_id": review["id"],
+            "user": {"login": "reviewer"}, "created_at": _now(), "updated_at": _now(),
+        })
+    reviews[f"{owner}/{repo}#{index}"].append(review)
+    pull["updated_at"] = _now()
+    return {k: v for k, v in review.items() if k != "comments"} | {"comments_count": len(review["comments"])}
+
+
+@app.get("/api/v1/repos/{owner}/{repo}/pulls/{index}/reviews/{review_id}/comments")
+async def get_review_comments(owner: str, repo: str, index: int, review_id: int):
+    _pull(owner, repo, index)
+    for review in reviews[f"{owner}/{repo}#{index}"]:
+        if review["id"] == review_id:
+            return review["comments"]
+    raise HTTPException(status_code=404, detail="review does not exist")
+
+
+@app.get("/api/v1/repos/{owner}/{repo}/issues/{index}/comments")
+async def get_issue_comments(owner: str, repo: str, index: int):
+    _pull(owner, repo, index)
+    return []
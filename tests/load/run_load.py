@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный прогон жизненного цикла сессии
+
+1. seed: N сессий (POST /api/reviewer/sessions), в каждой M комментариев кандидата
+2. сценарии с заданной конкуренцией:
+   - comment_post      POST /api/candidate/sessions/{token}/comments
+   - dashboard_list    GET  /api/reviewer/sessions
+   - diff_fetch        GET  /api/candidate/sessions/{token}/diff
+   - evaluation        POST /api/reviewer/sessions/{id}/evaluate + ожидание завершения задачи
+   - pdf_download      GET  /api/reviewer/sessions/{id}/report/pdf
+3. p50/p90/p99, RPS и ошибки по каждому сценарию -> JSON (results/<commit>-<время>.json)
+
+Окружение: API, Redis (docker compose) и RQ worker запущены; для Gitea - fake_gitea.py
+(GITEA_URL=http://localhost:4000), иначе сессии создаются без Gitea.
+
+Запуск:
+    python run_load.py --sessions 50 --comments 20 --concurrency 16
+    python run_load.py --scenarios dashboard_list,diff_fetch --requests 2000
+    python run_load.py --compare results/<предыдущий>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
+RESULTS_DIR = Path(__file__).parent / "results"
+SCENARIOS = ["comment_post", "dashboard_list", "diff_fetch", "evaluation", "pdf_download"]
+# Порог регрессии при сравнении (p99 / RPS хуже на N %)
+REGRESSION_THRESHOLD = 0.2
+
+COMMENT_TYPES = ["bug", "security", "style", "performance"]
+SEVERITIES = ["low", "medium", "high", "critical"]
+
+
+class LoadError(Exception):
+    pass
+
+
+def make_comment(n: int) -> Dict[str, Any]:
+    line = random.randint(1, 200)
+    return {
+        "file": f"src/module_{n % 7}.py",
+        "line_range": f"{line}-{line + random.randint(0, 5)}",
+        "type": random.choice(COMMENT_TYPES),
+        "severity": random.choice(SEVERITIES),
+        "text": f"Load test comment #{n}: possible issue near line {line}",
+    }
+
+
+# === Статистика ===
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p
+    low, high = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (k - low)
+
+
+def summarize(latencies: List[float], errors: int, wall: float) -> Dict[str, Any]:
+    values = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 2)
+    return {
+        "requests": len(values) + errors,
+        "errors": errors,
+        "rps": round(len(values) / wall, 2) if wall > 0 else 0.0,
+        "mean_ms": ms(statistics.fmean(values)) if values else 0.0,
+        "p50_ms": ms(percentile(values, 0.50)),
+        "p90_ms": ms(percentile(values, 0.90)),
+        "p99_ms": ms(percentile(values, 0.99)),
+        "max_ms": ms(values[-1]) if values else 0.0,
+        "wall_s": round(wall, 3),
+    }
+
+
+async def run_concurrent(total: int, concurrency: int, call: Callable[[int], Awaitable[None]]) -> Dict[str, Any]:
+    """Выполнить total вызовов call(i) в concurrency параллельных потоках"""
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                await call(i)
+            except (httpx.HTTPError, LoadError) as e:
+                errors += 1
+                if errors <= 5:
+                    print(f"  ! {type(e).__name__}: {e}")
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def _check(response: httpx.Response, expected: int = 200):
+    if response.status_code != expected:
+        raise LoadError(f"{response.request.method} {response.request.url.path} -> {response.status_code}: {response.text[:200]}")
+
+
+# === Сценарии ===
+
+class LoadRun:
+    def __init__(self, client: httpx.AsyncClient, args: argparse.Namespace):
+        self.client = client
+        self.args = args
+        self.sessions: List[Dict[str, Any]] = []
+
+    async def seed(self) -> Dict[str, Any]:
+        async def create(i: int):
+            response = await self.client.post("/api/reviewer/sessions", json={
+                "reviewer_name": "Load Reviewer",
+                "candidate_name": f"load_candidate_{i}",
+                "mr_package": "demo_package",
+            })
+            _check(response)
+            self.sessions.append(response.json())
+
+        result = await run_concurrent(self.args.sessions, self.args.concurrency, create)
+        if not self.sessions:
+            raise LoadError("No sessions created")
+        return result
+
+    def _session(self, i: int) -> Dict[str, Any]:
+        return self.sessions[i % len(self.sessions)]
+
+    async def comment_post(self, i: int):
+        session = self._session(i)
+        response = await self.client.post(f"/api/candidate/sessions/{session['access_token']}/comments", json=make_comment(i))
+        _check(response)
+
+    async def dashboard_list(self, i: int):
+        _check(await self.client.get("/api/reviewer/sessions"))
+
+    async def diff_fetch(self, i: int):
+        session = self._session(i)
+        _check(await self.client.get(f"/api/candidate/sessions/{session['access_token']}/diff"))
+
+    async def evaluation(self, i: int):
+        """Постановка оценки в очередь и ожидание её завершения worker-ом"""
+        session = self._session(i)
+        response = await self.client.post(f"/api/reviewer/sessions/{session['session_id']}/evaluate")
+        _check(response)
+        job_id = response.json()["job_id"]
+        deadline = time.monotonic() + self.args.job_timeout
+        while time.monotonic() < deadline:
+            status = await self.client.get(f"/api/jobs/{job_id}")
+            _check(status)
+            state = status.json()["status"]
+            if state == "finished":
+                return
+            if state in ("failed", "stopped", "canceled"):
+                raise LoadError(f"Job {job_id} {state}")
+            await asyncio.sleep(0.05)
+        raise LoadError(f"Job {job_id} not finished in {self.args.job_timeout}s")
+
+    async def pdf_download(self, i: int):
+        session = self._session(i)
+        _check(await self.client.get(f"/api/reviewer/sessions/{session['session_id']}/report/pdf"))
+
+    def requests_for(self, scenario: str) -> int:
+        if scenario == "comment_post":
+            # Посев комментариев - M на каждую сессию
+            return len(self.sessions) * self.args.comments
+        if scenario in ("evaluation", "pdf_download"):
+            # Тяжёлые сценарии - не больше одного запроса на сессию
+            return min(self.args.requests, len(self.sessions))
+        return self.args.requests
+
+
+# === Результаты ===
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, timeout=10).stdout.strip() or "unknown"
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+def print_table(results: Dict[str, Dict[str, Any]]):
+    print(f"\n{'scenario':<16}{'requests':>9}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}")
+    for name, stats in results.items():
+        print(f"{name:<16}{stats['requests']:>9}{stats['errors']:>8}{stats['rps']:>10}{stats['p50_ms']:>10}{stats['p90_ms']:>10}{stats['p99_ms']:>10}")
+
+
+def compare(current: Dict[str, Dict[str, Any]], baseline_path: Path) -> bool:
+    """Сравнить с сохранённым прогоном; True - регрессий нет"""
+    baseline = json.loads(baseline_path.read_text())
+    print(f"\nCompared with {baseline_path.name} (commit {baseline['meta']['commit']}):")
+    ok = True
+    for name, stats in current.items():
+        old = baseline["results"].get(name)
+        if not old or not old["p99_ms"] or not old["rps"]:
+            continue
+        p99_change = stats["p99_ms"] / old["p99_ms"] - 1
+        rps_change = stats["rps"] / old["rps"] - 1
+        regression = p99_change > REGRESSION_THRESHOLD or rps_change < -REGRESSION_THRESHOLD
+        ok = ok and not regression
+        marker = "✗ REGRESSION" if regression else "✓"
+        print(f"  {marker} {name}: p99 {old['p99_ms']} -> {stats['p99_ms']} ms ({p99_change:+.0%}), "
+              f"rps {old['rps']} -> {stats['rps']} ({rps_change:+.0%})")
+    return ok
+
+
+async def main(args: argparse.Namespace) -> int:
+    random.seed(args.seed)
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        print(f"Unknown scenarios: {sorted(unknown)}")
+        return 2
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        health = await client.get("/api/health")
+        _check(health)
+        run = LoadRun(client, args)
+
+        print(f"Seeding {args.sessions} sessions (concurrency {args.concurrency})...")
+        results = {"session_create": await run.seed()}
+        for scenario in scenarios:
+            total = run.requests_for(scenario)
+            print(f"Running {scenario}: {total} requests...")
+            results[scenario] = await run_concurrent(total, args.concurrency, getattr(run, scenario))
+
+    print_table(results)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "base_url": args.base_url,
+            "sessions": args.sessions,
+            "comments": args.comments,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "scenarios": scenarios,
+        },
+        "results": results,
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{report['meta']['commit']}-{datetime.utcnow():%Y%m%dT%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nResults saved: {output}")
+
+    if args.compare:
+        return 0 if compare(results, Path(args.compare)) else 1
+    return 0
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load test for the session lifecycle")
+    parser.add_argument("--base-url", default=API_BASE_URL)
+    parser.add_argument("--sessions", type=int, default=20, help="Sessions to seed (N)")
+    parser.add_argument("--comments", type=int, default=10, help="Comments per session (M)")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per read scenario")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--timeout", type=float, default=60.0, help="HTTP timeout, s")
+    parser.add_argument("--job-timeout", type=float, default=120.0, help="Evaluation job timeout, s")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Results JSON path")
+    parser.add_argument("--compare", help="Baseline results JSON; exit code 1 on regression")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -4,6 +4,7 @@
 import pytest
 import httpx
 import asyncio
+import json
 import time
 from typing import Dict, Any
 
@@ -132,6 +133,48 @@ class TestPerformance:
         assert elapsed < 60.0, f"Concurrent requests took too long: {elapsed:.2f}s"
         print(f"✓ Created {success_count} sessions concurrently in {elapsed:.2f}s")
 
+    @pytest.mark.asyncio
+    async def test_bulk_create_sessions(self, api_client: httpx.AsyncClient, test_reviewer_data: Dict[str, str]):
+        """Тест: Пакетное создание - токены сразу, статус подготовки Gitea в потоке до completed"""
+        candidates = [f"Bulk Candidate {i}" for i in range(5)]
+        start_time = time.time()
+        response = await api_client.post("/api/reviewer/sessions/bulk", json={
+            "candidates": candidates, "mr_package": test_reviewer_data["mr_package"], "reviewer_name": "Bulk Reviewer"
+        })
+        assert response.status_code == 200, f"Bulk creation failed: {response.status_code} {response.text}"
+        data = response.json()
+        assert [s["candidate_name"] for s in data["sessions"]] == candidates
+        assert len({s["access_token"] for s in data["sessions"]}) == len(candidates)
+
+        events = []
+        event = {}
+        async with api_client.stream("GET", data["events_url"]) as stream:
+            assert stream.status_code == 200
+            async for line in stream.aiter_lines():
+                if line.startswith("event: "):
+                    event["event"] = line[len("event: "):]
+                elif line.startswith("data: "):
+                    event["data"] = json.loads(line[len("data: "):])
+                elif line == "" and event:
+                    events.append(event)
+                    event = {}
+        elapsed = time.time() - start_time
+
+        snapshot = events[0]["data"]
+        completed = events[-1]["data"] if events[-1]["event"] == "completed" else snapshot["completed"]
+        assert completed["total"] == len(candidates)
+        provisioned = [e["data"] for e in events if e["event"] == "provisioned"] + [s for s in snapshot["sessions"] if s["status"] != "pending"]
+        assert sorted(s["session_id"] for s in provisioned) == sorted(s["session_id"] for s in data["sessions"])
+
+        for created in data["sessions"]:
+            session = await api_client.get(f"/api/reviewer/sessions/{created['session_id']}")
+            assert session.status_code == 200
+            assert session.json()["candidate_name"] == created["candidate_name"]
+        diff = await api_client.get(f"/api/candidate/sessions/{data['sessions'][0]['access_token']}/diff")
+        assert diff.status_code == 200
+        assert elapsed < 60.0, f"Bulk creation took too long: {elapsed:.2f}s"
+        print(f"✓ {len(candidates)} sessions created in bulk, {completed['ready']} provisioned in {elapsed:.2f}s")
+
 
 class TestValidation:
     """Тесты валидации данных"""
@@ -264,3 +307,453 @@ class TestRQJobs:
         print(f"✓ Nonexistent job correctly returns 404")
 
 
+
+
+class TestUploadMR:
+    """Тесты загрузки MR пакета"""
+    
+    @staticmethod
+    def _zip_bytes(files: Dict[str, str]) -> bytes:
+        import io
+        import zipfile
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w") as z:
+            for name, content in files.items():
+                z.writestr(name, content)
+        return buf.getvalue()
+    
+    @pytest.mark.asyncio
+    async def test_upload_not_zip(self, api_client: httpx.AsyncClient):
+        """Тест: Загрузка файла, который не является zip"""
+        response = await api_client.post(
+            "/api/upload-mr",
+            files={"file": ("package.zip", b"not a zip", "application/zip")}
+        )
+        assert response.status_code == 400, f"Expected 400, got {response.status_code}"
+        print(f"✓ Non-zip upload rejected")
+    
+    @pytest.mark.asyncio
+    async def test_upload_deduplicated(self, api_client: httpx.AsyncClient):
+        """Тест: Одинаковые пакеты хранятся один раз (одинаковый sha256)"""
+        content = self._zip_bytes({"main.py": f"print('dedup {time.time()}')\n"})
+        first = await api_client.post("/api/upload-mr", files={"file": ("package.zip", content, "application/zip")})
+        second = await api_client.post("/api/upload-mr", files={"file": ("package.zip", content, "application/zip")})
+        assert first.status_code == 200, f"Upload failed: {first.text}"
+        assert second.status_code == 200, f"Upload failed: {second.text}"
+        
+        first_data, second_data = first.json(), second.json()
+        assert first_data["session_id"] != second_data["session_id"], "Each upload should create a session"
+        assert first_data["package_sha"] == second_data["package_sha"], "Same content should have same sha256"
+        print(f"✓ Upload deduplicated: {first_data['package_sha'][:12]}")
+    
+    @pytest.mark.asyncio
+    async def test_upload_path_traversal_rejected(self, api_client: httpx.AsyncClient):
+        """Тест: Архив с path traversal не распаковывается"""
+        content = self._zip_bytes({f"../../evil_{time.time()}.py": "print('x')\n"})
+        response = await api_client.post("/api/upload-mr", files={"file": ("evil.zip", content, "application/zip")})
+        assert response.status_code == 200, f"Upload failed: {response.text}"
+        session_id = response.json()["session_id"]
+        
+        # Распаковка - фоновая задача, ждём её результат
+        status = None
+        for _ in range(20):
+            session = (await api_client.get(f"/api/reviewer/sessions/{session_id}")).json()
+            status = session.get("package_status")
+            if status != "pending":
+                break
+            await asyncio.sleep(0.5)
+        if status == "pending":
+            pytest.skip("Extraction job not processed (worker not running?)")
+        
+        assert status == "failed", f"Unsafe package should fail extraction, got {status}"
+        print(f"✓ Path traversal archive rejected")
+
+
+class TestArtifactStore:
+    """Тесты хранилища артефактов по содержимому"""
+    
+    @pytest.mark.asyncio
+    async def test_identical_diffs_stored_once(self, api_client: httpx.AsyncClient, test_reviewer_data: Dict[str, str]):
+        """Тест: Сессии с одинаковым diff ссылаются на один блоб"""
+        await api_client.post("/api/reviewer/sessions", json=test_reviewer_data)
+        before = (await api_client.get("/api/reviewer/artifacts/stats")).json().get("diff")
+        assert before, "Diff artifact should be registered"
+        
+        response = await api_client.post("/api/reviewer/sessions", json=test_reviewer_data)
+        assert response.status_code == 200
+        session_id = response.json()["session_id"]
+        after = (await api_client.get("/api/reviewer/artifacts/stats")).json()["diff"]
+        
+        assert after["artifacts"] == before["artifacts"], "Identical diff should not create a new blob"
+        assert after["references"] == before["references"] + 1, "Session should reference the diff"
+        
+        # Удаление сессии освобождает ссылку
+        await api_client.delete(f"/api/reviewer/sessions/{session_id}")
+        released = (await api_client.get("/api/reviewer/artifacts/stats")).json()["diff"]
+        assert released["references"] == before["references"], "Deleted session should release the diff"
+        print(f"✓ Diff stored once: {after['artifacts']} blobs, {after['references']} refs")
+
+
+class TestDiffServing:
+    """Тесты отдачи diff (ETag, 304, Range)"""
+    
+    @pytest.mark.asyncio
+    async def test_diff_conditional_and_range(self, api_client: httpx.AsyncClient, test_reviewer_data: Dict[str, str]):
+        """Тест: Повторный запрос diff с ETag получает 304, Range - 206"""
+        response = await api_client.post("/api/reviewer/sessions", json=test_reviewer_data)
+        assert response.status_code == 200
+        token = response.json()["access_token"]
+        
+        first = await api_client.get(f"/api/candidate/sessions/{token}/diff")
+        assert first.status_code == 200, f"Expected 200, got {first.status_code}"
+        etag = first.headers.get("etag")
+        assert etag and not etag.startswith("W/"), "Diff should have a strong ETag"
+        assert first.headers.get("last-modified"), "Diff should have Last-Modified"
+        
+        cached = await api_client.get(f"/api/candidate/sessions/{token}/diff", headers={"If-None-Match": etag})
+        assert cached.status_code == 304, f"Expected 304, got {cached.status_code}"
+        assert cached.content == b"", "304 response should have no body"
+        
+        partial = await api_client.get(f"/api/candidate/sessions/{token}/diff", headers={"Range": "bytes=0-9"})
+        assert partial.status_code == 206, f"Expected 206, got {partial.status_code}"
+        assert partial.content == first.content[:10], "Range should return requested bytes"
+        print(f"✓ Diff served with ETag {etag[:14]}..., 304 and Range")
+    
+    @pytest.mark.asyncio
+    async def test_diff_files_index(self, api_client: httpx.AsyncClient, test_reviewer_data: Dict[str, str]):
+        """Тест: Список файлов diff, diff одного файла и поиск hunk по строке"""
+        response = await api_client.post("/api/reviewer/sessions", json=test_reviewer_data)
+        assert response.status_code == 200
+        token = response.json()["access_token"]
+        
+        files = await api_client.get(f"/api/candidate/sessions/{token}/diff/files")
+        assert files.status_code == 200, f"Expected 200, got {files.status_code}"
+        data = files.json()
+        assert data["files"], "Diff should contain files"
+        first = data["files"][0]
+        
+        file_diff = await api_client.get(f"/api/candidate/sessions/{token}/diff/files/{first['index']}")
+        assert file_diff.status_code == 200
+        assert file_diff.text.startswith("diff --git"), "File diff should be a valid patch"
+        
+        located = await api_client.get(
+            f"/api/candidate/sessions/{token}/diff/locate",
+            params={"file": first["path"], "line": 1}
+        )
+        assert located.status_code == 200, f"Line should be found: {located.text}"
+        assert located.json()["file_index"] == first["index"]
+        
+        missing = await api_client.get(f"/api/candidate/sessions/{token}/diff/files/{len(data['files'])}")
+        assert missing.status_code == 404, "Out of range file index should return 404"
+        print(f"✓ Diff index: {len(data['files'])} files")
+
+
+class TestTokenCache:
+    """Тесты кэша токенов кандидата"""
+    
+    @pytest.mark.asyncio
+    async def test_deleted_session_not_served_from_cache(self, api_client: httpx.AsyncClient, test_reviewer_data: Dict[str, str]):
+        """Тест: После удаления сессии токен сразу перестаёт работать (кэш инвалидируется)"""
+        response = await api_client.post("/api/reviewer/sessions", json=test_reviewer_data)
+        assert response.status_code == 200
+        data = response.json()
+        token = data["access_token"]
+        
+        # Прогреваем кэш (diff идёт через кэш токенов, комментарии - запросом по токену)
+        for _ in range(3):
+            warm = await api_client.get(f"/api/candidate/sessions/{token}/comments")
+            assert warm.status_code == 200
+            warm = await api_client.get(f"/api/candidate/sessions/{token}/diff")
+            assert warm.status_code == 200
+        
+        deleted = await api_client.delete(f"/api/reviewer/sessions/{data['session_id']}")
+        assert deleted.status_code == 200
+        
+        for path in ("comments", "diff", "diff/files"):
+            after = await api_client.get(f"/api/candidate/sessions/{token}/{path}")
+            assert after.status_code == 404, f"Deleted session should not be served from cache ({path}), got {after.status_code}"
+        print(f"✓ Token cache invalidated on delete")
+
+
+class TestSessionSummaries:
+    """Тесты проекции session_summaries (список сессий ревьюера)"""
+    
+    @pytest.mark.asyncio
+    async def test_list_shows_comment_counts(self, api_client: httpx.AsyncClient, test_reviewer_data: Dict[str, str], test_comment: Dict[str, Any]):
+        """Тест: Список сессий показывает счётчики комментариев без загрузки самих комментариев"""
+        response = await api_client.post("/api/reviewer/sessions", json=test_reviewer_data)
+        assert response.status_code == 200
+        data = response.json()
+        
+        for severity in ("high", "low"):
+            added = await api_client.post(
+                f"/api/candidate/sessions/{data['access_token']}/comments",
+                json={**test_comment, "severity": severity}
+            )
+            assert added.status_code == 200
+        
+        listing = await api_client.get("/api/reviewer/sessions")
+        assert listing.status_code == 200
+        session = next(s for s in listing.json()["sessions"] if s["id"] == data["session_id"])
+        
+        assert session["comment_count"] == 2
+        assert session["comment_counts"]["by_severity"] == {"high": 1, "low": 1}
+        assert sum(session["comment_counts"]["by_type"].values()) == 2
+        assert "comments" not in session, "List should not carry full comments"
+        assert session["last_activity_at"]
+        print(f"✓ Session summary: {session['comment_count']} comments")
+
+
+class TestInternalAPI:
+    """Тесты internal API для RQ worker (данные сессии и запись результата оценки)"""
+    
+    @pytest.mark.asyncio
+    async def test_worker_roundtrip(self, api_client: httpx.AsyncClient, test_reviewer_data: Dict[str, str], test_comment: Dict[str, Any], internal_headers: Dict[str, str]):
+        """Тест: Worker получает комментарии сессии и сохраняет оценку через API"""
+        response = await api_client.post("/api/reviewer/sessions", json=test_reviewer_data)
+        assert response.status_code == 200
+        data = response.json()
+        session_id = data["session_id"]
+        
+        added = await api_client.post(f"/api/candidate/sessions/{data['access_token']}/comments", json=test_comment)
+        assert added.status_code == 200
+        
+        # Без токена internal API закрыт
+        assert (await api_client.get(f"/api/internal/sessions/{session_id}/evaluation-input")).status_code == 403
+        assert (await api_client.get(f"/api/internal/sessions/{session_id}/golden-truth")).status_code == 403
+        
+        evaluation_input = await api_client.get(f"/api/internal/sessions/{session_id}/evaluation-input", headers=internal_headers)
+        if evaluation_input.status_code == 403:
+            pytest.skip("INTERNAL_API_TOKEN of the API is not known to tests")
+        assert evaluation_input.status_code == 200
+        assert len(evaluation_input.json()["comments"]) == 1
+        
+        saved = await api_client.post(
+            f"/api/internal/sessions/{session_id}/evaluation",
+            json={"score": 0.5, "grade": "Middle", "report": "Score: 0.500\n"},
+            headers=internal_headers
+        )
+        assert saved.status_code == 200
+        
+        report = await api_client.get(f"/api/reviewer/sessions/{session_id}/report")
+        assert "Score: 0.500" in report.text
+        listing = await api_client.get("/api/reviewer/sessions")
+        session = next(s for s in listing.json()["sessions"] if s["id"] == session_id)
+        assert session["score"] == 0.5 and session["grade"] == "Middle"
+        
+        missing = await api_client.get("/api/internal/sessions/999999999/evaluation-input", headers=internal_headers)
+        assert missing.status_code == 404
+        print(f"✓ Internal API roundtrip for session {session_id}")
+
+    @pytest.mark.asyncio
+    async def test_ci_result_roundtrip(self, api_client: httpx.AsyncClient, test_reviewer_data: Dict[str, str], internal_headers: Dict[str, str]):
+        """Тест: Пакет без ci.json - runner пропускает сессию; результат CI сохраняется и отдаётся ревьюеру"""
+        response = await api_client.post("/api/reviewer/sessions", json=test_reviewer_data)
+        assert response.status_code == 200
+        session_id = response.json()["session_id"]
+
+        ci_input = await api_client.get(f"/api/internal/sessions/{session_id}/ci-input", headers=internal_headers)
+        if ci_input.status_code == 403:
+            pytest.skip("INTERNAL_API_TOKEN of the API is not known to tests")
+        assert ci_input.status_code == 409, "demo_package has no ci.json"
+        assert (await api_client.get(f"/api/reviewer/sessions/{session_id}/ci")).status_code == 404
+
+        result = {"status": "failed", "exit_code": 1, "head_sha": "a" * 40, "cached": False, "output": "1 failed"}
+        saved = await api_client.post(f"/api/internal/sessions/{session_id}/ci-result", json=result, headers=internal_headers)
+        assert saved.status_code == 200
+        ci = await api_client.get(f"/api/reviewer/sessions/{session_id}/ci")
+        assert ci.status_code == 200
+        assert ci.json()["status"] == "failed" and ci.json()["finished_at"]
+
+        assert (await api_client.get("/api/internal/sessions/999999999/ci-input", headers=internal_headers)).status_code == 404
+        print(f"✓ CI result roundtrip for session {session_id}")
+
+
+class TestRequestCoalescing:
+    """Тесты объединения одновременных одинаковых запросов (single-flight)"""
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_pdf_downloads_share_render(self, api_client: httpx.AsyncClient, test_reviewer_data: Dict[str, str]):
+        """Тест: Одновременные скачивания PDF одной сессии используют один рендер"""
+        response = await api_client.post("/api/reviewer/sessions", json=test_reviewer_data)
+        assert response.status_code == 200
+        session_id = response.json()["session_id"]
+        before = (await api_client.get("/api/reviewer/singleflight/stats")).json()["pdf_render"]
+        
+        downloads = await asyncio.gather(*(
+            api_client.get(f"/api/reviewer/sessions/{session_id}/report/pdf") for _ in range(8)
+        ))
+        assert all(r.status_code == 200 for r in downloads)
+        
+        after = (await api_client.get("/api/reviewer/singleflight/stats")).json()["pdf_render"]
+        assert after["calls"] - before["calls"] == 8
+        assert after["executed"] - before["executed"] < 8, "Concurrent renders should be coalesced"
+        print(f"✓ 8 downloads, {after['executed'] - before['executed']} renders")
+
+
+class TestGiteaCommentPush:
+    """Тесты отправки комментариев в Gitea PR"""
+    
+    @pytest.mark.asyncio
+    async def test_resync_pushes_only_new_comments(self, api_client: httpx.AsyncClient, test_reviewer_data: Dict[str, str], test_comment: Dict[str, Any]):
+        """Тест: Повторная синхронизация не дублирует уже отправленные комментарии"""
+        response = await api_client.post("/api/reviewer/sessions", json=test_reviewer_data)
+        assert response.status_code == 200
+        data = response.json()
+        session = (await api_client.get(f"/api/reviewer/sessions/{data['session_id']}")).json()
+        if not (session.get("gitea") or {}).get("pr_id"):
+            pytest.skip("Gitea integration not enabled")
+        
+        added = await api_client.post(f"/api/candidate/sessions/{data['access_token']}/comments", json=test_comment)
+        assert added.status_code == 200
+        
+        first = await api_client.post(f"/api/reviewer/sessions/{data['session_id']}/gitea/sync-comments")
+        assert first.status_code == 200
+        assert first.json()["synced_count"] == 1
+        
+        second = await api_client.post(f"/api/reviewer/sessions/{data['session_id']}/gitea/sync-comments")
+        assert second.status_code == 200
+        assert second.json()["synced_count"] == 0, "Already pushed comments should not be sent again"
+        assert second.json()["skipped_count"] == 1
+        print(f"✓ Re-sync pushed nothing new")
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_sync_pushes_once(self, api_client: httpx.AsyncClient, test_reviewer_data: Dict[str, str], test_comment: Dict[str, Any]):
+        """Тест: Одновременные синхронизации отправляют каждый комментарий один раз, обратная синхронизация не импортирует копии"""
+        response = await api_client.post("/api/reviewer/sessions", json=test_reviewer_data)
+        assert response.status_code == 200
+        data = response.json()
+        session = (await api_client.get(f"/api/reviewer/sessions/{data['session_id']}")).json()
+        if not (session.get("gitea") or {}).get("pr_id"):
+            pytest.skip("Gitea integration not enabled")
+        
+        for i in range(3):
+            added = await api_client.post(f"/api/candidate/sessions/{data['access_token']}/comments", json={**test_comment, "text": f"Comment {i}"})
+            assert added.status_code == 200
+        
+        syncs = await asyncio.gather(*(
+            api_client.post(f"/api/reviewer/sessions/{data['session_id']}/gitea/sync-comments") for _ in range(4)
+        ))
+        assert all(r.status_code == 200 for r in syncs)
+        assert sum(r.json()["synced_count"] for r in syncs) == 3, "Each comment should be pushed exactly once"
+        
+        back = await api_client.post(f"/api/reviewer/sessions/{data['session_id']}/gitea/sync-comments-from-gitea")
+        assert back.status_code == 200
+        assert back.json()["synced_count"] == 0, "Pushed comments should not be imported back"
+        assert back.json()["total_count"] == 3
+        print(f"✓ Concurrent syncs pushed 3 comments once")
+    
+    @pytest.mark.asyncio
+    async def test_repeat_pr_view_served_from_cache(self, api_client: httpx.AsyncClient, test_reviewer_data: Dict[str, str]):
+        """Тест: Повторный просмотр PR без изменений не обращается к Gitea"""
+        response = await api_client.post("/api/reviewer/sessions", json=test_reviewer_data)
+        assert response.status_code == 200
+        session_id = response.json()["session_id"]
+        session = (await api_client.get(f"/api/reviewer/sessions/{session_id}")).json()
+        if not (session.get("gitea") or {}).get("pr_id"):
+            pytest.skip("Gitea integration not enabled")
+        if not (await api_client.get("/api/reviewer/gitea/cache/stats")).json().get("enabled"):
+            pytest.skip("Gitea cache disabled")
+        
+        first = await api_client.get(f"/api/reviewer/sessions/{session_id}/gitea/pr")
+        assert first.status_code == 200
+        before = (await api_client.get("/api/reviewer/gitea/cache/stats")).json()
+        
+        second = await api_client.get(f"/api/reviewer/sessions/{session_id}/gitea/pr")
+        assert second.status_code == 200
+        assert second.json()["diff"] == first.json()["diff"]
+        after = (await api_client.get("/api/reviewer/gitea/cache/stats")).json()
+        assert after["misses"] == before["misses"], "Repeat view should not miss the cache"
+        assert after["hits"] > before["hits"]
+        print(f"✓ Repeat PR view served from cache ({after['hits'] - before['hits']} hits)")
+    
+    @pytest.mark.asyncio
+    async def test_scheduler_reports_queueing_by_lane(self, api_client: httpx.AsyncClient):
+        """Тест: Планировщик Gitea отдаёт метрики ожидания по полосам"""
+        response = await api_client.get("/api/reviewer/gitea/scheduler/stats")
+        assert response.status_code == 200
+        stats = response.json()
+        if not stats.get("enabled"):
+            pytest.skip("Gitea integration not enabled")
+        assert set(stats["lanes"]) == {"interactive", "background"}
+        assert stats["background_limit"] <= stats["max_in_flight"]
+        assert stats["in_flight"] <= stats["max_in_flight"]
+        print(f"✓ Scheduler: {stats['lanes']['interactive']['requests']} interactive, {stats['lanes']['background']['requests']} background requests")
+    
+    @pytest.mark.asyncio
+    async def test_sync_all_skips_unchanged_prs(self, api_client: httpx.AsyncClient, test_reviewer_data: Dict[str, str]):
+        """Тест: Повторная синхронизация всех PR пропускает PR без изменений"""
+        response = await api_client.post("/api/reviewer/sessions", json=test_reviewer_data)
+        assert response.status_code == 200
+        session = (await api_client.get(f"/api/reviewer/sessions/{response.json()['session_id']}")).json()
+        if not (session.get("gitea") or {}).get("pr_id"):
+            pytest.skip("Gitea integration not enabled")
+        
+        first = await api_client.post("/api/reviewer/gitea/sync-all", timeout=120.0)
+        assert first.status_code == 200
+        second = await api_client.post("/api/reviewer/gitea/sync-all", timeout=120.0)
+        assert second.status_code == 200
+        stats = second.json()
+        assert stats["changed"] == 0, "Nothing changed in Gitea between passes"
+        assert stats["unchanged"] >= 1
+        assert stats["unchanged"] + stats["errors"] == stats["sessions"]
+        print(f"✓ Second pass: {stats['unchanged']} unchanged PRs in {stats['duration_ms']} ms")
+    
+    @pytest.mark.asyncio
+    async def test_unsigned_webhook_ready_comment_checked_in_gitea(self, api_client: httpx.AsyncClient, test_reviewer_data: Dict[str, str]):
+        """Тест: Неподписанный webhook с "готово" не отмечает кандидата, если в PR в Gitea сигнала нет"""
+        response = await api_client.post("/api/reviewer/sessions", json=test_reviewer_data)
+        assert response.status_code == 200
+        session_id = response.json()["session_id"]
+        gitea = (await api_client.get(f"/api/reviewer/sessions/{session_id}")).json().get("gitea") or {}
+        if not gitea.get("pr_id"):
+            pytest.skip("Gitea integration not enabled")
+        
+        def payload(body: str) -> Dict[str, Any]:
+            return {
+                "action": "created",
+                "repository": {"name": gitea["repo"], "owner": {"login": gitea["user"]}},
+                "issue": {"number": gitea["pr_id"], "pull_request": {}},
+                "comment": {"body": body, "created_at": "2026-01-01T10:00:00Z"},
+            }
+        
+        not_ready = await api_client.post("/api/gitea/webhook", json=payload("This is already handled upstream"))
+        if not_ready.status_code == 403:
+            pytest.skip("Gitea webhook secret configured")
+        assert not_ready.status_code == 200
+        assert not_ready.json()["ready_sessions"] == []
+        
+        forged = await api_client.post("/api/gitea/webhook", json=payload("Готово, можно смотреть"))
+        assert forged.status_code == 200
+        assert forged.json()["ready_sessions"] == []
+        session = (await api_client.get(f"/api/reviewer/sessions/{session_id}")).json()
+        assert session["candidate_ready_at"] is None
+        print(f"✓ Unsigned ready signal not confirmed by Gitea ignored for session {session_id}")
+    
+    @pytest.mark.asyncio
+    async def test_pr_diff_files_from_mirror(self, api_client: httpx.AsyncClient, test_reviewer_data: Dict[str, str]):
+        """Тест: Diff PR по файлам - из локального зеркала или 503 с Retry-After, пока зеркало обновляется"""
+        response = await api_client.post("/api/reviewer/sessions", json=test_reviewer_data)
+        assert response.status_code == 200
+        session_id = response.json()["session_id"]
+        session = (await api_client.get(f"/api/reviewer/sessions/{session_id}")).json()
+        if not (session.get("gitea") or {}).get("pr_id"):
+            pytest.skip("Gitea integration not enabled")
+        if not (await api_client.get("/api/reviewer/gitea/mirror/stats")).json().get("enabled"):
+            pytest.skip("Git mirror disabled")
+        
+        pr = await api_client.get(f"/api/reviewer/sessions/{session_id}/gitea/pr")
+        assert pr.status_code == 200
+        assert pr.json()["diff"], "PR diff should be served (mirror or Gitea fallback)"
+        
+        files = await api_client.get(f"/api/reviewer/sessions/{session_id}/gitea/pr/diff/files")
+        if files.status_code == 503:
+            assert files.headers.get("retry-after"), "Client should know when to retry"
+            print("✓ Mirror not ready yet: 503 with Retry-After")
+            return
+        assert files.status_code == 200
+        data = files.json()
+        assert data["files"] and data["head_sha"]
+        cached = await api_client.get(f"/api/reviewer/sessions/{session_id}/gitea/pr/diff/files", headers={"If-None-Match": files.headers["etag"]})
+        assert cached.status_code == 304
+        print(f"✓ PR diff from mirror: {len(data['files'])} files")
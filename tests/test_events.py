@@ -0,0 +1,58 @@
+"""
+Тесты SSE потоков событий (сессии и RQ задачи)
+"""
+import pytest
+import httpx
+import json
+from typing import Dict
+
+
+async def read_first_event(response: httpx.Response) -> Dict:
+    """Прочитать первое SSE событие из потока"""
+    event = {}
+    async for line in response.aiter_lines():
+        if line.startswith("event: "):
+            event["event"] = line[len("event: "):]
+        elif line.startswith("data: "):
+            event["data"] = json.loads(line[len("data: "):])
+        elif line == "" and event:
+            return event
+    return event
+
+
+class TestSessionEvents:
+    """Тесты событий сессии"""
+
+    @pytest.mark.asyncio
+    async def test_session_events_stream(self, api_client: httpx.AsyncClient, test_reviewer_data: Dict[str, str]):
+        """Тест: Поток событий сессии открывается и отдаёт connected"""
+        create_response = await api_client.post("/api/reviewer/sessions", json=test_reviewer_data)
+        assert create_response.status_code == 200
+        session_id = create_response.json()["session_id"]
+
+        async with api_client.stream("GET", f"/api/reviewer/sessions/{session_id}/events") as response:
+            assert response.status_code == 200, f"Expected 200, got {response.status_code}"
+            assert response.headers["content-type"].startswith("text/event-stream")
+            event = await read_first_event(response)
+
+        assert event["event"] == "connected", f"Unexpected first event: {event}"
+        assert event["data"]["session_id"] == session_id
+        print(f"✓ Session events stream opened for session {session_id}")
+
+    @pytest.mark.asyncio
+    async def test_session_events_nonexistent(self, api_client: httpx.AsyncClient):
+        """Тест: Поток событий несуществующей сессии возвращает 404"""
+        response = await api_client.get("/api/reviewer/sessions/999999/events")
+        assert response.status_code == 404, f"Expected 404, got {response.status_code}"
+        print(f"✓ Nonexistent session events correctly return 404")
+
+
+class TestJobEvents:
+    """Тесты событий RQ задач"""
+
+    @pytest.mark.asyncio
+    async def test_job_events_nonexistent(self, api_client: httpx.AsyncClient):
+        """Тест: Поток событий несуществующей задачи возвращает 404"""
+        response = await api_client.get("/api/jobs/nonexistent-job-id/events")
+        assert response.status_code == 404, f"Expected 404, got {response.status_code}"
+        print(f"✓ Nonexistent job events correctly return 404")
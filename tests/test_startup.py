@@ -0,0 +1,50 @@
+"""
+Тесты времени старта API (python -X importtime)
+"""
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+API_DIR = Path(__file__).resolve().parent.parent / "api"
+# Бюджет на import main (мс); настраивается для медленных CI машин
+IMPORT_TIME_BUDGET_MS = int(os.getenv("IMPORT_TIME_BUDGET_MS", "1500"))
+# Модули, которые должны загружаться лениво (при первом использовании)
+LAZY_MODULES = {"weasyprint", "eval_worker", "rq", "rq_monitor", "gitea_client", "requests", "jinja2"}
+
+_IMPORTTIME_RE = re.compile(r"^import time:\s+\d+ \|\s+(\d+) \|(\s+)(\S+)$")
+
+
+def import_main() -> dict:
+    """Импортировать main в отдельном процессе; {модуль: суммарное время в мкс} для модулей верхнего уровня и main"""
+    if not (API_DIR / "main.py").exists():
+        pytest.skip("API sources not available")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=API_DIR, capture_output=True, text=True, timeout=120,
+    )
+    if result.returncode != 0:
+        pytest.skip(f"Cannot import main here: {result.stderr.strip().splitlines()[-1:]}")
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match:
+            modules[match.group(3)] = int(match.group(1))
+    return modules
+
+
+class TestStartup:
+    """Тесты холодного старта"""
+
+    def test_import_time_budget(self):
+        """Тест: import main укладывается в бюджет и не тянет тяжёлые модули"""
+        modules = import_main()
+        total_ms = modules["main"] / 1000
+
+        loaded = LAZY_MODULES & modules.keys()
+        assert not loaded, f"Modules should be imported lazily: {sorted(loaded)}"
+        assert total_ms < IMPORT_TIME_BUDGET_MS, f"import main took {total_ms:.0f} ms (budget {IMPORT_TIME_BUDGET_MS} ms)"
+        print(f"✓ import main: {total_ms:.0f} ms")
@@ -0,0 +1,363 @@
+"""
+CI runner: тесты ветки кандидата в песочнице, результат кэшируется по (commit SHA, версия пакета)
+
+Задача run_ci(session_id) в очереди CI_QUEUE:
+1. Вход через internal API: clone URL репозитория, head SHA PR, команда тестов пакета (ci.json)
+   и версия пакета
+2. Результат для (head SHA, версия пакета) уже есть в Redis - тесты не запускаются
+3. Иначе коммит выгружается в tmpfs (CI_WORKDIR) и команда запускается под rlimit (CPU, память,
+   процессы, размер файлов) с общим таймаутом, от отдельного непривилегированного uid на слот,
+   без переменных окружения worker (токенов) и в своём network namespace без сети (только lo):
+   тестам недоступны Redis, internal API и Gitea. Namespace не создан - тесты не запускаются
+   (контейнеру нужен CAP_SYS_ADMIN, см. docker-compose.yml)
+4. Результат - в Redis и в API (/api/internal/sessions/{id}/ci-result)
+
+Одна сборка на ключ одновременно: вторая задача с тем же ключом ждёт результат первой.
+
+Запуск: python ci_runner.py - пул из CI_CONCURRENCY процессов rq worker (по умолчанию по числу ядер)
+"""
+import ctypes
+import fcntl
+import json
+import logging
+import os
+import resource
+import shutil
+import signal
+import socket
+import struct
+import subprocess
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+import requests
+from redis import Redis
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("RQ_REDIS_URL", "redis://redis:6379")
+INTERNAL_API_URL = os.getenv("INTERNAL_API_URL", "http://api:8000").rstrip("/")
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN", "")
+INTERNAL_API_TIMEOUT = float(os.getenv("INTERNAL_API_TIMEOUT", "10"))
+
+CI_QUEUE = os.getenv("CI_QUEUE", "ci")
+CI_CONCURRENCY = int(os.getenv("CI_CONCURRENCY", "0")) or os.cpu_count() or 1
+# Рабочие каталоги сборок - tmpfs (в docker-compose: tmpfs /ci)
+CI_WORKDIR = os.getenv("CI_WORKDIR", "/ci")
+# Слот пула i запускает тесты от uid CI_UID_BASE + i (свой лимит процессов, чужие файлы недоступны)
+CI_UID_BASE = int(os.getenv("CI_UID_BASE", "20000"))
+CI_RESULT_TTL = int(os.getenv("CI_RESULT_TTL", str(7 * 24 * 3600)))
+CI_CHECKOUT_TIMEOUT = int(os.getenv("CI_CHECKOUT_TIMEOUT", "120"))
+# Сколько последних байт вывода тестов сохраняется в результате
+CI_OUTPUT_TAIL = int(os.getenv("CI_OUTPUT_TAIL", str(64 * 1024)))
+
+# Лимиты по умолчанию; ci.json пакета может задать свои, но не больше CI_MAX_*
+DEFAULT_LIMITS = {"timeout": 300, "memory_mb": 1024, "max_processes": 64, "max_file_mb": 64}
+MAX_LIMITS = {
+    "timeout": int(os.getenv("CI_MAX_TIMEOUT", "900")),
+    "memory_mb": int(os.getenv("CI_MAX_MEMORY_MB", "4096")),
+    "max_processes": int(os.getenv("CI_MAX_PROCESSES", "256")),
+    "max_file_mb": int(os.getenv("CI_MAX_FILE_MB", "256")),
+}
+
+STATUS_PASSED = "passed"
+STATUS_FAILED = "failed"
+STATUS_TIMEOUT = "timeout"
+STATUS_ERROR = "error"
+STATUS_SKIPPED = "skipped"
+
+# unshare(2) и ioctl интерфейсов (linux/sched.h, linux/sockios.h, linux/if.h)
+CLONE_NEWUSER = 0x10000000
+CLONE_NEWNET = 0x40000000
+SIOCGIFFLAGS = 0x8913
+SIOCSIFFLAGS = 0x8914
+IFF_UP = 0x1
+_libc = ctypes.CDLL(None, use_errno=True)
+
+_RESULT_PREFIX = "ci:result:"
+_LOCK_PREFIX = "ci:lock:"
+_POLL_INTERVAL = 1.0
+# Снятие lock только владельцем (сборка дольше TTL - lock мог истечь и достаться другой задаче)
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_http: Optional[requests.Session] = None
+_redis: Optional[Redis] = None
+
+
+class CheckoutError(Exception):
+    pass
+
+
+def _internal_api() -> requests.Session:
+    global _http
+    if _http is None:
+        _http = requests.Session()
+        if INTERNAL_API_TOKEN:
+            _http.headers["X-Internal-Token"] = INTERNAL_API_TOKEN
+    return _http
+
+
+def _redis_conn() -> Redis:
+    global _redis
+    if _redis is None:
+        _redis = Redis.from_url(REDIS_URL)
+    return _redis
+
+
+def _fetch_ci_input(session_id: int) -> Tuple[Optional[Dict], Optional[str]]:
+    """(вход сборки, None) или (None, причина пропуска)"""
+    response = _internal_api().get(f"{INTERNAL_API_URL}/api/internal/sessions/{session_id}/ci-input", timeout=INTERNAL_API_TIMEOUT)
+    if response.status_code in (404, 409):
+        return None, response.json().get("detail", "CI not available")
+    response.raise_for_status()
+    return response.json(), None
+
+
+def _post_result(session_id: int, result: Dict):
+    response = _internal_api().post(
+        f"{INTERNAL_API_URL}/api/internal/sessions/{session_id}/ci-result", json=result, timeout=INTERNAL_API_TIMEOUT
+    )
+    response.raise_for_status()
+
+
+def limits_for(config: Dict) -> Dict[str, int]:
+    return {key: max(1, min(int(config.get(key, default)), MAX_LIMITS[key])) for key, default in DEFAULT_LIMITS.items()}
+
+
+def cache_key(head_sha: str, package_version: str) -> str:
+    return f"{head_sha}:{package_version}"
+
+
+# === Слоты пула: uid на сборку ===
+
+@contextmanager
+def _slot():
+    """Свободный слот (flock): номер слота задаёт uid, от которого идут тесты"""
+    slots_dir = os.path.join(CI_WORKDIR, ".slots")
+    os.makedirs(slots_dir, exist_ok=True)
+    while True:
+        for index in range(CI_CONCURRENCY * 2):
+            lock_file = open(os.path.join(slots_dir, f"{index}.lock"), "w")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                continue
+            try:
+                yield index
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+            return
+        time.sleep(_POLL_INTERVAL)
+
+
+# === Checkout и запуск ===
+
+def _git(args: list, cwd: str):
+    command = ["git"]
+    token = os.getenv("GITEA_ADMIN_TOKEN", "")
+    if token:
+        # Токен только в заголовке запроса: в .git/config рабочего каталога он не попадает
+        command += ["-c", f"http.extraHeader=Authorization: token {token}"]
+    result = subprocess.run(command + args, cwd=cwd, capture_output=True, timeout=CI_CHECKOUT_TIMEOUT,
+                            env=dict(os.environ, GIT_TERMINAL_PROMPT="0"))
+    if result.returncode != 0:
+        stderr = result.stderr.decode("utf-8", errors="replace").strip()
+        raise CheckoutError(f"git {args[0]} failed: {stderr.replace(token, '***') if token else stderr}")
+
+
+def checkout(clone_url: str, head_sha: str, pr_ref: Optional[str], workdir: str):
+    """Только нужный коммит (--depth 1); сервер не отдаёт коммит по SHA - через ref PR"""
+    _git(["init", "-q"], workdir)
+    try:
+        _git(["fetch", "-q", "--depth", "1", clone_url, head_sha], workdir)
+    except CheckoutError:
+        if not pr_ref:
+            raise
+        _git(["fetch", "-q", "--depth", "1", clone_url, pr_ref], workdir)
+    _git(["-c", "advice.detachedHead=false", "checkout", "-q", head_sha], workdir)
+    # Тестам история не нужна
+    shutil.rmtree(os.path.join(workdir, ".git"), ignore_errors=True)
+
+
+def _chown_tree(path: str, uid: int):
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            os.lchown(os.path.join(root, name), uid, uid)
+    os.chown(path, uid, uid)
+
+
+def _isolate_network(privileged: bool):
+    """
+    Новый network namespace без интерфейсов, кроме lo (тесты могут слушать localhost)
+
+    Без root - вместе с user namespace: unshare(CLONE_NEWNET) требует CAP_SYS_ADMIN.
+    Ошибка - исключение: preexec_fn падает, и команда не запускается
+    """
+    if _libc.unshare(CLONE_NEWNET if privileged else CLONE_NEWUSER | CLONE_NEWNET) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, f"unshare: {os.strerror(errno)}")
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        ifreq = fcntl.ioctl(sock, SIOCGIFFLAGS, struct.pack("16sh22x", b"lo", 0))
+        flags = struct.unpack("16sh", ifreq[:18])[1]
+        fcntl.ioctl(sock, SIOCSIFFLAGS, struct.pack("16sh22x", b"lo", flags | IFF_UP))
+
+
+def _sandbox(limits: Dict[str, int], uid: Optional[int]):
+    """preexec_fn: rlimit, изоляция сети и смена пользователя в дочернем процессе"""
+    def apply():
+        cpu = limits["timeout"]
+        memory = limits["memory_mb"] * 1024 * 1024
+        file_size = limits["max_file_mb"] * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 5))
+        resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+        resource.setrlimit(resource.RLIMIT_NPROC, (limits["max_processes"], limits["max_processes"]))
+        resource.setrlimit(resource.RLIMIT_FSIZE, (file_size, file_size))
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+        # До смены uid: после неё прав на unshare нет
+        _isolate_network(privileged=os.getuid() == 0)
+        if uid is not None:
+            os.setgroups([])
+            os.setgid(uid)
+            os.setuid(uid)
+    return apply
+
+
+def _read_tail(path: str, limit: int) -> str:
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(size - limit, 0))
+        return f.read().decode("utf-8", errors="replace")
+
+
+def run_tests(workdir: str, command: str, limits: Dict[str, int], uid: Optional[int]) -> Dict:
+    """Запустить команду в workdir; вывод - в файл вне workdir (тесты его не видят)"""
+    log_fd, log_path = tempfile.mkstemp(prefix="ci-", suffix=".log", dir=CI_WORKDIR)
+    env = {"PATH": "/usr/local/bin:/usr/bin:/bin", "HOME": workdir, "LANG": "C.UTF-8", "PYTHONDONTWRITEBYTECODE": "1", "CI": "1"}
+    started = time.monotonic()
+    try:
+        proc = subprocess.Popen(
+            ["/bin/sh", "-c", command], cwd=workdir, env=env, stdin=subprocess.DEVNULL,
+            stdout=log_fd, stderr=subprocess.STDOUT, start_new_session=True,
+            preexec_fn=_sandbox(limits, uid),
+        )
+        timed_out = False
+        try:
+            proc.wait(timeout=limits["timeout"])
+        except subprocess.TimeoutExpired:
+            timed_out = True
+        # Вся группа процессов: тесты могли запустить дочерние процессы
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        proc.wait()
+        exit_code = proc.returncode
+        if timed_out or exit_code == -signal.SIGXCPU:
+            status = STATUS_TIMEOUT
+        else:
+            status = STATUS_PASSED if exit_code == 0 else STATUS_FAILED
+        return {
+            "status": status,
+            "exit_code": exit_code,
+            "duration_ms": round((time.monotonic() - started) * 1000),
+            "output": _read_tail(log_path, CI_OUTPUT_TAIL),
+        }
+    finally:
+        os.close(log_fd)
+        os.remove(log_path)
+
+
+def _build(ci_input: Dict) -> Dict:
+    """Checkout + тесты в отдельном каталоге tmpfs"""
+    config = ci_input["ci"]
+    limits = limits_for(config)
+    with _slot() as slot:
+        uid = CI_UID_BASE + slot if os.getuid() == 0 else None
+        workdir = tempfile.mkdtemp(prefix=f"session-{ci_input['session_id']}-", dir=CI_WORKDIR)
+        try:
+            try:
+                checkout(ci_input["clone_url"], ci_input["head_sha"], ci_input.get("pr_ref"), workdir)
+            except (CheckoutError, subprocess.TimeoutExpired) as e:
+                logger.error(f"[CI] Checkout failed for session {ci_input['session_id']}: {e}")
+                return {"status": STATUS_ERROR, "exit_code": None, "duration_ms": 0, "output": str(e)}
+            if uid is not None:
+                _chown_tree(workdir, uid)
+            os.chmod(workdir, 0o700)
+            try:
+                result = run_tests(workdir, config["command"], limits, uid)
+            except (OSError, subprocess.SubprocessError) as e:
+                # Песочница не создана (нет прав на namespace) - без изоляции тесты не запускаем
+                logger.error(f"[CI] Sandbox failed for session {ci_input['session_id']}: {e}")
+                return {"status": STATUS_ERROR, "exit_code": None, "duration_ms": 0, "output": f"Sandbox failed: {e}"}
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    result["limits"] = limits
+    return result
+
+
+def _cached_or_build(key: str, ci_input: Dict) -> Tuple[Dict, bool]:
+    """(результат, из кэша ли). Пока сборку с этим ключом делает другая задача - ждём её результат"""
+    redis_conn = _redis_conn()
+    result_key = _RESULT_PREFIX + key
+    lock_key = _LOCK_PREFIX + key
+    lock_ttl = limits_for(ci_input["ci"])["timeout"] + CI_CHECKOUT_TIMEOUT + 60
+    owner = uuid.uuid4().hex
+    while True:
+        cached = redis_conn.get(result_key)
+        if cached is not None:
+            return json.loads(cached), True
+        if redis_conn.set(lock_key, owner, nx=True, ex=lock_ttl):
+            break
+        time.sleep(_POLL_INTERVAL)
+    try:
+        result = _build(ci_input)
+        # Ошибка checkout (Gitea недоступен) - не результат кода, не кэшируем
+        if result["status"] != STATUS_ERROR:
+            redis_conn.set(result_key, json.dumps(result), ex=CI_RESULT_TTL)
+        return result, False
+    finally:
+        redis_conn.eval(_RELEASE_SCRIPT, 1, lock_key, owner)
+
+
+def run_ci(session_id: int) -> Dict:
+    """RQ задача: тесты head коммита PR сессии"""
+    try:
+        ci_input, skip_reason = _fetch_ci_input(session_id)
+    except requests.RequestException as e:
+        # API недоступен (деплой) - задача упадёт и будет повторена RQ
+        logger.error(f"[CI] Internal API error: {e}")
+        raise
+    if ci_input is None:
+        logger.info(f"[CI] Session {session_id} skipped: {skip_reason}")
+        return {"status": STATUS_SKIPPED, "reason": skip_reason}
+
+    key = cache_key(ci_input["head_sha"], ci_input["package_version"])
+    result, cached = _cached_or_build(key, ci_input)
+    result = dict(result, head_sha=ci_input["head_sha"], package_version=ci_input["package_version"], cached=cached)
+    logger.info(f"[CI] Session {session_id} {ci_input['head_sha'][:8]}: {result['status']}"
+                f"{' (cached)' if cached else ''} in {result['duration_ms']} ms")
+    _post_result(session_id, result)
+    return {key: value for key, value in result.items() if key != "output"}
+
+
+def main():
+    from rq.worker_pool import WorkerPool
+    os.makedirs(CI_WORKDIR, exist_ok=True)
+    logger.info(f"[CI] Starting {CI_CONCURRENCY} workers on queue '{CI_QUEUE}'")
+    WorkerPool([CI_QUEUE], connection=_redis_conn(), num_workers=CI_CONCURRENCY).start()
+
+
+if __name__ == "__main__":
+    main()